@@ -0,0 +1,152 @@
+"""
+Capa de base de datos asíncrona (asyncpg) para rutas `async def`.
+
+Convive con `db_connection()` (psycopg2, bloqueante): las rutas de lectura más
+calientes la usan para no ocupar un hilo del threadpool de Starlette mientras
+esperan a PostgreSQL. La DB se resuelve igual que en la capa síncrona, con el
+ContextVar de `tenant_context` que fija el TenantMiddleware.
+
+Un pool asyncpg por DB de tenant, creado a demanda (min_size=0). Al crearse
+reserva su max_size del presupuesto global DB_MAX_TOTAL_CONNECTIONS, el mismo
+de los pools psycopg2, y lo devuelve al cerrarse. Si hay DB_ASYNC_MAX_POOLS
+pools o la reserva no cabe, primero se cierra el pool async usado hace más
+tiempo (LRU); sin pools que cerrar se espera hasta DB_POOL_WAIT_TIMEOUT.
+
+Las consultas usan placeholders de asyncpg ($1, $2, ...). `pg_sql()` convierte
+SQL escrito para psycopg2 (%s / %%) cuando se comparte entre ambas capas.
+"""
+import asyncio
+import logging
+import re
+import time
+from contextlib import asynccontextmanager
+
+import asyncpg
+
+from app.core.config import settings
+from app.core.database import _parse_db_url, release_connections, reserve_connections
+
+logger = logging.getLogger(__name__)
+
+_pools: dict = {}          # pool_key -> [asyncpg.Pool, last_used]
+_pools_lock: asyncio.Lock | None = None
+_placeholder_re = re.compile(r"%%|%s")
+
+
+def pg_sql(sql: str) -> str:
+    """Convierte placeholders de psycopg2 (%s, %%) a los de asyncpg ($n, %)."""
+    counter = 0
+
+    def _sub(match):
+        nonlocal counter
+        if match.group(0) == "%%":
+            return "%"
+        counter += 1
+        return f"${counter}"
+
+    return _placeholder_re.sub(_sub, sql)
+
+
+def _lock() -> asyncio.Lock:
+    # Se crea perezosamente para quedar ligado al event loop de uvicorn
+    global _pools_lock
+    if _pools_lock is None:
+        _pools_lock = asyncio.Lock()
+    return _pools_lock
+
+
+async def _get_pool(db_config: dict) -> asyncpg.Pool:
+    pool_key = (db_config.get("host"), db_config.get("port"), db_config.get("database"), db_config.get("user"))
+    entry = _pools.get(pool_key)
+    if entry is None:
+        async with _lock():
+            entry = _pools.get(pool_key)
+            if entry is None:
+                await _reserve_locked(settings.DB_ASYNC_POOL_MAX)
+                try:
+                    pool = await asyncpg.create_pool(
+                        **db_config,
+                        min_size=0,
+                        max_size=settings.DB_ASYNC_POOL_MAX,
+                        max_inactive_connection_lifetime=settings.DB_POOL_IDLE_TIMEOUT,
+                        timeout=settings.DB_POOL_WAIT_TIMEOUT,
+                    )
+                except BaseException:
+                    release_connections(settings.DB_ASYNC_POOL_MAX)
+                    raise
+                entry = _pools[pool_key] = [pool, time.monotonic()]
+    entry[1] = time.monotonic()
+    return entry[0]
+
+
+async def _reserve_locked(n: int) -> None:
+    """Reserva n conexiones del presupuesto global; cierra pools async LRU si hace falta."""
+    while len(_pools) >= settings.DB_ASYNC_MAX_POOLS:
+        await _evict_lru_locked()
+    # Sin espera mientras haya pools async que cerrar; el último intento espera
+    while not await asyncio.to_thread(reserve_connections, n, 0 if _pools else settings.DB_POOL_WAIT_TIMEOUT):
+        if not _pools:
+            raise ConnectionError(
+                f"Sin conexiones disponibles en el presupuesto global "
+                f"(DB_MAX_TOTAL_CONNECTIONS={settings.DB_MAX_TOTAL_CONNECTIONS})"
+            )
+        await _evict_lru_locked()
+
+
+async def _evict_lru_locked() -> None:
+    key = min(_pools, key=lambda k: _pools[k][1])
+    pool, _ = _pools.pop(key)
+    max_size = pool.get_max_size()
+    # close() espera a que se devuelvan las conexiones prestadas; la reserva
+    # vuelve al presupuesto recién cuando están cerradas
+    try:
+        await asyncio.wait_for(pool.close(), timeout=settings.DB_POOL_WAIT_TIMEOUT)
+    except Exception:
+        pool.terminate()
+    release_connections(max_size)
+    logger.info("Pool async de '%s' cerrado por LRU", key[2])
+
+
+@asynccontextmanager
+async def async_db_connection():
+    from app.core.tenant_context import get_tenant_db
+    tenant_url = get_tenant_db()
+    _db = _parse_db_url(tenant_url if tenant_url else settings.DATABASE_URL)
+
+    try:
+        pool = await _get_pool(_db)
+        conn = await pool.acquire(timeout=settings.DB_POOL_WAIT_TIMEOUT)
+    except Exception as e:
+        raise ConnectionError(
+            f"Error al conectar con la base de datos o al obtener conexión del pool async: {e}"
+        ) from e
+
+    try:
+        yield conn
+    finally:
+        await pool.release(conn)
+
+
+def get_async_pool_stats() -> dict:
+    return {
+        "pools": [
+            {
+                "open": pool.get_size(),
+                "idle": pool.get_idle_size(),
+                "max": pool.get_max_size(),
+                "idle_seconds": round(time.monotonic() - last_used, 1),
+            }
+            for key, (pool, last_used) in _pools.items()
+        ],
+    }
+
+
+async def close_async_pools() -> None:
+    pools = [pool for pool, _ in _pools.values()]
+    _pools.clear()
+    for pool in pools:
+        try:
+            await asyncio.wait_for(pool.close(), timeout=10)
+        except Exception:
+            pool.terminate()
+        release_connections(pool.get_max_size())
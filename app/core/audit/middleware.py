@@ -2,26 +2,71 @@ import logging
 import time
 
 from fastapi import Request
+from starlette.concurrency import run_in_threadpool
 from starlette.middleware.base import BaseHTTPMiddleware
 
 from app.core.audit.context import audit_context
-from app.core.audit.service import save_audit_log
+from app.core.audit.writer import audit_writer
 
 logger = logging.getLogger(__name__)
 
+def _request_context(request: Request) -> dict:
+    return {
+        "endpoint": request.url.path,
+        "method": request.method,
+        "ip_address": request.client.host if request.client else None,
+        "user_agent": request.headers.get("user-agent"),
+    }
+
+
+async def _submit(ctx: dict) -> None:
+    # Se encola: el hilo audit-log-writer lo persiste en lote
+    try:
+        if audit_writer.policy == "block":
+            await run_in_threadpool(audit_writer.submit, ctx)
+        else:
+            audit_writer.submit(ctx)
+    except Exception as exc:
+        logger.error("Fallo encolando audit log: %s", exc)
+
+
+def _rejection_context(request: Request, status_code: int, detail: str) -> dict:
+    ctx = _request_context(request)
+    ctx.update({
+        "status": "FAIL",
+        "error_message": f"{status_code}: {detail}",
+        "duration": 0,
+    })
+    return ctx
+
+
+async def audit_rejection(request: Request, status_code: int, detail: str) -> None:
+    """
+    Registra un request cortado antes de llegar a AuditMiddleware (tenant
+    desconocido, suspendido o no resoluble). Sin tenant resuelto, el registro
+    va a la DB por defecto.
+    """
+    await _submit(_rejection_context(request, status_code, detail))
+
+
+def audit_rejection_sync(request: Request, status_code: int, detail: str) -> None:
+    """
+    Igual que audit_rejection, para handlers síncronos (el 429 de
+    SlowAPIMiddleware solo admite handlers síncronos). Con la política
+    "block" y la cola llena puede esperar hasta AUDIT_ENQUEUE_TIMEOUT.
+    """
+    try:
+        audit_writer.submit(_rejection_context(request, status_code, detail))
+    except Exception as exc:
+        logger.error("Fallo encolando audit log: %s", exc)
+
+
 class AuditMiddleware(BaseHTTPMiddleware):
     async def dispatch(self, request: Request, call_next):
         start_time = time.time()
 
         # Contexto base del request
-        context = {
-            "endpoint": request.url.path,
-            "method": request.method,
-            "ip_address": request.client.host if request.client else None,
-            "user_agent": request.headers.get("user-agent"),
-        }
-
-        audit_context.set(context)
+        audit_context.set(_request_context(request))
 
         try:
             response = await call_next(request)
@@ -43,8 +88,4 @@ class AuditMiddleware(BaseHTTPMiddleware):
                 "error_message": error,
                 "duration": elapsed,
             })
-
-            try:
-                save_audit_log(base_ctx)
-            except Exception as exc:
-                logger.error("Fallo guardando audit log: %s", exc)
+            await _submit(base_ctx)
@@ -0,0 +1,195 @@
+"""
+Mantenimiento de audit_logs particionada por mes (migración 051).
+
+  - Crea por adelantado las particiones de los próximos AUDIT_PARTITIONS_AHEAD
+    meses (los INSERT nunca caen en audit_logs_default).
+  - Retención: una partición cuyo mes terminó antes del corte
+    (AUDIT_RETENTION_DAYS) se separa (DETACH), se archiva opcionalmente como
+    .csv.gz en AUDIT_ARCHIVE_DIR/<db>/ y se borra (DROP). Sin DELETE masivo ni
+    bloat; el bloqueo sobre audit_logs dura lo que el DETACH.
+  - audit_logs_default (filas fuera de todo mes creado) se purga por lotes;
+    si tiene filas de un mes que todavía no tiene partición,
+    audit_logs_ensure_partitions las mueve a la nueva al crearla.
+"""
+import gzip
+import logging
+import os
+from datetime import date
+
+from psycopg2 import sql
+
+from app.core.config import settings
+from app.core.database import _parse_db_url, db_connection
+from app.core.tenant_context import get_tenant_db
+
+logger = logging.getLogger(__name__)
+
+_DEFAULT_PURGE_BATCH = 5000
+
+
+def _add_months(d: date, months: int) -> date:
+    month = d.month - 1 + months
+    return date(d.year + month // 12, month % 12 + 1, 1)
+
+
+def ensure_partitions(months_ahead: int | None = None) -> int:
+    """Crea las particiones del mes actual y los siguientes. Retorna cuántas creó."""
+    ahead = settings.AUDIT_PARTITIONS_AHEAD if months_ahead is None else months_ahead
+    first = date.today().replace(day=1)
+    with db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                "SELECT public.audit_logs_ensure_partitions(%s, %s)",
+                (first, _add_months(first, ahead)),
+            )
+            created = cur.fetchone()[0]
+        conn.commit()
+    return created
+
+
+def _expired_partitions(cur, cutoff: date) -> list[tuple[str, date]]:
+    """(nombre, mes) de las particiones mensuales que terminan antes de `cutoff`."""
+    cur.execute("""
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'public.audit_logs'::regclass
+          AND c.relname ~ '^audit_logs_p[0-9]{6}$'
+        ORDER BY c.relname
+    """)
+    expired = []
+    for (name,) in cur.fetchall():
+        month = date(int(name[-6:-2]), int(name[-2:]), 1)
+        if _add_months(month, 1) <= cutoff:
+            expired.append((name, month))
+    return expired
+
+
+def _archive_path(name: str) -> str:
+    db_name = _parse_db_url(get_tenant_db() or settings.DATABASE_URL)["database"] or "default"
+    folder = os.path.join(settings.AUDIT_ARCHIVE_DIR, db_name)
+    os.makedirs(folder, exist_ok=True)
+    return os.path.join(folder, f"{name}.csv.gz")
+
+
+def _archive_partition(cur, name: str) -> str:
+    path = _archive_path(name)
+    tmp = path + ".part"
+    with gzip.open(tmp, "wb") as f:
+        cur.copy_expert(
+            sql.SQL("COPY {} TO STDOUT WITH (FORMAT csv, HEADER true)")
+            .format(sql.Identifier(name)).as_string(cur.connection),
+            f,
+        )
+    os.replace(tmp, path)
+    return path
+
+
+def drop_expired_partitions(retention_days: int | None = None, archive: bool | None = None) -> int:
+    """
+    Separa, archiva (si AUDIT_ARCHIVE_DIR está configurado) y borra las
+    particiones vencidas. Retorna las filas eliminadas.
+    """
+    days = settings.AUDIT_RETENTION_DAYS if retention_days is None else retention_days
+    archive = bool(settings.AUDIT_ARCHIVE_DIR) if archive is None else archive
+    cutoff = date.fromordinal(date.today().toordinal() - days)
+
+    removed = 0
+    failed = []
+    with db_connection() as conn:
+        with conn.cursor() as cur:
+            expired = _expired_partitions(cur, cutoff)
+        conn.commit()
+
+        # Una transacción por partición: un fallo no deja a medias las demás
+        for name, _month in expired:
+            try:
+                with conn.cursor() as cur:
+                    ident = sql.Identifier(name)
+                    cur.execute(sql.SQL("ALTER TABLE public.audit_logs DETACH PARTITION {}").format(ident))
+                    conn.commit()
+                    cur.execute(sql.SQL("SELECT count(*) FROM {}").format(ident))
+                    rows = cur.fetchone()[0]
+                    if archive and rows:
+                        path = _archive_partition(cur, name)
+                        logger.info("[audit] %s archivada en %s (%d filas)", name, path, rows)
+                    cur.execute(sql.SQL("DROP TABLE {}").format(ident))
+                conn.commit()
+                removed += rows
+            except Exception as exc:
+                conn.rollback()
+                # Si el DETACH ya se confirmó, la tabla queda suelta con sus datos
+                # y se retoma en la siguiente pasada (_drop_detached_leftovers)
+                logger.error("[audit] no se pudo retirar la partición %s: %s", name, exc)
+                failed.append(name)
+
+        removed += _drop_detached_leftovers(conn, archive, failed)
+        removed += _purge_default_partition(conn, cutoff)
+
+    if failed:
+        raise RuntimeError(f"Particiones de auditoría sin retirar: {', '.join(failed)}")
+    return removed
+
+
+def _drop_detached_leftovers(conn, archive: bool, failed: list[str]) -> int:
+    """
+    Particiones separadas en una pasada que falló después del DETACH. Las que
+    no se pueden retirar se agregan a `failed` y no detienen al resto.
+    """
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT c.relname
+            FROM pg_class c
+            JOIN pg_namespace n ON n.oid = c.relnamespace
+            WHERE n.nspname = 'public' AND c.relkind = 'r'
+              AND c.relname ~ '^audit_logs_p[0-9]{6}$'
+              AND NOT c.relispartition
+        """)
+        leftovers = [r[0] for r in cur.fetchall()]
+    conn.commit()
+
+    removed = 0
+    for name in leftovers:
+        try:
+            with conn.cursor() as cur:
+                ident = sql.Identifier(name)
+                cur.execute(sql.SQL("SELECT count(*) FROM {}").format(ident))
+                rows = cur.fetchone()[0]
+                if archive and rows:
+                    path = _archive_partition(cur, name)
+                    logger.info("[audit] %s archivada en %s (%d filas)", name, path, rows)
+                cur.execute(sql.SQL("DROP TABLE {}").format(ident))
+            conn.commit()
+            removed += rows
+        except Exception as exc:
+            conn.rollback()
+            logger.error("[audit] no se pudo retirar la partición separada %s: %s", name, exc)
+            failed.append(name)
+    return removed
+
+
+def _purge_default_partition(conn, cutoff: date) -> int:
+    removed = 0
+    while True:
+        with conn.cursor() as cur:
+            cur.execute("""
+                DELETE FROM audit_logs_default
+                WHERE ctid IN (
+                    SELECT ctid FROM audit_logs_default
+                    WHERE created_at < %s
+                    LIMIT %s
+                )
+            """, (cutoff, _DEFAULT_PURGE_BATCH))
+            deleted = cur.rowcount
+        conn.commit()
+        removed += deleted
+        if deleted < _DEFAULT_PURGE_BATCH:
+            return removed
+
+
+def maintain_partitions() -> int:
+    """Job del scheduler: particiones por adelantado + retención. Retorna filas eliminadas."""
+    created = ensure_partitions()
+    if created:
+        logger.info("[audit] %d particiones mensuales creadas", created)
+    return drop_expired_partitions()
@@ -0,0 +1,188 @@
+"""
+Escritor asíncrono de audit_logs.
+
+El middleware encola cada registro en una cola acotada en memoria y un hilo
+de fondo la vacía en lotes: agrupa por DB de tenant y hace un solo INSERT
+multi-fila por grupo. Así el request no paga ni la conexión ni el round-trip.
+
+Políticas cuando la cola está llena (settings.AUDIT_QUEUE_POLICY):
+  - drop_oldest : descarta el registro más antiguo y encola el nuevo (default)
+  - drop_newest : descarta el registro nuevo
+  - block       : espera hasta AUDIT_ENQUEUE_TIMEOUT segundos; si sigue llena, descarta el nuevo
+"""
+import logging
+import queue
+import threading
+import time
+
+from psycopg2.extras import execute_values
+
+from app.core.audit.service import AUDIT_INSERT_COLUMNS, build_audit_row, save_audit_log
+from app.core.config import settings
+from app.core.database import db_connection
+from app.core.tenant_context import get_tenant_db, set_tenant_db
+
+logger = logging.getLogger(__name__)
+
+_POLICIES = ("drop_oldest", "drop_newest", "block")
+
+
+class AuditLogWriter:
+    def __init__(
+        self,
+        maxsize: int,
+        batch_size: int,
+        flush_interval: float,
+        policy: str,
+        enqueue_timeout: float,
+    ):
+        if policy not in _POLICIES:
+            raise ValueError(f"AUDIT_QUEUE_POLICY inválida: {policy} (opciones: {', '.join(_POLICIES)})")
+        self.policy = policy
+        self._queue: queue.Queue = queue.Queue(maxsize=maxsize)
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._enqueue_timeout = enqueue_timeout
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "enqueued": 0,
+            "dropped": 0,
+            "written": 0,
+            "flushes": 0,
+            "flush_errors": 0,
+            "last_flush_ms": 0.0,
+            "max_flush_ms": 0.0,
+            "total_flush_ms": 0.0,
+        }
+
+    # ── Productor (request path) ──────────────────────────────
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def submit(self, ctx: dict) -> None:
+        """Encola un registro de auditoría con la DB del tenant actual."""
+        item = (get_tenant_db(), build_audit_row(ctx))
+
+        if not self.running:
+            # Sin hilo de fondo (scripts, tests sin lifespan): escritura directa
+            save_audit_log(ctx)
+            return
+
+        try:
+            if self.policy == "block":
+                self._queue.put(item, timeout=self._enqueue_timeout)
+            else:
+                self._queue.put_nowait(item)
+        except queue.Full:
+            if self.policy == "drop_oldest":
+                try:
+                    self._queue.get_nowait()
+                    self._queue.put_nowait(item)
+                except (queue.Empty, queue.Full):
+                    pass
+            self._count("dropped")
+            logger.warning("Cola de auditoría llena (%d): registro descartado", self._queue.maxsize)
+            return
+
+        self._count("enqueued")
+        # Back-pressure: con un lote completo esperando, despertar al escritor
+        if self._queue.qsize() >= self._batch_size:
+            self._wakeup.set()
+
+    # ── Consumidor (hilo de fondo) ────────────────────────────
+    def start(self) -> None:
+        if self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="audit-log-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """Detiene el hilo y vacía lo que quede en la cola (hook de shutdown)."""
+        if not self.running:
+            return
+        self._stop.set()
+        self._wakeup.set()
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._wakeup.wait(self._flush_interval)
+            self._wakeup.clear()
+            self._drain()
+        self._drain()
+
+    def _drain(self) -> None:
+        while True:
+            batch = []
+            try:
+                while len(batch) < self._batch_size:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+            if not batch:
+                return
+            self._flush(batch)
+            if len(batch) < self._batch_size:
+                return
+
+    def _flush(self, batch: list) -> None:
+        by_tenant: dict = {}
+        for tenant_db, row in batch:
+            by_tenant.setdefault(tenant_db, []).append(row)
+
+        for tenant_db, rows in by_tenant.items():
+            started = time.perf_counter()
+            try:
+                set_tenant_db(tenant_db)
+                with db_connection() as conn:
+                    with conn.cursor() as cur:
+                        execute_values(
+                            cur,
+                            f"INSERT INTO audit_logs ({', '.join(AUDIT_INSERT_COLUMNS)}) VALUES %s",
+                            rows,
+                            page_size=len(rows),
+                        )
+                    conn.commit()
+            except Exception as exc:
+                self._count("flush_errors")
+                self._count("dropped", len(rows))
+                logger.error("Fallo guardando %d audit logs: %s", len(rows), exc)
+                continue
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            with self._stats_lock:
+                self._stats["written"] += len(rows)
+                self._stats["flushes"] += 1
+                self._stats["last_flush_ms"] = round(elapsed_ms, 2)
+                self._stats["max_flush_ms"] = round(max(self._stats["max_flush_ms"], elapsed_ms), 2)
+                self._stats["total_flush_ms"] += elapsed_ms
+
+    # ── Métricas ──────────────────────────────────────────────
+    def _count(self, key: str, n: int = 1) -> None:
+        with self._stats_lock:
+            self._stats[key] += n
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            data = dict(self._stats)
+        flushes = data.pop("total_flush_ms")
+        data["avg_flush_ms"] = round(flushes / data["flushes"], 2) if data["flushes"] else 0.0
+        data["queue_depth"] = self._queue.qsize()
+        data["queue_max"] = self._queue.maxsize
+        data["policy"] = self.policy
+        data["running"] = self.running
+        return data
+
+
+audit_writer = AuditLogWriter(
+    maxsize=settings.AUDIT_QUEUE_MAX,
+    batch_size=settings.AUDIT_BATCH_SIZE,
+    flush_interval=settings.AUDIT_FLUSH_INTERVAL,
+    policy=settings.AUDIT_QUEUE_POLICY,
+    enqueue_timeout=settings.AUDIT_ENQUEUE_TIMEOUT,
+)
@@ -12,14 +12,80 @@ class Settings(BaseSettings):
 
     # 🗄️ Master DB (registro de tenants)
     MASTER_DATABASE_URL: str = ""
+    MASTER_DB_POOL_MIN: int = 1
+    # Clientes concurrentes: lookups de TenantMiddleware (uno por slug), 2 hilos de
+    # refresco del cache y SCHEDULER_TENANT_WORKERS (turnos del scheduler)
+    MASTER_DB_POOL_MAX: int = 10
+    MASTER_DB_POOL_WAIT_TIMEOUT: float = 5.0  # espera máxima por una conexión libre
+
+    # 🏢 Cache de resolución de tenants (segundos)
+    TENANT_CACHE_TTL: int = 60         # fresco: se sirve sin consultar
+    TENANT_CACHE_STALE_TTL: int = 600  # vencido: se sirve mientras se refresca en segundo plano
+    TENANT_CACHE_MISS_TTL: int = 10    # slug inexistente: evita martillar la Master DB
+
+    # 👤 Cache del usuario autenticado (fila de users por tenant)
+    PRINCIPAL_CACHE_TTL: int = 30      # segundos; 0 desactiva. Cota para ver una desactivación hecha en otro worker
+    PRINCIPAL_CACHE_MAX: int = 10000   # entradas (todos los tenants)
 
     # 👑 Superadmin (credenciales en env, no en DB)
     SUPERADMIN_USERNAME: str = ""
     SUPERADMIN_PASSWORD_HASH: str = ""
 
-    # ⚡ Pool de conexiones de base de datos
-    DB_POOL_MIN: int = 1
-    DB_POOL_MAX: int = 5
+    # ⚡ Pool de conexiones de base de datos (uno por tenant)
+    DB_POOL_MIN: int = 1                    # ociosas que conserva un pool en uso
+    DB_POOL_MAX: int = 5                    # máximo por tenant
+    DB_MAX_TOTAL_CONNECTIONS: int = 40      # presupuesto global, todos los tenants
+    DB_POOL_WAIT_TIMEOUT: float = 5.0       # espera máxima por una conexión libre
+    DB_POOL_IDLE_TIMEOUT: int = 300         # ociosa más tiempo que esto → se cierra
+    DB_POOL_HEALTHCHECK_AFTER: float = 30.0 # ociosa más tiempo que esto → SELECT 1 antes de reusar
+
+    # ⚡ Pool asyncpg (rutas async de solo lectura); cada pool reserva
+    # DB_ASYNC_POOL_MAX del presupuesto DB_MAX_TOTAL_CONNECTIONS
+    DB_ASYNC_POOL_MAX: int = 4              # máximo por tenant
+    DB_ASYNC_MAX_POOLS: int = 4             # tenants con pool async abierto (LRU)
+
+    # 📝 Escritor asíncrono de auditoría (cola acotada + lotes)
+    AUDIT_QUEUE_MAX: int = 10000
+    AUDIT_BATCH_SIZE: int = 500
+    AUDIT_FLUSH_INTERVAL: float = 1.0
+    AUDIT_QUEUE_POLICY: str = "drop_oldest"   # drop_oldest | drop_newest | block
+    AUDIT_ENQUEUE_TIMEOUT: float = 0.05
+    AUDIT_RETENTION_DAYS: int = 90            # particiones mensuales más viejas se retiran
+    AUDIT_PARTITIONS_AHEAD: int = 2           # meses creados por adelantado
+    AUDIT_ARCHIVE_DIR: str = ""               # vacío: se borran sin archivar; si no, .csv.gz por partición
+
+    # ⏳ Jobs en segundo plano (importaciones / exportaciones largas)
+    JOBS_MAX_WORKERS: int = 2
+    JOBS_HEARTBEAT_INTERVAL: float = 10.0   # latido de los jobs en curso
+    JOBS_STALE_AFTER: int = 120             # sin latido más que esto → interrumpido
+    JOBS_RETENTION_HOURS: int = 48          # jobs terminados y sus archivos
+    JOBS_STORAGE_DIR: str = "app/storage/jobs"
+
+    # 🗓️ Scheduler multi-tenant (app/core/tenant_scheduler.py)
+    SCHEDULER_TENANT_WORKERS: int = 4         # tenants procesados en paralelo por job
+    SCHEDULER_RUNS_RETENTION_DAYS: int = 30   # historial en scheduler_job_runs
+    SCHEDULER_RUN_STALE_HOURS: int = 6        # RUNNING más que esto → ABANDONED (worker caído)
+
+    # 🔓 Expiración programada de reservas de stock (todos los tenants)
+    RESERVATION_EXPIRY_INTERVAL: int = 60       # segundos entre pasadas
+    RESERVATION_EXPIRY_BATCH: int = 500         # reservas por transacción
+    RESERVATION_EXPIRY_MAX_BATCHES: int = 20    # tope por tenant y pasada
+
+    # 🚨 Motor de alertas de reposición (app/modules/logistics/reorder.py)
+    REORDER_ALERTS_FULL_REFRESH: int = 600    # segundos entre recálculos completos por tenant
+    REORDER_ALERTS_LOOKBACK: int = 120        # margen sobre updated_at para transacciones que confirman tarde
+
+    # 🏷️ Códigos QR y hojas de etiquetas (app/core/labels.py)
+    QR_CACHE_DIR: str = "app/storage/qr"      # caché en disco direccionada por contenido
+    QR_CACHE_MAX_MB: int = 64                 # al superarlo se borran los menos usados
+    LABEL_RENDER_WORKERS: int = 2             # procesos para dibujar QR en lote; 0 = en el hilo
+    LABEL_SHEET_MAX: int = 2000               # etiquetas por hoja PDF
+
+    # 🔔 Badges en vivo por SSE (app/core/notifications, migración 054)
+    NOTIFY_HEARTBEAT: int = 25                # segundos entre comentarios keep-alive del stream
+    NOTIFY_RESYNC_INTERVAL: int = 300         # recálculo de los contadores con suscriptores
+    NOTIFY_RETRY_MS: int = 5000               # espera de reconexión sugerida al EventSource
+    NOTIFY_STREAM_TICKET_TTL: int = 60        # segundos de validez del ticket de /notifications/stream
 
     model_config = ConfigDict(
         env_file=".env",
@@ -1,13 +1,63 @@
 import psycopg2
-from psycopg2.pool import ThreadedConnectionPool
+from psycopg2 import extensions
+from psycopg2.pool import PoolError
 import threading
+import time
+import logging
 from contextlib import contextmanager
 from urllib.parse import urlparse
 from app.core.config import settings
 
-# Diccionario global para cachear los pools de conexiones por base de datos
-_pools = {}
-_pools_lock = threading.Lock()
+logger = logging.getLogger(__name__)
+
+# ============================================================
+# Registro de pools por base de datos (uno por tenant)
+# ============================================================
+# Todas las conexiones abiertas, de todos los tenants, cuentan contra un
+# presupuesto global (DB_MAX_TOTAL_CONNECTIONS). Si un tenant necesita una
+# conexión nueva y el presupuesto está lleno, se cierran conexiones ociosas
+# de los pools usados hace más tiempo (LRU); si no hay ninguna, se espera
+# hasta DB_POOL_WAIT_TIMEOUT a que alguien devuelva una.
+# Un lock global protege el registro; connect() se hace fuera del lock.
+# Los pools asyncpg reservan su max_size del mismo presupuesto al crearse
+# (reserve_connections) y lo devuelven al cerrarse (release_connections).
+_pools: dict = {}
+_registry_cond = threading.Condition()
+_total_open = 0
+_external_reserved = 0
+
+
+class TenantPool:
+    def __init__(self, key: tuple, db_config: dict, maxconn: int):
+        self.key = key
+        self.db_config = db_config
+        self.maxconn = maxconn
+        self.idle: list = []          # [(conn, devuelta_en)] — LIFO
+        self.open = 0                 # conexiones abiertas (idle + en uso + reservadas)
+        self.in_use = 0
+        self.last_used = time.monotonic()
+        self.borrows = 0
+        self.waits = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+        self.health_check_failures = 0
+        self.reaped = 0
+
+    def stats(self) -> dict:
+        return {
+            "open": self.open,
+            "in_use": self.in_use,
+            "idle": len(self.idle),
+            "max": self.maxconn,
+            "borrows": self.borrows,
+            "waits": self.waits,
+            "avg_wait_ms": round(self.wait_time_total * 1000 / self.borrows, 2) if self.borrows else 0.0,
+            "max_wait_ms": round(self.wait_time_max * 1000, 2),
+            "health_check_failures": self.health_check_failures,
+            "reaped": self.reaped,
+            "idle_seconds": round(time.monotonic() - self.last_used, 1),
+        }
+
 
 def _parse_db_url(url: str) -> dict:
     # Normalizar esquemas con driver (postgresql+asyncpg://, etc.)
@@ -22,28 +72,244 @@ def _parse_db_url(url: str) -> dict:
         "password": parsed.password,
     }
 
-def get_connection_pool(db_config: dict) -> ThreadedConnectionPool:
+
+def get_connection_pool(db_config: dict) -> TenantPool:
     """
-    Retorna o inicializa un pool de conexiones hilo-seguro para la configuración dada.
+    Retorna o registra el pool de la configuración dada (no abre conexiones).
     """
     pool_key = (db_config.get("host"), db_config.get("port"), db_config.get("database"), db_config.get("user"))
-    with _pools_lock:
-        if pool_key not in _pools:
-            # Tamaño del pool configurable (por defecto Min=1, Max=5 para prevenir saturación en multi-tenant)
-            minconn = settings.DB_POOL_MIN
-            maxconn = settings.DB_POOL_MAX
-            _pools[pool_key] = ThreadedConnectionPool(minconn, maxconn, **db_config)
-    return _pools[pool_key]
+    with _registry_cond:
+        pool = _pools.get(pool_key)
+        if pool is None:
+            pool = _pools[pool_key] = TenantPool(pool_key, db_config, settings.DB_POOL_MAX)
+    return pool
+
+
+def _close_quietly(conn) -> None:
+    try:
+        conn.close()
+    except Exception:
+        pass
+
+
+def _release_slot_locked(pool: TenantPool) -> None:
+    global _total_open
+    pool.open -= 1
+    _total_open -= 1
+    _registry_cond.notify_all()
+
+
+def _evict_idle_locked(exclude: TenantPool | None) -> bool:
+    """Cierra UNA conexión ociosa del pool menos usado recientemente (LRU)."""
+    candidates = sorted(
+        (p for p in _pools.values() if p is not exclude and p.idle),
+        key=lambda p: p.last_used,
+    )
+    if not candidates:
+        return False
+    victim = candidates[0]
+    conn, _ = victim.idle.pop(0)   # la más antigua del pool
+    _close_quietly(conn)
+    victim.reaped += 1
+    _release_slot_locked(victim)
+    # open cuenta también las prestadas: solo sale del registro sin ninguna afuera
+    if victim.open == 0:
+        _pools.pop(victim.key, None)
+    return True
+
+
+def _is_healthy(conn, idle_for: float) -> bool:
+    if conn.closed:
+        return False
+    if idle_for < settings.DB_POOL_HEALTHCHECK_AFTER:
+        return True
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1")
+        conn.rollback()
+        return True
+    except Exception:
+        return False
+
+
+def _acquire(pool: TenantPool) -> tuple[TenantPool, object]:
+    """
+    Retorna (pool, conexión). El pool puede no ser el recibido: si aquel fue
+    desalojado del registro (open == 0) y otro hilo ya registró uno nuevo para
+    la misma DB, se usa el registrado, así nunca hay dos pools por clave y el
+    máximo por tenant se respeta. La conexión se devuelve a ese pool.
+    """
+    global _total_open
+    started = time.monotonic()
+    deadline = started + settings.DB_POOL_WAIT_TIMEOUT
+    waited = False
+
+    while True:
+        conn = None
+        returned_at = None
+        with _registry_cond:
+            while True:
+                # Sin conexiones propias (open == 0) es seguro cambiar al pool vigente
+                pool = _pools.setdefault(pool.key, pool)
+                if pool.idle:
+                    conn, returned_at = pool.idle.pop()
+                    break
+                if pool.open < pool.maxconn and _total_open < settings.DB_MAX_TOTAL_CONNECTIONS:
+                    pool.open += 1
+                    _total_open += 1
+                    break
+                if pool.open < pool.maxconn and _evict_idle_locked(exclude=pool):
+                    continue
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolError(
+                        f"Sin conexiones disponibles para '{pool.key[2]}' "
+                        f"(en uso {pool.in_use}/{pool.maxconn}, total {_total_open}/{settings.DB_MAX_TOTAL_CONNECTIONS})"
+                    )
+                waited = True
+                _registry_cond.wait(remaining)
+            pool.in_use += 1
+
+        if conn is None:
+            try:
+                conn = psycopg2.connect(**pool.db_config)
+            except BaseException:
+                with _registry_cond:
+                    pool.in_use -= 1
+                    _release_slot_locked(pool)
+                raise
+        elif not _is_healthy(conn, time.monotonic() - returned_at):
+            # Conexión muerta (reinicio del servidor, timeout de red): descartar y reintentar
+            _close_quietly(conn)
+            with _registry_cond:
+                pool.in_use -= 1
+                pool.health_check_failures += 1
+                _release_slot_locked(pool)
+            continue
+
+        wait_time = time.monotonic() - started
+        with _registry_cond:
+            pool.borrows += 1
+            pool.waits += int(waited)
+            pool.wait_time_total += wait_time
+            pool.wait_time_max = max(pool.wait_time_max, wait_time)
+            pool.last_used = time.monotonic()
+        return pool, conn
+
+
+def _release(pool: TenantPool, conn) -> None:
+    keep = not conn.closed
+    if keep:
+        try:
+            status = conn.info.transaction_status
+            if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+                keep = False
+            elif status != extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+        except Exception:
+            keep = False
+
+    with _registry_cond:
+        pool.in_use -= 1
+        pool.last_used = time.monotonic()
+        if keep:
+            pool.idle.append((conn, time.monotonic()))
+            _registry_cond.notify_all()
+        else:
+            _close_quietly(conn)
+            _release_slot_locked(pool)
+
+
+def reserve_connections(n: int, timeout: float) -> bool:
+    """
+    Reserva n conexiones del presupuesto global para un pool externo (asyncpg).
+    Si no caben cierra ociosas de los pools síncronos (LRU) y, si no hay, espera
+    hasta `timeout` a que se liberen. Retorna False si no se pudo reservar.
+    """
+    global _total_open, _external_reserved
+    deadline = time.monotonic() + timeout
+    with _registry_cond:
+        while _total_open + n > settings.DB_MAX_TOTAL_CONNECTIONS:
+            if _evict_idle_locked(exclude=None):
+                continue
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            _registry_cond.wait(remaining)
+        _total_open += n
+        _external_reserved += n
+    return True
+
+
+def release_connections(n: int) -> None:
+    """Devuelve al presupuesto global una reserva de reserve_connections()."""
+    global _total_open, _external_reserved
+    with _registry_cond:
+        _total_open -= n
+        _external_reserved -= n
+        _registry_cond.notify_all()
+
+
+def reap_idle_connections() -> int:
+    """
+    Cierra conexiones ociosas por más de DB_POOL_IDLE_TIMEOUT. Los pools usados
+    recientemente conservan DB_POOL_MIN ociosas; los pools sin uso ni conexiones
+    salen del registro. Retorna cuántas conexiones se cerraron.
+    """
+    now = time.monotonic()
+    closed = 0
+    with _registry_cond:
+        for key, pool in list(_pools.items()):
+            pool_idle = now - pool.last_used > settings.DB_POOL_IDLE_TIMEOUT
+            keep_min = 0 if pool_idle else settings.DB_POOL_MIN
+            survivors = []
+            # idle está en orden de devolución: las más antiguas primero
+            for i, (conn, returned_at) in enumerate(pool.idle):
+                stale = now - returned_at > settings.DB_POOL_IDLE_TIMEOUT
+                if stale and len(pool.idle) - i > keep_min:
+                    _close_quietly(conn)
+                    pool.reaped += 1
+                    _release_slot_locked(pool)
+                    closed += 1
+                else:
+                    survivors.append((conn, returned_at))
+            pool.idle = survivors
+            if pool.open == 0 and pool_idle:
+                del _pools[key]
+    return closed
+
+
+def get_pool_stats() -> dict:
+    with _registry_cond:
+        return {
+            "total_open": _total_open,
+            "async_reserved": _external_reserved,
+            "budget": settings.DB_MAX_TOTAL_CONNECTIONS,
+            "pools": [p.stats() for p in _pools.values()],
+        }
+
+
+def close_all_pools() -> None:
+    global _total_open
+    with _registry_cond:
+        for pool in _pools.values():
+            for conn, _ in pool.idle:
+                _close_quietly(conn)
+            _total_open -= len(pool.idle)
+            pool.open -= len(pool.idle)
+            pool.idle = []
+        _pools.clear()
+
 
 @contextmanager
 def db_connection():
     from app.core.tenant_context import get_tenant_db
     tenant_url = get_tenant_db()
     _db = _parse_db_url(tenant_url if tenant_url else settings.DATABASE_URL)
-    
+
+    pool = get_connection_pool(_db)
     try:
-        pool = get_connection_pool(_db)
-        conn = pool.getconn()
+        pool, conn = _acquire(pool)
     except UnicodeDecodeError:
         # On Spanish Windows, PostgreSQL returns error messages in Windows-1252
         # (e.g. "autenticación" with byte 0xf3). psycopg2 tries to decode them
@@ -57,15 +323,29 @@ def db_connection():
         raise psycopg2.OperationalError(
             f"Error al conectar con la base de datos o al obtener conexión del pool: {e}"
         )
-        
+
     try:
         yield conn
     except Exception:
-        conn.rollback()
-        raise
-    finally:
         try:
-            pool.putconn(conn)
+            conn.rollback()
         except Exception:
             pass
+        raise
+    finally:
+        _release(pool, conn)
 
+
+def stream_query(query, params=None, itersize: int = 2000, name: str = "stream"):
+    """
+    Itera las filas de `query` con un cursor de servidor (named cursor): el
+    resultado se trae en bloques de `itersize` filas en vez de cargarlo
+    completo en memoria. La conexión queda tomada mientras se consume.
+    """
+    with db_connection() as conn:
+        with conn.cursor(name=f"{name}_{threading.get_ident()}_{time.monotonic_ns()}") as cur:
+            cur.itersize = itersize
+            if not isinstance(query, str):
+                query = query.as_string(conn)   # psycopg2.sql.Composed
+            cur.execute(query.rstrip().rstrip(";"), params)
+            yield from cur
@@ -1,18 +1,35 @@
 """
 Utilidad compartida para exportaciones Excel con estilos CeShark.
 Usado por todos los módulos que generen archivos .xlsx descargables.
+
+Dos caminos:
+  - write_*_row + excel_response: Workbook en memoria (reportes chicos con
+    celdas combinadas o varias pasadas sobre la hoja).
+  - StreamingExcel: workbook write-only para listados grandes. Las filas se
+    vuelcan a disco a medida que se agregan, las celdas comparten estilos con
+    nombre y el .xlsx se envía al cliente por bloques desde un temporal.
+
+csv_response cubre el mismo caso en texto plano (historiales completos).
 """
+import csv
 import io
+import os
+import tempfile
 from datetime import datetime
+from functools import lru_cache
 from fastapi.responses import StreamingResponse
 
 try:
     import openpyxl
-    from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font, PatternFill, Alignment, Border, Side, NamedStyle
     from openpyxl.utils import get_column_letter
 except ImportError:
     openpyxl = None
 
+XLSX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+EXPORT_CHUNK_SIZE = 64 * 1024
+
 
 # ── Design tokens ──────────────────────────────────────────────────────────────
 PRIMARY_HEX = "0B2E33"
@@ -22,26 +39,35 @@ CAP_HEX     = "1a4a52"
 ALT_HEX     = "F0F9FA"
 
 # ── Estilos reutilizables ──────────────────────────────────────────────────────
+# Los objetos de estilo de openpyxl son inmutables una vez asignados: se
+# cachean para no crear Fill/Font/Border nuevos por cada celda.
 
+@lru_cache(maxsize=None)
 def _fill(hex_color: str):
     return PatternFill("solid", fgColor=hex_color)
 
+@lru_cache(maxsize=None)
 def _border():
     thin = Side(style="thin", color="C5D8DB")
     return Border(left=thin, right=thin, top=thin, bottom=thin)
 
+@lru_cache(maxsize=None)
 def _font_header():
     return Font(bold=True, color="FFFFFF", size=9)
 
+@lru_cache(maxsize=None)
 def _font_title():
     return Font(bold=True, color="FFFFFF", size=12)
 
+@lru_cache(maxsize=None)
 def _font_normal():
     return Font(size=9, color="1F2937")
 
+@lru_cache(maxsize=None)
 def _font_bold_dark():
     return Font(bold=True, size=9, color=PRIMARY_HEX)
 
+@lru_cache(maxsize=None)
 def _align(h="left", wrap=False):
     return Alignment(horizontal=h, vertical="center", wrap_text=wrap)
 
@@ -126,11 +152,167 @@ def excel_response(wb, filename: str) -> StreamingResponse:
     buf.seek(0)
     return StreamingResponse(
         buf,
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        media_type=XLSX_MEDIA_TYPE,
         headers={"Content-Disposition": f'attachment; filename="{filename}"'},
     )
 
 
+# ── Exportación en streaming (write-only, memoria constante) ───────────────────
+
+def _named_style(name: str, font, fill, alignment) -> "NamedStyle":
+    style = NamedStyle(name=name)
+    style.font = font
+    style.fill = fill
+    style.alignment = alignment
+    style.border = _border()
+    return style
+
+
+def _iter_file(path: str, chunk_size: int = EXPORT_CHUNK_SIZE):
+    """Lee el archivo por bloques y lo borra al terminar (o si el cliente corta)."""
+    try:
+        with open(path, "rb") as f:
+            while chunk := f.read(chunk_size):
+                yield chunk
+    finally:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+class StreamingSheet:
+    """Hoja write-only: las filas se agregan en orden y no se pueden releer."""
+
+    def __init__(self, book: "StreamingExcel", ws, n_cols: int):
+        self._book = book
+        self._ws = ws
+        self.n_cols = n_cols
+        self.row = 0
+
+    def _append(self, values: list, style: str, overrides: dict = None, height: float = None) -> None:
+        self.row += 1
+        if height:
+            self._ws.row_dimensions[self.row].height = height
+        cells = []
+        for col, val in enumerate(values, start=1):
+            cell = WriteOnlyCell(self._ws, value=val)
+            cell.style = overrides.get(col, style) if overrides else style
+            cells.append(cell)
+        self._ws.append(cells)
+
+    def title_row(self, title: str) -> None:
+        """Banda oscura con el título, combinada sobre todas las columnas."""
+        self._append([title] + [None] * (self.n_cols - 1), "erp_title", height=26)
+        self._ws.merged_cells.add(
+            f"A{self.row}:{get_column_letter(self.n_cols)}{self.row}"
+        )
+
+    def header_row(self, headers: list[str]) -> None:
+        self._append(headers, "erp_header", height=18)
+
+    def data_row(self, values: list, alternate: bool = False, badges: dict = None) -> None:
+        """
+        Fila de datos. `badges` = {columna (1-based): (fondo, texto)} pinta esas
+        celdas como etiqueta de color (estado, prioridad...).
+        """
+        overrides = None
+        if badges:
+            overrides = {col: self._book.badge_style(bg, fg) for col, (bg, fg) in badges.items()}
+        self._append(values, "erp_data_alt" if alternate else "erp_data", overrides)
+
+    def total_row(self, values: list, height: float = None) -> None:
+        overrides = {1: "erp_total_label"}
+        self._append(values, "erp_total", overrides, height=height)
+
+
+class StreamingExcel:
+    """
+    Workbook write-only con los estilos CeShark registrados como estilos con
+    nombre: cada celda guarda solo una referencia al estilo compartido.
+
+        book = StreamingExcel()
+        sheet = book.sheet("Stock", headers, widths, title="CeShark ERP — ...")
+        for row in stream_query(...):
+            sheet.data_row([...], alternate=...)
+        return book.response("stock.xlsx")
+    """
+
+    def __init__(self):
+        self.wb = openpyxl.Workbook(write_only=True)
+        self._badges: set = set()
+        for style in (
+            _named_style("erp_title", _font_title(), _fill(PRIMARY_HEX), _align("center")),
+            _named_style("erp_header", _font_header(), _fill(CAP_HEX), _align("center")),
+            _named_style("erp_data", _font_normal(), _fill("FFFFFF"), _align("left")),
+            _named_style("erp_data_alt", _font_normal(), _fill(ALT_HEX), _align("left")),
+            _named_style("erp_total", _font_bold_dark(), _fill(ACCENT_HEX), _align("right")),
+            _named_style("erp_total_label", _font_bold_dark(), _fill(ACCENT_HEX), _align("left")),
+        ):
+            self.wb.add_named_style(style)
+
+    def badge_style(self, bg: str, fg: str) -> str:
+        name = f"erp_badge_{bg}_{fg}"
+        if name not in self._badges:
+            self.wb.add_named_style(
+                _named_style(name, Font(size=9, bold=True, color=fg), _fill(bg), _align("left"))
+            )
+            self._badges.add(name)
+        return name
+
+    def sheet(self, name: str, headers: list[str], widths: list[int], title: str = None) -> StreamingSheet:
+        """Crea la hoja con anchos, título opcional (fila 1) y encabezados."""
+        ws = self.wb.create_sheet(name)
+        set_column_widths(ws, widths)
+        sheet = StreamingSheet(self, ws, len(headers))
+        if title:
+            sheet.title_row(title)
+        sheet.header_row(headers)
+        return sheet
+
+    def response(self, filename: str) -> StreamingResponse:
+        """Cierra el workbook en un temporal y lo envía por bloques."""
+        fd, path = tempfile.mkstemp(prefix="export_", suffix=".xlsx")
+        os.close(fd)
+        try:
+            self.wb.save(path)
+        except Exception:
+            os.remove(path)
+            raise
+        return StreamingResponse(
+            _iter_file(path),
+            media_type=XLSX_MEDIA_TYPE,
+            headers={
+                "Content-Disposition": f'attachment; filename="{filename}"',
+                "Content-Length": str(os.path.getsize(path)),
+            },
+        )
+
+
+def csv_response(headers: list[str], rows, filename: str) -> StreamingResponse:
+    """
+    Escribe `rows` (cualquier iterable, p.ej. stream_query) a un CSV temporal y
+    lo envía por bloques. UTF-8 con BOM y ';' para que Excel lo abra bien.
+    """
+    fd, path = tempfile.mkstemp(prefix="export_", suffix=".csv")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8-sig", newline="") as f:
+            writer = csv.writer(f, delimiter=";")
+            writer.writerow(headers)
+            writer.writerows(rows)
+    except Exception:
+        os.remove(path)
+        raise
+    return StreamingResponse(
+        _iter_file(path),
+        media_type="text/csv; charset=utf-8",
+        headers={
+            "Content-Disposition": f'attachment; filename="{filename}"',
+            "Content-Length": str(os.path.getsize(path)),
+        },
+    )
+
+
 def save_and_upload_to_sharepoint(wb, filename: str) -> str:
     """
     Serializa el Workbook y lo sube automáticamente a SharePoint Online,
@@ -0,0 +1,168 @@
+"""
+Motor compartido para importaciones Excel masivas (set-based).
+
+Flujo:
+  1. Validar el DataFrame completo con operaciones vectorizadas de pandas
+     (texto, números, fechas). Cada fila inválida queda como error "Fila N".
+  2. Cargar las filas válidas a una tabla temporal con COPY (stage_rows).
+  3. Aplicar la importación con pocas sentencias SQL sobre la tabla temporal
+     (apply_staged). Si PostgreSQL rechaza el lote (FK, CHECK, longitud...),
+     se repite fila a fila con SAVEPOINT para atribuir el error a su fila.
+
+La fila N es la del Excel: índice del DataFrame + 2 (encabezado y base 0).
+"""
+import io
+import logging
+import time
+
+import numpy as np
+import pandas as pd
+import psycopg2
+
+from app.core.jobs.runner import report_progress
+
+logger = logging.getLogger(__name__)
+
+ROW_FILTER_ALL = "TRUE"
+ROW_FILTER_ONE = "s.row_num = %(row_num)s"
+
+
+# ── Validación vectorizada ─────────────────────────────────────────────────────
+
+def excel_row_numbers(df: pd.DataFrame) -> pd.Series:
+    return pd.Series(df.index, index=df.index).astype(int) + 2
+
+
+def ensure_columns(df: pd.DataFrame, columns) -> pd.DataFrame:
+    """Agrega como vacías las columnas opcionales que no vengan en el archivo."""
+    for col in columns:
+        if col not in df.columns:
+            df[col] = None
+    return df
+
+
+def clean_text(series: pd.Series) -> pd.Series:
+    """str(x).strip(); vacíos y nulos → None."""
+    text = series.astype("string").str.strip()
+    present = (text.notna() & (text != "")).fillna(False).astype(bool)
+    return text.astype(object).where(present, None)
+
+
+def to_number(series: pd.Series) -> tuple[pd.Series, pd.Series]:
+    """(valores numéricos, máscara de celdas con valor no numérico)."""
+    values = pd.to_numeric(series, errors="coerce")
+    return values, series.notna() & values.isna()
+
+
+def to_date(series: pd.Series) -> tuple[pd.Series, pd.Series]:
+    """
+    Fechas como 'YYYY-MM-DD' (o None). Acepta celdas fecha de Excel, ISO
+    (AAAA-MM-DD) y DD/MM/AAAA. Retorna (fechas, máscara de inválidas).
+    """
+    text = clean_text(series).astype("string")
+    parsed = pd.to_datetime(text, format="ISO8601", errors="coerce")
+    parsed = parsed.fillna(pd.to_datetime(text, format="%d/%m/%Y", errors="coerce"))
+    dates = parsed.dt.strftime("%Y-%m-%d").astype(object).where(parsed.notna(), None)
+    return dates, text.notna() & parsed.isna()
+
+
+def too_long(series: pd.Series, max_len: int) -> pd.Series:
+    return (series.astype("string").str.len() > max_len).fillna(False).astype(bool)
+
+
+def first_errors(checks) -> pd.Series:
+    """
+    checks: lista ordenada de (máscara, mensaje) donde mensaje es un str o una
+    Series de mensajes. Retorna, por fila, el primer error que aplica (o None).
+    """
+    errors = None
+    for mask, message in checks:
+        if not isinstance(message, pd.Series):
+            message = pd.Series(message, index=mask.index)
+        current = message.where(mask, None)
+        errors = current if errors is None else errors.where(errors.notna(), current)
+    return errors
+
+
+# ── Staging (COPY) ─────────────────────────────────────────────────────────────
+
+def stage_rows(cur, table: str, columns: dict, df: pd.DataFrame) -> int:
+    """
+    Crea la tabla temporal `table` (row_num + columns {nombre: tipo SQL}, se
+    borra al COMMIT) y carga df[list(columns)] con COPY. Retorna filas cargadas.
+    """
+    col_defs = ", ".join(f"{name} {sql_type}" for name, sql_type in columns.items())
+    cur.execute(f"CREATE TEMP TABLE {table} (row_num INTEGER PRIMARY KEY, {col_defs}) ON COMMIT DROP")
+    if df.empty:
+        return 0
+
+    buf = io.StringIO()
+    df[["row_num", *columns]].to_csv(buf, index=False, header=False, na_rep="")
+    buf.seek(0)
+    cur.copy_expert(
+        f"COPY {table} (row_num, {', '.join(columns)}) FROM STDIN WITH (FORMAT csv)",
+        buf,
+    )
+    cur.execute(f"ANALYZE {table}")
+    report_progress(40, f"{len(df)} filas validadas")
+    return len(df)
+
+
+# ── Aplicación set-based con fallback fila a fila ─────────────────────────────
+
+def _run_statements(cur, statements, row_filter: str, params) -> list:
+    returned = []
+    for i, statement in enumerate(statements):
+        cur.execute(statement.format(row_filter=row_filter), params)
+        if i == 0 and cur.description is not None:
+            returned = cur.fetchall()
+    return returned
+
+
+def apply_staged(cur, table: str, statements: list) -> tuple[list, dict]:
+    """
+    Ejecuta `statements` (SQL con `{row_filter}` sobre la tabla temporal con
+    alias `s`) para todas las filas a la vez. Si el lote falla, lo revierte y
+    repite fila a fila para aislar las que PostgreSQL rechaza.
+
+    Retorna (filas RETURNING de la primera sentencia, {row_num: error}).
+    """
+    report_progress(50, "Aplicando importación")
+    cur.execute("SAVEPOINT bulk_apply")
+    try:
+        returned = _run_statements(cur, statements, ROW_FILTER_ALL, None)
+        cur.execute("RELEASE SAVEPOINT bulk_apply")
+        return returned, {}
+    except psycopg2.Error as e:
+        cur.execute("ROLLBACK TO SAVEPOINT bulk_apply")
+        logger.warning("Importación en bloque rechazada (%s); reintentando fila a fila", e.pgcode or e)
+
+    cur.execute(f"SELECT row_num FROM {table} ORDER BY row_num")
+    row_nums = [r[0] for r in cur.fetchall()]
+    returned, errors = [], {}
+    report_every = max(1, len(row_nums) // 20)
+    for i, row_num in enumerate(row_nums, start=1):
+        if i % report_every == 0:
+            report_progress(50 + 45 * i // len(row_nums), f"Aplicando fila a fila ({i}/{len(row_nums)})")
+        cur.execute("SAVEPOINT bulk_row")
+        try:
+            returned += _run_statements(cur, statements, ROW_FILTER_ONE, {"row_num": row_num})
+            cur.execute("RELEASE SAVEPOINT bulk_row")
+        except psycopg2.Error as e:
+            cur.execute("ROLLBACK TO SAVEPOINT bulk_row")
+            errors[row_num] = str(e).strip()
+    cur.execute("RELEASE SAVEPOINT bulk_apply")
+    return returned, errors
+
+
+def to_python(value):
+    """Escalares numpy → tipos nativos (para serializar el detalle de errores)."""
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def log_throughput(kind: str, rows: int, started: float) -> None:
+    elapsed = time.perf_counter() - started
+    logger.info(
+        "Importación %s: %d filas en %.2fs (%.0f filas/s)",
+        kind, rows, elapsed, rows / elapsed if elapsed else 0.0,
+    )
@@ -0,0 +1,38 @@
+from fastapi import APIRouter, Depends, Query
+from fastapi.responses import FileResponse
+
+from app.core.jobs.runner import job_runner
+from app.core.jobs.service import (
+    get_job_artifact_service,
+    get_job_service,
+    list_jobs_service,
+)
+from app.core.security.dependencies import get_current_user
+
+router = APIRouter(prefix="/jobs", tags=["Jobs"])
+
+
+@router.get("")
+def list_my_jobs(
+    limit: int = Query(50, ge=1, le=200),
+    user=Depends(get_current_user),
+):
+    """Jobs del usuario, más recientes primero."""
+    return list_jobs_service(user, limit, job_runner.local_job_ids())
+
+
+@router.get("/{job_id}")
+def get_job(job_id: str, user=Depends(get_current_user)):
+    """Estado, avance y resultado de un job (para polling)."""
+    return get_job_service(job_id, user, job_runner.local_job_ids())
+
+
+@router.get("/{job_id}/download")
+def download_job_artifact(job_id: str, user=Depends(get_current_user)):
+    """Descarga el archivo generado por un job de exportación."""
+    artifact = get_job_artifact_service(job_id, user)
+    return FileResponse(
+        artifact["path"],
+        media_type=artifact["media_type"],
+        filename=artifact["name"],
+    )
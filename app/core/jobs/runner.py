@@ -0,0 +1,201 @@
+"""
+Runner de jobs en segundo plano (importaciones / exportaciones largas).
+
+El endpoint registra el job (PENDING) y responde 202 con su id; un pool de
+hilos lo ejecuta con el contexto del request que lo envió (tenant y
+auditoría), así que sigue corriendo aunque el cliente se desconecte.
+
+  - El servicio que ejecuta el job es el mismo que usa el endpoint síncrono.
+    Si devuelve un StreamingResponse (Excel/PDF) el contenido se guarda como
+    artefacto en JOBS_STORAGE_DIR/<id>/; si devuelve otra cosa se guarda en
+    background_jobs.result.
+  - Los servicios pueden informar avance con report_progress(); fuera de un
+    job es un no-op.
+  - Un hilo de latido actualiza heartbeat_at de los jobs en curso; un job
+    activo sin latido reciente se reporta como interrumpido (service.py).
+"""
+import asyncio
+import contextvars
+import logging
+import os
+import re
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+from fastapi.responses import JSONResponse
+from starlette.responses import StreamingResponse
+
+from app.core.config import settings
+from app.core.jobs import service
+from app.core.tenant_context import get_tenant_db, set_tenant_db
+
+logger = logging.getLogger(__name__)
+
+_current_job: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("_current_job", default=None)
+_FILENAME_RE = re.compile(r'filename="?([^";]+)"?')
+
+
+def report_progress(progress: int, message: Optional[str] = None) -> None:
+    """Actualiza el avance (0-100) del job en curso. Fuera de un job no hace nada."""
+    job_id = _current_job.get()
+    if job_id is None:
+        return
+    try:
+        service.update_progress(job_id, max(0, min(100, int(progress))), message)
+    except Exception as exc:
+        logger.warning("No se pudo registrar el avance del job %s: %s", job_id, exc)
+
+
+async def _write_body(response: StreamingResponse, path: str) -> None:
+    with open(path, "wb") as f:
+        async for chunk in response.body_iterator:
+            f.write(chunk.encode(response.charset) if isinstance(chunk, str) else chunk)
+
+
+def _streaming_artifact(job_id: str, response: StreamingResponse) -> dict:
+    """Vuelca el cuerpo de un StreamingResponse a disco por bloques (corre en el hilo del job)."""
+    match = _FILENAME_RE.search(response.headers.get("content-disposition", ""))
+    name = match.group(1) if match else f"{job_id}.bin"
+    path = service.artifact_path(job_id, name)
+    asyncio.run(_write_body(response, path))
+    return {"path": path, "name": name, "media_type": response.media_type}
+
+
+class JobRunner:
+    def __init__(self, max_workers: int, heartbeat_interval: float):
+        self.runner_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._max_workers = max_workers
+        self._heartbeat_interval = heartbeat_interval
+        self._executor: ThreadPoolExecutor | None = None
+        self._in_flight: dict = {}          # job_id → tenant_db
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._heartbeat: threading.Thread | None = None
+        self._stats = {"submitted": 0, "succeeded": 0, "failed": 0}
+
+    @property
+    def running(self) -> bool:
+        return self._executor is not None
+
+    # ── Ciclo de vida ─────────────────────────────────────────
+    def start(self) -> None:
+        if self.running:
+            return
+        self._stop.clear()
+        self._executor = ThreadPoolExecutor(max_workers=self._max_workers, thread_name_prefix="job-worker")
+        self._heartbeat = threading.Thread(target=self._heartbeat_loop, name="job-heartbeat", daemon=True)
+        self._heartbeat.start()
+
+    def stop(self) -> None:
+        """
+        Hook de shutdown: no espera a los jobs en curso (el proceso se va).
+        Quedan sin latido y se reportan como interrumpidos.
+        """
+        if not self.running:
+            return
+        self._stop.set()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._executor = None
+
+    # ── Envío ─────────────────────────────────────────────────
+    def submit(
+        self,
+        kind: str,
+        fn: Callable,
+        *args,
+        user: Optional[dict] = None,
+        params: Optional[dict] = None,
+        **kwargs,
+    ) -> dict:
+        """Registra el job y lo encola. Retorna la fila recién creada (PENDING)."""
+        created_by = str(user["id"]) if user else None
+        job = service.create_job(kind, params or {}, created_by, self.runner_id)
+        with self._lock:
+            self._stats["submitted"] += 1
+            self._in_flight[job["id"]] = get_tenant_db()
+
+        # copy_context(): el worker ve la DB del tenant y el audit_context del request
+        ctx = contextvars.copy_context()
+        if self.running:
+            self._executor.submit(ctx.run, self._execute, job["id"], kind, fn, args, kwargs)
+        else:
+            # Sin lifespan (scripts, tests): se ejecuta en línea
+            ctx.run(self._execute, job["id"], kind, fn, args, kwargs)
+        return job
+
+    def _execute(self, job_id: str, kind: str, fn: Callable, args: tuple, kwargs: dict) -> None:
+        _current_job.set(job_id)
+        started = time.perf_counter()
+        try:
+            service.mark_running(job_id)
+            result = fn(*args, **kwargs)
+            if isinstance(result, StreamingResponse):
+                service.finish_job(job_id, artifact=_streaming_artifact(job_id, result))
+            else:
+                service.finish_job(job_id, result=result)
+            self._count("succeeded")
+            logger.info("[jobs] %s %s terminado en %.1fs", kind, job_id, time.perf_counter() - started)
+        except Exception as exc:
+            detail = getattr(exc, "detail", None) or str(exc) or exc.__class__.__name__
+            logger.exception("[jobs] %s %s falló: %s", kind, job_id, detail)
+            self._count("failed")
+            try:
+                service.fail_job(job_id, str(detail))
+            except Exception as db_exc:
+                logger.error("[jobs] no se pudo marcar FAILED el job %s: %s", job_id, db_exc)
+        finally:
+            with self._lock:
+                self._in_flight.pop(job_id, None)
+
+    # ── Latido ────────────────────────────────────────────────
+    def _heartbeat_loop(self) -> None:
+        while not self._stop.wait(self._heartbeat_interval):
+            with self._lock:
+                by_tenant: dict = {}
+                for job_id, tenant_db in self._in_flight.items():
+                    by_tenant.setdefault(tenant_db, []).append(job_id)
+            for tenant_db, job_ids in by_tenant.items():
+                try:
+                    set_tenant_db(tenant_db)
+                    service.touch_jobs(job_ids)
+                except Exception as exc:
+                    logger.warning("[jobs] latido falló para %d jobs: %s", len(job_ids), exc)
+
+    # ── Consultas / métricas ──────────────────────────────────
+    def local_job_ids(self) -> set:
+        with self._lock:
+            return set(self._in_flight)
+
+    def _count(self, key: str) -> None:
+        with self._lock:
+            self._stats[key] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            data = dict(self._stats)
+            data["in_flight"] = len(self._in_flight)
+        data["workers"] = self._max_workers
+        data["running"] = self.running
+        return data
+
+
+job_runner = JobRunner(
+    max_workers=settings.JOBS_MAX_WORKERS,
+    heartbeat_interval=settings.JOBS_HEARTBEAT_INTERVAL,
+)
+
+
+def submit_job(kind: str, fn: Callable, *args, user: Optional[dict] = None, params: Optional[dict] = None, **kwargs) -> JSONResponse:
+    """Atajo para routers: encola el job y responde 202 con la URL de consulta."""
+    job = job_runner.submit(kind, fn, *args, user=user, params=params, **kwargs)
+    return JSONResponse(
+        status_code=202,
+        content={
+            "job_id": job["id"],
+            "status": job["status"],
+            "status_url": f"/jobs/{job['id']}",
+        },
+    )
@@ -0,0 +1,253 @@
+"""
+Persistencia de background_jobs (migración 045).
+
+Cada operación abre su propia conexión corta: el job nunca retiene una
+conexión del pool mientras el servicio que ejecuta está trabajando.
+"""
+import json
+import os
+import shutil
+import uuid
+from datetime import datetime, timedelta
+from typing import Optional
+
+from fastapi import HTTPException
+
+from app.core.config import settings
+from app.core.database import db_connection
+
+JOB_COLUMNS = (
+    "id", "kind", "status", "progress", "message", "params", "result", "error",
+    "artifact_path", "artifact_name", "artifact_media_type", "created_by",
+    "runner_id", "created_at", "started_at", "finished_at", "heartbeat_at",
+)
+ACTIVE_STATUSES = ("PENDING", "RUNNING")
+INTERRUPTED_MESSAGE = "Job interrumpido: el proceso que lo ejecutaba dejó de responder"
+
+
+def _to_json(value) -> Optional[str]:
+    if value is None:
+        return None
+    return json.dumps(value, default=str)
+
+
+def _row_to_job(row) -> dict:
+    job = dict(zip(JOB_COLUMNS, row))
+    job["id"] = str(job["id"])
+    for key in ("created_at", "started_at", "finished_at", "heartbeat_at"):
+        if job[key] is not None:
+            job[key] = job[key].isoformat()
+    job["has_artifact"] = bool(job.pop("artifact_path"))
+    return job
+
+
+# ── Escritura (runner) ─────────────────────────────────────────────────────────
+
+def create_job(kind: str, params: dict, created_by: Optional[str], runner_id: str) -> dict:
+    with db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                f"""
+                INSERT INTO background_jobs (kind, params, created_by, runner_id)
+                VALUES (%s, %s, %s, %s)
+                RETURNING {', '.join(JOB_COLUMNS)}
+                """,
+                (kind, _to_json(params or {}), created_by, runner_id),
+            )
+            row = cur.fetchone()
+        conn.commit()
+    return _row_to_job(row)
+
+
+def mark_running(job_id: str) -> None:
+    with db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                UPDATE background_jobs
+                SET status = 'RUNNING', started_at = now(), heartbeat_at = now()
+                WHERE id = %s
+            """, (job_id,))
+        conn.commit()
+
+
+def update_progress(job_id: str, progress: int, message: Optional[str] = None) -> None:
+    with db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                UPDATE background_jobs
+                SET progress = %s, message = COALESCE(%s, message), heartbeat_at = now()
+                WHERE id = %s AND status = 'RUNNING'
+            """, (progress, message, job_id))
+        conn.commit()
+
+
+def touch_jobs(job_ids: list) -> None:
+    """Latido de los jobs de este proceso (encolados o en curso) de un mismo tenant."""
+    with db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                UPDATE background_jobs
+                SET heartbeat_at = now()
+                WHERE id = ANY(%s::uuid[]) AND status IN ('PENDING', 'RUNNING')
+            """, (job_ids,))
+        conn.commit()
+
+
+def finish_job(job_id: str, result=None, artifact: Optional[dict] = None) -> None:
+    artifact = artifact or {}
+    with db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                UPDATE background_jobs
+                SET status = 'SUCCEEDED', progress = 100, finished_at = now(), heartbeat_at = now(),
+                    result = %s, artifact_path = %s, artifact_name = %s, artifact_media_type = %s
+                WHERE id = %s
+            """, (
+                _to_json(result),
+                artifact.get("path"), artifact.get("name"), artifact.get("media_type"),
+                job_id,
+            ))
+        conn.commit()
+
+
+def fail_job(job_id: str, error: str) -> None:
+    with db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                UPDATE background_jobs
+                SET status = 'FAILED', finished_at = now(), heartbeat_at = now(), error = %s
+                WHERE id = %s
+            """, (error[:4000], job_id))
+        conn.commit()
+
+
+# ── Artefactos en disco ────────────────────────────────────────────────────────
+
+def artifact_dir(job_id: str) -> str:
+    return os.path.join(settings.JOBS_STORAGE_DIR, job_id)
+
+
+def artifact_path(job_id: str, filename: str) -> str:
+    """Ruta donde se guarda el archivo del job (crea su directorio)."""
+    directory = artifact_dir(job_id)
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, os.path.basename(filename))
+
+
+def cleanup_expired_jobs(retention_hours: int) -> tuple[int, int]:
+    """
+    Borra los jobs terminados hace más de retention_hours y sus artefactos.
+    Retorna (filas eliminadas, directorios eliminados).
+    """
+    with db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                DELETE FROM background_jobs
+                WHERE status NOT IN ('PENDING', 'RUNNING')
+                  AND finished_at < now() - make_interval(hours => %s)
+            """, (retention_hours,))
+            deleted = cur.rowcount
+        conn.commit()
+
+    # El directorio de artefactos es compartido por todos los tenants: se
+    # limpia por antigüedad aunque la fila viva en otra base.
+    removed = 0
+    root = settings.JOBS_STORAGE_DIR
+    if os.path.isdir(root):
+        cutoff = (datetime.now() - timedelta(hours=retention_hours)).timestamp()
+        for name in os.listdir(root):
+            path = os.path.join(root, name)
+            if os.path.isdir(path) and os.path.getmtime(path) < cutoff:
+                shutil.rmtree(path, ignore_errors=True)
+                removed += 1
+    return deleted, removed
+
+
+# ── Lectura (API) ──────────────────────────────────────────────────────────────
+
+def _fetch_job(job_id: str):
+    with db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                f"SELECT {', '.join(JOB_COLUMNS)} FROM background_jobs WHERE id = %s",
+                (job_id,),
+            )
+            return cur.fetchone()
+
+
+def _expire_if_stale(row, local_job_ids) -> tuple:
+    """
+    Un job activo sin latido reciente (y que no corre en este proceso) quedó
+    huérfano por un reinicio/caída del worker: se marca FAILED.
+    """
+    job = dict(zip(JOB_COLUMNS, row))
+    if job["status"] not in ACTIVE_STATUSES or str(job["id"]) in local_job_ids:
+        return row
+    with db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                f"""
+                UPDATE background_jobs
+                SET status = 'FAILED', finished_at = now(), error = %s
+                WHERE id = %s
+                  AND status IN ('PENDING', 'RUNNING')
+                  AND COALESCE(heartbeat_at, created_at) < now() - make_interval(secs => %s)
+                RETURNING {', '.join(JOB_COLUMNS)}
+                """,
+                (INTERRUPTED_MESSAGE, job["id"], settings.JOBS_STALE_AFTER),
+            )
+            expired = cur.fetchone()
+        conn.commit()
+    return expired or row
+
+
+def _check_owner(row, user: dict) -> None:
+    if not row:
+        raise HTTPException(404, "Job no encontrado")
+    created_by = row[JOB_COLUMNS.index("created_by")]
+    if created_by != str(user["id"]) and user.get("role") != "superadmin":
+        raise HTTPException(404, "Job no encontrado")
+
+
+def _load_owned_job(job_id: str, user: dict, local_job_ids=()):
+    try:
+        uuid.UUID(job_id)
+    except ValueError:
+        raise HTTPException(404, "Job no encontrado")
+    row = _fetch_job(job_id)
+    _check_owner(row, user)
+    return _expire_if_stale(row, local_job_ids)
+
+
+def get_job_service(job_id: str, user: dict, local_job_ids=()) -> dict:
+    return _row_to_job(_load_owned_job(job_id, user, local_job_ids))
+
+
+def list_jobs_service(user: dict, limit: int = 50, local_job_ids=()) -> list:
+    with db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                f"""
+                SELECT {', '.join(JOB_COLUMNS)}
+                FROM background_jobs
+                WHERE created_by = %s
+                ORDER BY created_at DESC
+                LIMIT %s
+                """,
+                (str(user["id"]), limit),
+            )
+            rows = cur.fetchall()
+    return [_row_to_job(_expire_if_stale(r, local_job_ids)) for r in rows]
+
+
+def get_job_artifact_service(job_id: str, user: dict) -> dict:
+    job = dict(zip(JOB_COLUMNS, _load_owned_job(job_id, user)))
+    if job["status"] != "SUCCEEDED" or not job["artifact_path"]:
+        raise HTTPException(409, "El job no tiene un archivo disponible")
+    if not os.path.exists(job["artifact_path"]):
+        raise HTTPException(410, "El archivo del job ya no está disponible")
+    return {
+        "path": job["artifact_path"],
+        "name": job["artifact_name"],
+        "media_type": job["artifact_media_type"] or "application/octet-stream",
+    }
@@ -0,0 +1,278 @@
+"""
+Códigos QR y hojas de etiquetas imprimibles (materiales y lotes).
+
+  - qr_png(): PNG del QR con caché en disco direccionada por contenido
+    (sha256 de payload + color + tamaño) en QR_CACHE_DIR. Un acierto toca el
+    mtime del archivo; al superar QR_CACHE_MAX_MB se borran los menos usados
+    (LRU por mtime) hasta bajar al 80 %.
+  - render_many(): lo mismo para un lote; los QR que faltan en caché se
+    dibujan en un pool de procesos (LABEL_RENDER_WORKERS) cuando son muchos.
+  - label_sheet_pdf(): hoja A4 de 3 × 7 etiquetas (63,5 × 38,1 mm) con el QR,
+    el código y la descripción.
+
+Este módulo no importa la capa de datos: los procesos del pool solo cargan
+qrcode/Pillow y la configuración.
+"""
+import hashlib
+import io
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+
+import qrcode
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+QR_FILL = "#0B2E33"
+QR_BOX_SIZE = 10
+_QR_BORDER = 4
+_RENDER_VERSION = "1"        # cambiar si cambia el dibujo: invalida la caché
+_POOL_MIN_RENDERS = 32       # menos faltantes que esto se dibujan en el propio hilo
+
+
+def render_qr(payload: str, fill: str = QR_FILL, box_size: int = QR_BOX_SIZE) -> bytes:
+    """Dibuja el QR como PNG. Función de módulo: se ejecuta en el pool de procesos."""
+    qr = qrcode.QRCode(
+        version=1,
+        error_correction=qrcode.constants.ERROR_CORRECT_H,
+        box_size=box_size,
+        border=_QR_BORDER,
+    )
+    qr.add_data(payload)
+    qr.make(fit=True)
+    img = qr.make_image(fill_color=fill, back_color="white")
+    buf = io.BytesIO()
+    img.save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def _render_args(args: tuple) -> bytes:
+    return render_qr(*args)
+
+
+def qr_key(payload: str, fill: str = QR_FILL, box_size: int = QR_BOX_SIZE) -> str:
+    raw = f"{_RENDER_VERSION}|{fill.lower()}|{box_size}|{payload}"
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+# ── Caché en disco ─────────────────────────────────────────────────────────────
+
+class _DiskCache:
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._size: Optional[int] = None     # se calcula en la primera escritura
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evicted": 0}
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.png")
+
+    def get(self, key: str) -> Optional[bytes]:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self._stats["misses"] += 1
+            return None
+        with self._lock:
+            self._stats["hits"] += 1
+        return data
+
+    def put(self, key: str, data: bytes) -> None:
+        path = self._path(key)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.part"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except OSError as exc:
+            # Sin caché (disco lleno, permisos) el QR se sigue sirviendo
+            logger.warning("[labels] no se pudo guardar %s en caché: %s", key, exc)
+            return
+        with self._lock:
+            if self._size is None:
+                self._size = sum(size for _m, size, _p in self._entries())
+            else:
+                self._size += len(data)
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _entries(self) -> list[tuple[float, int, str]]:
+        entries = []
+        if not os.path.isdir(self.directory):
+            return entries
+        for sub in os.scandir(self.directory):
+            if not sub.is_dir():
+                continue
+            for f in os.scandir(sub.path):
+                if f.name.endswith(".png"):
+                    st = f.stat()
+                    entries.append((st.st_mtime, st.st_size, f.path))
+        return entries
+
+    def _evict(self) -> None:
+        # Otros workers escriben en el mismo directorio: se parte del disco, no del contador
+        entries = sorted(self._entries())
+        total = sum(size for _m, size, _p in entries)
+        target = int(self.max_bytes * 0.8)
+        for _mtime, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+                self._stats["evicted"] += 1
+            except FileNotFoundError:
+                pass
+        self._size = total
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self._stats, "bytes": self._size, "max_bytes": self.max_bytes}
+
+
+_cache = _DiskCache(settings.QR_CACHE_DIR, settings.QR_CACHE_MAX_MB * 1024 * 1024)
+
+
+def qr_png(payload: str, fill: str = QR_FILL, box_size: int = QR_BOX_SIZE) -> tuple[bytes, str]:
+    """(PNG, clave) del QR; la clave sirve como ETag."""
+    key = qr_key(payload, fill, box_size)
+    data = _cache.get(key)
+    if data is None:
+        data = render_qr(payload, fill, box_size)
+        _cache.put(key, data)
+    return data, key
+
+
+# ── Lotes (pool de procesos) ───────────────────────────────────────────────────
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn: el proceso del servidor tiene hilos (pools de DB, scheduler) y fork no es seguro
+            _pool = ProcessPoolExecutor(
+                max_workers=settings.LABEL_RENDER_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _pool
+
+
+def _reset_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def render_many(payloads: list[str], fill: str = QR_FILL, box_size: int = QR_BOX_SIZE) -> list[bytes]:
+    """PNG de cada payload (en el mismo orden); dibuja solo lo que no está en caché."""
+    keys = [qr_key(p, fill, box_size) for p in payloads]
+    found: dict[str, bytes] = {}
+    missing: dict[str, str] = {}
+    for key, payload in zip(keys, payloads):
+        if key in found or key in missing:
+            continue
+        data = _cache.get(key)
+        if data is None:
+            missing[key] = payload
+        else:
+            found[key] = data
+
+    if missing:
+        args = [(p, fill, box_size) for p in missing.values()]
+        rendered = None
+        if len(args) >= _POOL_MIN_RENDERS and settings.LABEL_RENDER_WORKERS > 0:
+            try:
+                chunk = max(1, len(args) // (settings.LABEL_RENDER_WORKERS * 4))
+                rendered = list(_get_pool().map(_render_args, args, chunksize=chunk))
+            except BrokenProcessPool as exc:
+                logger.warning("[labels] pool de render caído, se dibuja en el hilo: %s", exc)
+                _reset_pool()
+        if rendered is None:
+            rendered = [render_qr(*a) for a in args]
+        for key, data in zip(missing, rendered):
+            _cache.put(key, data)
+            found[key] = data
+    return [found[k] for k in keys]
+
+
+# ── Hoja de etiquetas (PDF) ────────────────────────────────────────────────────
+
+def label_sheet_pdf(labels: list[dict], images: list[bytes]) -> bytes:
+    """
+    labels: [{"title", "subtitle", "detail"}] en el orden de `images` (PNG del QR).
+    Formato A4, 3 columnas × 7 filas (etiquetas 63,5 × 38,1 mm tipo L7160).
+    """
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.units import mm
+    from reportlab.lib.utils import ImageReader, simpleSplit
+    from reportlab.pdfgen import canvas
+
+    cols, rows = 3, 7
+    label_w, label_h = 63.5 * mm, 38.1 * mm
+    page_w, page_h = A4
+    margin_x = (page_w - cols * label_w - (cols - 1) * 2.5 * mm) / 2
+    margin_y = (page_h - rows * label_h) / 2
+    qr_side = label_h - 6 * mm
+    text_w = label_w - qr_side - 7 * mm
+
+    buf = io.BytesIO()
+    pdf = canvas.Canvas(buf, pagesize=A4)
+    per_page = cols * rows
+    readers: dict[int, ImageReader] = {}
+    for i, (label, png) in enumerate(zip(labels, images)):
+        if i and i % per_page == 0:
+            pdf.showPage()
+        slot = i % per_page
+        col, row = slot % cols, slot // cols
+        x = margin_x + col * (label_w + 2.5 * mm)
+        y = page_h - margin_y - (row + 1) * label_h
+
+        # Mismo QR repetido (varias etiquetas del mismo material) → una sola imagen en el PDF
+        if id(png) not in readers:
+            readers[id(png)] = ImageReader(io.BytesIO(png))
+        reader = readers[id(png)]
+        pdf.drawImage(reader, x + 3 * mm, y + 3 * mm, qr_side, qr_side)
+
+        tx = x + qr_side + 5 * mm
+        ty = y + label_h - 7 * mm
+        pdf.setFont("Helvetica-Bold", 9)
+        title = simpleSplit(label.get("title") or "", "Helvetica-Bold", 9, text_w)
+        if title:
+            pdf.drawString(tx, ty, title[0])
+        pdf.setFont("Helvetica", 7)
+        for line in simpleSplit(label.get("subtitle") or "", "Helvetica", 7, text_w)[:3]:
+            ty -= 3.2 * mm
+            pdf.drawString(tx, ty, line)
+        if label.get("detail"):
+            pdf.setFont("Helvetica-Oblique", 6.5)
+            for line in simpleSplit(label["detail"], "Helvetica-Oblique", 6.5, text_w)[:2]:
+                ty -= 3 * mm
+                pdf.drawString(tx, ty, line)
+    pdf.save()
+    return buf.getvalue()
+
+
+def stats() -> dict:
+    return _cache.stats()
+
+
+def shutdown() -> None:
+    _reset_pool()
@@ -1,18 +1,64 @@
-import psycopg2
+import threading
 from contextlib import contextmanager
+
+import psycopg2
+from psycopg2.pool import PoolError, ThreadedConnectionPool
+
 from app.core.config import settings
 from app.core.database import _parse_db_url
 
+# Pool propio para la Master DB (registro de tenants). Se crea en el primer uso
+# para no abrir conexiones al importar (scripts, migraciones).
+_master_pool: ThreadedConnectionPool | None = None
+_master_pool_lock = threading.Lock()
+# ThreadedConnectionPool falla de inmediato (PoolError) si está agotado: el
+# semáforo hace esperar hasta MASTER_DB_POOL_WAIT_TIMEOUT a que se libere una.
+_master_slots = threading.BoundedSemaphore(settings.MASTER_DB_POOL_MAX)
+
+
+def _get_master_pool() -> ThreadedConnectionPool:
+    global _master_pool
+    if _master_pool is None:
+        with _master_pool_lock:
+            if _master_pool is None:
+                url = settings.MASTER_DATABASE_URL or settings.DATABASE_URL
+                _master_pool = ThreadedConnectionPool(
+                    settings.MASTER_DB_POOL_MIN,
+                    settings.MASTER_DB_POOL_MAX,
+                    **_parse_db_url(url),
+                )
+    return _master_pool
+
 
 @contextmanager
 def master_db_connection():
-    url = settings.MASTER_DATABASE_URL or settings.DATABASE_URL
-    _db = _parse_db_url(url)
-    conn = psycopg2.connect(**_db)
+    if not _master_slots.acquire(timeout=settings.MASTER_DB_POOL_WAIT_TIMEOUT):
+        raise psycopg2.OperationalError(
+            f"Pool de la Master DB agotado: sin conexión libre tras "
+            f"{settings.MASTER_DB_POOL_WAIT_TIMEOUT}s"
+        )
     try:
-        yield conn
-    except Exception:
-        conn.rollback()
-        raise
+        pool = _get_master_pool()
+        try:
+            conn = pool.getconn()
+        except PoolError as e:
+            raise psycopg2.OperationalError(f"Pool de la Master DB agotado: {e}")
+
+        try:
+            yield conn
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            # Conexiones rotas (reinicio del servidor, timeout) no vuelven al pool
+            pool.putconn(conn, close=bool(conn.closed))
     finally:
-        conn.close()
+        _master_slots.release()
+
+
+def close_master_pool() -> None:
+    global _master_pool
+    with _master_pool_lock:
+        if _master_pool is not None:
+            _master_pool.closeall()
+            _master_pool = None
@@ -0,0 +1,74 @@
+"""
+Badges del sidebar que se empujan por /notifications/stream.
+
+Cada badge define la clave del contador que ve un usuario (None = no aplica)
+y el COUNT que da su valor al primer suscriptor y en cada resincronización.
+Los deltas de esas mismas claves los emiten los triggers de la migración 054
+en las tablas de cada módulo: cualquier escritura (servicio, importación,
+job, SQL directo) llega a los clientes sin tocar los servicios.
+
+Los COUNT son los mismos de los endpoints */pending-count, que se mantienen
+para clientes sin SSE.
+"""
+from typing import Optional
+
+# prefijo de clave → (SQL estilo psycopg2, ¿recibe el argumento de la clave?)
+_COUNT_SQL = {
+    "planificacion": ("""
+        SELECT COUNT(*) FROM planificacion_semanal
+        WHERE estado != 'Completado'
+          AND (responsable_id = %s::uuid OR responsables_ids LIKE '%%' || %s || '%%')
+    """, 2),
+    "canal": ("""
+        SELECT COUNT(*) FROM canal_solicitudes
+        WHERE status = 'PENDIENTE' AND (%s = '*' OR to_module = %s)
+    """, 2),
+    "gerencia": ("SELECT COUNT(*) FROM aprobaciones_gerencia WHERE estado = 'PENDIENTE'", 0),
+    "requests": ("SELECT COUNT(*) FROM material_requests WHERE status = 'PENDING'", 0),
+}
+
+
+def _planificacion_key(user: dict) -> Optional[str]:
+    # El superadmin no es un usuario del tenant
+    if user.get("role") == "superadmin":
+        return None
+    return f"planificacion:{user['id']}"
+
+
+def _canal_key(user: dict) -> Optional[str]:
+    module = user.get("primary_module", "administracion")
+    return "canal:*" if module == "admin" else f"canal:{module}"
+
+
+def _gerencia_key(user: dict) -> Optional[str]:
+    return "gerencia"
+
+
+def _requests_key(user: dict) -> Optional[str]:
+    # Mismo permiso que /material-requests (listar / aprobar)
+    return "requests" if "logistics:stock:move" in user.get("permissions", []) else None
+
+
+BADGES = {
+    "planificacion": _planificacion_key,
+    "canal":         _canal_key,
+    "gerencia":      _gerencia_key,
+    "requests":      _requests_key,
+}
+
+
+def keys_for(user: dict) -> dict[str, str]:
+    """{badge: clave del contador} de los badges que aplican al usuario."""
+    keys = {}
+    for badge, key_fn in BADGES.items():
+        key = key_fn(user)
+        if key is not None:
+            keys[badge] = key
+    return keys
+
+
+def count_query(key: str) -> tuple[str, tuple]:
+    """(SQL, params) del valor actual de una clave."""
+    prefix, _, arg = key.partition(":")
+    sql, n_args = _COUNT_SQL[prefix]
+    return sql, (arg,) * n_args
@@ -0,0 +1,264 @@
+"""
+Hub de badges en vivo: un LISTEN por tenant y worker, fan-out a los streams SSE.
+
+  - El primer suscriptor de un tenant abre una conexión asyncpg dedicada (fuera
+    de los pools) con LISTEN badges; cuando se va el último, se cierra.
+  - counts guarda el valor vigente de cada clave con al menos un suscriptor.
+    Un NOTIFY {"k", "d"} (migración 054) de una clave conocida suma el delta y
+    despierta a sus suscriptores; las claves sin suscriptores se ignoran. Sin
+    escrituras no hay consultas: un cliente inactivo no cuesta nada.
+  - Cada NOTIFY_RESYNC_INTERVAL segundos, y al reconectar el LISTEN (los NOTIFY
+    emitidos mientras estuvo caído se pierden), se recalculan las claves con
+    suscriptores: un COUNT por clave, no por cliente. Un delta que cruza el
+    COUNT inicial de una clave nueva queda corregido en esa pasada.
+  - Cada suscriptor acumula solo el último valor por badge: una ráfaga de
+    cambios se envía como un único evento.
+
+Todo corre en el event loop de uvicorn, sin locks.
+"""
+import asyncio
+import json
+import logging
+from typing import AsyncIterator, Awaitable, Callable, Optional
+
+import asyncpg
+
+from app.core.async_database import async_db_connection, pg_sql
+from app.core.config import settings
+from app.core.database import _parse_db_url
+from app.core.notifications import badges
+from app.core.tenant_context import get_tenant_db, set_tenant_db
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "badges"
+
+
+class Subscriber:
+    def __init__(self, tenant_db: Optional[str], keys: dict[str, str]):
+        self.tenant_db = tenant_db
+        self.keys = keys                       # badge → clave del contador
+        self.values: dict[str, int] = {}
+        self.changed: set[str] = set()         # badges pendientes de enviar
+        self.wakeup = asyncio.Event()
+        self.closed = False
+
+    def update(self, key: str, value: int) -> None:
+        for badge, k in self.keys.items():
+            if k == key and self.values.get(badge) != value:
+                self.values[badge] = value
+                self.changed.add(badge)
+                self.wakeup.set()
+
+    def take(self) -> dict[str, int]:
+        changes = {badge: self.values[badge] for badge in self.changed}
+        self.changed.clear()
+        self.wakeup.clear()
+        return changes
+
+    def close(self) -> None:
+        self.closed = True
+        self.wakeup.set()
+
+
+class _TenantHub:
+    def __init__(self, tenant_db: Optional[str]):
+        self.tenant_db = tenant_db
+        self.by_key: dict[str, set[Subscriber]] = {}
+        self.counts: dict[str, int] = {}
+        self.listening = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+
+    # ── LISTEN ────────────────────────────────────────────────────────────────
+
+    async def run(self) -> None:
+        # La tarea tiene su propia copia del contexto: fijar la DB para async_db_connection
+        set_tenant_db(self.tenant_db)
+        db_config = _parse_db_url(self.tenant_db or settings.DATABASE_URL)
+        backoff = 1
+        first = True
+        while True:
+            conn = None
+            lost = asyncio.Event()
+            try:
+                conn = await asyncpg.connect(**db_config, timeout=settings.DB_POOL_WAIT_TIMEOUT)
+                conn.add_termination_listener(lambda _conn: lost.set())
+                await conn.add_listener(CHANNEL, self._on_notify)
+                if not first:
+                    _stats["reconnects"] += 1
+                first = False
+                backoff = 1
+                self.listening.set()
+                await self._resync()
+                while not lost.is_set():
+                    try:
+                        await asyncio.wait_for(lost.wait(), settings.NOTIFY_RESYNC_INTERVAL)
+                    except asyncio.TimeoutError:
+                        await self._resync()
+                logger.warning("[notifications] LISTEN de '%s' perdido, reconectando", db_config["database"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                logger.warning("[notifications] LISTEN de '%s' falló: %s", db_config["database"], exc)
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+            finally:
+                self.listening.clear()
+                if conn is not None and not conn.is_closed():
+                    try:
+                        await asyncio.wait_for(conn.close(), timeout=5)
+                    except Exception:
+                        conn.terminate()
+
+    def _on_notify(self, _conn, _pid, _channel, payload: str) -> None:
+        _stats["notifications"] += 1
+        try:
+            msg = json.loads(payload)
+            key, delta = msg["k"], int(msg["d"])
+        except (ValueError, KeyError, TypeError):
+            logger.warning("[notifications] payload inválido: %r", payload)
+            return
+        if key in self.counts:
+            self.counts[key] += delta
+            self._publish(key)
+
+    def _publish(self, key: str) -> None:
+        value = self.counts[key]
+        for sub in self.by_key.get(key, ()):
+            sub.update(key, value)
+
+    # ── Contadores ────────────────────────────────────────────────────────────
+
+    async def _count(self, key: str) -> int:
+        sql, params = badges.count_query(key)
+        async with async_db_connection() as conn:
+            return int(await conn.fetchval(pg_sql(sql), *params))
+
+    async def _resync(self) -> None:
+        for key in list(self.counts):
+            try:
+                value = await self._count(key)
+            except Exception as exc:
+                logger.warning("[notifications] no se pudo recalcular %s: %s", key, exc)
+                continue
+            if key in self.counts:
+                self.counts[key] = value
+                self._publish(key)
+        if self.counts:
+            _stats["resyncs"] += 1
+
+    # ── Suscriptores ──────────────────────────────────────────────────────────
+
+    async def add(self, sub: Subscriber) -> None:
+        for key in sub.keys.values():
+            self.by_key.setdefault(key, set()).add(sub)
+        if self.task is None:
+            self.task = asyncio.create_task(self.run())
+        # COUNT después del LISTEN: un cambio confirmado entre ambos no se pierde
+        try:
+            await asyncio.wait_for(self.listening.wait(), settings.DB_POOL_WAIT_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.warning("[notifications] LISTEN no disponible; se envía el conteo actual")
+        for key in set(sub.keys.values()):
+            if key not in self.counts:
+                value = await self._count(key)
+                # Otro suscriptor pudo cargarla (o irse el último) mientras se contaba
+                if key in self.by_key:
+                    self.counts.setdefault(key, value)
+            sub.update(key, self.counts.get(key, 0))
+
+    def remove(self, sub: Subscriber) -> bool:
+        """Quita al suscriptor; True si el hub quedó vacío."""
+        for key in sub.keys.values():
+            subs = self.by_key.get(key)
+            if subs is None:
+                continue
+            subs.discard(sub)
+            if not subs:
+                del self.by_key[key]
+                self.counts.pop(key, None)
+        return not self.by_key
+
+    def stop(self) -> None:
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+        for subs in self.by_key.values():
+            for sub in subs:
+                sub.close()
+
+
+_hubs: dict[Optional[str], _TenantHub] = {}
+_stats = {"notifications": 0, "resyncs": 0, "reconnects": 0, "events_sent": 0}
+
+
+async def subscribe(keys: dict[str, str]) -> Subscriber:
+    """Registra un stream del tenant actual y carga el valor de sus badges."""
+    tenant_db = get_tenant_db()
+    sub = Subscriber(tenant_db, keys)
+    hub = _hubs.get(tenant_db)
+    if hub is None:
+        hub = _hubs[tenant_db] = _TenantHub(tenant_db)
+    try:
+        await hub.add(sub)
+    except BaseException:
+        unsubscribe(sub)
+        raise
+    return sub
+
+
+def unsubscribe(sub: Subscriber) -> None:
+    hub = _hubs.get(sub.tenant_db)
+    if hub is not None and hub.remove(sub):
+        hub.stop()
+        del _hubs[sub.tenant_db]
+
+
+def _event(changes: dict[str, int]) -> str:
+    _stats["events_sent"] += 1
+    return f"event: badges\ndata: {json.dumps(changes)}\n\n"
+
+
+async def stream(sub: Subscriber, is_disconnected: Callable[[], Awaitable[bool]]) -> AsyncIterator[str]:
+    """Cuerpo SSE: estado inicial completo y luego solo los badges que cambian."""
+    try:
+        yield f"retry: {settings.NOTIFY_RETRY_MS}\n\n"
+        yield _event(sub.take())
+        while not sub.closed:
+            try:
+                await asyncio.wait_for(sub.wakeup.wait(), settings.NOTIFY_HEARTBEAT)
+            except asyncio.TimeoutError:
+                if await is_disconnected():
+                    break
+                # Comentario SSE: mantiene viva la conexión en proxies y detecta clientes caídos
+                yield ": ping\n\n"
+                continue
+            changes = sub.take()
+            if changes:
+                yield _event(changes)
+    finally:
+        unsubscribe(sub)
+
+
+def stats() -> dict:
+    return {
+        **_stats,
+        "tenants": len(_hubs),
+        "subscribers": sum(
+            len({sub for subs in hub.by_key.values() for sub in subs}) for hub in _hubs.values()
+        ),
+        "keys": sum(len(hub.counts) for hub in _hubs.values()),
+    }
+
+
+async def shutdown() -> None:
+    hubs = list(_hubs.values())
+    _hubs.clear()
+    for hub in hubs:
+        task = hub.task
+        hub.stop()
+        if task is not None:
+            try:
+                await asyncio.wait_for(task, timeout=5)
+            except (asyncio.CancelledError, Exception):
+                pass
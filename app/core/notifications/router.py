@@ -0,0 +1,56 @@
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+
+from app.core.config import settings
+from app.core.notifications import badges, hub
+from app.core.security.auth import STREAM_TICKET_PURPOSE, create_stream_ticket
+from app.core.security.dependencies import get_current_user, get_ticket_user
+from app.core.tenant_middleware import request_tenant_slug
+
+router = APIRouter(prefix="/notifications", tags=["Notificaciones"])
+
+
+@router.post("/stream-ticket")
+def badge_stream_ticket(request: Request, user=Depends(get_current_user)):
+    """
+    Ticket para abrir /notifications/stream con EventSource, que no permite
+    cabeceras: vale NOTIFY_STREAM_TICKET_TTL segundos, solo para el stream y
+    solo en el tenant de X-Tenant-ID. Así el JWT de acceso no viaja en la URL.
+    """
+    return {
+        "ticket": create_stream_ticket(user, request.headers.get("X-Tenant-ID")),
+        "expires_in": settings.NOTIFY_STREAM_TICKET_TTL,
+    }
+
+
+@router.get("/stream")
+async def badge_stream(request: Request, ticket: Optional[str] = Query(None)):
+    """
+    Server-Sent Events con los badges del usuario (planificación, canal,
+    gerencia, solicitudes de material). Evento `badges`: primero todos los
+    valores, luego solo los que cambian. Reemplaza el polling de */pending-count.
+
+    EventSource: /notifications/stream?ticket=…&tenant=<slug>, con un ticket
+    de POST /notifications/stream-ticket. Un cliente basado en fetch puede
+    usar las cabeceras Authorization y X-Tenant-ID de siempre.
+    La autenticación se hace una vez, al abrir el stream.
+    """
+    auth = request.headers.get("authorization", "")
+    if auth.lower().startswith("bearer "):
+        user = await run_in_threadpool(get_current_user, request, auth[7:])
+    elif ticket:
+        user = await run_in_threadpool(
+            get_ticket_user, request, ticket, STREAM_TICKET_PURPOSE, request_tenant_slug(request),
+        )
+    else:
+        raise HTTPException(401, "Credenciales inválidas", headers={"WWW-Authenticate": "Bearer"})
+
+    sub = await hub.subscribe(badges.keys_for(user))
+    return StreamingResponse(
+        hub.stream(sub, request.is_disconnected),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
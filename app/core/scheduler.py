@@ -1,67 +1,148 @@
 """
 Scheduler de tareas periódicas del backend.
-Jobs registrados:
-  - cleanup_refresh_tokens  : diario 02:00 — elimina tokens expirados/revocados
-  - cleanup_audit_logs      : semanal domingo 03:00 — retención 90 días
+Jobs registrados (los marcados [tenant] corren en TODAS las DBs de tenant vía
+app/core/tenant_scheduler.py: un turno por job y tenant aunque haya varios
+workers uvicorn, duración y filas afectadas en scheduler_job_runs):
+  - cleanup_refresh_tokens   [tenant]: diario 02:00 — elimina tokens expirados/revocados
+  - maintain_audit_partitions[tenant]: diario 03:00 — crea los meses siguientes de audit_logs y
+                              retira (archiva/borra) las particiones vencidas (AUDIT_RETENTION_DAYS)
+  - reconcile_stock_balances [tenant]: diario 04:00 — verifica el snapshot stock_balances
+                              (base de vw_stock_availability) y lo reconstruye si difiere
+  - cleanup_background_jobs  [tenant]: cada hora — borra jobs terminados y sus archivos (JOBS_RETENTION_HOURS)
+  - expire_stock_reservations[tenant]: cada RESERVATION_EXPIRY_INTERVAL s — expira reservas BLOCKED
+                              vencidas (lotes con SKIP LOCKED)
+  - reap_idle_db_connections : cada minuto — cierra conexiones ociosas de los pools de ESTE proceso
+  - cleanup_scheduler_runs   : diario 05:00 — retención de scheduler_job_runs (Master DB)
 """
 import logging
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
-from app.core.database import db_connection
+from apscheduler.triggers.interval import IntervalTrigger
+from app.core import tenant_scheduler
+from app.core.audit import retention as audit_retention
+from app.core.config import settings
+from app.core.database import db_connection, reap_idle_connections
+from app.core.jobs.service import cleanup_expired_jobs
+from app.modules.logistics.service import (
+    rebuild_stock_balances_service,
+    verify_stock_balances_service,
+)
+from app.modules.requests.service import expire_reservations_service
 
 logger = logging.getLogger(__name__)
 
 scheduler = BackgroundScheduler(timezone="America/Lima")
 
+_DAY = 24 * 3600
 
-def cleanup_refresh_tokens():
+
+# ── Jobs por tenant: corren con la DB del tenant fijada y retornan filas afectadas ──
+
+def cleanup_refresh_tokens() -> int:
+    with db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                DELETE FROM refresh_tokens
+                WHERE expires_at < NOW()
+                   OR revoked = TRUE
+            """)
+            deleted = cur.rowcount
+        conn.commit()
+    return deleted
+
+
+def maintain_audit_partitions() -> int:
+    return audit_retention.maintain_partitions()
+
+
+def reconcile_stock_balances() -> int:
+    report = verify_stock_balances_service()
+    if report["ok"]:
+        return 0
+    logger.warning(
+        "[scheduler] reconcile_stock_balances: %d saldos difieren, reconstruyendo",
+        len(report["mismatches"]),
+    )
+    result = rebuild_stock_balances_service()
+    return result["balances"]
+
+
+def cleanup_background_jobs() -> int:
+    deleted, _removed = cleanup_expired_jobs(settings.JOBS_RETENTION_HOURS)
+    return deleted
+
+
+def expire_stock_reservations() -> int:
+    result = expire_reservations_service(
+        batch_size=settings.RESERVATION_EXPIRY_BATCH,
+        max_batches=settings.RESERVATION_EXPIRY_MAX_BATCHES,
+    )
+    return result["expired_count"]
+
+
+# ── Jobs de proceso / Master DB ────────────────────────────────────────────────
+
+def reap_idle_db_connections():
     try:
-        with db_connection() as conn:
-            with conn.cursor() as cur:
-                cur.execute("""
-                    DELETE FROM refresh_tokens
-                    WHERE expires_at < NOW()
-                       OR revoked = TRUE
-                """)
-                deleted = cur.rowcount
-            conn.commit()
-        logger.info("[scheduler] cleanup_refresh_tokens: %d tokens eliminados", deleted)
+        closed = reap_idle_connections()
+        if closed:
+            logger.info("[scheduler] reap_idle_db_connections: %d conexiones ociosas cerradas", closed)
     except Exception as e:
-        logger.error("[scheduler] cleanup_refresh_tokens falló: %s", e)
+        logger.error("[scheduler] reap_idle_db_connections falló: %s", e)
 
 
-def cleanup_audit_logs():
+def cleanup_scheduler_runs():
     try:
-        with db_connection() as conn:
-            with conn.cursor() as cur:
-                cur.execute("""
-                    DELETE FROM audit_logs
-                    WHERE created_at < NOW() - INTERVAL '90 days'
-                """)
-                deleted = cur.rowcount
-            conn.commit()
-        logger.info("[scheduler] cleanup_audit_logs: %d registros eliminados (>90 días)", deleted)
+        deleted = tenant_scheduler.cleanup_job_runs(settings.SCHEDULER_RUNS_RETENTION_DAYS)
+        logger.info("[scheduler] cleanup_scheduler_runs: %d ejecuciones eliminadas", deleted)
     except Exception as e:
-        logger.error("[scheduler] cleanup_audit_logs falló: %s", e)
+        logger.error("[scheduler] cleanup_scheduler_runs falló: %s", e)
+
+
+def _add_tenant_job(fn, trigger, period: int) -> None:
+    scheduler.add_job(
+        tenant_scheduler.run_tenant_job,
+        trigger,
+        args=[fn.__name__, fn, period],
+        id=fn.__name__,
+        replace_existing=True,
+        max_instances=1,
+        coalesce=True,
+    )
 
 
 def start_scheduler():
+    _add_tenant_job(cleanup_refresh_tokens, CronTrigger(hour=2, minute=0), period=_DAY)
+    _add_tenant_job(maintain_audit_partitions, CronTrigger(hour=3, minute=0), period=_DAY)
+    _add_tenant_job(reconcile_stock_balances, CronTrigger(hour=4, minute=0), period=_DAY)
+    _add_tenant_job(cleanup_background_jobs, IntervalTrigger(hours=1), period=3600)
+    _add_tenant_job(
+        expire_stock_reservations,
+        IntervalTrigger(seconds=settings.RESERVATION_EXPIRY_INTERVAL),
+        period=settings.RESERVATION_EXPIRY_INTERVAL,
+    )
     scheduler.add_job(
-        cleanup_refresh_tokens,
-        CronTrigger(hour=2, minute=0),
-        id="cleanup_refresh_tokens",
+        reap_idle_db_connections,
+        IntervalTrigger(minutes=1),
+        id="reap_idle_db_connections",
         replace_existing=True,
     )
     scheduler.add_job(
-        cleanup_audit_logs,
-        CronTrigger(day_of_week="sun", hour=3, minute=0),
-        id="cleanup_audit_logs",
+        cleanup_scheduler_runs,
+        CronTrigger(hour=5, minute=0),
+        id="cleanup_scheduler_runs",
         replace_existing=True,
     )
     scheduler.start()
-    logger.info("[scheduler] iniciado — refresh_tokens (diario 02:00) + audit_logs (dom 03:00)")
+    logger.info(
+        "[scheduler] iniciado — por tenant: refresh_tokens (diario 02:00) + particiones audit_logs (diario 03:00)"
+        " + stock_balances (diario 04:00) + background_jobs (cada hora)"
+        " + expiración de reservas (cada %ds); por proceso: reaper de conexiones (cada minuto)",
+        settings.RESERVATION_EXPIRY_INTERVAL,
+    )
 
 
 def stop_scheduler():
     if scheduler.running:
         scheduler.shutdown(wait=False)
+    tenant_scheduler.shutdown()
@@ -25,6 +25,7 @@ def get_user_blocks(user_id: str) -> list[dict]:
 # ===============================
 SECRET_KEY = settings.SECRET_KEY
 REFRESH_TOKEN_EXPIRE_DAYS = 7
+STREAM_TICKET_PURPOSE = "badge_stream"
 
 # ===============================
 # AUTHENTICATE USER
@@ -156,6 +157,27 @@ def create_access_token(
     return jwt.encode(payload, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
 
 
+def create_stream_ticket(user: dict, tenant: str | None) -> str:
+    """
+    JWT de vida corta (NOTIFY_STREAM_TICKET_TTL) que solo abre
+    /notifications/stream del tenant indicado; no vale como token de acceso.
+    """
+    now = datetime.utcnow()
+    payload = {
+        "sub": str(user["id"]),
+        "purpose": STREAM_TICKET_PURPOSE,
+        "tenant": tenant,
+        "permissions": user.get("permissions", []),
+        "primary_module": user.get("primary_module"),
+        "iat": now,
+        "exp": now + timedelta(seconds=settings.NOTIFY_STREAM_TICKET_TTL),
+    }
+    if user.get("role"):
+        payload["role"] = user["role"]
+
+    return jwt.encode(payload, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
+
+
 def get_user_permissions(user_id: str) -> list[str]:
     with db_connection() as conn:
         with conn.cursor() as cur:
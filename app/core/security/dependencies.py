@@ -3,37 +3,58 @@ from fastapi.security import OAuth2PasswordBearer
 from jose import jwt, JWTError
 from app.core.config import settings
 from app.core.database import db_connection
+from app.core.security import principal_cache
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 
 
-def get_current_user(
-    request: Request,
-    token: str = Depends(oauth2_scheme)
-):
-    credentials_exception = HTTPException(
+def _credentials_exception() -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Credenciales inválidas",
         headers={"WWW-Authenticate": "Bearer"},
     )
 
+
+def _decode(token: str, purpose: str | None = None) -> dict:
+    """
+    Payload del JWT. Los tickets de un solo propósito (claim `purpose`) no
+    sirven como token de acceso, ni un token de acceso como ticket.
+    """
     try:
         payload = jwt.decode(
             token,
             settings.SECRET_KEY,
             algorithms=[settings.ALGORITHM],
         )
+    except JWTError:
+        raise _credentials_exception()
 
-        user_id: str = payload.get("sub")
-        permissions: list[str] = payload.get("permissions", [])
-        primary_module: str = payload.get("primary_module", "administracion")
-        role: str | None = payload.get("role")
+    if not payload.get("sub") or payload.get("purpose") != purpose:
+        raise _credentials_exception()
+    return payload
 
-        if not user_id:
-            raise credentials_exception
 
-    except JWTError:
-        raise credentials_exception
+def get_current_user(
+    request: Request,
+    token: str = Depends(oauth2_scheme)
+):
+    return _user_from_payload(request, _decode(token))
+
+
+def get_ticket_user(request: Request, ticket: str, purpose: str, tenant: str | None):
+    """Usuario de un ticket de vida corta emitido para `purpose` en `tenant`."""
+    payload = _decode(ticket, purpose)
+    if payload.get("tenant") != tenant:
+        raise _credentials_exception()
+    return _user_from_payload(request, payload)
+
+
+def _user_from_payload(request: Request, payload: dict):
+    user_id: str = payload.get("sub")
+    permissions: list[str] = payload.get("permissions", [])
+    primary_module: str = payload.get("primary_module", "administracion")
+    role: str | None = payload.get("role")
 
     # Superadmin: token especial, no existe en ninguna DB de tenant
     if role == "superadmin":
@@ -48,14 +69,19 @@ def get_current_user(
         request.state.user = user
         return user
 
-    with db_connection() as conn:
-        with conn.cursor() as cur:
-            cur.execute("""
-                SELECT id, username, email, is_active, avatar_url, full_name
-                FROM users
-                WHERE id = %s
-            """, (user_id,))
-            row = cur.fetchone()
+    row = principal_cache.get_principal(user_id)
+    if row is None:
+        epoch = principal_cache.current_epoch()
+        with db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    SELECT id, username, email, is_active, avatar_url, full_name
+                    FROM users
+                    WHERE id = %s
+                """, (user_id,))
+                row = cur.fetchone()
+        if row:
+            principal_cache.put_principal(user_id, row, epoch)
 
     if not row or not row[3]:
         raise HTTPException(status_code=401, detail="Usuario inactivo")
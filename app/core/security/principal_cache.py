@@ -0,0 +1,93 @@
+"""
+Cache en memoria del usuario autenticado (fila de users) por tenant.
+
+get_current_user consultaba users en cada request; una carga de dashboard
+dispara ~15 llamadas del mismo usuario. Los permisos viajan en el JWT; aquí
+solo se guarda la fila (id, username, email, is_active, avatar_url, full_name).
+
+  - Clave: (DB del tenant, user_id). TTL corto (PRINCIPAL_CACHE_TTL): un
+    usuario desactivado en otro worker queda fuera, como mucho, tras el TTL.
+  - Invalidación explícita en este worker desde los servicios que cambian
+    estado, roles o perfil (invalidate_principal / invalidate_tenant_principals).
+  - Época de invalidación: una lectura que empezó antes de una invalidación
+    no se guarda, así no se reinstala una fila vieja.
+"""
+import threading
+import time
+from typing import Optional
+
+from app.core.config import settings
+from app.core.tenant_context import get_tenant_db
+
+# {(tenant_db, user_id): (row, expires_at)}
+_principals: dict[tuple[Optional[str], str], tuple[tuple, float]] = {}
+_lock = threading.Lock()
+_epoch = 0
+_stats = {"hits": 0, "misses": 0, "invalidations": 0}
+
+
+def _key(user_id) -> tuple[Optional[str], str]:
+    return get_tenant_db(), str(user_id)
+
+
+def current_epoch() -> int:
+    return _epoch
+
+
+def get_principal(user_id) -> Optional[tuple]:
+    """Fila cacheada del usuario en el tenant actual, o None si no hay o venció."""
+    key = _key(user_id)
+    now = time.monotonic()
+    with _lock:
+        entry = _principals.get(key)
+        if entry is not None and entry[1] > now:
+            _stats["hits"] += 1
+            return entry[0]
+        if entry is not None:
+            del _principals[key]
+        _stats["misses"] += 1
+    return None
+
+
+def put_principal(user_id, row: tuple, epoch: int) -> None:
+    """Guarda la fila leída si no hubo invalidaciones desde `epoch`."""
+    if settings.PRINCIPAL_CACHE_TTL <= 0:
+        return
+    key = _key(user_id)
+    with _lock:
+        if epoch != _epoch:
+            return
+        if len(_principals) >= settings.PRINCIPAL_CACHE_MAX and key not in _principals:
+            now = time.monotonic()
+            for k in [k for k, (_, exp) in _principals.items() if exp <= now]:
+                del _principals[k]
+            if len(_principals) >= settings.PRINCIPAL_CACHE_MAX:
+                # Sigue lleno: se descarta la entrada más antigua (orden de inserción)
+                del _principals[next(iter(_principals))]
+        _principals[key] = (row, time.monotonic() + settings.PRINCIPAL_CACHE_TTL)
+
+
+def invalidate_principal(user_id) -> None:
+    global _epoch
+    with _lock:
+        _epoch += 1
+        _stats["invalidations"] += 1
+        _principals.pop(_key(user_id), None)
+
+
+def invalidate_tenant_principals() -> None:
+    """Cambios que afectan a varios usuarios (permisos de un rol, reset de datos)."""
+    global _epoch
+    tenant_db = get_tenant_db()
+    with _lock:
+        _epoch += 1
+        _stats["invalidations"] += 1
+        for k in [k for k in _principals if k[0] == tenant_db]:
+            del _principals[k]
+
+
+def stats() -> dict:
+    with _lock:
+        data = dict(_stats)
+        data["size"] = len(_principals)
+    return data
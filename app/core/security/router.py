@@ -17,6 +17,7 @@ from app.core.security.auth import (
     get_user_blocks,
 )
 from app.core.security.dependencies import get_current_user
+from app.core.security.principal_cache import invalidate_principal
 from app.core.security.preferences_service import (
     get_user_preferences,
     update_user_preferences,
@@ -182,6 +183,7 @@ def upload_avatar(
                 WHERE id = %s
             """, (url, user_id))
         conn.commit()
+    invalidate_principal(user_id)
         
     return {"status": "ok", "avatar_url": url}
 
@@ -204,6 +206,7 @@ def update_avatar_url(
                 WHERE id = %s
             """, (payload.avatar_url, user_id))
         conn.commit()
+    invalidate_principal(user_id)
     return {"status": "ok", "avatar_url": payload.avatar_url}
 
 
@@ -228,6 +231,7 @@ def update_profile(
                 WHERE id = %s
             """, (payload.full_name.strip(), user_id))
         conn.commit()
+    invalidate_principal(user_id)
 
     return {"status": "ok", "full_name": payload.full_name.strip()}
 
@@ -4,7 +4,7 @@ from typing import Optional
 _tenant_db_url: ContextVar[Optional[str]] = ContextVar("_tenant_db_url", default=None)
 
 
-def set_tenant_db(url: str) -> None:
+def set_tenant_db(url: Optional[str]) -> None:
     _tenant_db_url.set(url)
 
 
@@ -1,31 +1,42 @@
 import logging
+import random
 import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 
+import psycopg2
+from starlette.concurrency import run_in_threadpool
 from starlette.middleware.base import BaseHTTPMiddleware
 from starlette.requests import Request
 from starlette.responses import JSONResponse
 
+from app.core.audit.middleware import audit_rejection
+from app.core.config import settings
 from app.core.tenant_context import set_tenant_db
 from app.core.master_db import master_db_connection
 
 logger = logging.getLogger(__name__)
 
-# Cache in-memory: {slug: (db_url, is_active, timestamp)}
-_tenant_cache: dict[str, tuple[str, bool, float]] = {}
+# Cache in-memory: {slug: (result, fetched_at, ttl)}; result = (db_url, is_active) | None
+#   - edad < ttl                      → fresco, se sirve tal cual
+#   - edad < TENANT_CACHE_STALE_TTL   → se sirve y se refresca en segundo plano
+#   - si no                           → lookup síncrono
+# El TTL lleva jitter (±10 %) para que las entradas no venzan todas a la vez.
+_tenant_cache: dict[str, tuple[tuple[str, bool] | None, float, float]] = {}
 _cache_lock = threading.Lock()
-_CACHE_TTL = 60  # seconds
+# Single-flight: un solo lookup por slug; el resto espera su Event
+_inflight: dict[str, threading.Event] = {}
+# Generación por slug: invalidate_tenant_cache la incrementa y un lookup que
+# leyó la Master DB antes de la invalidación no guarda su resultado
+_generations: dict[str, int] = {}
+_refresh_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="tenant-refresh")
 
 
-def _resolve_tenant(slug: str) -> tuple[str, bool] | None:
-    now = time.time()
-    with _cache_lock:
-        if slug in _tenant_cache:
-            db_url, is_active, ts = _tenant_cache[slug]
-            if now - ts < _CACHE_TTL:
-                return db_url, is_active
-            del _tenant_cache[slug]
+def _jittered(ttl: float) -> float:
+    return ttl * random.uniform(0.9, 1.1)
 
+
+def _fetch_tenant(slug: str) -> tuple[str, bool] | None:
     with master_db_connection() as conn:
         with conn.cursor() as cur:
             cur.execute(
@@ -33,50 +44,139 @@ def _resolve_tenant(slug: str) -> tuple[str, bool] | None:
                 (slug,),
             )
             row = cur.fetchone()
+    return (row[0], row[1]) if row else None
+
+
+def _lookup(slug: str) -> tuple[str, bool] | None:
+    """Consulta la Master DB y guarda el resultado. Solo la ejecuta el dueño del Event."""
+    try:
+        for _ in range(3):
+            with _cache_lock:
+                generation = _generations.get(slug, 0)
+            result = _fetch_tenant(slug)
+            ttl = settings.TENANT_CACHE_TTL if result is not None else settings.TENANT_CACHE_MISS_TTL
+            with _cache_lock:
+                if _generations.get(slug, 0) == generation:
+                    _tenant_cache[slug] = (result, time.time(), _jittered(ttl))
+                    return result
+            # Invalidado mientras se consultaba: la fila leída puede ser la anterior
+        return result
+    finally:
+        with _cache_lock:
+            event = _inflight.pop(slug, None)
+        if event is not None:
+            event.set()
+
+
+def _background_refresh(slug: str) -> None:
+    try:
+        _lookup(slug)
+    except Exception as exc:
+        # Se sigue sirviendo la entrada vencida hasta TENANT_CACHE_STALE_TTL
+        logger.warning("Refresco de tenant '%s' falló: %s", slug, exc)
+
+
+def _cache_lookup(slug: str) -> tuple[bool, tuple[str, bool] | None]:
+    """
+    Camino rápido, sin bloquear: (hit, result). Si la entrada está vencida pero
+    dentro de la ventana stale, la devuelve y agenda un refresco único.
+    """
+    now = time.time()
+    with _cache_lock:
+        entry = _tenant_cache.get(slug)
+        if entry is None:
+            return False, None
+        result, fetched_at, ttl = entry
+        age = now - fetched_at
+        if age < ttl:
+            return True, result
+        if age >= settings.TENANT_CACHE_STALE_TTL or result is None:
+            return False, None
+        if slug in _inflight:
+            return True, result
+        _inflight[slug] = threading.Event()
+    _refresh_executor.submit(_background_refresh, slug)
+    return True, result
+
+
+def _resolve_tenant(slug: str) -> tuple[str, bool] | None:
+    started = time.time()
+    hit, result = _cache_lookup(slug)
+    if hit:
+        return result
 
-    if row is None:
-        return None
+    with _cache_lock:
+        event = _inflight.get(slug)
+        owner = event is None
+        if owner:
+            event = _inflight[slug] = threading.Event()
+
+    if owner:
+        return _lookup(slug)
 
-    db_url, is_active = row
+    # Otro hilo ya está consultando este slug: esperar su resultado
+    event.wait(timeout=10)
     with _cache_lock:
-        _tenant_cache[slug] = (db_url, is_active, now)
-    return db_url, is_active
+        entry = _tenant_cache.get(slug)
+    if entry is not None and entry[1] >= started:
+        return entry[0]
+    # El dueño falló (Master DB caída): no reintentar en cascada
+    raise psycopg2.OperationalError(f"No se pudo resolver el tenant '{slug}' en la Master DB")
+
+
+# EventSource no puede enviar cabeceras: estas rutas aceptan el tenant en
+# ?tenant=, con la misma resolución y validación que X-Tenant-ID
+_QUERY_TENANT_PATHS = frozenset({"/notifications/stream"})
+
+
+def request_tenant_slug(request: Request) -> str | None:
+    slug = request.headers.get("X-Tenant-ID")
+    if not slug and request.url.path in _QUERY_TENANT_PATHS:
+        slug = request.query_params.get("tenant")
+    return slug
 
 
 def invalidate_tenant_cache(slug: str) -> None:
     with _cache_lock:
         _tenant_cache.pop(slug, None)
+        _generations[slug] = _generations.get(slug, 0) + 1
 
 
 class TenantMiddleware(BaseHTTPMiddleware):
     async def dispatch(self, request: Request, call_next):
-        slug = request.headers.get("X-Tenant-ID")
+        slug = request_tenant_slug(request)
 
         if not slug:
             return await call_next(request)
 
         try:
-            result = _resolve_tenant(slug)
+            hit, result = _cache_lookup(slug)
+            if not hit:
+                # Miss: el lookup (o la espera al lookup en curso) va al threadpool
+                result = await run_in_threadpool(_resolve_tenant, slug)
         except Exception as exc:
             logger.error("Error resolviendo tenant '%s': %s", slug, exc, exc_info=True)
-            return JSONResponse(
-                status_code=503,
-                content={"detail": "Servicio temporalmente no disponible. Intenta de nuevo en unos momentos."},
+            return await _reject(
+                request, 503,
+                "Servicio temporalmente no disponible. Intenta de nuevo en unos momentos.",
             )
 
         if result is None:
-            return JSONResponse(
-                status_code=404,
-                content={"detail": f"Empresa '{slug}' no encontrada."},
-            )
+            return await _reject(request, 404, f"Empresa '{slug}' no encontrada.")
 
         db_url, is_active = result
 
         if not is_active:
-            return JSONResponse(
-                status_code=503,
-                content={"detail": f"La empresa '{slug}' está temporalmente suspendida. Contacta al administrador."},
+            return await _reject(
+                request, 503,
+                f"La empresa '{slug}' está temporalmente suspendida. Contacta al administrador.",
             )
 
         set_tenant_db(db_url)
         return await call_next(request)
+
+
+async def _reject(request: Request, status_code: int, detail: str) -> JSONResponse:
+    # AuditMiddleware va por dentro de este middleware: el rechazo se audita aquí
+    await audit_rejection(request, status_code, detail)
+    return JSONResponse(status_code=status_code, content={"detail": detail})
@@ -0,0 +1,236 @@
+"""
+Ejecución de jobs periódicos en todas las DBs de tenant.
+
+run_tenant_job(name, fn, period) lista los tenants activos de la Master DB y
+ejecuta fn() una vez por tenant, con la DB del tenant fijada en el contexto,
+sobre un pool acotado de hilos (SCHEDULER_TENANT_WORKERS).
+
+  - Varios workers uvicorn arrancan su propio scheduler: cada ejecución
+    reclama su turno en scheduler_job_runs (Master DB, UNIQUE job + tenant +
+    fire_key = epoch // período). Solo el worker que inserta la fila ejecuta;
+    si el registro falla, ese disparo se salta (CLAIM_FAILED) en vez de
+    ejecutarse sin garantía de corrida única.
+  - Lock por tenant: pg_try_advisory_lock en la DB del tenant, así una
+    corrida lenta no se solapa con el turno siguiente del mismo job.
+  - fn() retorna las filas afectadas; duración, filas y error quedan en
+    scheduler_job_runs y en stats() (/superadmin/metrics).
+"""
+import logging
+import os
+import socket
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+from psycopg2.extras import execute_values
+
+from app.core.config import settings
+from app.core.database import db_connection
+from app.core.master_db import master_db_connection
+from app.core.tenant_context import set_tenant_db
+
+logger = logging.getLogger(__name__)
+
+RUNNER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+_executor = ThreadPoolExecutor(
+    max_workers=settings.SCHEDULER_TENANT_WORKERS,
+    thread_name_prefix="tenant-job",
+)
+_stats_lock = threading.Lock()
+_stats: dict[str, dict] = {}
+
+
+def active_tenants() -> list[tuple[str, Optional[str]]]:
+    """
+    (slug, db_url) de los tenants activos según la Master DB. Sin Master DB
+    configurada (dev / single-tenant) se usa la DB por defecto (db_url None).
+    """
+    if not settings.MASTER_DATABASE_URL:
+        return [("default", None)]
+    with master_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT slug, db_url
+                FROM tenants
+                WHERE is_active = TRUE AND provision_status = 'active'
+                ORDER BY slug
+            """)
+            return [(r[0], r[1]) for r in cur.fetchall()]
+
+
+# ── Registro de turnos (Master DB) ─────────────────────────────────────────────
+# Una conexión a la Master DB para reclamar los turnos de todos los tenants y
+# otra para cerrarlos: los hilos de SCHEDULER_TENANT_WORKERS no la tocan y no
+# compiten con los lookups de TenantMiddleware por el pool.
+
+def _claim_turns(name: str, slugs: list[str], fire_key: int) -> dict[str, int]:
+    """{slug: id de la fila} de los turnos que ganó este worker."""
+    if not slugs:
+        return {}
+    with master_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                INSERT INTO scheduler_job_runs (job_name, tenant_slug, fire_key, runner)
+                SELECT %s, slug, %s, %s FROM unnest(%s::text[]) AS slug
+                ON CONFLICT ON CONSTRAINT uq_scheduler_job_runs_turn DO NOTHING
+                RETURNING tenant_slug, id
+            """, (name, fire_key, RUNNER_ID, slugs))
+            claimed = {r[0]: r[1] for r in cur.fetchall()}
+        conn.commit()
+    return claimed
+
+
+def _finish_turns(results: list[dict]) -> None:
+    """Cierra en una sentencia los turnos ejecutados (results con run_id)."""
+    rows = [
+        (r["run_id"], r["status"], r["rows"], r["duration_ms"], r["error"])
+        for r in results if r.get("run_id") is not None
+    ]
+    if not rows:
+        return
+    with master_db_connection() as conn:
+        with conn.cursor() as cur:
+            execute_values(cur, """
+                UPDATE scheduler_job_runs r
+                SET status = v.status, rows_affected = v.rows_affected,
+                    duration_ms = v.duration_ms, error = v.error, finished_at = NOW()
+                FROM (VALUES %s) AS v(id, status, rows_affected, duration_ms, error)
+                WHERE r.id = v.id
+            """, rows, template="(%s::bigint, %s, %s::bigint, %s::numeric, %s)", page_size=len(rows))
+        conn.commit()
+
+
+def cleanup_job_runs(retention_days: int) -> int:
+    with master_db_connection() as conn:
+        with conn.cursor() as cur:
+            # Turnos que nadie cerró (worker caído a mitad de la corrida)
+            cur.execute("""
+                UPDATE scheduler_job_runs
+                SET status = 'ABANDONED', finished_at = NOW()
+                WHERE status = 'RUNNING'
+                  AND started_at < NOW() - make_interval(hours => %s)
+            """, (settings.SCHEDULER_RUN_STALE_HOURS,))
+            cur.execute(
+                "DELETE FROM scheduler_job_runs WHERE started_at < NOW() - make_interval(days => %s)",
+                (retention_days,),
+            )
+            deleted = cur.rowcount
+        conn.commit()
+    return deleted
+
+
+# ── Ejecución ──────────────────────────────────────────────────────────────────
+
+def _lock_key(name: str) -> int:
+    # Estable entre procesos (hash() de Python cambia por proceso)
+    return zlib.crc32(f"scheduler:{name}".encode())
+
+
+def _run_in_tenant(name: str, fn: Callable[[], Optional[int]], slug: str, db_url: Optional[str], run_id: int) -> dict:
+    started = time.perf_counter()
+    status, rows, error = "OK", None, None
+    set_tenant_db(db_url)
+    try:
+        with db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT pg_try_advisory_lock(%s)", (_lock_key(name),))
+                locked = cur.fetchone()[0]
+            conn.commit()
+            if not locked:
+                status = "SKIPPED"
+            else:
+                try:
+                    rows = fn()
+                finally:
+                    # El lock es de sesión: liberarlo antes de devolver la conexión al pool
+                    with conn.cursor() as cur:
+                        cur.execute("SELECT pg_advisory_unlock(%s)", (_lock_key(name),))
+                    conn.commit()
+    except Exception as e:
+        status, error = "ERROR", str(e)
+        logger.error("[scheduler] %s falló en %s: %s", name, slug, e)
+    finally:
+        # Los hilos del pool se reutilizan: no dejar el tenant fijado
+        set_tenant_db(None)
+
+    duration_ms = round((time.perf_counter() - started) * 1000, 1)
+    return {"status": status, "slug": slug, "rows": rows, "duration_ms": duration_ms,
+            "error": error, "run_id": run_id}
+
+
+def run_tenant_job(name: str, fn: Callable[[], Optional[int]], period: int) -> None:
+    """Ejecuta fn() en cada tenant activo. `period` (s) define el turno compartido entre workers."""
+    started = time.perf_counter()
+    fire_key = int(time.time() // period)
+    try:
+        tenants = active_tenants()
+    except Exception as e:
+        logger.error("[scheduler] %s: no se pudo listar tenants: %s", name, e)
+        _record(name, [], started, failed=True)
+        return
+
+    try:
+        claimed = _claim_turns(name, [slug for slug, _ in tenants], fire_key)
+    except Exception as e:
+        # Sin turno registrado no hay garantía de una sola corrida entre workers:
+        # este disparo se salta en todos los tenants
+        logger.error("[scheduler] %s: no se pudieron reclamar los turnos: %s", name, e)
+        _record(name, [{"status": "CLAIM_FAILED", "slug": slug, "error": str(e)} for slug, _ in tenants],
+                started, failed=True)
+        return
+
+    futures = [
+        _executor.submit(_run_in_tenant, name, fn, slug, db_url, claimed[slug])
+        for slug, db_url in tenants if slug in claimed
+    ]
+    results = [f.result() for f in futures]
+    results += [{"status": "CLAIMED", "slug": slug} for slug, _ in tenants if slug not in claimed]
+
+    for attempt in range(3):
+        try:
+            _finish_turns(results)
+            break
+        except Exception as e:
+            logger.warning("[scheduler] %s: no se pudieron cerrar los turnos (intento %d): %s", name, attempt + 1, e)
+            time.sleep(attempt + 1)
+    # Si los tres intentos fallan, cleanup_job_runs los marca ABANDONED
+
+    for r in results:
+        r.pop("run_id", None)
+    _record(name, results, started)
+
+    ran = [r for r in results if r["status"] in ("OK", "ERROR")]
+    if ran:
+        logger.info(
+            "[scheduler] %s: %d tenants, %d filas, %d errores, %.0f ms",
+            name, len(ran), sum(r["rows"] or 0 for r in ran),
+            sum(1 for r in ran if r["status"] == "ERROR"),
+            (time.perf_counter() - started) * 1000,
+        )
+
+
+def _record(name: str, results: list[dict], started: float, failed: bool = False) -> None:
+    with _stats_lock:
+        entry = _stats.setdefault(name, {"runs": 0, "errors": 0, "rows_total": 0, "tenants": {}})
+        entry["runs"] += 1
+        entry["errors"] += int(failed) + sum(1 for r in results if r["status"] == "ERROR")
+        entry["rows_total"] += sum(r.get("rows") or 0 for r in results)
+        entry["last_run_at"] = time.time()
+        entry["last_duration_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        for r in results:
+            entry["tenants"][r["slug"]] = {k: v for k, v in r.items() if k != "slug"}
+
+
+def stats() -> dict:
+    with _stats_lock:
+        return {
+            name: {**entry, "tenants": {k: dict(v) for k, v in entry["tenants"].items()}}
+            for name, entry in _stats.items()
+        }
+
+
+def shutdown() -> None:
+    _executor.shutdown(wait=False, cancel_futures=True)
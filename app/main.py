@@ -11,7 +11,9 @@ from slowapi.middleware import SlowAPIMiddleware
 from app.core.rate_limit import limiter
 from app.core.security_headers import SecurityHeadersMiddleware
 from app.core.tenant_middleware import TenantMiddleware
+from app.core import labels
 from app.core.scheduler import start_scheduler, stop_scheduler
+from app.core.master_db import close_master_pool
 from app.modules.admin.router import router as admin_router
 from app.core.security.router import router as auth_router
 from app.modules.logistics.router import router as logistics_router
@@ -19,7 +21,13 @@ from app.modules.logistics.router_lots import router as lots_router
 from app.modules.logistics.router_transfers import router as transfers_router
 from app.modules.logistics.router_physical_inv import router as physical_inv_router
 from app.modules.logistics.router_advanced import router as advanced_router
-from app.core.audit.middleware import AuditMiddleware
+from app.core.audit.context import audit_context
+from app.core.audit.middleware import AuditMiddleware, audit_rejection_sync
+from app.core.audit.writer import audit_writer
+from app.core.jobs.runner import job_runner
+from app.core.jobs.router import router as jobs_router
+from app.core.notifications import hub as notifications_hub
+from app.core.notifications.router import router as notifications_router
 from app.modules.requests.router import router as requests_router
 from app.modules.reporting.router import router as reporting_router
 from app.modules.operations.router import router as operations_router
@@ -34,7 +42,8 @@ from app.modules.requerimientos.router import router as requerimientos_router
 from app.modules.branding.router import router as branding_router
 from app.modules.superadmin.router import router as superadmin_router
 from app.modules.search.router import router as search_router
-from app.core.database import db_connection
+from app.core.database import db_connection, close_all_pools
+from app.core.async_database import close_async_pools
 
 logger = logging.getLogger(__name__)
 
@@ -56,12 +65,21 @@ async def lifespan(app: FastAPI):
         print(f"[ERROR] Conexion a la base de datos fallida: {e}")
         print("  Verifica DATABASE_URL en tu archivo .env")
         raise SystemExit(1)
+    audit_writer.start()
+    job_runner.start()
     start_scheduler()
     
     yield
     
     # Shutdown
     stop_scheduler()
+    job_runner.stop()
+    labels.shutdown()
+    await notifications_hub.shutdown()
+    audit_writer.stop()
+    close_master_pool()
+    close_all_pools()
+    await close_async_pools()
 
 
 app = FastAPI(
@@ -96,21 +114,35 @@ origins = [
 ]
 origins += [o.strip() for o in os.getenv("CORS_ORIGINS", "").split(",") if o.strip()]
 
+
+def _rate_limit_handler(request: Request, exc: RateLimitExceeded):
+    # Límites globales: el 429 lo responde SlowAPIMiddleware, por fuera de
+    # AuditMiddleware (audit_context vacío) y hay que auditarlo aquí. Los de
+    # @limiter.limit pasan por AuditMiddleware, que ya registra el request.
+    # Síncrono: SlowAPIMiddleware reemplaza los handlers async por el default.
+    if not audit_context.get():
+        audit_rejection_sync(request, 429, f"Rate limit exceeded: {exc.detail}")
+    return _rate_limit_exceeded_handler(request, exc)
+
+
 app.state.limiter = limiter
-app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
+app.add_exception_handler(RateLimitExceeded, _rate_limit_handler)
 
 # Orden de middlewares (último en add_middleware = primero en ejecutarse):
-# SecurityHeaders → Tenant → SlowAPI → Audit → CORS (outermost, maneja preflight)
+# SecurityHeaders → Audit → Tenant → SlowAPI → CORS (outermost, maneja preflight)
+# Audit va por dentro de Tenant para que el registro encolado lleve la DB del tenant;
+# los rechazos de Tenant (404/503) y el 429 de SlowAPI se auditan explícitamente.
 app.add_middleware(SecurityHeadersMiddleware)
+app.add_middleware(AuditMiddleware)
 app.add_middleware(TenantMiddleware)
 app.add_middleware(SlowAPIMiddleware)
-app.add_middleware(AuditMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
     allow_credentials=True,
     allow_methods=["GET", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"],
     allow_headers=["Content-Type", "Authorization", "X-Tenant-ID"],
+    expose_headers=["X-Total-Count", "X-Next-Offset"],
 )
 
 # ===============================
@@ -137,6 +169,8 @@ app.include_router(requerimientos_router)
 app.include_router(branding_router)
 app.include_router(superadmin_router)
 app.include_router(search_router)
+app.include_router(jobs_router)
+app.include_router(notifications_router)
 
 # Estáticos de marca (logos subidos). El directorio es de runtime (gitignored).
 _BRANDING_DIR = os.path.join("app", "storage", "branding")
@@ -2,6 +2,7 @@ from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from typing import Optional
 from uuid import UUID
 from app.core.database import db_connection
+from app.core.jobs.runner import submit_job
 from app.core.rate_limit import limiter
 from app.core.security.permissions import require_permission
 from app.modules.admin.schemas import (
@@ -320,16 +321,23 @@ def export_audit_logs(
     method: Optional[str] = Query(None, max_length=20),
     fecha_inicio: Optional[str] = Query(None),
     fecha_fin: Optional[str] = Query(None),
-    _=Depends(require_permission("admin:audit")),
+    background: bool = Query(False),
+    user=Depends(require_permission("admin:audit")),
 ):
     if fecha_inicio and not _DATE_RE.match(fecha_inicio):
         raise HTTPException(400, "fecha_inicio debe tener formato YYYY-MM-DD")
     if fecha_fin and not _DATE_RE.match(fecha_fin):
         raise HTTPException(400, "fecha_fin debe tener formato YYYY-MM-DD")
-    return export_audit_logs_excel_service(
+    filters = dict(
         username=username, module=module, method=method,
         fecha_inicio=fecha_inicio, fecha_fin=fecha_fin,
     )
+    if background:
+        return submit_job(
+            "admin.export_audit_logs", export_audit_logs_excel_service,
+            user=user, params=filters, **filters,
+        )
+    return export_audit_logs_excel_service(**filters)
 
 
 _DATE_RE = __import__("re").compile(r"^\d{4}-\d{2}-\d{2}$")
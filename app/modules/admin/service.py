@@ -1,5 +1,6 @@
-from app.core.database import db_connection
+from app.core.database import db_connection, stream_query
 from app.core.security.hashing import hash_password
+from app.core.security.principal_cache import invalidate_principal, invalidate_tenant_principals
 from psycopg2 import sql
 from uuid import UUID
 
@@ -77,6 +78,7 @@ def update_user_roles_service(user_id: UUID, role_ids: list[UUID]):
                 """, (str(user_id), str(role_id)))
 
         conn.commit()
+    invalidate_principal(user_id)
 
 
 # ============================
@@ -94,6 +96,8 @@ def update_user_status_service(user_id: UUID, is_active: bool):
                 raise ValueError("Usuario no existe")
 
         conn.commit()
+    # Desactivado: deja de autenticarse ya en este worker (en los demás, tras PRINCIPAL_CACHE_TTL)
+    invalidate_principal(user_id)
 
 
 # ============================
@@ -146,6 +150,7 @@ def update_role_permissions_service(role_id: str, permission_codes: list[str]):
                     (role_id, code)
                 )
         conn.commit()
+    invalidate_tenant_principals()
 
 
 def create_role_service(name: str):
@@ -216,6 +221,7 @@ def add_user_to_role_service(role_id: str, user_id: str):
                 (user_id, role_id)
             )
         conn.commit()
+    invalidate_principal(user_id)
     return {"status": "added"}
 
 
@@ -229,6 +235,7 @@ def remove_user_from_role_service(role_id: str, user_id: str):
             if cur.rowcount == 0:
                 raise ValueError("Asignación no encontrada")
         conn.commit()
+    invalidate_principal(user_id)
     return {"status": "removed"}
 
 
@@ -300,6 +307,7 @@ def delete_user_service(user_id: str, requester_id: str):
             cur.execute("DELETE FROM users WHERE id = %s", (user_id,))
 
         conn.commit()
+    invalidate_principal(user_id)
     return {"status": "deleted", "username": username}
 
 
@@ -393,23 +401,20 @@ def _audit_conditions(username=None, module=None, method=None, fecha_inicio=None
             conditions.append("(action LIKE 'PUT%' OR action LIKE 'PATCH%')")
         elif method == "DELETE":
             conditions.append("action LIKE 'DELETE%'")
+    # audit_logs está particionada por mes (created_at): los límites de fecha
+    # van como constantes para que el planner descarte las particiones fuera
+    # del rango. Fin exclusivo (día siguiente) para no perder las fracciones
+    # de segundo de las 23:59:59.
     if fecha_inicio:
-        conditions.append("created_at >= %s::timestamp")
-        params.append(f"{fecha_inicio} 00:00:00")
+        conditions.append("created_at >= %s::date")
+        params.append(fecha_inicio)
     if fecha_fin:
-        conditions.append("created_at <= %s::timestamp")
-        params.append(f"{fecha_fin} 23:59:59")
+        conditions.append("created_at < %s::date + 1")
+        params.append(fecha_fin)
     return conditions, params
 
 
-def list_audit_logs_service(
-    limit: int = 500,
-    username: str = None,
-    module: str = None,
-    method: str = None,
-    fecha_inicio: str = None,
-    fecha_fin: str = None,
-):
+def _audit_logs_query(limit, username=None, module=None, method=None, fecha_inicio=None, fecha_fin=None):
     conditions, params = _audit_conditions(username, module, method, fecha_inicio, fecha_fin)
     params.append(limit)
 
@@ -426,21 +431,33 @@ def list_audit_logs_service(
         )
     else:
         where_clause = sql.SQL("")
+    return base.format(where=where_clause), params
 
+
+def _row_to_audit_log(r):
+    return {
+        "username": r[0],
+        "action": r[1],
+        "endpoint": r[2],
+        "module": r[3],
+        "ip": r[4],
+        "created_at": r[5],
+    }
+
+
+def list_audit_logs_service(
+    limit: int = 500,
+    username: str = None,
+    module: str = None,
+    method: str = None,
+    fecha_inicio: str = None,
+    fecha_fin: str = None,
+):
+    query, params = _audit_logs_query(limit, username, module, method, fecha_inicio, fecha_fin)
     with db_connection() as conn:
         with conn.cursor() as cur:
-            cur.execute(base.format(where=where_clause), params)
-            return [
-                {
-                    "username": r[0],
-                    "action": r[1],
-                    "endpoint": r[2],
-                    "module": r[3],
-                    "ip": r[4],
-                    "created_at": r[5],
-                }
-                for r in cur.fetchall()
-            ]
+            cur.execute(query, params)
+            return [_row_to_audit_log(r) for r in cur.fetchall()]
 
 
 def export_audit_logs_excel_service(
@@ -449,43 +466,30 @@ def export_audit_logs_excel_service(
     method: str = None,
     fecha_inicio: str = None,
     fecha_fin: str = None,
-    limit: int = 10000,
+    limit: int = 100000,
 ):
     from datetime import datetime
-    from app.core.export_utils import (
-        write_title_row, write_header_row, write_data_row,
-        set_column_widths, excel_response,
-    )
-    import openpyxl
-
-    logs = list_audit_logs_service(
-        limit=limit,
-        username=username,
-        module=module,
-        method=method,
-        fecha_inicio=fecha_inicio,
-        fecha_fin=fecha_fin,
-    )
-    fecha = datetime.now().strftime("%d/%m/%Y %H:%M")
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = "Auditoría"
+    from app.core.export_utils import StreamingExcel
 
+    fecha = datetime.now().strftime("%d/%m/%Y %H:%M")
     headers = [
         "Fecha", "Hora", "Usuario", "Acción", "Módulo",
         "Ruta del sistema", "Dirección IP",
     ]
     widths = [12, 10, 20, 14, 14, 42, 16]
-    write_title_row(ws, f"CeShark ERP — Registro de Auditoría — {fecha}", len(headers))
-    write_header_row(ws, headers, row=2)
-    set_column_widths(ws, widths)
-    ws.row_dimensions[2].height = 18
+    book = StreamingExcel()
+    sheet = book.sheet(
+        "Auditoría", headers, widths,
+        title=f"CeShark ERP — Registro de Auditoría — {fecha}",
+    )
 
-    for i, log in enumerate(logs, start=1):
+    query, params = _audit_logs_query(limit, username, module, method, fecha_inicio, fecha_fin)
+    for i, row in enumerate(stream_query(query, params, name="export_audit_logs"), start=1):
+        log = _row_to_audit_log(row)
         dt = log.get("created_at")
         fecha_str = dt.strftime("%d/%m/%Y") if dt else ""
         hora_str = dt.strftime("%H:%M:%S") if dt else ""
-        write_data_row(ws, i + 2, [
+        sheet.data_row([
             fecha_str,
             hora_str,
             log.get("username") or "anónimo",
@@ -495,7 +499,7 @@ def export_audit_logs_excel_service(
             log.get("ip") or "—",
         ], alternate=(i % 2 == 0))
 
-    return excel_response(wb, f"auditoria_{datetime.now().strftime('%Y%m%d')}.xlsx")
+    return book.response(f"auditoria_{datetime.now().strftime('%Y%m%d')}.xlsx")
 
 
 def reset_user_password_service(user_id: str, new_password: str):
@@ -1,5 +1,7 @@
+import uuid
 from fastapi import HTTPException
-from app.core.database import db_connection
+from psycopg2.extras import execute_values
+from app.core.database import db_connection, stream_query
 from app.core.utils import generate_sequential_code
 from app.modules.compras.schemas import TRANSICIONES_OC
 
@@ -80,19 +82,24 @@ def _recalc_total(conn, oc_id: str):
 # PROVEEDORES
 # ══════════════════════════════════════════════════════════════════════════════
 
+def _proveedores_list_query(activo: bool = None):
+    sql = """
+        SELECT id, codigo, nombre, ruc, direccion, telefono, email, contacto,
+               tipo, activo, created_at
+        FROM proveedores
+    """
+    params = []
+    if activo is not None:
+        sql += " WHERE activo = %s"
+        params.append(activo)
+    sql += " ORDER BY nombre"
+    return sql, params
+
+
 def list_proveedores_service(activo: bool = None) -> list:
+    sql, params = _proveedores_list_query(activo)
     with db_connection() as conn:
         with conn.cursor() as cur:
-            sql = """
-                SELECT id, codigo, nombre, ruc, direccion, telefono, email, contacto,
-                       tipo, activo, created_at
-                FROM proveedores
-            """
-            params = []
-            if activo is not None:
-                sql += " WHERE activo = %s"
-                params.append(activo)
-            sql += " ORDER BY nombre"
             cur.execute(sql, params)
             rows = cur.fetchall()
     return [_row_to_proveedor(r) for r in rows]
@@ -272,32 +279,37 @@ def list_material_proveedores_service(material_id: str) -> list:
 # ÓRDENES DE COMPRA
 # ══════════════════════════════════════════════════════════════════════════════
 
+def _oc_list_query(status=None, proveedor_id=None, plan_id=None, solicitado_por=None):
+    sql = """
+        SELECT oc.id, oc.code, oc.proveedor_id, p.nombre AS proveedor_nombre,
+               oc.plan_id, oc.status, oc.solicitado_por, oc.aprobado_por,
+               oc.almacen_destino, w.name AS almacen_nombre,
+               oc.fecha_solicitud, oc.fecha_entrega_est, oc.fecha_recepcion,
+               oc.notas, oc.total_estimado, oc.total_real,
+               oc.created_at, oc.updated_at
+        FROM ordenes_compra oc
+        JOIN proveedores p ON p.id = oc.proveedor_id
+        LEFT JOIN warehouses w ON w.id = oc.almacen_destino
+    """
+    filters, params = [], []
+    if status:
+        filters.append("oc.status = %s"); params.append(status)
+    if proveedor_id:
+        filters.append("oc.proveedor_id = %s"); params.append(proveedor_id)
+    if plan_id:
+        filters.append("oc.plan_id = %s"); params.append(plan_id)
+    if solicitado_por:
+        filters.append("oc.solicitado_por = %s"); params.append(solicitado_por)
+    if filters:
+        sql += " WHERE " + " AND ".join(filters)
+    sql += " ORDER BY oc.created_at DESC"
+    return sql, params
+
+
 def list_oc_service(status=None, proveedor_id=None, plan_id=None, solicitado_por=None) -> list:
+    sql, params = _oc_list_query(status, proveedor_id, plan_id, solicitado_por)
     with db_connection() as conn:
         with conn.cursor() as cur:
-            sql = """
-                SELECT oc.id, oc.code, oc.proveedor_id, p.nombre AS proveedor_nombre,
-                       oc.plan_id, oc.status, oc.solicitado_por, oc.aprobado_por,
-                       oc.almacen_destino, w.name AS almacen_nombre,
-                       oc.fecha_solicitud, oc.fecha_entrega_est, oc.fecha_recepcion,
-                       oc.notas, oc.total_estimado, oc.total_real,
-                       oc.created_at, oc.updated_at
-                FROM ordenes_compra oc
-                JOIN proveedores p ON p.id = oc.proveedor_id
-                LEFT JOIN warehouses w ON w.id = oc.almacen_destino
-            """
-            filters, params = [], []
-            if status:
-                filters.append("oc.status = %s"); params.append(status)
-            if proveedor_id:
-                filters.append("oc.proveedor_id = %s"); params.append(proveedor_id)
-            if plan_id:
-                filters.append("oc.plan_id = %s"); params.append(plan_id)
-            if solicitado_por:
-                filters.append("oc.solicitado_por = %s"); params.append(solicitado_por)
-            if filters:
-                sql += " WHERE " + " AND ".join(filters)
-            sql += " ORDER BY oc.created_at DESC"
             cur.execute(sql, params)
             rows = cur.fetchall()
     return [_row_to_oc(r) for r in rows]
@@ -345,38 +357,43 @@ def create_oc_service(payload, user) -> dict:
     return get_oc_service(oc_id)
 
 
+def _fetch_oc(cur, oc_id: str) -> dict:
+    """OC con sus ítems, leída con el cursor dado."""
+    cur.execute("""
+        SELECT oc.id, oc.code, oc.proveedor_id, p.nombre,
+               oc.plan_id, oc.status, oc.solicitado_por, oc.aprobado_por,
+               oc.almacen_destino, w.name,
+               oc.fecha_solicitud, oc.fecha_entrega_est, oc.fecha_recepcion,
+               oc.notas, oc.total_estimado, oc.total_real,
+               oc.created_at, oc.updated_at
+        FROM ordenes_compra oc
+        JOIN proveedores p ON p.id = oc.proveedor_id
+        LEFT JOIN warehouses w ON w.id = oc.almacen_destino
+        WHERE oc.id = %s
+    """, (oc_id,))
+    row = cur.fetchone()
+    if not row:
+        raise HTTPException(404, "Orden de Compra no encontrada")
+    oc = _row_to_oc(row)
+
+    cur.execute("""
+        SELECT oci.id, oci.oc_id, oci.material_id, m.name, m.unit,
+               oci.cantidad_pedida, oci.precio_unitario,
+               oci.cantidad_recibida, oci.stock_movement_id, oci.notas
+        FROM ordenes_compra_items oci
+        JOIN materials m ON m.id = oci.material_id
+        WHERE oci.oc_id = %s
+        ORDER BY m.name
+    """, (oc_id,))
+    oc["items"] = [_row_to_oc_item(r) for r in cur.fetchall()]
+
+    return oc
+
+
 def get_oc_service(oc_id: str) -> dict:
     with db_connection() as conn:
         with conn.cursor() as cur:
-            cur.execute("""
-                SELECT oc.id, oc.code, oc.proveedor_id, p.nombre,
-                       oc.plan_id, oc.status, oc.solicitado_por, oc.aprobado_por,
-                       oc.almacen_destino, w.name,
-                       oc.fecha_solicitud, oc.fecha_entrega_est, oc.fecha_recepcion,
-                       oc.notas, oc.total_estimado, oc.total_real,
-                       oc.created_at, oc.updated_at
-                FROM ordenes_compra oc
-                JOIN proveedores p ON p.id = oc.proveedor_id
-                LEFT JOIN warehouses w ON w.id = oc.almacen_destino
-                WHERE oc.id = %s
-            """, (oc_id,))
-            row = cur.fetchone()
-            if not row:
-                raise HTTPException(404, "Orden de Compra no encontrada")
-            oc = _row_to_oc(row)
-
-            cur.execute("""
-                SELECT oci.id, oci.oc_id, oci.material_id, m.name, m.unit,
-                       oci.cantidad_pedida, oci.precio_unitario,
-                       oci.cantidad_recibida, oci.stock_movement_id, oci.notas
-                FROM ordenes_compra_items oci
-                JOIN materials m ON m.id = oci.material_id
-                WHERE oci.oc_id = %s
-                ORDER BY m.name
-            """, (oc_id,))
-            oc["items"] = [_row_to_oc_item(r) for r in cur.fetchall()]
-
-    return oc
+            return _fetch_oc(cur, oc_id)
 
 
 def update_oc_service(oc_id: str, payload) -> dict:
@@ -535,10 +552,17 @@ def delete_oc_item_service(oc_id: str, item_id: str) -> dict:
 # ── Recepción de OC ───────────────────────────────────────────────────────────
 
 def recibir_oc_service(oc_id: str, payload, user) -> dict:
+    """
+    Recibe las líneas de la OC en una transacción con un número fijo de
+    sentencias, sin importar cuántas líneas traiga: se leen los ítems de una
+    vez, se valida en memoria y se escriben movimientos, ubicaciones e ítems
+    en lote.
+    """
     with db_connection() as conn:
         with conn.cursor() as cur:
+            # FOR UPDATE: dos recepciones simultáneas de la misma OC se serializan
             cur.execute(
-                "SELECT status, almacen_destino FROM ordenes_compra WHERE id = %s",
+                "SELECT status, almacen_destino FROM ordenes_compra WHERE id = %s FOR UPDATE",
                 (oc_id,)
             )
             row = cur.fetchone()
@@ -549,97 +573,98 @@ def recibir_oc_service(oc_id: str, payload, user) -> dict:
 
             oc_almacen = str(row[1]) if row[1] else None
 
-        total_real = 0.0
+            lineas = [item for item in payload.items if item.cantidad_recibida > 0]
 
-        for item_recv in payload.items:
-            if item_recv.cantidad_recibida <= 0:
-                continue
-
-            almacen_id = item_recv.almacen_id or (payload.almacen_id if hasattr(payload, "almacen_id") else None) or oc_almacen
-            if not almacen_id:
-                raise HTTPException(400, "Se requiere almacen_id para la recepción")
-
-            with conn.cursor() as cur:
-                cur.execute("""
-                    SELECT oci.id, oci.material_id, oci.cantidad_pedida, oci.cantidad_recibida, oci.precio_unitario
-                    FROM ordenes_compra_items oci
-                    WHERE oci.id = %s AND oci.oc_id = %s
-                """, (item_recv.item_id, oc_id))
-                item_row = cur.fetchone()
+            cur.execute("""
+                SELECT oci.id, oci.material_id, oci.precio_unitario
+                FROM ordenes_compra_items oci
+                WHERE oci.oc_id = %s AND oci.id = ANY(%s::uuid[])
+            """, (oc_id, [item.item_id for item in lineas]))
+            items_oc = {str(r[0]): r for r in cur.fetchall()}
+
+            movimientos = []       # (id, material, cantidad, almacén, referencia, usuario)
+            ubicaciones = {}       # (material, almacén) → cantidad
+            recibido = {}          # ítem → (cantidad, último movimiento)
+            total_real = 0.0
+            referencia = f"OC-{oc_id[:8]}"
+            usuario = user.get("username", str(user["id"]))
+
+            for item_recv in lineas:
+                almacen_id = item_recv.almacen_id or payload.almacen_id or oc_almacen
+                if not almacen_id:
+                    raise HTTPException(400, "Se requiere almacen_id para la recepción")
+
+                item_row = items_oc.get(str(uuid.UUID(item_recv.item_id)))
                 if not item_row:
                     raise HTTPException(404, f"Ítem {item_recv.item_id} no pertenece a esta OC")
 
-                _, material_id, cant_pedida, cant_ya_recibida, precio_u = item_row
-                nueva_cantidad = float(cant_ya_recibida) + item_recv.cantidad_recibida
-
-                # Crear stock_movement ENTRADA
-                cur.execute("""
+                item_id, material_id, precio_u = str(item_row[0]), str(item_row[1]), item_row[2]
+                movement_id = str(uuid.uuid4())
+                cantidad = item_recv.cantidad_recibida
+
+                movimientos.append((movement_id, material_id, cantidad, almacen_id, referencia, usuario))
+                ubicaciones[(material_id, almacen_id)] = ubicaciones.get((material_id, almacen_id), 0) + cantidad
+                ya_recibido = recibido.get(item_id, (0, None))[0]
+                recibido[item_id] = (ya_recibido + cantidad, movement_id)
+                total_real += cantidad * float(precio_u)
+
+            if movimientos:
+                # Movimientos ENTRADA (id generado aquí para enlazarlo al ítem).
+                # Ordenados por (material, almacén): los triggers de saldos y
+                # disponibilidad bloquean en ese orden y dos recepciones con
+                # los mismos materiales no se bloquean en cruz
+                movimientos.sort(key=lambda m: (m[1], m[3]))
+                execute_values(cur, """
                     INSERT INTO stock_movements
-                        (material_id, movement_type, quantity,
+                        (id, material_id, movement_type, quantity,
                          from_warehouse, to_warehouse, reference, created_by)
-                    VALUES (%s::uuid, 'IN', %s, NULL, %s::uuid, %s, %s)
-                    RETURNING id
-                """, (
-                    material_id, item_recv.cantidad_recibida,
-                    almacen_id,
-                    f"OC-{oc_id[:8]}",
-                    user.get("username", str(user["id"])),
-                ))
-                movement_id = str(cur.fetchone()[0])
-
-                # Actualizar stock_locations (sin ubicación física específica)
-                cur.execute("""
-                    SELECT id FROM stock_locations
-                    WHERE material_id = %s::uuid AND warehouse_id = %s::uuid
-                      AND rack = '' AND level = '' AND box = '' AND position = ''
-                    FOR UPDATE
-                """, (material_id, almacen_id))
-                loc = cur.fetchone()
-                if loc:
-                    cur.execute(
-                        "UPDATE stock_locations SET quantity = quantity + %s, updated_at = NOW() WHERE id = %s",
-                        (item_recv.cantidad_recibida, loc[0])
-                    )
-                else:
-                    cur.execute("""
-                        INSERT INTO stock_locations
-                            (material_id, warehouse_id, rack, level, box, position, quantity)
-                        VALUES (%s::uuid, %s::uuid, '', '', '', '', %s)
-                    """, (material_id, almacen_id, item_recv.cantidad_recibida))
-
-                # Marcar ítem recibido
-                cur.execute("""
-                    UPDATE ordenes_compra_items
-                    SET cantidad_recibida = %s, stock_movement_id = %s
-                    WHERE id = %s
-                """, (nueva_cantidad, movement_id, item_recv.item_id))
-
-                total_real += item_recv.cantidad_recibida * float(precio_u)
-
-        # Determinar nuevo estado
-        with conn.cursor() as cur:
+                    VALUES %s
+                """, movimientos,
+                    template="(%s::uuid, %s::uuid, 'IN', %s, NULL, %s::uuid, %s, %s)",
+                    page_size=len(movimientos))
+
+                # stock_locations sin ubicación física específica, en el mismo orden
+                execute_values(cur, """
+                    INSERT INTO stock_locations
+                        (material_id, warehouse_id, rack, level, box, position, quantity)
+                    VALUES %s
+                    ON CONFLICT (material_id, warehouse_id, rack, level, box, position)
+                    DO UPDATE SET quantity   = stock_locations.quantity + EXCLUDED.quantity,
+                                  updated_at = NOW()
+                """, [(m, w, q) for (m, w), q in sorted(ubicaciones.items())],
+                    template="(%s::uuid, %s::uuid, '', '', '', '', %s)",
+                    page_size=len(ubicaciones))
+
+                # Marcar ítems recibidos
+                execute_values(cur, """
+                    UPDATE ordenes_compra_items oci
+                    SET cantidad_recibida = oci.cantidad_recibida + v.cantidad,
+                        stock_movement_id = v.movement_id
+                    FROM (VALUES %s) AS v(id, cantidad, movement_id)
+                    WHERE oci.id = v.id
+                """, [(i, q, m) for i, (q, m) in recibido.items()],
+                    template="(%s::uuid, %s::numeric, %s::uuid)",
+                    page_size=len(recibido))
+
+            # Nuevo estado y total real, con los totales de la OC en la misma sentencia
             cur.execute("""
-                SELECT SUM(cantidad_pedida), SUM(cantidad_recibida)
-                FROM ordenes_compra_items WHERE oc_id = %s
-            """, (oc_id,))
-            totals = cur.fetchone()
-            pedida_total = float(totals[0] or 0)
-            recibida_total = float(totals[1] or 0)
-
-        new_status = "RECIBIDA" if recibida_total >= pedida_total else "EN_TRANSITO"
-
-        with conn.cursor() as cur:
-            cur.execute("""
-                UPDATE ordenes_compra
-                SET status = %s,
-                    total_real = COALESCE(total_real, 0) + %s,
-                    fecha_recepcion = CASE WHEN %s = 'RECIBIDA' THEN NOW() ELSE fecha_recepcion END,
+                UPDATE ordenes_compra oc
+                SET status = CASE WHEN t.recibida >= t.pedida THEN 'RECIBIDA' ELSE 'EN_TRANSITO' END,
+                    total_real = COALESCE(oc.total_real, 0) + %s,
+                    fecha_recepcion = CASE WHEN t.recibida >= t.pedida THEN NOW() ELSE oc.fecha_recepcion END,
                     updated_at = NOW()
-                WHERE id = %s
-            """, (new_status, total_real, new_status, oc_id))
+                FROM (
+                    SELECT COALESCE(SUM(cantidad_pedida), 0)   AS pedida,
+                           COALESCE(SUM(cantidad_recibida), 0) AS recibida
+                    FROM ordenes_compra_items WHERE oc_id = %s
+                ) t
+                WHERE oc.id = %s
+            """, (total_real, oc_id, oc_id))
+
+            oc = _fetch_oc(cur, oc_id)
             conn.commit()
 
-    return get_oc_service(oc_id)
+    return oc
 
 
 # ══════════════════════════════════════════════════════════════════════════════
@@ -647,15 +672,9 @@ def recibir_oc_service(oc_id: str, payload, user) -> dict:
 # ══════════════════════════════════════════════════════════════════════════════
 
 def export_oc_excel_service(status=None, proveedor_id=None):
-    from app.core.export_utils import (
-        write_title_row, write_header_row, write_data_row,
-        set_column_widths, fmt_date, fmt_num, excel_response, write_total_row,
-    )
-    import openpyxl
-    from openpyxl.styles import Font, PatternFill
+    from app.core.export_utils import StreamingExcel, fmt_date, fmt_num
     from datetime import datetime
 
-    ocs = list_oc_service(status=status, proveedor_id=proveedor_id)
     fecha = datetime.now().strftime("%d/%m/%Y %H:%M")
 
     STATUS_COLORS = {
@@ -668,10 +687,6 @@ def export_oc_excel_service(status=None, proveedor_id=None):
         "CANCELADA":   ("FEE2E2", "991B1B"),
     }
 
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = "Órdenes de Compra"
-
     headers = [
         "Código OC", "Proveedor", "Estado", "Almacén Destino",
         "Total Estimado (S/)", "Total Real (S/)",
@@ -680,25 +695,30 @@ def export_oc_excel_service(status=None, proveedor_id=None):
     ]
     widths = [13, 32, 14, 24, 18, 16, 16, 18, 16, 32]
 
-    write_title_row(ws, f"CeShark ERP — Órdenes de Compra — {fecha}", len(headers))
-    write_header_row(ws, headers, row=2)
-    set_column_widths(ws, widths)
-    ws.row_dimensions[1].height = 26
-    ws.row_dimensions[2].height = 18
+    book = StreamingExcel()
+    sheet = book.sheet(
+        "Órdenes de Compra", headers, widths,
+        title=f"CeShark ERP — Órdenes de Compra — {fecha}",
+    )
 
     total_est_sum = 0.0
     total_real_sum = 0.0
+    count = 0
 
-    for i, oc in enumerate(ocs, start=1):
+    sql, params = _oc_list_query(status=status, proveedor_id=proveedor_id)
+    for i, row in enumerate(stream_query(sql, params, name="export_oc"), start=1):
+        oc = _row_to_oc(row)
+        count += 1
         t_est = oc.get("total_estimado") or 0
         t_real = oc.get("total_real") or 0
         total_est_sum  += float(t_est)
         total_real_sum += float(t_real)
 
-        write_data_row(ws, i + 2, [
+        status_val = oc.get("status", "")
+        sheet.data_row([
             oc.get("code", ""),
             oc.get("proveedor_nombre", ""),
-            oc.get("status", ""),
+            status_val,
             oc.get("almacen_nombre") or "",
             fmt_num(t_est),
             fmt_num(t_real) if t_real else "",
@@ -706,23 +726,16 @@ def export_oc_excel_service(status=None, proveedor_id=None):
             fmt_date(oc.get("fecha_entrega_est")),
             fmt_date(oc.get("fecha_recepcion")),
             oc.get("notas") or "",
-        ], alternate=(i % 2 == 0))
+        ], alternate=(i % 2 == 0),
+           badges={3: STATUS_COLORS[status_val]} if status_val in STATUS_COLORS else None)
 
-        status_val = oc.get("status", "")
-        if status_val in STATUS_COLORS:
-            bg, fg = STATUS_COLORS[status_val]
-            c = ws.cell(row=i + 2, column=3)
-            c.fill = PatternFill("solid", fgColor=bg)
-            c.font = Font(size=9, bold=True, color=fg)
-
-    tot_row = len(ocs) + 3
-    write_total_row(ws, tot_row, [
-        f"TOTAL ({len(ocs)} OCs)", "", "", "",
+    sheet.total_row([
+        f"TOTAL ({count} OCs)", "", "", "",
         fmt_num(total_est_sum), fmt_num(total_real_sum),
         "", "", "", "",
-    ], len(headers))
+    ])
 
-    return excel_response(wb, f"ordenes_compra_{datetime.now().strftime('%Y%m%d')}.xlsx")
+    return book.response(f"ordenes_compra_{datetime.now().strftime('%Y%m%d')}.xlsx")
 
 
 # ══════════════════════════════════════════════════════════════════════════════
@@ -730,21 +743,11 @@ def export_oc_excel_service(status=None, proveedor_id=None):
 # ══════════════════════════════════════════════════════════════════════════════
 
 def export_proveedores_excel_service():
-    from app.core.export_utils import (
-        write_title_row, write_header_row, write_data_row,
-        set_column_widths, fmt_date, excel_response,
-    )
-    import openpyxl
-    from openpyxl.styles import Font, PatternFill
+    from app.core.export_utils import StreamingExcel, fmt_date
     from datetime import datetime
 
-    proveedores = list_proveedores_service()
     fecha = datetime.now().strftime("%d/%m/%Y %H:%M")
 
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = "Proveedores"
-
     headers = [
         "Código", "Nombre / Razón Social", "RUC",
         "Teléfono", "Email", "Contacto",
@@ -752,15 +755,17 @@ def export_proveedores_excel_service():
     ]
     widths = [11, 36, 13, 15, 28, 22, 16, 10, 32, 14]
 
-    write_title_row(ws, f"CeShark ERP — Catálogo de Proveedores — {fecha}", len(headers))
-    write_header_row(ws, headers, row=2)
-    set_column_widths(ws, widths)
-    ws.row_dimensions[1].height = 26
-    ws.row_dimensions[2].height = 18
+    book = StreamingExcel()
+    sheet = book.sheet(
+        "Proveedores", headers, widths,
+        title=f"CeShark ERP — Catálogo de Proveedores — {fecha}",
+    )
 
-    for i, p in enumerate(proveedores, start=1):
+    sql, params = _proveedores_list_query()
+    for i, row in enumerate(stream_query(sql, params, name="export_proveedores"), start=1):
+        p = _row_to_proveedor(row)
         activo = p.get("activo", True)
-        write_data_row(ws, i + 2, [
+        sheet.data_row([
             p.get("codigo", ""),
             p.get("nombre", ""),
             p.get("ruc") or "",
@@ -771,22 +776,9 @@ def export_proveedores_excel_service():
             "Activo" if activo else "Inactivo",
             p.get("direccion") or "",
             fmt_date(p.get("created_at")),
-        ], alternate=(i % 2 == 0))
-
-        c = ws.cell(row=i + 2, column=8)
-        if activo:
-            c.fill = PatternFill("solid", fgColor="D1FAE5")
-            c.font = Font(size=9, bold=True, color="065F46")
-        else:
-            c.fill = PatternFill("solid", fgColor="FEE2E2")
-            c.font = Font(size=9, bold=True, color="991B1B")
-
-        tipo_c = ws.cell(row=i + 2, column=7)
-        if p.get("tipo") == "SUBCONTRATISTA":
-            tipo_c.fill = PatternFill("solid", fgColor="FEF3C7")
-            tipo_c.font = Font(size=9, color="92400E")
-        else:
-            tipo_c.fill = PatternFill("solid", fgColor="DCFCE7")
-            tipo_c.font = Font(size=9, color="166534")
-
-    return excel_response(wb, f"proveedores_{datetime.now().strftime('%Y%m%d')}.xlsx")
+        ], alternate=(i % 2 == 0), badges={
+            7: ("FEF3C7", "92400E") if p.get("tipo") == "SUBCONTRATISTA" else ("DCFCE7", "166534"),
+            8: ("D1FAE5", "065F46") if activo else ("FEE2E2", "991B1B"),
+        })
+
+    return book.response(f"proveedores_{datetime.now().strftime('%Y%m%d')}.xlsx")
@@ -1,4 +1,6 @@
+import io
 from fastapi import APIRouter, Depends, Query, UploadFile, File
+from app.core.jobs.runner import submit_job
 from app.core.security.dependencies import get_current_user
 from app.modules.cotizaciones.schemas import (
     RecursoMOCreate, RecursoMOUpdate,
@@ -169,12 +171,22 @@ def update_cotizacion_status(
 # ── Exportación ───────────────────────────────────────────────────────────────
 
 @router.get("/planes/{plan_id}/export/pdf")
-def export_pdf(plan_id: str, current_user=Depends(get_current_user)):
+def export_pdf(plan_id: str, background: bool = Query(False), current_user=Depends(get_current_user)):
+    if background:
+        return submit_job(
+            "cotizaciones.export_pdf", export_pdf_service, plan_id,
+            user=current_user, params={"plan_id": plan_id},
+        )
     return export_pdf_service(plan_id)
 
 
 @router.get("/planes/{plan_id}/export/excel")
-def export_excel(plan_id: str, current_user=Depends(get_current_user)):
+def export_excel(plan_id: str, background: bool = Query(False), current_user=Depends(get_current_user)):
+    if background:
+        return submit_job(
+            "cotizaciones.export_excel", export_excel_service, plan_id,
+            user=current_user, params={"plan_id": plan_id},
+        )
     return export_excel_service(plan_id)
 
 
@@ -196,7 +208,16 @@ def create_baul(payload: BaulCreate, current_user=Depends(get_current_user)):
     return create_baul_service(payload)
 
 @router.post("/baules/import")
-def import_baules(file: UploadFile = File(...), current_user=Depends(get_current_user)):
+def import_baules(
+    file: UploadFile = File(...),
+    background: bool = Query(False),
+    current_user=Depends(get_current_user),
+):
+    if background:
+        return submit_job(
+            "cotizaciones.import_baules", import_baules_from_excel_service, io.BytesIO(file.file.read()),
+            user=current_user, params={"filename": file.filename},
+        )
     return import_baules_from_excel_service(file.file)
 
 @router.patch("/baules/{baul_id}")
@@ -2,6 +2,7 @@ from datetime import datetime
 from fastapi import HTTPException
 from fastapi.responses import StreamingResponse
 from psycopg2 import sql
+from psycopg2.extras import execute_values
 from app.core.database import db_connection
 from app.core.utils import generate_sequential_code
 import io
@@ -196,16 +197,6 @@ def delete_recurso_mo_service(recurso_id: str) -> dict:
 # PARTIDAS DEL PRESUPUESTO
 # ══════════════════════════════════════════════════════════════════════════════
 
-def _apu_subtotal(conn, partida_id: str) -> float:
-    with conn.cursor() as cur:
-        cur.execute("""
-            SELECT COALESCE(SUM(cantidad * precio_unitario), 0)
-            FROM presupuesto_apu_items
-            WHERE partida_id = %s
-        """, (partida_id,))
-        return float(cur.fetchone()[0])
-
-
 def _row_to_partida(r, apu_items=None) -> dict:
     return {
         "id": str(r[0]), "plan_id": str(r[1]),
@@ -228,10 +219,7 @@ def list_partidas_service(plan_id: str) -> list:
             cur.execute("""
                 SELECT pp.id, pp.plan_id, pp.codigo, pp.descripcion,
                        pp.unidad, pp.cantidad, pp.orden, pp.es_capitulo, pp.parent_id,
-                       COALESCE((
-                           SELECT SUM(ai.cantidad * ai.precio_unitario)
-                           FROM presupuesto_apu_items ai WHERE ai.partida_id = pp.id
-                       ), 0) AS precio_unitario_apu
+                       pp.precio_unitario_apu
                 FROM presupuesto_partidas pp
                 WHERE pp.plan_id = %s
                 ORDER BY pp.orden, pp.codigo
@@ -257,7 +245,8 @@ def create_partida_service(plan_id: str, payload) -> dict:
                 INSERT INTO presupuesto_partidas
                     (plan_id, codigo, descripcion, unidad, cantidad, orden, es_capitulo, parent_id)
                 VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-                RETURNING id, plan_id, codigo, descripcion, unidad, cantidad, orden, es_capitulo, parent_id, NULL
+                RETURNING id, plan_id, codigo, descripcion, unidad, cantidad, orden, es_capitulo, parent_id,
+                          precio_unitario_apu
             """, (
                 plan_id, payload.codigo.strip(), payload.descripcion.strip(),
                 payload.unidad, payload.cantidad, payload.orden,
@@ -289,15 +278,15 @@ def update_partida_service(plan_id: str, partida_id: str, payload) -> dict:
             cur.execute(
                 f"UPDATE presupuesto_partidas SET {', '.join(fields)} "
                 "WHERE id = %s AND plan_id = %s "
-                "RETURNING id, plan_id, codigo, descripcion, unidad, cantidad, orden, es_capitulo, parent_id",
+                "RETURNING id, plan_id, codigo, descripcion, unidad, cantidad, orden, es_capitulo, parent_id, "
+                "precio_unitario_apu",
                 vals,
             )
             row = cur.fetchone()
             if not row:
                 raise HTTPException(404, "Partida no encontrada")
-            pu = _apu_subtotal(conn, str(row[0]))
             conn.commit()
-    return _row_to_partida((*row, pu))
+    return _row_to_partida(row)
 
 
 def delete_partida_service(plan_id: str, partida_id: str) -> dict:
@@ -707,21 +696,20 @@ def get_cotizaciones_stats_service() -> dict:
 
 
 def _compute_resumen(conn, plan_id: str) -> dict:
-    # Breakdown de costos por categoría (directo e indirecto)
+    # Breakdown de costos por categoría (directo e indirecto).
+    # presupuesto_categoria_totales lo mantienen los triggers de la migración 053.
     with conn.cursor() as cur:
         cur.execute("""
             SELECT
-                COALESCE(cc.codigo, ai.tipo_recurso)  AS codigo,
-                COALESCE(cc.nombre, ai.tipo_recurso)  AS nombre,
+                COALESCE(cc.codigo, t.tipo_recurso)   AS codigo,
+                COALESCE(cc.nombre, t.tipo_recurso)   AS nombre,
                 COALESCE(cc.es_directo, TRUE)          AS es_directo,
                 COALESCE(cc.orden, 99)                 AS orden,
                 COALESCE(cc.color_hex, '#4F7C82')      AS color_hex,
-                SUM(pp.cantidad * ai.cantidad * ai.precio_unitario) AS costo
-            FROM presupuesto_partidas pp
-            JOIN presupuesto_apu_items ai ON ai.partida_id = pp.id
-            LEFT JOIN categorias_costo cc ON cc.codigo = ai.tipo_recurso
-            WHERE pp.plan_id = %s AND pp.es_capitulo = FALSE
-            GROUP BY cc.codigo, ai.tipo_recurso, cc.nombre, cc.es_directo, cc.orden, cc.color_hex
+                t.costo
+            FROM presupuesto_categoria_totales t
+            LEFT JOIN categorias_costo cc ON cc.codigo = t.tipo_recurso
+            WHERE t.plan_id = %s AND t.lineas > 0
             ORDER BY COALESCE(cc.orden, 99)
         """, (plan_id,))
         categorias_rows = cur.fetchall()
@@ -819,17 +807,15 @@ def export_pdf_service(plan_id: str) -> StreamingResponse:
         with conn.cursor() as cur:
             cur.execute("""
                 SELECT pp.id, pp.codigo, pp.descripcion, pp.unidad, pp.cantidad, pp.es_capitulo,
-                       COALESCE((
-                           SELECT SUM(ai.cantidad * ai.precio_unitario)
-                           FROM presupuesto_apu_items ai WHERE ai.partida_id = pp.id
-                       ), 0) AS precio_apu
+                       pp.precio_unitario_apu
                 FROM presupuesto_partidas pp
                 WHERE pp.plan_id = %s
                 ORDER BY pp.orden, pp.codigo
             """, (plan_id,))
             partidas = cur.fetchall()
 
-    resumen = _compute_resumen_raw(cfg)
+        resumen = _compute_resumen(conn, plan_id)
+
     fecha = datetime.now().strftime("%d/%m/%Y")
 
     PRIMARY = colors.HexColor("#0B2E33")
@@ -945,8 +931,8 @@ def export_pdf_service(plan_id: str) -> StreamingResponse:
     r = resumen
     summary_data = [
         ["COSTO DIRECTO", f"{moneda} {r['costo_directo']:,.2f}"],
-        [f"GASTOS GENERALES ({r['gg_pct']:.1f}%)", f"{moneda} {r['gastos_generales']:,.2f}"],
-        [f"UTILIDAD ({r['ut_pct']:.1f}%)", f"{moneda} {r['utilidad']:,.2f}"],
+        [f"GASTOS GENERALES ({r['gastos_generales_pct']:.1f}%)", f"{moneda} {r['gastos_generales']:,.2f}"],
+        [f"UTILIDAD ({r['utilidad_pct']:.1f}%)", f"{moneda} {r['utilidad']:,.2f}"],
         ["VALOR VENTA", f"{moneda} {r['valor_venta']:,.2f}"],
         [f"IGV ({r['igv_pct']:.1f}%)", f"{moneda} {r['igv']:,.2f}"],
         ["PRECIO TOTAL", f"{moneda} {r['precio_total']:,.2f}"],
@@ -985,21 +971,6 @@ def export_pdf_service(plan_id: str) -> StreamingResponse:
     )
 
 
-def _compute_resumen_raw(cfg) -> dict:
-    return {
-        "gg_pct": float(cfg[5]),
-        "ut_pct": float(cfg[6]),
-        "igv_pct": float(cfg[7]),
-        "costo_directo": 0,
-        "gastos_generales": 0,
-        "sub_total": 0,
-        "utilidad": 0,
-        "valor_venta": 0,
-        "igv": 0,
-        "precio_total": 0,
-    }
-
-
 # ══════════════════════════════════════════════════════════════════════════════
 # EXPORTACIÓN EXCEL
 # ══════════════════════════════════════════════════════════════════════════════
@@ -1457,7 +1428,7 @@ def bulk_create_apu_service(partida_id: str, items: list) -> list:
             if not cur.fetchone():
                 raise HTTPException(404, "Partida no encontrada")
 
-            results = []
+            rows, names = [], []
             for payload in items:
                 if payload.tipo_recurso not in valid_tipos:
                     raise HTTPException(400, f"tipo_recurso inválido: {payload.tipo_recurso}")
@@ -1478,22 +1449,25 @@ def bulk_create_apu_service(partida_id: str, items: list) -> list:
                         raise HTTPException(400, f"recurso_mo_id no existe: {payload.recurso_mo_id}")
                     mo_codigo = row[0]
 
-                cur.execute("""
-                    INSERT INTO presupuesto_apu_items
-                        (partida_id, tipo_recurso, material_id, recurso_mo_id,
-                         descripcion, unidad, cantidad, precio_unitario)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-                    RETURNING id, partida_id, tipo_recurso, material_id, recurso_mo_id,
-                              descripcion, unidad, cantidad, precio_unitario
-                """, (
+                rows.append((
                     partida_id, payload.tipo_recurso,
                     payload.material_id if payload.tipo_recurso != "MO" else None,
                     payload.recurso_mo_id if payload.tipo_recurso == "MO" else None,
                     payload.descripcion, payload.unidad,
                     payload.cantidad, payload.precio_unitario,
                 ))
-                row = cur.fetchone()
-                results.append(_row_to_apu((*row, mat_nombre, mo_codigo)))
+                names.append((mat_nombre, mo_codigo))
+
+            # Un solo INSERT: los totales de la partida/plan (trigger por sentencia) se actualizan una vez
+            inserted = execute_values(cur, """
+                INSERT INTO presupuesto_apu_items
+                    (partida_id, tipo_recurso, material_id, recurso_mo_id,
+                     descripcion, unidad, cantidad, precio_unitario)
+                VALUES %s
+                RETURNING id, partida_id, tipo_recurso, material_id, recurso_mo_id,
+                          descripcion, unidad, cantidad, precio_unitario
+            """, rows, page_size=len(rows), fetch=True)
+            results = [_row_to_apu((*row, *name)) for row, name in zip(inserted, names)]
 
             conn.commit()
     return results
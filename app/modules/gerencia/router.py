@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends, Query
+from fastapi import APIRouter, Depends, Query, Response
 from app.core.security.dependencies import get_current_user
 from app.modules.gerencia.schemas import AprobacionDecidir
 from app.modules.gerencia.service import (
@@ -10,10 +10,18 @@ router = APIRouter(prefix="/gerencia", tags=["Gerencia"])
 
 @router.get("/aprobaciones")
 def list_aprobaciones(
+    response: Response,
     estado: str = Query(None),
+    limit: int = Query(100, ge=1, le=500),
+    offset: int = Query(0, ge=0),
     current_user=Depends(get_current_user),
 ):
-    return list_aprobaciones_service(estado=estado)
+    # El cuerpo sigue siendo la lista; la paginación va en cabeceras
+    aprobaciones, total = list_aprobaciones_service(estado=estado, limit=limit, offset=offset)
+    response.headers["X-Total-Count"] = str(total)
+    if offset + len(aprobaciones) < total:
+        response.headers["X-Next-Offset"] = str(offset + len(aprobaciones))
+    return aprobaciones
 
 @router.post("/aprobaciones/{aprobacion_id}/decidir")
 def decidir_aprobacion(
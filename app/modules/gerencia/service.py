@@ -2,7 +2,102 @@ from fastapi import HTTPException
 from app.core.database import db_connection
 from app.modules.gerencia.schemas import AprobacionDecidir
 
-def list_aprobaciones_service(estado: str = None):
+# ── Detalles por tipo (una consulta por tipo para toda la página) ────────────
+
+def _detalles_visitas(cur, ref_ids: list) -> dict:
+    cur.execute("""
+        SELECT vt.id, vt.fecha_visita, vt.destino, vt.motivo, vt.costo_estimado, p.title
+        FROM visitas_tecnicas vt
+        JOIN project_plans p ON vt.plan_id = p.id
+        WHERE vt.id = ANY(%s::uuid[])
+    """, (ref_ids,))
+    return {
+        str(r[0]): {
+            "fecha_visita": str(r[1]) if r[1] else None,
+            "destino": r[2],
+            "motivo": r[3],
+            "costo_estimado": float(r[4]),
+            "proyecto": r[5]
+        }
+        for r in cur.fetchall()
+    }
+
+
+def _detalles_cotizaciones(cur, ref_ids: list) -> dict:
+    cur.execute("""
+        SELECT pc.id, pc.numero_cotizacion, pc.cliente_nombre, pc.moneda, pc.plazo_dias,
+               pc.validez_dias, pc.plan_id, p.title,
+               (SELECT COUNT(*) FROM presupuesto_partidas pp WHERE pp.plan_id = pc.plan_id)
+        FROM presupuesto_config pc
+        JOIN project_plans p ON pc.plan_id = p.id
+        WHERE pc.id = ANY(%s::uuid[])
+    """, (ref_ids,))
+    return {
+        str(r[0]): {
+            "numero_cotizacion": r[1],
+            "cliente_nombre": r[2],
+            "moneda": r[3],
+            "plazo_dias": r[4],
+            "validez_dias": r[5],
+            "plan_id": str(r[6]),
+            "proyecto": r[7],
+            "partidas_count": r[8],
+        }
+        for r in cur.fetchall()
+    }
+
+
+def _detalles_prestamos(cur, ref_ids: list) -> dict:
+    cur.execute("""
+        SELECT oc.id, oc.code, pr.nombre, wh.name, oc.total_estimado, oc.notas
+        FROM ordenes_compra oc
+        JOIN proveedores pr ON oc.proveedor_id = pr.id
+        JOIN warehouses wh ON oc.almacen_destino = wh.id
+        WHERE oc.id = ANY(%s::uuid[])
+    """, (ref_ids,))
+    detalles = {
+        str(r[0]): {
+            "code": r[1],
+            "proveedor": r[2],
+            "almacen": r[3],
+            "total_estimado": float(r[4]) if r[4] is not None else None,
+            "notas": r[5],
+            "items": []
+        }
+        for r in cur.fetchall()
+    }
+    if not detalles:
+        return detalles
+
+    # Ítems de todas las órdenes de compra de la página
+    cur.execute("""
+        SELECT oci.oc_id, m.name, oci.cantidad_pedida, oci.precio_unitario, oci.notas
+        FROM ordenes_compra_items oci
+        JOIN materials m ON oci.material_id = m.id
+        WHERE oci.oc_id = ANY(%s::uuid[])
+    """, (list(detalles),))
+    for item in cur.fetchall():
+        detalles[str(item[0])]["items"].append({
+            "material": item[1],
+            "cantidad": float(item[2]),
+            "precio_unitario": float(item[3]),
+            "notas": item[4]
+        })
+    return detalles
+
+
+_DETALLES_POR_TIPO = {
+    "VISITA_TECNICA": _detalles_visitas,
+    "COTIZACION": _detalles_cotizaciones,
+    "PRESTAMO_COMPRA": _detalles_prestamos,
+}
+
+
+def list_aprobaciones_service(estado: str = None, limit: int = 100, offset: int = 0):
+    """
+    Página de aprobaciones y total del filtro: (aprobaciones, total).
+    El total sale de la misma consulta de la página (COUNT(*) OVER ()).
+    """
     with db_connection() as conn:
         with conn.cursor() as cur:
             query = """
@@ -18,102 +113,50 @@ def list_aprobaciones_service(estado: str = None):
                     u.username AS solicitante_username,
                     a.notas_gerencia,
                     a.created_at,
-                    a.updated_at
+                    a.updated_at,
+                    COUNT(*) OVER () AS total
                 FROM aprobaciones_gerencia a
                 JOIN users u ON a.solicitado_por = u.id
             """
+            where = ""
             params = []
             if estado:
-                query += " WHERE a.estado = %s"
+                where = " WHERE a.estado = %s"
                 params.append(estado)
-            query += " ORDER BY a.created_at DESC"
-            
-            cur.execute(query, tuple(params))
+            query += where + " ORDER BY a.created_at DESC, a.id LIMIT %s OFFSET %s"
+
+            cur.execute(query, tuple(params + [limit, offset]))
             rows = cur.fetchall()
-            
+
+            if rows:
+                total = rows[0][12]
+            elif offset:
+                # Página fuera de rango: la ventana no trae filas, se cuenta aparte
+                cur.execute(
+                    "SELECT COUNT(*) FROM aprobaciones_gerencia a JOIN users u ON a.solicitado_por = u.id" + where,
+                    tuple(params),
+                )
+                total = cur.fetchone()[0]
+            else:
+                total = 0
+
+            # Detalles del objeto referenciado para inspección gerencial:
+            # una consulta por tipo presente en la página, no por aprobación
+            ref_ids_por_tipo: dict = {}
+            for r in rows:
+                if r[1] in _DETALLES_POR_TIPO:
+                    ref_ids_por_tipo.setdefault(r[1], set()).add(str(r[2]))
+            detalles_por_tipo = {
+                tipo: _DETALLES_POR_TIPO[tipo](cur, sorted(ref_ids))
+                for tipo, ref_ids in ref_ids_por_tipo.items()
+            }
+
             aprobaciones = []
             for r in rows:
-                ap_id = str(r[0])
                 tipo = r[1]
                 ref_id = str(r[2])
-                
-                detalles = {}
-                # Obtener detalles del objeto referenciado para inspección gerencial
-                if tipo == 'VISITA_TECNICA':
-                    cur.execute("""
-                        SELECT vt.fecha_visita, vt.destino, vt.motivo, vt.costo_estimado, p.title
-                        FROM visitas_tecnicas vt
-                        JOIN project_plans p ON vt.plan_id = p.id
-                        WHERE vt.id = %s
-                    """, (ref_id,))
-                    vt_row = cur.fetchone()
-                    if vt_row:
-                        detalles = {
-                            "fecha_visita": str(vt_row[0]) if vt_row[0] else None,
-                            "destino": vt_row[1],
-                            "motivo": vt_row[2],
-                            "costo_estimado": float(vt_row[3]),
-                            "proyecto": vt_row[4]
-                        }
-                elif tipo == 'COTIZACION':
-                    cur.execute("""
-                        SELECT pc.numero_cotizacion, pc.cliente_nombre, pc.moneda, pc.plazo_dias, pc.validez_dias, pc.plan_id, p.title
-                        FROM presupuesto_config pc
-                        JOIN project_plans p ON pc.plan_id = p.id
-                        WHERE pc.id = %s
-                    """, (ref_id,))
-                    pc_row = cur.fetchone()
-                    if pc_row:
-                        detalles = {
-                            "numero_cotizacion": pc_row[0],
-                            "cliente_nombre": pc_row[1],
-                            "moneda": pc_row[2],
-                            "plazo_dias": pc_row[3],
-                            "validez_dias": pc_row[4],
-                            "plan_id": str(pc_row[5]),
-                            "proyecto": pc_row[6]
-                        }
-                        # Contar partidas
-                        cur.execute("SELECT COUNT(*) FROM presupuesto_partidas WHERE plan_id = %s;", (pc_row[5],))
-                        detalles["partidas_count"] = cur.fetchone()[0]
-                elif tipo == 'PRESTAMO_COMPRA':
-                    cur.execute("""
-                        SELECT oc.code, pr.nombre, wh.name, oc.total_estimado, oc.notas
-                        FROM ordenes_compra oc
-                        JOIN proveedores pr ON oc.proveedor_id = pr.id
-                        JOIN warehouses wh ON oc.almacen_destino = wh.id
-                        WHERE oc.id = %s
-                    """, (ref_id,))
-                    oc_row = cur.fetchone()
-                    if oc_row:
-                        detalles = {
-                            "code": oc_row[0],
-                            "proveedor": oc_row[1],
-                            "almacen": oc_row[2],
-                            "total_estimado": float(oc_row[3]) if oc_row[3] is not None else None,
-                            "notas": oc_row[4],
-                            "items": []
-                        }
-                        # Traer ítems de la orden de compra
-                        cur.execute("""
-                            SELECT m.name, oci.cantidad_pedida, oci.precio_unitario, oci.notas
-                            FROM ordenes_compra_items oci
-                            JOIN materials m ON oci.material_id = m.id
-                            WHERE oci.oc_id = %s
-                        """, (ref_id,))
-                        item_rows = cur.fetchall()
-                        detalles["items"] = [
-                            {
-                                "material": item[0],
-                                "cantidad": float(item[1]),
-                                "precio_unitario": float(item[2]),
-                                "notas": item[3]
-                            }
-                            for item in item_rows
-                        ]
-                
                 aprobaciones.append({
-                    "id": ap_id,
+                    "id": str(r[0]),
                     "tipo": tipo,
                     "referencia_id": ref_id,
                     "titulo": r[3],
@@ -125,9 +168,9 @@ def list_aprobaciones_service(estado: str = None):
                     "notas_gerencia": r[9],
                     "created_at": r[10],
                     "updated_at": r[11],
-                    "detalles": detalles
+                    "detalles": detalles_por_tipo.get(tipo, {}).get(ref_id, {})
                 })
-            return aprobaciones
+            return aprobaciones, total
 
 def decidir_aprobacion_service(aprobacion_id: str, payload: AprobacionDecidir, current_user):
     is_gerente = current_user.get("primary_module") == "gerente" or "admin" in current_user.get("permissions", [])
@@ -0,0 +1,225 @@
+"""
+Motor de alertas de stock (reposición): una sola pasada sobre stock_balances.
+
+Clases, de más a menos severa (cada fila lleva solo la más severa):
+  NEGATIVE       stock < 0
+  BELOW_MIN      stock <= mínimo                (mínimo > 0)
+  BELOW_REORDER  stock <= punto de reposición   (punto > 0)
+  OVER_MAX       stock > máximo                 (máximo > 0)
+
+Se evalúa cada (material, almacén) con los umbrales de
+warehouse_stock_policies (migración 052, NULL = valor global de materials)
+y el total de cada material (warehouse_id None) con los umbrales globales.
+
+Cache por tenant en memoria. Cada lectura pide a la DB los materiales cuyo
+saldo o política cambió desde la pasada anterior (updated_at, con un margen
+REORDER_ALERTS_LOOKBACK para transacciones que confirman tarde) y recalcula
+solo esos, así un movimiento registrado por cualquier worker se refleja en
+la siguiente lectura. materials no tiene updated_at: los servicios que crean,
+editan, validan, importan o borran materiales llaman a invalidate() tras el
+commit, lo que cubre al worker que hizo el cambio. Los demás workers lo ven
+en la pasada completa, cada REORDER_ALERTS_FULL_REFRESH segundos.
+"""
+import threading
+import time
+from datetime import timedelta
+from typing import Iterable, Optional
+
+from app.core.config import settings
+from app.core.database import db_connection
+from app.core.tenant_context import get_tenant_db
+
+ALERT_CLASSES = ("NEGATIVE", "BELOW_MIN", "BELOW_REORDER", "OVER_MAX")
+_SEVERITY = {c: i for i, c in enumerate(ALERT_CLASSES)}
+
+_ALERTS_SQL = """
+    WITH bal AS (
+        SELECT material_id, warehouse_id, SUM(quantity) AS qty
+        FROM stock_balances
+        WHERE %(materials)s::uuid[] IS NULL OR material_id = ANY(%(materials)s::uuid[])
+        GROUP BY material_id, warehouse_id
+    ), pol AS (
+        SELECT material_id, warehouse_id, min_stock, reorder_point, max_stock
+        FROM warehouse_stock_policies
+        WHERE %(materials)s::uuid[] IS NULL OR material_id = ANY(%(materials)s::uuid[])
+    ), pairs AS (
+        -- Saldos + políticas en almacenes donde el material aún no tiene saldo (stock 0)
+        SELECT COALESCE(b.material_id, p.material_id)   AS material_id,
+               COALESCE(b.warehouse_id, p.warehouse_id) AS warehouse_id,
+               COALESCE(b.qty, 0) AS qty,
+               p.min_stock, p.reorder_point, p.max_stock
+        FROM bal b
+        FULL JOIN pol p ON p.material_id = b.material_id AND p.warehouse_id = b.warehouse_id
+    ), levels AS (
+        -- ROLLUP: una fila por (material, almacén) y otra con el total del material
+        SELECT m.id AS material_id,
+               pr.warehouse_id,
+               COALESCE(SUM(pr.qty), 0) AS qty,
+               CASE WHEN GROUPING(pr.warehouse_id) = 1 THEN m.min_stock
+                    ELSE COALESCE(MAX(pr.min_stock), m.min_stock) END     AS min_stock,
+               CASE WHEN GROUPING(pr.warehouse_id) = 1 THEN m.reorder_point
+                    ELSE COALESCE(MAX(pr.reorder_point), m.reorder_point) END AS reorder_point,
+               CASE WHEN GROUPING(pr.warehouse_id) = 1 THEN m.max_stock
+                    ELSE COALESCE(MAX(pr.max_stock), m.max_stock) END     AS max_stock
+        FROM materials m
+        LEFT JOIN pairs pr ON pr.material_id = m.id
+        WHERE %(materials)s::uuid[] IS NULL OR m.id = ANY(%(materials)s::uuid[])
+        GROUP BY m.id, m.min_stock, m.reorder_point, m.max_stock, ROLLUP (pr.warehouse_id)
+        HAVING GROUPING(pr.warehouse_id) = 1 OR pr.warehouse_id IS NOT NULL
+    ), classified AS (
+        SELECT l.*,
+               CASE
+                   WHEN l.qty < 0                                    THEN 'NEGATIVE'
+                   WHEN l.min_stock > 0     AND l.qty <= l.min_stock     THEN 'BELOW_MIN'
+                   WHEN l.reorder_point > 0 AND l.qty <= l.reorder_point THEN 'BELOW_REORDER'
+                   WHEN l.max_stock > 0     AND l.qty > l.max_stock      THEN 'OVER_MAX'
+               END AS alert
+        FROM levels l
+    )
+    SELECT c.material_id, c.warehouse_id, c.qty,
+           COALESCE(c.min_stock, 0), COALESCE(c.reorder_point, 0), COALESCE(c.max_stock, 0),
+           c.alert, m.code, m.name, m.unit, m.category, m.supplier_name,
+           COALESCE(NULLIF(m.weighted_avg_cost, 0), m.unit_cost, 0)
+    FROM classified c
+    JOIN materials m ON m.id = c.material_id
+    WHERE c.alert IS NOT NULL
+"""
+
+_CHANGED_SQL = """
+    SELECT material_id FROM stock_balances WHERE updated_at > %(since)s
+    UNION
+    SELECT material_id FROM warehouse_stock_policies WHERE updated_at > %(since)s
+"""
+
+
+def _suggested_qty(qty: float, min_stock: float, reorder_point: float, max_stock: float) -> float:
+    """Cantidad a pedir para llegar al máximo (o 2 × mínimo / punto de reposición)."""
+    target = max_stock or (min_stock * 2) or reorder_point
+    return max(0.0, round(target - qty, 2))
+
+
+def _row(r) -> dict:
+    qty, min_stock, reorder_point, max_stock = (float(v) for v in r[2:6])
+    return {
+        "material_id":         str(r[0]),
+        "warehouse_id":        str(r[1]) if r[1] is not None else None,
+        "current_stock":       qty,
+        "min_stock":           min_stock,
+        "reorder_point":       reorder_point,
+        "max_stock":           max_stock,
+        "alert":               r[6],
+        "code":                r[7],
+        "name":                r[8],
+        "unit":                r[9],
+        "category":            r[10],
+        "supplier_name":       r[11],
+        "unit_cost":           float(r[12]),
+        "suggested_order_qty": _suggested_qty(qty, min_stock, reorder_point, max_stock),
+    }
+
+
+class _TenantAlerts:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.by_material: dict[str, list[dict]] = {}
+        self.watermark = None          # now() de la DB en la última pasada
+        self.full_at = 0.0             # monotonic de la última pasada completa
+        self.pending: set[str] = set() # invalidados en este worker
+        self.force_full = False
+
+
+_tenants: dict[Optional[str], _TenantAlerts] = {}
+_tenants_lock = threading.Lock()
+_stats = {"full_refreshes": 0, "incremental_refreshes": 0, "materials_recomputed": 0}
+
+
+def _entry() -> _TenantAlerts:
+    key = get_tenant_db()
+    with _tenants_lock:
+        entry = _tenants.get(key)
+        if entry is None:
+            entry = _tenants[key] = _TenantAlerts()
+        return entry
+
+
+def _refresh(entry: _TenantAlerts) -> None:
+    """Llamar con entry.lock tomado."""
+    now = time.monotonic()
+    full = entry.watermark is None or entry.force_full \
+        or now - entry.full_at >= settings.REORDER_ALERTS_FULL_REFRESH
+
+    with db_connection() as conn:
+        with conn.cursor() as cur:
+            # Mismo tipo que updated_at (timestamp sin zona)
+            cur.execute("SELECT now()::timestamp")
+            watermark = cur.fetchone()[0]
+
+            if full:
+                cur.execute(_ALERTS_SQL, {"materials": None})
+                by_material: dict[str, list[dict]] = {}
+                for r in cur.fetchall():
+                    row = _row(r)
+                    by_material.setdefault(row["material_id"], []).append(row)
+                entry.by_material = by_material
+                entry.full_at = now
+                entry.force_full = False
+                _stats["full_refreshes"] += 1
+            else:
+                since = entry.watermark - timedelta(seconds=settings.REORDER_ALERTS_LOOKBACK)
+                cur.execute(_CHANGED_SQL, {"since": since})
+                changed = {str(r[0]) for r in cur.fetchall()} | entry.pending
+                if changed:
+                    cur.execute(_ALERTS_SQL, {"materials": list(changed)})
+                    for material_id in changed:
+                        entry.by_material.pop(material_id, None)
+                    for r in cur.fetchall():
+                        row = _row(r)
+                        entry.by_material.setdefault(row["material_id"], []).append(row)
+                    _stats["incremental_refreshes"] += 1
+                    _stats["materials_recomputed"] += len(changed)
+        conn.commit()
+
+    entry.watermark = watermark
+    entry.pending.clear()
+
+
+def stock_alerts(
+    warehouse_id: Optional[str] = None,
+    alerts: Optional[Iterable[str]] = None,
+    totals: bool = False,
+) -> list[dict]:
+    """
+    Alertas vigentes del tenant actual, de más a menos severa.
+    totals=True: una fila por material (stock total, umbrales globales);
+    si no, una por (material, almacén), opcionalmente de un solo almacén.
+    """
+    wanted = set(alerts) if alerts else None
+    entry = _entry()
+    with entry.lock:
+        _refresh(entry)
+        rows = [
+            dict(row)
+            for material_rows in entry.by_material.values()
+            for row in material_rows
+            if (row["warehouse_id"] is None) == totals
+            and (warehouse_id is None or row["warehouse_id"] == warehouse_id)
+            and (wanted is None or row["alert"] in wanted)
+        ]
+    rows.sort(key=lambda r: (_SEVERITY[r["alert"]], r["current_stock"], r["code"]))
+    return rows
+
+
+def invalidate(material_ids: Optional[Iterable[str]] = None) -> None:
+    """Umbrales cambiados en este worker: recalcular esos materiales (None = todo)."""
+    entry = _entry()
+    with entry.lock:
+        if material_ids is None:
+            entry.force_full = True
+        else:
+            entry.pending.update(str(m) for m in material_ids)
+
+
+def stats() -> dict:
+    with _tenants_lock:
+        tenants = len(_tenants)
+    return {**_stats, "tenants": tenants}
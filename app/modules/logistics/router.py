@@ -1,5 +1,7 @@
+import io
 from fastapi import APIRouter, Query, UploadFile, File, Depends
 from pydantic import BaseModel
+from app.core.jobs.runner import submit_job
 from app.core.security.dependencies import get_current_user
 from app.core.security.permissions import require_permission
 from app.modules.logistics.schemas import (
@@ -28,6 +30,8 @@ from app.modules.logistics.service import (
     get_stock_movements_history,
     get_current_stock,
     get_current_stock_summary,
+    verify_stock_balances_service,
+    rebuild_stock_balances_service,
     get_negative_stock,
     upsert_stock_location,
     get_material_locations,
@@ -40,7 +44,7 @@ from app.modules.logistics.service import (
     register_tool_maintenance,
     get_tool_maintenance_alerts,
     create_material_service,
-    get_materials_service,
+    get_materials_async_service,
     update_material_service,
     delete_material_service,
     import_materials_from_excel,
@@ -48,10 +52,10 @@ from app.modules.logistics.service import (
     import_stock_out_from_excel,
     reset_logistics_data_service,
     create_warehouse_service,
-    get_warehouses_service,
+    get_warehouses_async_service,
     update_warehouse_service,
     delete_warehouse_service,
-    get_stock_availability_service,
+    get_stock_availability_async_service,
     update_stock_location_meta_service,
     get_warehouse_inventory_service,
     get_calibration_alerts,
@@ -109,8 +113,8 @@ def create_material(payload: MaterialCreate):
 # 📋 LISTAR MATERIALES (con filtro ?estado=)
 # ============================================================
 @router.get("/materials", dependencies=[Depends(get_current_user)])
-def get_materials(estado: str = Query(None)):
-    return get_materials_service(estado=estado)
+async def get_materials(estado: str = Query(None)):
+    return await get_materials_async_service(estado=estado)
 
 
 # ============================================================
@@ -299,6 +303,31 @@ def stock_summary(material_id: str | None = None, _=Depends(get_current_user)):
     return get_current_stock_summary(material_id)
 
 
+# ============================================================
+# 🧮 SALDOS MATERIALIZADOS (stock_balances)
+# ============================================================
+@router.get(
+    "/stock/balances/verify",
+    dependencies=[Depends(require_permission("logistics:admin:reset"))]
+)
+def verify_stock_balances():
+    """
+    Compara el saldo materializado contra la suma de stock_movements.
+    """
+    return verify_stock_balances_service()
+
+
+@router.post(
+    "/stock/balances/rebuild",
+    dependencies=[Depends(require_permission("logistics:admin:reset"))]
+)
+def rebuild_stock_balances():
+    """
+    Reconstruye stock_balances desde stock_movements.
+    """
+    return rebuild_stock_balances_service()
+
+
 # ============================================================
 # 🚨 ALERTAS DE STOCK NEGATIVO
 # ============================================================
@@ -380,25 +409,45 @@ def maintenance_alerts(days: int = 7):
 @router.get("/stock/ranking", dependencies=[Depends(get_current_user)])
 def ranking_materials(limit: int = 10):
     return get_most_used_materials(limit)
-@router.post(
-    "/materials/import",
-    dependencies=[Depends(require_permission("logistics:import:materials"))]
-)
-def import_materials(file: UploadFile = File(...)):
+# background=true: responde 202 con un job_id (ver /jobs) en vez de importar
+# dentro del request. El archivo se lee aquí: el UploadFile se cierra al responder.
+@router.post("/materials/import")
+def import_materials(
+    file: UploadFile = File(...),
+    background: bool = Query(False),
+    user=Depends(require_permission("logistics:import:materials")),
+):
+    if background:
+        return submit_job(
+            "logistics.import_materials", import_materials_from_excel, io.BytesIO(file.file.read()),
+            user=user, params={"filename": file.filename},
+        )
     return import_materials_from_excel(file.file)
 
-@router.post(
-    "/stock/import-in",
-    dependencies=[Depends(require_permission("logistics:import:stock"))]
-)
-def import_stock_in(file: UploadFile = File(...)):
+@router.post("/stock/import-in")
+def import_stock_in(
+    file: UploadFile = File(...),
+    background: bool = Query(False),
+    user=Depends(require_permission("logistics:import:stock")),
+):
+    if background:
+        return submit_job(
+            "logistics.import_stock_in", import_stock_in_from_excel, io.BytesIO(file.file.read()),
+            user=user, params={"filename": file.filename},
+        )
     return import_stock_in_from_excel(file.file)
 
-@router.post(
-    "/stock/import-out",
-    dependencies=[Depends(require_permission("logistics:import:stock"))]
-)
-def import_stock_out(file: UploadFile = File(...)):
+@router.post("/stock/import-out")
+def import_stock_out(
+    file: UploadFile = File(...),
+    background: bool = Query(False),
+    user=Depends(require_permission("logistics:import:stock")),
+):
+    if background:
+        return submit_job(
+            "logistics.import_stock_out", import_stock_out_from_excel, io.BytesIO(file.file.read()),
+            user=user, params={"filename": file.filename},
+        )
     return import_stock_out_from_excel(file.file)
 
 # ============================================================
@@ -429,8 +478,8 @@ def create_warehouse(payload: WarehouseCreate):
 
 
 @router.get("/warehouses", dependencies=[Depends(get_current_user)])
-def get_warehouses():
-    return get_warehouses_service()
+async def get_warehouses():
+    return await get_warehouses_async_service()
 
 
 @router.get("/warehouses/{warehouse_id}/inventory", dependencies=[Depends(get_current_user)])
@@ -460,11 +509,11 @@ def delete_warehouse(warehouse_id: str):
 
 
 @router.get("/stock/availability", dependencies=[Depends(get_current_user)])
-def stock_availability():
+async def stock_availability():
     """
     Flat list: material + warehouse + stock disponible + ubicación física.
     """
-    return get_stock_availability_service()
+    return await get_stock_availability_async_service()
 
 
 class StockLocationMetaUpdate(BaseModel):
@@ -534,18 +583,30 @@ def delete_project(project_id: str):
 # 📥 IMPORTACIONES MASIVAS
 # ============================================================
 
-@router.post(
-    "/warehouses/import",
-    dependencies=[Depends(require_permission("logistics:stock:move"))]
-)
-def import_warehouses(file: UploadFile = File(...)):
+@router.post("/warehouses/import")
+def import_warehouses(
+    file: UploadFile = File(...),
+    background: bool = Query(False),
+    user=Depends(require_permission("logistics:stock:move")),
+):
+    if background:
+        return submit_job(
+            "logistics.import_warehouses", import_warehouses_from_excel, io.BytesIO(file.file.read()),
+            user=user, params={"filename": file.filename},
+        )
     return import_warehouses_from_excel(file.file)
 
-@router.post(
-    "/projects/import",
-    dependencies=[Depends(require_permission("logistics:stock:move"))]
-)
-def import_projects(file: UploadFile = File(...)):
+@router.post("/projects/import")
+def import_projects(
+    file: UploadFile = File(...),
+    background: bool = Query(False),
+    user=Depends(require_permission("logistics:stock:move")),
+):
+    if background:
+        return submit_job(
+            "logistics.import_projects", import_projects_from_excel, io.BytesIO(file.file.read()),
+            user=user, params={"filename": file.filename},
+        )
     return import_projects_from_excel(file.file)
 
 @router.post(
@@ -698,13 +759,17 @@ def project_requirements_gap(project_id: str):
 # 📥 EXPORTAR MATERIALES / STOCK A EXCEL
 # ============================================================
 
-@router.get("/materials/export", dependencies=[Depends(get_current_user)])
-def export_materials_excel():
+@router.get("/materials/export")
+def export_materials_excel(background: bool = Query(False), user=Depends(get_current_user)):
     """Descarga el catálogo completo de materiales como Excel."""
+    if background:
+        return submit_job("logistics.export_materials", export_materials_excel_service, user=user)
     return export_materials_excel_service()
 
 
-@router.get("/stock/export", dependencies=[Depends(get_current_user)])
-def export_stock_excel():
+@router.get("/stock/export")
+def export_stock_excel(background: bool = Query(False), user=Depends(get_current_user)):
     """Descarga el reporte de stock actual por almacén como Excel."""
+    if background:
+        return submit_job("logistics.export_stock", export_stock_excel_service, user=user)
     return export_stock_excel_service()
@@ -1,19 +1,30 @@
 """
 Funcionalidades avanzadas de Logística:
-  · Kardex con costo unitario y valor total
+  · Kardex con costo unitario y valor total (paginado por keyset + exportación)
   · Valorización de inventario (costo promedio ponderado)
-  · Punto de reposición / alertas de reposición
-  · Códigos QR (generar imagen PNG)
+  · Alertas de stock (negativo / mínimo / reposición / máximo) y umbrales por almacén
+  · Códigos QR (imagen PNG en caché) y hojas de etiquetas PDF en lote
 Endpoints: /logistics/advanced/*
 """
+import base64
 import io
-import qrcode
-from fastapi import APIRouter, Depends, HTTPException, Query
-from fastapi.responses import StreamingResponse
-from pydantic import BaseModel
+from datetime import datetime
+from uuid import UUID
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi.responses import Response, StreamingResponse
+from pydantic import BaseModel, Field
 from typing import Optional
-from app.core.database import db_connection
+from app.core import labels
+from app.core.config import settings
+from app.core.database import db_connection, stream_query
+from app.core.jobs.runner import report_progress, submit_job
 from app.core.security.permissions import require_permission
+from app.modules.logistics import reorder
+from app.modules.logistics.service import (
+    rebuild_stock_valuation_service,
+    verify_stock_valuation_service,
+)
 
 router = APIRouter(prefix="/logistics/advanced", tags=["Avanzado"])
 
@@ -22,90 +33,201 @@ router = APIRouter(prefix="/logistics/advanced", tags=["Avanzado"])
 # KARDEX CON COSTO
 # ══════════════════════════════════════════════════════════════
 
+# Signo del movimiento en el saldo. Con filtro de almacén: entra o sale de ese
+# almacén (las transferencias cuentan). Sin filtro: las transferencias son neutras.
+_KARDEX_SIGN = """
+    CASE
+        WHEN %(warehouse_id)s::uuid IS NOT NULL THEN
+            CASE WHEN sm.to_warehouse   = %(warehouse_id)s::uuid THEN 1
+                 WHEN sm.from_warehouse = %(warehouse_id)s::uuid THEN -1
+                 ELSE 0 END
+        WHEN sm.to_warehouse IS NOT NULL AND sm.from_warehouse IS NULL THEN 1
+        WHEN sm.from_warehouse IS NOT NULL AND sm.to_warehouse IS NULL THEN -1
+        ELSE 0
+    END
+"""
+_KARDEX_COST = "COALESCE(sm.unit_cost, m.unit_cost, 0)"
+_KARDEX_WHERE = """
+    sm.material_id = %(material_id)s::uuid
+    AND (%(warehouse_id)s::uuid IS NULL
+         OR sm.from_warehouse = %(warehouse_id)s::uuid
+         OR sm.to_warehouse   = %(warehouse_id)s::uuid)
+"""
+_KARDEX_ROWS = f"""
+    SELECT
+        sm.id,
+        sm.movement_type,
+        sm.quantity,
+        {_KARDEX_COST}                AS unit_cost,
+        sm.quantity * {_KARDEX_COST}  AS line_value,
+        sm.reference,
+        sm.notes,
+        sm.created_at,
+        fw.name AS from_warehouse,
+        tw.name AS to_warehouse,
+        sm.lot_id,
+        {_KARDEX_SIGN}                AS direction
+    FROM stock_movements sm
+    JOIN materials m ON m.id = sm.material_id
+    LEFT JOIN warehouses fw ON fw.id = sm.from_warehouse
+    LEFT JOIN warehouses tw ON tw.id = sm.to_warehouse
+    WHERE {_KARDEX_WHERE}
+"""
+_SIGN_LABEL = {1: "+", -1: "−", 0: "→"}
+
+
+def _encode_cursor(created_at: datetime, movement_id) -> str:
+    raw = f"{created_at.isoformat()}|{movement_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> tuple[datetime, str]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, movement_id = raw.split("|")
+        return datetime.fromisoformat(created_at), str(UUID(movement_id))
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(400, "Cursor inválido")
+
+
+def _kardex_material(cur, material_id: str) -> tuple:
+    cur.execute(
+        "SELECT id, code, name, unit, unit_cost, weighted_avg_cost FROM materials WHERE id = %s::uuid",
+        (material_id,)
+    )
+    mat = cur.fetchone()
+    if not mat:
+        raise HTTPException(404, "Material no encontrado")
+    return mat
+
+
 @router.get("/kardex/{material_id}")
 def kardex_with_cost(
     material_id: str,
     warehouse_id: Optional[str] = None,
-    limit: int = Query(200, le=1000),
+    limit: int = Query(200, ge=1, le=1000),
+    cursor: Optional[str] = Query(None, description="next_cursor de la página anterior"),
     _=Depends(require_permission("logistics:stock:view")),
 ):
     """
-    Kardex completo: muestra cantidad, costo unitario, valor del movimiento
-    y saldo acumulado en valor para un material dado.
+    Kardex paginado por keyset (created_at, id): cantidad, costo unitario,
+    valor del movimiento y saldo acumulado. Cada página trae su saldo inicial
+    (suma de todos los movimientos anteriores al cursor), así que el saldo es
+    correcto en cualquier página. Historial completo: /kardex/{id}/export.
     """
+    params = {"material_id": material_id, "warehouse_id": warehouse_id}
+    after = _decode_cursor(cursor) if cursor else None
+
     with db_connection() as conn:
         with conn.cursor() as cur:
-            cur.execute("""
-                SELECT
-                    sm.id,
-                    sm.movement_type,
-                    sm.quantity,
-                    COALESCE(sm.unit_cost, m.unit_cost, 0)  AS unit_cost,
-                    sm.quantity * COALESCE(sm.unit_cost, m.unit_cost, 0) AS line_value,
-                    sm.reference,
-                    sm.notes,
-                    sm.created_at,
-                    fw.name AS from_warehouse,
-                    tw.name AS to_warehouse,
-                    sm.lot_id
-                FROM stock_movements sm
-                JOIN materials m ON m.id = sm.material_id
-                LEFT JOIN warehouses fw ON fw.id = sm.from_warehouse
-                LEFT JOIN warehouses tw ON tw.id = sm.to_warehouse
-                WHERE sm.material_id = %s::uuid
-                  AND (%s IS NULL OR sm.from_warehouse = %s::uuid OR sm.to_warehouse = %s::uuid)
-                ORDER BY sm.created_at ASC
-                LIMIT %s
-            """, (material_id, warehouse_id, warehouse_id, warehouse_id, limit))
+            mat = _kardex_material(cur, material_id)
+
+            opening_qty = opening_value = 0.0
+            page_query = _KARDEX_ROWS
+            if after:
+                params["after_ts"], params["after_id"] = after
+                keyset = " AND (sm.created_at, sm.id) {} (%(after_ts)s, %(after_id)s::uuid)"
+                cur.execute(f"""
+                    SELECT COALESCE(SUM(({_KARDEX_SIGN}) * sm.quantity), 0),
+                           COALESCE(SUM(({_KARDEX_SIGN}) * sm.quantity * {_KARDEX_COST}), 0)
+                    FROM stock_movements sm
+                    JOIN materials m ON m.id = sm.material_id
+                    WHERE {_KARDEX_WHERE}
+                """ + keyset.format("<="), params)
+                opening_qty, opening_value = (float(v) for v in cur.fetchone())
+                page_query += keyset.format(">")
+
+            # limit + 1: la fila extra solo indica si hay otra página
+            params["limit"] = limit + 1
+            cur.execute(page_query + " ORDER BY sm.created_at, sm.id LIMIT %(limit)s", params)
             rows = cur.fetchall()
             cols = [d[0] for d in cur.description]
 
-            cur.execute(
-                "SELECT id, code, name, unit, unit_cost, weighted_avg_cost FROM materials WHERE id = %s::uuid",
-                (material_id,)
-            )
-            mat = cur.fetchone()
-            if not mat:
-                raise HTTPException(404, "Material no encontrado")
+    has_more = len(rows) > limit
+    rows = rows[:limit]
 
-    # Calcular saldo acumulado en cantidad y valor
     movements = []
-    running_qty   = 0.0
-    running_value = 0.0
+    running_qty   = opening_qty
+    running_value = opening_value
     for r in rows:
         row = dict(zip(cols, r))
-        mv = row["movement_type"]
-        qty = float(row["quantity"])
-        val = float(row["line_value"])
-
-        if mv in ("IN", "RETURN", "ADJUST") and row["from_warehouse"] is None:
-            running_qty   += qty
-            running_value += val
-            sign = "+"
-        elif mv in ("OUT", "ADJUST") and row["to_warehouse"] is None:
-            running_qty   -= qty
-            running_value -= val
-            sign = "−"
-        else:
-            sign = "→"   # TRANSFER — neutro en el saldo
-
+        direction = row.pop("direction")
+        running_qty   += direction * float(row["quantity"])
+        running_value += direction * float(row["line_value"])
         row["running_quantity"] = round(running_qty, 4)
         row["running_value"]    = round(running_value, 4)
-        row["sign"]             = sign
+        row["sign"]             = _SIGN_LABEL[direction]
         movements.append(row)
 
+    last = rows[-1] if rows else None
     return {
         "material": {
             "id": str(mat[0]), "code": mat[1], "name": mat[2],
             "unit": mat[3], "unit_cost": float(mat[4] or 0),
             "weighted_avg_cost": float(mat[5] or 0),
         },
+        "opening_quantity": round(opening_qty, 4),
+        "opening_value": round(opening_value, 4),
         "movements": movements,
         "total_quantity": round(running_qty, 4),
         "total_value": round(running_value, 4),
+        "has_more": has_more,
+        "next_cursor": _encode_cursor(last[cols.index("created_at")], last[0]) if has_more else None,
     }
 
 
+@router.get("/kardex/{material_id}/export")
+def export_kardex(
+    material_id: str,
+    warehouse_id: Optional[str] = None,
+    format: str = Query("xlsx", pattern="^(xlsx|csv)$"),
+    _=Depends(require_permission("logistics:stock:view")),
+):
+    """
+    Historial completo del kardex con saldo acumulado, en streaming
+    (cursor de servidor, memoria constante) como .xlsx o .csv.
+    """
+    from app.core.export_utils import StreamingExcel, csv_response, fmt_num
+
+    with db_connection() as conn:
+        with conn.cursor() as cur:
+            mat = _kardex_material(cur, material_id)
+
+    params = {"material_id": material_id, "warehouse_id": warehouse_id}
+    rows = stream_query(_KARDEX_ROWS + " ORDER BY sm.created_at, sm.id", params, name="export_kardex")
+
+    def lines():
+        running_qty = running_value = 0.0
+        for (_id, mv, qty, unit_cost, line_value, reference, notes,
+             created_at, from_wh, to_wh, _lot, direction) in rows:
+            running_qty   += direction * float(qty)
+            running_value += direction * float(line_value)
+            yield [
+                created_at.strftime("%d/%m/%Y %H:%M") if created_at else "",
+                mv, _SIGN_LABEL[direction], from_wh or "", to_wh or "",
+                float(qty), float(unit_cost), float(line_value),
+                round(running_qty, 4), round(running_value, 4),
+                reference or "", notes or "",
+            ]
+
+    headers = ["Fecha", "Tipo", "Signo", "Desde", "Hacia", "Cantidad", "Costo Unit.",
+               "Valor", "Saldo Cant.", "Saldo Valor", "Referencia", "Notas"]
+    filename = f"kardex_{mat[1]}_{datetime.now().strftime('%Y%m%d')}"
+
+    if format == "csv":
+        return csv_response(headers, lines(), f"{filename}.csv")
+
+    book = StreamingExcel()
+    sheet = book.sheet(
+        "Kardex", headers, [16, 10, 7, 22, 22, 12, 12, 14, 12, 14, 20, 30],
+        title=f"CeShark ERP — Kardex {mat[1]} — {mat[2]}",
+    )
+    for i, line in enumerate(lines(), start=1):
+        line[5:10] = [fmt_num(v, d) for v, d in zip(line[5:10], (2, 4, 2, 2, 2))]
+        sheet.data_row(line, alternate=(i % 2 == 0))
+    return book.response(f"{filename}.xlsx")
+
+
 # ══════════════════════════════════════════════════════════════
 # VALORIZACIÓN DE INVENTARIO (Costo Promedio Ponderado)
 # ══════════════════════════════════════════════════════════════
@@ -117,90 +239,63 @@ def inventory_valuation(
 ):
     """
     Retorna el inventario valorizado: stock actual × costo promedio ponderado.
-    Recalcula el CPP en tiempo real a partir de los movimientos de entrada con costo.
+    Lee stock_valuation y materials.weighted_avg_cost, mantenidos por trigger
+    al registrar cada movimiento (migración 047).
     """
     with db_connection() as conn:
         with conn.cursor() as cur:
             cur.execute("""
-                WITH entradas AS (
-                    -- Costo promedio ponderado: promedio de entradas con costo > 0
-                    SELECT
-                        sm.material_id,
-                        CASE
-                            WHEN SUM(CASE WHEN sm.unit_cost > 0 THEN sm.quantity ELSE 0 END) > 0
-                            THEN SUM(CASE WHEN sm.unit_cost > 0 THEN sm.quantity * sm.unit_cost ELSE 0 END)
-                               / SUM(CASE WHEN sm.unit_cost > 0 THEN sm.quantity ELSE 0 END)
-                            ELSE MAX(m.unit_cost)
-                        END AS weighted_avg_cost
-                    FROM stock_movements sm
-                    JOIN materials m ON m.id = sm.material_id
-                    WHERE sm.movement_type IN ('IN', 'RETURN')
-                    GROUP BY sm.material_id
-                ),
-                stock_actual AS (
-                    SELECT
-                        sm.material_id,
-                        sm.to_warehouse   AS warehouse_id,
-                        SUM(CASE WHEN sm.to_warehouse IS NOT NULL AND sm.movement_type IN ('IN','RETURN','TRANSFER','ADJUST')
-                                 THEN sm.quantity ELSE 0 END) -
-                        SUM(CASE WHEN sm.from_warehouse IS NOT NULL AND sm.movement_type IN ('OUT','TRANSFER','ADJUST')
-                                 THEN sm.quantity ELSE 0 END) AS qty
-                    FROM stock_movements sm
-                    WHERE %s IS NULL OR sm.to_warehouse = %s::uuid OR sm.from_warehouse = %s::uuid
-                    GROUP BY sm.material_id, sm.to_warehouse
-                )
                 SELECT
                     m.id, m.code, m.name, m.unit, m.category,
-                    w.name AS warehouse_name,
-                    COALESCE(sa.qty, 0)                             AS current_stock,
-                    COALESCE(e.weighted_avg_cost, m.unit_cost, 0)  AS weighted_avg_cost,
-                    COALESCE(sa.qty, 0) *
-                        COALESCE(e.weighted_avg_cost, m.unit_cost, 0) AS total_value
-                FROM materials m
-                JOIN stock_actual sa ON sa.material_id = m.id
-                LEFT JOIN warehouses w ON w.id = sa.warehouse_id
-                LEFT JOIN entradas e ON e.material_id = m.id
-                WHERE COALESCE(sa.qty, 0) > 0
-                ORDER BY total_value DESC
-            """, (warehouse_id, warehouse_id, warehouse_id))
+                    w.name                                              AS warehouse_name,
+                    v.quantity                                          AS current_stock,
+                    COALESCE(NULLIF(m.weighted_avg_cost, 0), m.unit_cost, 0) AS weighted_avg_cost,
+                    v.value                                             AS total_value
+                FROM stock_valuation v
+                JOIN materials m ON m.id = v.material_id
+                LEFT JOIN warehouses w ON w.id = v.warehouse_id
+                WHERE v.quantity > 0
+                  AND (%s IS NULL OR v.warehouse_id = %s::uuid)
+                ORDER BY v.value DESC
+            """, (warehouse_id, warehouse_id))
             rows = cur.fetchall()
             cols = [d[0] for d in cur.description]
 
-            # Total general
-            cur.execute("""
-                SELECT COALESCE(SUM(
-                    COALESCE(stock.qty, 0) *
-                    COALESCE(e.weighted_avg_cost, m.unit_cost, 0)
-                ), 0)
-                FROM materials m
-                JOIN (
-                    SELECT material_id,
-                        SUM(CASE WHEN to_warehouse IS NOT NULL THEN quantity ELSE 0 END) -
-                        SUM(CASE WHEN from_warehouse IS NOT NULL THEN quantity ELSE 0 END) AS qty
-                    FROM stock_movements GROUP BY material_id
-                ) stock ON stock.material_id = m.id
-                LEFT JOIN (
-                    SELECT material_id,
-                        SUM(CASE WHEN unit_cost > 0 THEN quantity * unit_cost ELSE 0 END) /
-                        NULLIF(SUM(CASE WHEN unit_cost > 0 THEN quantity ELSE 0 END), 0)
-                        AS weighted_avg_cost
-                    FROM stock_movements WHERE movement_type IN ('IN','RETURN')
-                    GROUP BY material_id
-                ) e ON e.material_id = m.id
-                WHERE stock.qty > 0
-            """)
-            total_row = cur.fetchone()
-
+    items = [dict(zip(cols, r)) for r in rows]
     return {
-        "total_value": float(total_row[0]) if total_row else 0,
-        "items": [dict(zip(cols, r)) for r in rows],
+        "total_value": float(sum(i["total_value"] for i in items)),
+        "items": items,
     }
 
 
+@router.get("/valuation/verify")
+def verify_inventory_valuation(
+    _=Depends(require_permission("logistics:admin:reset")),
+):
+    """
+    Compara la valorización materializada contra el kardex.
+    """
+    return verify_stock_valuation_service()
+
+
+@router.post("/valuation/rebuild")
+def rebuild_inventory_valuation(
+    material_id: Optional[str] = None,
+    _=Depends(require_permission("logistics:admin:reset")),
+):
+    """
+    Recalcula el CPP reproduciendo el kardex (un material o todos).
+    """
+    return rebuild_stock_valuation_service(material_id)
+
+
 # ══════════════════════════════════════════════════════════════
 # PUNTO DE REPOSICIÓN / ALERTAS DE REPOSICIÓN
 # ══════════════════════════════════════════════════════════════
 
+# Todas las alertas salen del motor único (app/modules/logistics/reorder.py):
+# una pasada sobre stock_balances, cache por tenant, recálculo por material.
+
 @router.get("/reorder-alerts")
 def reorder_alerts(
     warehouse_id: Optional[str] = None,
@@ -209,44 +304,83 @@ def reorder_alerts(
     """
     Materiales cuyo stock actual está en o por debajo del punto de reposición.
     Incluye sugerencia de cantidad a comprar (hasta llegar al stock máximo).
+    Con warehouse_id se usan los umbrales de ese almacén.
     """
+    rows = reorder.stock_alerts(
+        warehouse_id=warehouse_id,
+        alerts=("NEGATIVE", "BELOW_MIN", "BELOW_REORDER"),
+        totals=warehouse_id is None,
+    )
+    result = []
+    for a in rows:
+        if a["reorder_point"] <= 0 or a["current_stock"] > a["reorder_point"]:
+            continue
+        critical = a["alert"] != "BELOW_REORDER" or a["current_stock"] <= 0
+        result.append({
+            "id": a["material_id"], "code": a["code"], "name": a["name"],
+            "unit": a["unit"], "category": a["category"],
+            "min_stock": a["min_stock"], "reorder_point": a["reorder_point"],
+            "max_stock": a["max_stock"], "supplier_name": a["supplier_name"],
+            "unit_cost": a["unit_cost"], "current_stock": a["current_stock"],
+            "suggested_order_qty": a["suggested_order_qty"],
+            "alert_level": "CRITICAL" if critical else "LOW",
+        })
+    return result
+
+
+@router.get("/stock-alerts")
+def stock_alerts(
+    warehouse_id: Optional[str] = None,
+    alert: Optional[list[str]] = Query(None, description="NEGATIVE, BELOW_MIN, BELOW_REORDER, OVER_MAX"),
+    totals: bool = Query(False, description="una fila por material (stock total, umbrales globales)"),
+    _=Depends(require_permission("logistics:stock:view")),
+):
+    """Todas las clases de alerta (negativo, bajo mínimo, bajo punto de reposición,
+    sobre máximo) por material y almacén, con el resumen por clase."""
+    if alert and not set(alert) <= set(reorder.ALERT_CLASSES):
+        raise HTTPException(400, f"alert debe ser uno de {', '.join(reorder.ALERT_CLASSES)}")
+    rows = reorder.stock_alerts(warehouse_id=warehouse_id, alerts=alert, totals=totals)
+    summary = {c: 0 for c in reorder.ALERT_CLASSES}
+    for a in rows:
+        summary[a["alert"]] += 1
+    return {"summary": summary, "items": rows}
+
+
+class StockPolicy(BaseModel):
+    min_stock: Optional[float] = None       # None = usa el valor global del material
+    reorder_point: Optional[float] = None
+    max_stock: Optional[float] = None
+
+
+@router.put("/materials/{material_id}/stock-policies/{warehouse_id}")
+def set_stock_policy(
+    material_id: str,
+    warehouse_id: str,
+    body: StockPolicy,
+    _=Depends(require_permission("logistics:stock:move")),
+):
+    """Umbrales de un material en un almacén. Todos en null = volver a los globales."""
+    values = body.model_dump()
+    if any(v is not None and v < 0 for v in values.values()):
+        raise HTTPException(400, "Los umbrales no pueden ser negativos")
     with db_connection() as conn:
         with conn.cursor() as cur:
+            # La fila se conserva aunque quede vacía: su updated_at avisa del
+            # cambio al motor de alertas de los demás workers
             cur.execute("""
-                WITH stock_actual AS (
-                    SELECT
-                        material_id,
-                        SUM(CASE WHEN to_warehouse IS NOT NULL   THEN quantity ELSE 0 END) -
-                        SUM(CASE WHEN from_warehouse IS NOT NULL THEN quantity ELSE 0 END) AS qty
-                    FROM stock_movements
-                    WHERE %s IS NULL OR to_warehouse = %s::uuid OR from_warehouse = %s::uuid
-                    GROUP BY material_id
-                )
-                SELECT
-                    m.id, m.code, m.name, m.unit, m.category,
-                    m.min_stock, m.reorder_point, m.max_stock,
-                    m.supplier_name,
-                    COALESCE(m.weighted_avg_cost, m.unit_cost, 0) AS unit_cost,
-                    COALESCE(sa.qty, 0)  AS current_stock,
-                    GREATEST(0, COALESCE(m.max_stock, m.min_stock * 2, 0) - COALESCE(sa.qty, 0))
-                        AS suggested_order_qty,
-                    CASE
-                        WHEN COALESCE(sa.qty, 0) <= 0               THEN 'CRITICAL'
-                        WHEN COALESCE(sa.qty, 0) <= m.min_stock     THEN 'CRITICAL'
-                        WHEN COALESCE(sa.qty, 0) <= m.reorder_point THEN 'LOW'
-                        ELSE 'OK'
-                    END AS alert_level
-                FROM materials m
-                LEFT JOIN stock_actual sa ON sa.material_id = m.id
-                WHERE m.reorder_point > 0
-                  AND COALESCE(sa.qty, 0) <= m.reorder_point
-                ORDER BY
-                    CASE WHEN COALESCE(sa.qty, 0) <= m.min_stock THEN 0 ELSE 1 END ASC,
-                    current_stock ASC
-            """, (warehouse_id, warehouse_id, warehouse_id))
-            rows = cur.fetchall()
-            cols = [d[0] for d in cur.description]
-    return [dict(zip(cols, r)) for r in rows]
+                INSERT INTO warehouse_stock_policies
+                    (material_id, warehouse_id, min_stock, reorder_point, max_stock, updated_at)
+                VALUES (%(material_id)s::uuid, %(warehouse_id)s::uuid,
+                        %(min_stock)s, %(reorder_point)s, %(max_stock)s, NOW())
+                ON CONFLICT (material_id, warehouse_id) DO UPDATE
+                SET min_stock = EXCLUDED.min_stock,
+                    reorder_point = EXCLUDED.reorder_point,
+                    max_stock = EXCLUDED.max_stock,
+                    updated_at = NOW()
+            """, {"material_id": material_id, "warehouse_id": warehouse_id, **values})
+        conn.commit()
+    reorder.invalidate([material_id])
+    return {"ok": True}
 
 
 @router.patch("/materials/{material_id}/reorder-config")
@@ -280,16 +414,34 @@ def update_reorder_config(
                 values
             )
         conn.commit()
+    reorder.invalidate([material_id])
     return {"ok": True}
 
 
 # ══════════════════════════════════════════════════════════════
-# CÓDIGO QR — generar imagen PNG
+# CÓDIGO QR — imagen PNG (caché en disco, app/core/labels.py)
 # ══════════════════════════════════════════════════════════════
 
+_HEX_COLOR = "^#[0-9A-Fa-f]{6}$"
+
+
+def _qr_response(qr_data: str, filename: str, color: str, size: int, if_none_match: Optional[str]):
+    png, key = labels.qr_png(qr_data, color, size)
+    etag = f'"{key}"'
+    # no-cache: el cliente revalida (el qr_code del material puede cambiar) y recibe 304
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if if_none_match == etag:
+        return Response(status_code=304, headers=headers)
+    headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return Response(content=png, media_type="image/png", headers=headers)
+
+
 @router.get("/qr/material/{material_id}")
 def generate_material_qr(
     material_id: str,
+    color: str = Query(labels.QR_FILL, pattern=_HEX_COLOR),
+    size: int = Query(labels.QR_BOX_SIZE, ge=2, le=40),
+    if_none_match: Optional[str] = Header(None),
     _=Depends(require_permission("logistics:stock:view")),
 ):
     """Genera una imagen QR PNG con el código único del material."""
@@ -304,31 +456,15 @@ def generate_material_qr(
                 raise HTTPException(404, "Material no encontrado")
             qr_data = mat[2] or mat[0]
 
-    qr = qrcode.QRCode(
-        version=1,
-        error_correction=qrcode.constants.ERROR_CORRECT_H,
-        box_size=10,
-        border=4,
-    )
-    qr.add_data(qr_data)
-    qr.make(fit=True)
-    img = qr.make_image(fill_color="#0B2E33", back_color="white")
-
-    buf = io.BytesIO()
-    img.save(buf, format="PNG")
-    buf.seek(0)
-
-    filename = f"QR_{mat[0]}.png"
-    return StreamingResponse(
-        buf,
-        media_type="image/png",
-        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
-    )
+    return _qr_response(qr_data, f"QR_{mat[0]}.png", color, size, if_none_match)
 
 
 @router.get("/qr/lot/{lot_id}")
 def generate_lot_qr(
     lot_id: str,
+    color: str = Query(labels.QR_FILL, pattern=_HEX_COLOR),
+    size: int = Query(labels.QR_BOX_SIZE, ge=2, le=40),
+    if_none_match: Optional[str] = Header(None),
     _=Depends(require_permission("logistics:lots:view")),
 ):
     """Genera una imagen QR PNG con el código único del lote."""
@@ -345,23 +481,108 @@ def generate_lot_qr(
                 raise HTTPException(404, "Lote no encontrado")
             qr_data = lot[1] or f"{lot[2]}-{lot[0]}"
 
-    qr = qrcode.QRCode(
-        version=1,
-        error_correction=qrcode.constants.ERROR_CORRECT_H,
-        box_size=10,
-        border=4,
-    )
-    qr.add_data(qr_data)
-    qr.make(fit=True)
-    img = qr.make_image(fill_color="#0B2E33", back_color="white")
+    return _qr_response(qr_data, f"QR_LOT_{lot[0]}.png", color, size, if_none_match)
+
+
+# ══════════════════════════════════════════════════════════════
+# HOJA DE ETIQUETAS — PDF con un QR por material o lote
+# ══════════════════════════════════════════════════════════════
+
+class LabelSheetRequest(BaseModel):
+    warehouse_id: Optional[str] = None   # materiales con stock en el almacén
+    category: Optional[str] = None       # materiales de la categoría (combinable con almacén)
+    lot_ids: Optional[list[str]] = None  # lotes puntuales (p. ej. una recepción nueva)
+    color: str = Field(labels.QR_FILL, pattern=_HEX_COLOR)
+
+
+# Mismo payload que /qr/material y /qr/lot
+_LABEL_MATERIALS_SQL = """
+    SELECT COALESCE(m.qr_code, m.code), m.code, m.name, m.unit
+    FROM materials m
+    WHERE (%(category)s::text IS NULL OR m.category = %(category)s)
+      AND (%(warehouse_id)s::uuid IS NULL OR m.id IN (
+            SELECT sb.material_id FROM stock_balances sb
+            WHERE sb.warehouse_id = %(warehouse_id)s::uuid
+            GROUP BY sb.material_id
+            HAVING SUM(sb.quantity) > 0
+      ))
+    ORDER BY m.code
+    LIMIT %(limit)s
+"""
 
-    buf = io.BytesIO()
-    img.save(buf, format="PNG")
-    buf.seek(0)
+_LABEL_LOTS_SQL = """
+    SELECT COALESCE(sl.qr_code, m.code || '-' || sl.lot_number),
+           sl.lot_number, m.code || ' · ' || m.name, sl.expiry_date
+    FROM stock_lots sl
+    JOIN materials m ON m.id = sl.material_id
+    WHERE sl.id = ANY(%(lot_ids)s::uuid[])
+    ORDER BY m.code, sl.lot_number
+    LIMIT %(limit)s
+"""
+
+
+def label_sheet_service(
+    warehouse_id: Optional[str] = None,
+    category: Optional[str] = None,
+    lot_ids: Optional[list[str]] = None,
+    color: str = labels.QR_FILL,
+) -> StreamingResponse:
+    params = {
+        "warehouse_id": warehouse_id, "category": category,
+        "lot_ids": lot_ids, "limit": settings.LABEL_SHEET_MAX + 1,
+    }
+    with db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(_LABEL_LOTS_SQL if lot_ids else _LABEL_MATERIALS_SQL, params)
+            rows = cur.fetchall()
+    if not rows:
+        raise HTTPException(404, "No hay materiales o lotes para etiquetar con esos filtros")
+    if len(rows) > settings.LABEL_SHEET_MAX:
+        raise HTTPException(400, f"Máximo {settings.LABEL_SHEET_MAX} etiquetas por hoja; acote el filtro")
+
+    report_progress(10, f"Dibujando {len(rows)} códigos QR")
+    images = labels.render_many([r[0] for r in rows], color)
+    report_progress(70, "Armando el PDF")
+    if lot_ids:
+        items = [
+            {"title": lot_number, "subtitle": material,
+             "detail": f"Vence: {expiry.isoformat()}" if expiry else None}
+            for _qr, lot_number, material, expiry in rows
+        ]
+        name = "etiquetas_lotes"
+    else:
+        items = [
+            {"title": code, "subtitle": mat_name, "detail": unit}
+            for _qr, code, mat_name, unit in rows
+        ]
+        name = "etiquetas_materiales"
+    pdf = labels.label_sheet_pdf(items, images)
 
-    filename = f"QR_LOT_{lot[0]}.png"
+    filename = f"{name}_{datetime.now().strftime('%Y%m%d_%H%M')}.pdf"
     return StreamingResponse(
-        buf,
-        media_type="image/png",
+        io.BytesIO(pdf),
+        media_type="application/pdf",
         headers={"Content-Disposition": f'attachment; filename="{filename}"'},
     )
+
+
+@router.post("/qr/labels")
+def generate_label_sheet(
+    body: LabelSheetRequest,
+    background: bool = Query(False),
+    user=Depends(require_permission("logistics:stock:view")),
+):
+    """
+    Hoja A4 imprimible (3 × 7 etiquetas) para todo un almacén, una categoría
+    o una lista de lotes. Los QR salen de la caché; los que faltan se dibujan
+    en paralelo. background=true: responde 202 con un job_id (ver /jobs).
+    """
+    if not (body.warehouse_id or body.category or body.lot_ids):
+        raise HTTPException(400, "Indique warehouse_id, category o lot_ids")
+    params = body.model_dump()
+    if background:
+        return submit_job(
+            "logistics.label_sheet", label_sheet_service,
+            user=user, params=params, **params,
+        )
+    return label_sheet_service(**params)
@@ -1,14 +1,26 @@
 """
 Inventario Físico (Toma de Inventario)
 Endpoints: /logistics/physical-inventory/*
+
+El conteo se registra ítem a ítem (PATCH /items/count) o en lote
+(PATCH /items/count/bulk con un arreglo JSON, POST /items/count/upload con un
+CSV del escáner): un solo UPDATE por lote, idempotente por ítem. La
+aprobación genera todos los ADJUST y marca los ítems en una sola sentencia.
 """
-from fastapi import APIRouter, Depends, HTTPException
+import csv
+import io
+import logging
+import time
+import uuid
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
 from pydantic import BaseModel
 from typing import Optional
 from datetime import datetime
 from app.core.database import db_connection
 from app.core.security.permissions import require_permission
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter(prefix="/logistics/physical-inventory", tags=["Inventario Físico"])
 
 
@@ -24,6 +36,9 @@ class ItemCount(BaseModel):
     notes: Optional[str] = None
 
 
+_CSV_KEY_COLUMNS = ("item_id", "code")
+
+
 def _next_inv_number(cur) -> str:
     cur.execute("SELECT nextval('physical_inventory_seq')")
     seq = cur.fetchone()[0]
@@ -146,31 +161,65 @@ def get_inventory(
     return inv
 
 
-# ── Registrar conteo de un ítem ────────────────────────────────
-@router.patch("/{inv_id}/items/count")
-def register_count(
-    inv_id: str,
-    body: ItemCount,
-    user=Depends(require_permission("logistics:physical_inv:manage")),
-):
+# ── Registrar conteos ─────────────────────────────────────────
+# Un lote = un UPDATE ... FROM unnest(...). Reenviar el mismo lote no cambia
+# nada: solo se tocan los ítems cuyo conteo o nota difiere de lo guardado.
+_BULK_COUNT_SQL = """
+    WITH c(key, qty, notes) AS (
+        SELECT * FROM unnest(%(keys)s::text[], %(qtys)s::numeric[], %(notes)s::text[])
+    ), target AS (
+        SELECT pii.id, c.key, c.qty, c.notes, pii.counted_quantity, pii.notes AS old_notes
+        FROM c
+        {join}
+        WHERE pii.inventory_id = %(inv)s::uuid
+    ), upd AS (
+        UPDATE physical_inventory_items pii
+        SET counted_quantity = t.qty, notes = t.notes,
+            counted_by = %(user)s::uuid, counted_at = NOW()
+        FROM target t
+        WHERE pii.id = t.id
+          AND (t.counted_quantity IS DISTINCT FROM t.qty OR t.old_notes IS DISTINCT FROM t.notes)
+        RETURNING pii.id
+    )
+    SELECT t.key, EXISTS (SELECT 1 FROM upd WHERE upd.id = t.id)
+    FROM target t
+"""
+
+_COUNT_JOINS = {
+    "item_id": "JOIN physical_inventory_items pii ON pii.id = c.key::uuid",
+    "code": """JOIN materials m ON m.code = c.key
+        JOIN physical_inventory_items pii ON pii.material_id = m.id""",
+}
+
+
+def _lock_countable(cur, inv_id: str) -> None:
+    # FOR UPDATE: un cierre concurrente espera a que termine el lote
+    cur.execute(
+        "SELECT status FROM physical_inventories WHERE id = %s::uuid FOR UPDATE",
+        (inv_id,)
+    )
+    inv = cur.fetchone()
+    if not inv:
+        raise HTTPException(404, "Inventario no encontrado")
+    if inv[0] not in ("OPEN", "COUNTING"):
+        raise HTTPException(400, f"No se puede contar en estado '{inv[0]}'")
+
+
+def _apply_counts(inv_id: str, counts: dict, key: str, user_id) -> dict:
+    """counts: {clave: (cantidad, notas)} con clave = item_id o código de material."""
+    started = time.perf_counter()
+    keys = list(counts)
     with db_connection() as conn:
         with conn.cursor() as cur:
-            cur.execute(
-                "SELECT status FROM physical_inventories WHERE id = %s::uuid",
-                (inv_id,)
-            )
-            inv = cur.fetchone()
-            if not inv:
-                raise HTTPException(404, "Inventario no encontrado")
-            if inv[0] not in ("OPEN", "COUNTING"):
-                raise HTTPException(400, f"No se puede contar en estado '{inv[0]}'")
-
-            cur.execute("""
-                UPDATE physical_inventory_items
-                SET counted_quantity = %s, notes = %s,
-                    counted_by = %s::uuid, counted_at = NOW()
-                WHERE id = %s::uuid AND inventory_id = %s::uuid
-            """, (body.counted_quantity, body.notes, user["id"], body.item_id, inv_id))
+            _lock_countable(cur, inv_id)
+            cur.execute(_BULK_COUNT_SQL.format(join=_COUNT_JOINS[key]), {
+                "keys": keys,
+                "qtys": [counts[k][0] for k in keys],
+                "notes": [counts[k][1] for k in keys],
+                "inv": inv_id,
+                "user": user_id,
+            })
+            matched = dict(cur.fetchall())
 
             # Marcar el inventario como COUNTING si aún está OPEN
             cur.execute("""
@@ -178,9 +227,119 @@ def register_count(
                 WHERE id = %s::uuid AND status = 'OPEN'
             """, (inv_id,))
         conn.commit()
+
+    updated = sum(1 for changed in matched.values() if changed)
+    logger.info(
+        "[physical_inv] %s: %d conteos (%d actualizados) en %.0f ms",
+        inv_id, len(keys), updated, (time.perf_counter() - started) * 1000,
+    )
+    return {
+        "ok": True,
+        "received": len(keys),
+        "updated": updated,
+        "unchanged": len(matched) - updated,
+        "unknown": [k for k in keys if k not in matched],
+    }
+
+
+def _valid_item_id(value: str) -> bool:
+    try:
+        uuid.UUID(value)
+        return True
+    except ValueError:
+        return False
+
+
+def _item_counts(items: list[ItemCount]) -> tuple[dict, list[str]]:
+    """Deduplica por item_id (gana el último) y separa los ids mal formados."""
+    counts, invalid = {}, []
+    for item in items:
+        if _valid_item_id(item.item_id):
+            counts[item.item_id] = (item.counted_quantity, item.notes)
+        else:
+            invalid.append(item.item_id)
+    return counts, invalid
+
+
+@router.patch("/{inv_id}/items/count")
+def register_count(
+    inv_id: str,
+    body: ItemCount,
+    user=Depends(require_permission("logistics:physical_inv:manage")),
+):
+    counts, invalid = _item_counts([body])
+    if invalid:
+        raise HTTPException(400, f"item_id inválido: {body.item_id}")
+    _apply_counts(inv_id, counts, "item_id", user["id"])
     return {"ok": True}
 
 
+@router.patch("/{inv_id}/items/count/bulk")
+def register_counts_bulk(
+    inv_id: str,
+    body: list[ItemCount],
+    user=Depends(require_permission("logistics:physical_inv:manage")),
+):
+    """Registra un lote de conteos. Idempotente por item_id; si un ítem se
+    repite en el lote gana la última aparición."""
+    counts, invalid = _item_counts(body)
+    result = _apply_counts(inv_id, counts, "item_id", user["id"])
+    result["unknown"] += invalid
+    return result
+
+
+def _parse_counts_csv(raw: bytes) -> tuple[dict, str, list[dict]]:
+    """
+    CSV con cabecera: item_id o code (código de material), counted_quantity
+    y notes opcional. Separador ';' o ','. Retorna (conteos, clave, errores).
+    """
+    text = raw.decode("utf-8-sig")
+    try:
+        delimiter = csv.Sniffer().sniff(text[:4096], delimiters=";,\t").delimiter
+    except csv.Error:
+        delimiter = ";"
+    reader = csv.DictReader(io.StringIO(text), delimiter=delimiter)
+    fields = [f.strip().lower() for f in reader.fieldnames or []]
+    reader.fieldnames = fields
+
+    key = next((k for k in _CSV_KEY_COLUMNS if k in fields), None)
+    if key is None or "counted_quantity" not in fields:
+        raise HTTPException(400, "El CSV debe tener las columnas 'item_id' o 'code' y 'counted_quantity'")
+
+    counts, errors = {}, []
+    for line, row in enumerate(reader, start=2):
+        ref = (row.get(key) or "").strip()
+        qty = (row.get("counted_quantity") or "").strip().replace(",", ".")
+        if not ref:
+            continue
+        if key == "item_id" and not _valid_item_id(ref):
+            errors.append({"line": line, "error": f"item_id inválido: {ref}"})
+            continue
+        try:
+            quantity = float(qty)
+        except ValueError:
+            errors.append({"line": line, "error": f"Cantidad inválida: {qty!r}"})
+            continue
+        counts[ref] = (quantity, (row.get("notes") or "").strip() or None)
+    return counts, key, errors
+
+
+@router.post("/{inv_id}/items/count/upload")
+def upload_counts(
+    inv_id: str,
+    file: UploadFile = File(...),
+    user=Depends(require_permission("logistics:physical_inv:manage")),
+):
+    """Carga el conteo desde un CSV (exportado por el escáner o la hoja de conteo)."""
+    try:
+        counts, key, errors = _parse_counts_csv(file.file.read())
+    except UnicodeDecodeError:
+        raise HTTPException(400, "El archivo debe ser un CSV en UTF-8")
+    result = _apply_counts(inv_id, counts, key, user["id"])
+    result["errors"] = errors
+    return result
+
+
 # ── Cerrar inventario (freeze) ─────────────────────────────────
 @router.post("/{inv_id}/close")
 def close_inventory(
@@ -207,6 +366,31 @@ def close_inventory(
 
 
 # ── Aprobar y aplicar ajustes al stock ────────────────────────
+# Una sola sentencia: el UPDATE marca adjusted y el INSERT genera el ADJUST
+# de cada ítem marcado. ORDER BY material_id fija el orden en que el trigger
+# de valorización bloquea materiales (sin deadlocks entre aprobaciones).
+_APPROVE_SQL = """
+    WITH adj AS (
+        UPDATE physical_inventory_items
+        SET adjusted = TRUE
+        WHERE inventory_id = %(inv)s::uuid
+          AND counted_quantity IS NOT NULL
+          AND counted_quantity <> system_quantity
+          AND adjusted = FALSE
+        RETURNING material_id, counted_quantity - system_quantity AS diff, unit_cost
+    )
+    INSERT INTO stock_movements
+        (material_id, movement_type, quantity, to_warehouse, from_warehouse,
+         unit_cost, reference, notes, created_by)
+    SELECT material_id, 'ADJUST', abs(diff),
+           CASE WHEN diff > 0 THEN %(wh)s::uuid END,
+           CASE WHEN diff < 0 THEN %(wh)s::uuid END,
+           COALESCE(unit_cost, 0), %(ref)s, 'Ajuste por inventario físico', %(user)s::uuid
+    FROM adj
+    ORDER BY material_id
+"""
+
+
 @router.post("/{inv_id}/approve")
 def approve_inventory(
     inv_id: str,
@@ -214,59 +398,25 @@ def approve_inventory(
 ):
     """Aprueba el inventario y genera movimientos ADJUST en stock_movements
     para las diferencias encontradas."""
+    started = time.perf_counter()
     with db_connection() as conn:
         with conn.cursor() as cur:
             cur.execute("""
                 SELECT pi.status, pi.warehouse_id
                 FROM physical_inventories pi WHERE pi.id = %s::uuid
+                FOR UPDATE
             """, (inv_id,))
             inv = cur.fetchone()
             if not inv or inv[0] != "CLOSED":
                 raise HTTPException(400, "Solo se puede aprobar un inventario CLOSED")
 
-            warehouse_id = str(inv[1])
-
-            # Obtener ítems con diferencia y no ajustados
-            cur.execute("""
-                SELECT id, material_id, system_quantity, counted_quantity, unit_cost
-                FROM physical_inventory_items
-                WHERE inventory_id = %s::uuid
-                  AND counted_quantity IS NOT NULL
-                  AND counted_quantity <> system_quantity
-                  AND adjusted = FALSE
-            """, (inv_id,))
-            items = cur.fetchall()
-
-            for item_id, mat_id, sys_qty, cnt_qty, unit_cost in items:
-                diff = float(cnt_qty) - float(sys_qty)
-                mv_type = "ADJUST"
-                qty = abs(diff)
-
-                if diff > 0:
-                    cur.execute("""
-                        INSERT INTO stock_movements
-                            (material_id, movement_type, quantity, to_warehouse,
-                             unit_cost, reference, notes, created_by)
-                        VALUES (%s::uuid, %s, %s, %s::uuid,
-                                %s, %s, 'Ajuste por inventario físico', %s::uuid)
-                    """, (str(mat_id), mv_type, qty, warehouse_id,
-                          float(unit_cost or 0),
-                          f"INV-ADJ-{inv_id[:8]}", str(user["id"])))
-                else:
-                    cur.execute("""
-                        INSERT INTO stock_movements
-                            (material_id, movement_type, quantity, from_warehouse,
-                             unit_cost, reference, notes, created_by)
-                        VALUES (%s::uuid, %s, %s, %s::uuid,
-                                %s, %s, 'Ajuste por inventario físico', %s::uuid)
-                    """, (str(mat_id), mv_type, qty, warehouse_id,
-                          float(unit_cost or 0),
-                          f"INV-ADJ-{inv_id[:8]}", str(user["id"])))
-
-                cur.execute("""
-                    UPDATE physical_inventory_items SET adjusted = TRUE
-                    WHERE id = %s
-                """, (item_id,))
+            cur.execute(_APPROVE_SQL, {
+                "inv": inv_id,
+                "wh": str(inv[1]),
+                "ref": f"INV-ADJ-{inv_id[:8]}",
+                "user": str(user["id"]),
+            })
+            applied = cur.rowcount
 
             # Aprobar inventario
             cur.execute("""
@@ -275,4 +425,8 @@ def approve_inventory(
                 WHERE id = %s::uuid
             """, (user["id"], inv_id))
         conn.commit()
-    return {"ok": True, "adjustments_applied": len(items)}
+    logger.info(
+        "[physical_inv] %s aprobado: %d ajustes en %.0f ms",
+        inv_id, applied, (time.perf_counter() - started) * 1000,
+    )
+    return {"ok": True, "adjustments_applied": applied}
@@ -1,5 +1,6 @@
 import app.core.security
 import json
+import time
 from decimal import Decimal
 from typing import Optional, Dict
 from uuid import UUID
@@ -10,7 +11,14 @@ from openpyxl import Workbook
 from openpyxl.styles import Font
 from pathlib import Path
 from datetime import datetime
-from app.core.database import db_connection
+import numpy as np
+import pandas as pd
+from app.core.async_database import async_db_connection, pg_sql
+from app.core.database import db_connection, stream_query
+from app.core.import_utils import (
+    apply_staged, clean_text, ensure_columns, excel_row_numbers, first_errors,
+    log_throughput, stage_rows, to_date, to_number, to_python, too_long,
+)
 
 from app.modules.logistics.schemas import (
     StockMovementCreate,
@@ -19,27 +27,32 @@ from app.modules.logistics.schemas import (
     MaterialCreate,
     StockReceptionCreate
 )
+from app.modules.logistics import reorder
 from app.modules.logistics.utils import read_excel
 
 DISPATCH_FILES_DIR = Path("app/storage/dispatches")
 
 
 # ============================================================
-# 📦 CALCULAR STOCK TOTAL (KARDEX)
+# 📦 CALCULAR STOCK TOTAL (SALDO MATERIALIZADO)
 # ============================================================
 def get_current_stock(
     material_id: str,
     warehouse_id: str,
     project_id: str | None = None,
 ) -> float:
-
+    """
+    Saldo actual leído de stock_balances (mantenido por trigger en la misma
+    transacción que cada movimiento). Sin project_id suma todos los proyectos.
+    """
     query = """
-        SELECT movement_type, quantity, from_warehouse, to_warehouse
-        FROM stock_movements
+        SELECT COALESCE(SUM(quantity), 0)
+        FROM stock_balances
         WHERE material_id = %s
+          AND warehouse_id = %s
     """
 
-    params = [material_id]
+    params = [material_id, warehouse_id]
 
     if project_id:
         query += " AND project_id = %s"
@@ -48,28 +61,9 @@ def get_current_stock(
     with db_connection() as conn:
         with conn.cursor() as cur:
             cur.execute(query, tuple(params))
-            rows = cur.fetchall()
-
-    stock = 0.0
-
-    for m in rows:
-        movement_type = m[0]
-        quantity = float(m[1])
-        from_wh = m[2]
-        to_wh = m[3]
-
-        if movement_type in ("IN", "RETURN") and to_wh == warehouse_id:
-            stock += quantity
-
-        elif movement_type == "OUT" and from_wh == warehouse_id:
-            stock -= quantity
+            row = cur.fetchone()
 
-        elif movement_type == "TRANSFER":
-            # 👉 Transferencia interna NO cambia el total del almacén
-            # Solo moverá stock entre ubicaciones
-            continue
-
-    return stock
+    return float(row[0])
 
 # ============================================================
 # 📍 STOCK POR UBICACIÓN
@@ -186,13 +180,18 @@ def get_stock_movements_history(
 # 📊 RESUMEN
 # ============================================================
 def get_current_stock_summary(material_id: Optional[str] = None) -> Dict:
-    query = "SELECT material_id, movement_type, quantity, from_warehouse, to_warehouse FROM stock_movements"
+    query = """
+        SELECT material_id, warehouse_id, SUM(quantity)
+        FROM stock_balances
+    """
     params = []
 
     if material_id:
         query += " WHERE material_id = %s"
         params.append(material_id)
 
+    query += " GROUP BY material_id, warehouse_id"
+
     stock: Dict[str, Dict[str, float]] = {}
 
     with db_connection() as conn:
@@ -200,43 +199,178 @@ def get_current_stock_summary(material_id: Optional[str] = None) -> Dict:
             cur.execute(query, params)
             rows = cur.fetchall()
 
-    for mat, m_type, qty, from_wh, to_wh in rows:
-        stock.setdefault(mat, {})
+    for mat, wh, qty in rows:
+        stock.setdefault(mat, {})[wh] = float(qty)
 
-        def add(wh, amount):
-            if not wh:
-                return
-            stock[mat][wh] = stock[mat].get(wh, 0) + amount
+    return stock
 
-        if m_type in ("IN", "RETURN"):
-            add(to_wh, qty)
-        elif m_type == "OUT":
-            add(from_wh, -qty)
-        elif m_type == "TRANSFER":
-            add(from_wh, -qty)
-            add(to_wh, qty)
 
-    return stock
+# ============================================================
+# 🧮 SALDOS MATERIALIZADOS — VERIFICAR / RECONSTRUIR
+# ============================================================
+_BALANCE_DRIFT_QUERY = """
+    WITH expected AS (
+        SELECT material_id, warehouse_id, project_id, SUM(delta) AS quantity
+        FROM vw_stock_movement_deltas
+        GROUP BY material_id, warehouse_id, project_id
+    )
+    SELECT
+        COALESCE(e.material_id, b.material_id),
+        COALESCE(e.warehouse_id, b.warehouse_id),
+        COALESCE(e.project_id, b.project_id),
+        COALESCE(e.quantity, 0) AS expected_qty,
+        COALESCE(b.quantity, 0) AS stored_qty
+    FROM expected e
+    FULL OUTER JOIN stock_balances b
+        ON  b.material_id  = e.material_id
+        AND b.warehouse_id = e.warehouse_id
+        AND b.project_id IS NOT DISTINCT FROM e.project_id
+    WHERE COALESCE(e.quantity, 0) <> COALESCE(b.quantity, 0)
+"""
+
+
+def verify_stock_balances_service() -> Dict:
+    """Compara stock_balances contra la suma cruda de stock_movements."""
+    with db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(_BALANCE_DRIFT_QUERY)
+            rows = cur.fetchall()
+            cur.execute("SELECT COUNT(*) FROM stock_balances")
+            total = cur.fetchone()[0]
+
+    return {
+        "ok": not rows,
+        "balances": total,
+        "mismatches": [
+            {
+                "material_id": str(r[0]),
+                "warehouse_id": str(r[1]),
+                "project_id": str(r[2]) if r[2] else None,
+                "expected": float(r[3]),
+                "stored": float(r[4]),
+            }
+            for r in rows
+        ],
+    }
+
+
+def rebuild_stock_balances_service() -> Dict:
+    """
+    Reconstruye stock_balances desde cero a partir de stock_movements.
+    Bloquea escrituras de movimientos mientras dura (SHARE lock).
+    """
+    with db_connection() as conn:
+        try:
+            with conn.cursor() as cur:
+                cur.execute("LOCK TABLE stock_movements IN SHARE MODE")
+                cur.execute("DELETE FROM stock_balances")
+                cur.execute("""
+                    INSERT INTO stock_balances (material_id, warehouse_id, project_id, quantity)
+                    SELECT material_id, warehouse_id, project_id, SUM(delta)
+                    FROM vw_stock_movement_deltas
+                    GROUP BY material_id, warehouse_id, project_id
+                """)
+                rebuilt = cur.rowcount
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    reorder.invalidate()
+    return {"status": "OK", "balances": rebuilt}
 
 
 # ============================================================
-# 🚨 STOCK NEGATIVO
+# 💰 VALORIZACIÓN PERPETUA (CPP) — VERIFICAR / RECONSTRUIR
 # ============================================================
-def get_negative_stock():
-    stock = get_current_stock_summary()
-    alerts = []
+_VALUATION_DRIFT_QUERY = """
+    WITH expected AS (
+        SELECT material_id, warehouse_id, SUM(delta) AS quantity
+        FROM vw_stock_movement_deltas
+        GROUP BY material_id, warehouse_id
+    )
+    SELECT
+        COALESCE(e.material_id, v.material_id),
+        COALESCE(e.warehouse_id, v.warehouse_id),
+        COALESCE(e.quantity, 0) AS expected_qty,
+        COALESCE(v.quantity, 0) AS stored_qty,
+        v.value,
+        v.quantity * COALESCE(NULLIF(m.weighted_avg_cost, 0), m.unit_cost, 0) AS expected_value
+    FROM expected e
+    FULL OUTER JOIN stock_valuation v
+        ON  v.material_id  = e.material_id
+        AND v.warehouse_id = e.warehouse_id
+    LEFT JOIN materials m ON m.id = COALESCE(e.material_id, v.material_id)
+    WHERE COALESCE(e.quantity, 0) <> COALESCE(v.quantity, 0)
+       OR round(v.value, 2) <> round(v.quantity * COALESCE(NULLIF(m.weighted_avg_cost, 0), m.unit_cost, 0), 2)
+"""
+
+
+def verify_stock_valuation_service() -> Dict:
+    """
+    Compara stock_valuation contra los deltas de stock_movements (cantidad)
+    y contra cantidad × CPP del material (valor).
+    """
+    with db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(_VALUATION_DRIFT_QUERY)
+            rows = cur.fetchall()
+            cur.execute("SELECT COUNT(*) FROM stock_valuation")
+            total = cur.fetchone()[0]
 
-    for material, warehouses in stock.items():
-        for wh, qty in warehouses.items():
-            if qty < 0:
-                alerts.append({
-                    "material_id": material,
-                    "warehouse_id": wh,
-                    "quantity": qty,
-                    "alert": "NEGATIVE_STOCK"
-                })
+    return {
+        "ok": not rows,
+        "valuations": total,
+        "mismatches": [
+            {
+                "material_id": str(r[0]),
+                "warehouse_id": str(r[1]),
+                "expected_quantity": float(r[2]),
+                "stored_quantity": float(r[3]),
+                "stored_value": float(r[4]) if r[4] is not None else None,
+                "expected_value": float(r[5]) if r[5] is not None else None,
+            }
+            for r in rows
+        ],
+    }
 
-    return alerts
+
+def rebuild_stock_valuation_service(material_id: Optional[str] = None) -> Dict:
+    """
+    Reproduce el kardex y recalcula el CPP y stock_valuation (de un material o
+    de todos). Bloquea escrituras de movimientos mientras dura (SHARE lock).
+    """
+    with db_connection() as conn:
+        try:
+            with conn.cursor() as cur:
+                cur.execute("LOCK TABLE stock_movements IN SHARE MODE")
+                if material_id:
+                    cur.execute("SELECT public.recompute_material_valuation(%s::uuid)", (material_id,))
+                    rebuilt = 1
+                else:
+                    cur.execute("SELECT public.rebuild_stock_valuation()")
+                    rebuilt = cur.fetchone()[0]
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    return {"status": "OK", "materials": rebuilt}
+
+
+# ============================================================
+# 🚨 STOCK NEGATIVO
+# ============================================================
+def get_negative_stock():
+    return [
+        {
+            "material_id": a["material_id"],
+            "warehouse_id": a["warehouse_id"],
+            "quantity": a["current_stock"],
+            "alert": "NEGATIVE_STOCK",
+        }
+        for a in reorder.stock_alerts(alerts=["NEGATIVE"])
+    ]
 
 
 # ============================================================
@@ -435,44 +569,17 @@ def get_stock_by_project(project_id: str | None = None):
     return result
 
 def get_low_stock_alerts():
-    query = """
-        SELECT 
-            m.id AS material_id,
-            COALESCE(SUM(
-                CASE 
-                    WHEN sm.movement_type IN ('IN','RETURN') THEN sm.quantity
-                    WHEN sm.movement_type = 'OUT' THEN -sm.quantity
-                    ELSE 0
-                END
-            ), 0) AS current_stock,
-            m.min_stock
-        FROM materials m
-        LEFT JOIN stock_movements sm ON sm.material_id = m.id
-        GROUP BY m.id, m.min_stock
-        HAVING COALESCE(SUM(
-                CASE 
-                    WHEN sm.movement_type IN ('IN','RETURN') THEN sm.quantity
-                    WHEN sm.movement_type = 'OUT' THEN -sm.quantity
-                    ELSE 0
-                END
-            ), 0) <= m.min_stock;
-    """
-
-    with db_connection() as conn:
-        with conn.cursor() as cur:
-            cur.execute(query)
-            rows = cur.fetchall()
-
-    alerts = []
-    for material_id, current_stock, min_stock in rows:
-        alerts.append({
-            "material_id": str(material_id),
-            "current_stock": float(current_stock),
-            "min_stock": float(min_stock),
-            "alert": "LOW_STOCK"
-        })
-
-    return alerts
+    # Stock total del material contra su mínimo global (motor de reposición)
+    return [
+        {
+            "material_id": a["material_id"],
+            "current_stock": a["current_stock"],
+            "min_stock": a["min_stock"],
+            "alert": "LOW_STOCK",
+        }
+        for a in reorder.stock_alerts(alerts=["NEGATIVE", "BELOW_MIN"], totals=True)
+        if a["min_stock"] > 0
+    ]
 
 def get_most_used_materials(limit: int = 10):
     query = """
@@ -724,6 +831,7 @@ def create_material_service(payload: MaterialCreate):
                 )
 
             conn.commit()
+    reorder.invalidate([material_id])
 
     return {
         "id": str(row[0]), "name": row[1], "code": row[2],
@@ -740,44 +848,58 @@ def create_material_service(payload: MaterialCreate):
 # ============================================================
 # 📋 LISTAR MATERIALES
 # ============================================================
+def _materials_list_query(estado: str = None):
+    where = "WHERE m.estado = %s" if estado else "WHERE m.estado != 'INACTIVO'"
+    params = (estado,) if estado else ()
+    return f"""
+        SELECT
+            m.id, m.name, m.code, m.min_stock, m.category, m.created_at,
+            COALESCE(array_agg(a.alias_name) FILTER (WHERE a.alias_name IS NOT NULL), '{{}}') AS aliases,
+            m.brand, m.model, m.serial_number,
+            m.supplier_name, m.supplier_contact, m.unit_cost,
+            m.useful_life_years, m.purchase_date, m.warranty_expires,
+            m.estado, m.precio_referencia, m.proveedor_referencia
+        FROM materials m
+        LEFT JOIN material_aliases a ON a.material_id = m.id
+        {where}
+        GROUP BY m.id
+        ORDER BY m.estado, m.name;
+    """, params
+
+
+def _material_list_item(r):
+    return {
+        "id": str(r[0]), "name": r[1], "code": r[2],
+        "min_stock": float(r[3]), "category": r[4], "created_at": r[5],
+        "aliases": list(r[6]),
+        "brand": r[7], "model": r[8], "serial_number": r[9],
+        "supplier_name": r[10], "supplier_contact": r[11],
+        "unit_cost": float(r[12]) if r[12] is not None else None,
+        "useful_life_years": r[13],
+        "purchase_date": r[14].isoformat() if r[14] else None,
+        "warranty_expires": r[15].isoformat() if r[15] else None,
+        "estado": r[16] if r[16] else "ACTIVO",
+        "precio_referencia": float(r[17]) if r[17] is not None else None,
+        "proveedor_referencia": r[18],
+    }
+
+
 def get_materials_service(estado: str = None):
+    query, params = _materials_list_query(estado)
     with db_connection() as conn:
         with conn.cursor() as cur:
-            where = "WHERE m.estado = %s" if estado else "WHERE m.estado != 'INACTIVO'"
-            params = (estado,) if estado else ()
-            cur.execute(f"""
-                SELECT
-                    m.id, m.name, m.code, m.min_stock, m.category, m.created_at,
-                    COALESCE(array_agg(a.alias_name) FILTER (WHERE a.alias_name IS NOT NULL), '{{}}') AS aliases,
-                    m.brand, m.model, m.serial_number,
-                    m.supplier_name, m.supplier_contact, m.unit_cost,
-                    m.useful_life_years, m.purchase_date, m.warranty_expires,
-                    m.estado, m.precio_referencia, m.proveedor_referencia
-                FROM materials m
-                LEFT JOIN material_aliases a ON a.material_id = m.id
-                {where}
-                GROUP BY m.id
-                ORDER BY m.estado, m.name;
-            """, params)
+            cur.execute(query, params)
             rows = cur.fetchall()
 
-    return [
-        {
-            "id": str(r[0]), "name": r[1], "code": r[2],
-            "min_stock": float(r[3]), "category": r[4], "created_at": r[5],
-            "aliases": list(r[6]),
-            "brand": r[7], "model": r[8], "serial_number": r[9],
-            "supplier_name": r[10], "supplier_contact": r[11],
-            "unit_cost": float(r[12]) if r[12] is not None else None,
-            "useful_life_years": r[13],
-            "purchase_date": r[14].isoformat() if r[14] else None,
-            "warranty_expires": r[15].isoformat() if r[15] else None,
-            "estado": r[16] if r[16] else "ACTIVO",
-            "precio_referencia": float(r[17]) if r[17] is not None else None,
-            "proveedor_referencia": r[18],
-        }
-        for r in rows
-    ]
+    return [_material_list_item(r) for r in rows]
+
+
+async def get_materials_async_service(estado: str = None):
+    query, params = _materials_list_query(estado)
+    async with async_db_connection() as conn:
+        rows = await conn.fetch(pg_sql(query), *params)
+
+    return [_material_list_item(r) for r in rows]
 
 # ============================================================
 # ✏️ EDITAR MATERIAL
@@ -825,6 +947,7 @@ def update_material_service(material_id: str, payload):
             )
             row = cur.fetchone()
             conn.commit()
+    reorder.invalidate([material_id])
 
     return {"id": str(row[0]), "name": row[1], "code": row[2], "min_stock": float(row[3]), "category": row[4]}
 
@@ -848,6 +971,7 @@ def delete_material_service(material_id: str):
             cur.execute("DELETE FROM material_aliases WHERE material_id = %s;", (material_id,))
             cur.execute("DELETE FROM materials WHERE id = %s;", (material_id,))
             conn.commit()
+    reorder.invalidate([material_id])
 
     return {"message": f"Material '{mat[1]}' eliminado correctamente"}
 
@@ -856,7 +980,71 @@ def delete_material_service(material_id: str):
 # 📦 A) Importar Materiales
 # ============================================================
 
+_MATERIAL_TEXT_LIMITS = {
+    "category": 50, "brand": 120, "model": 120, "serial_number": 120,
+    "supplier_name": 200, "supplier_contact": 200,
+}
+
+_MATERIAL_STAGE_COLUMNS = {
+    "code": "TEXT", "name": "TEXT", "category": "TEXT", "min_stock": "NUMERIC",
+    "brand": "TEXT", "model": "TEXT", "serial_number": "TEXT",
+    "supplier_name": "TEXT", "supplier_contact": "TEXT", "unit_cost": "NUMERIC",
+    "useful_life_years": "SMALLINT", "purchase_date": "DATE", "warranty_expires": "DATE",
+    "aliases": "TEXT",
+}
+
+_MATERIAL_UPSERT_SQL = """
+    INSERT INTO materials (
+        name, code, category, min_stock,
+        brand, model, serial_number,
+        supplier_name, supplier_contact, unit_cost,
+        useful_life_years, purchase_date, warranty_expires
+    )
+    SELECT s.name, s.code, s.category, COALESCE(s.min_stock, 0),
+           s.brand, s.model, s.serial_number,
+           s.supplier_name, s.supplier_contact, COALESCE(s.unit_cost, 0),
+           s.useful_life_years, s.purchase_date, s.warranty_expires
+    FROM _import_materials s
+    WHERE {row_filter}
+    ON CONFLICT (code) DO UPDATE
+    SET name = EXCLUDED.name, category = EXCLUDED.category, min_stock = EXCLUDED.min_stock,
+        brand = EXCLUDED.brand, model = EXCLUDED.model, serial_number = EXCLUDED.serial_number,
+        supplier_name = EXCLUDED.supplier_name, supplier_contact = EXCLUDED.supplier_contact,
+        unit_cost = EXCLUDED.unit_cost, useful_life_years = EXCLUDED.useful_life_years,
+        purchase_date = EXCLUDED.purchase_date, warranty_expires = EXCLUDED.warranty_expires
+    RETURNING (xmax = 0) AS inserted
+"""
+
+# Sincroniza aliases de los materiales importados: borra los que ya no vienen
+# en el Excel e inserta los nuevos, sin tocar los que se mantienen.
+_MATERIAL_ALIASES_SYNC_SQL = """
+    WITH wanted AS (
+        SELECT DISTINCT m.id AS material_id, btrim(a.alias_name) AS alias_name
+        FROM _import_materials s
+        JOIN materials m ON m.code = s.code
+        CROSS JOIN LATERAL regexp_split_to_table(COALESCE(s.aliases, ''), ',') AS a(alias_name)
+        WHERE {row_filter} AND btrim(a.alias_name) <> ''
+    ), removed AS (
+        DELETE FROM material_aliases ma
+        USING _import_materials s, materials m
+        WHERE {row_filter} AND m.code = s.code AND ma.material_id = m.id
+          AND NOT EXISTS (
+              SELECT 1 FROM wanted w
+              WHERE w.material_id = ma.material_id AND w.alias_name = ma.alias_name
+          )
+    )
+    INSERT INTO material_aliases (material_id, alias_name)
+    SELECT w.material_id, w.alias_name
+    FROM wanted w
+    WHERE NOT EXISTS (
+        SELECT 1 FROM material_aliases ma
+        WHERE ma.material_id = w.material_id AND ma.alias_name = w.alias_name
+    )
+"""
+
+
 def import_materials_from_excel(file):
+    started = time.perf_counter()
     df = read_excel(file)
 
     # Normalize Spanish column names to internal field names
@@ -873,274 +1061,211 @@ def import_materials_from_excel(file):
     if "code" not in df.columns or "name" not in df.columns:
         raise ValueError("Faltan columnas obligatorias: 'Código' y 'Nombre'")
 
-    inserted = 0
-    updated = 0
-    errors = []
-
+    # 1️⃣ Validación vectorizada de todo el archivo
+    df = ensure_columns(df, _MATERIAL_STAGE_COLUMNS)
+    data = pd.DataFrame({"row_num": excel_row_numbers(df)})
+    for col in ("code", "name", "aliases", *_MATERIAL_TEXT_LIMITS):
+        data[col] = clean_text(df[col])
+    data["min_stock"], bad_min_stock = to_number(df["min_stock"])
+    data["unit_cost"], bad_unit_cost = to_number(df["unit_cost"])
+    life_years, bad_life_years = to_number(df["useful_life_years"])
+    data["useful_life_years"] = np.trunc(life_years).astype("Int64")
+    data["purchase_date"], bad_purchase = to_date(df["purchase_date"])
+    data["warranty_expires"], bad_warranty = to_date(df["warranty_expires"])
+
+    row_errors = first_errors([
+        (data["code"].isna() | data["name"].isna(), "Código y Nombre son obligatorios"),
+        (bad_min_stock, "Stock mínimo inválido: " + df["min_stock"].astype(str)),
+        (bad_unit_cost, "Costo unitario inválido: " + df["unit_cost"].astype(str)),
+        (bad_life_years | (life_years.abs() > 32767), "Vida útil inválida: " + df["useful_life_years"].astype(str)),
+        (bad_purchase, "Fecha compra inválida: " + df["purchase_date"].astype(str)),
+        (bad_warranty, "Venc. garantía inválida: " + df["warranty_expires"].astype(str)),
+        *[
+            (too_long(data[col], limit), f"{col} excede {limit} caracteres")
+            for col, limit in _MATERIAL_TEXT_LIMITS.items()
+        ],
+    ])
+    errors_by_row = dict(zip(data.loc[row_errors.notna(), "row_num"], row_errors.dropna()))
+
+    # Mismo código repetido en el archivo: gana la última fila (como el import fila a fila)
+    valid = data[row_errors.isna()]
+    superseded = valid.duplicated("code", keep="last")
+    valid = valid[~superseded]
+
+    # 2️⃣ COPY a tabla temporal + upsert y aliases en bloque
     with db_connection() as conn:
         with conn.cursor() as cur:
-            for idx, row in df.iterrows():
-                try:
-                    code = str(row["code"]).strip() if row.get("code") else None
-                    name = str(row["name"]).strip() if row.get("name") else None
-                    if not code or not name:
-                        raise ValueError("Código y Nombre son obligatorios")
-
-                    category   = str(row["category"]).strip()   if row.get("category")   else None
-                    min_stock  = float(row["min_stock"])         if row.get("min_stock") is not None else 0.0
-                    brand      = str(row["brand"]).strip()       if row.get("brand")      else None
-                    model      = str(row["model"]).strip()       if row.get("model")      else None
-                    sup_name   = str(row["supplier_name"]).strip()    if row.get("supplier_name")    else None
-                    sup_con    = str(row["supplier_contact"]).strip()  if row.get("supplier_contact") else None
-                    unit_cost  = float(row["unit_cost"])         if row.get("unit_cost") is not None else None
-                    serial     = str(row["serial_number"]).strip()    if row.get("serial_number")    else None
-                    life_yrs   = int(row["useful_life_years"])   if row.get("useful_life_years") is not None else None
-                    pur_date   = str(row["purchase_date"]).strip()    if row.get("purchase_date")    else None
-                    warranty   = str(row["warranty_expires"]).strip()  if row.get("warranty_expires")  else None
-                    aliases_raw = str(row["aliases"]).strip()    if row.get("aliases")    else ""
-                    aliases = [a.strip() for a in aliases_raw.split(",") if a.strip()] if aliases_raw else []
-
-                    cur.execute("SELECT id FROM materials WHERE code = %s", (code,))
-                    existing = cur.fetchone()
-
-                    if existing:
-                        mat_id = existing[0]
-                        cur.execute("""
-                            UPDATE materials
-                            SET name=%s, category=%s, min_stock=%s,
-                                brand=%s, model=%s, serial_number=%s,
-                                supplier_name=%s, supplier_contact=%s, unit_cost=%s,
-                                useful_life_years=%s, purchase_date=%s, warranty_expires=%s
-                            WHERE id=%s
-                        """, (name, category, min_stock, brand, model, serial,
-                              sup_name, sup_con, unit_cost, life_yrs, pur_date, warranty, mat_id))
-                        cur.execute("DELETE FROM material_aliases WHERE material_id = %s", (mat_id,))
-                        updated += 1
-                    else:
-                        cur.execute("""
-                            INSERT INTO materials (
-                                name, code, category, min_stock,
-                                brand, model, serial_number,
-                                supplier_name, supplier_contact, unit_cost,
-                                useful_life_years, purchase_date, warranty_expires
-                            ) VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)
-                            RETURNING id
-                        """, (name, code, category, min_stock, brand, model, serial,
-                              sup_name, sup_con, unit_cost, life_yrs, pur_date, warranty))
-                        mat_id = cur.fetchone()[0]
-                        inserted += 1
-
-                    for alias in aliases:
-                        cur.execute(
-                            "INSERT INTO material_aliases (material_id, alias_name) VALUES (%s, %s) ON CONFLICT DO NOTHING",
-                            (mat_id, alias)
-                        )
-                except Exception as e:
-                    errors.append(f"Fila {int(idx)+2}: {e}")
-                    continue
-
+            stage_rows(cur, "_import_materials", _MATERIAL_STAGE_COLUMNS, valid)
+            returned, db_errors = apply_staged(
+                cur, "_import_materials", [_MATERIAL_UPSERT_SQL, _MATERIAL_ALIASES_SYNC_SQL]
+            )
         conn.commit()
+    reorder.invalidate()
+
+    errors_by_row.update(db_errors)
+    inserted = sum(1 for (was_insert,) in returned if was_insert)
+    updated = len(returned) - inserted
+    log_throughput("materiales", len(df), started)
 
     return {
         "imported": inserted + updated,
         "inserted": inserted,
         "updated": updated,
-        "skipped": 0,
-        "errors": errors,
+        "skipped": int(superseded.sum()),
+        "errors": [f"Fila {n}: {msg}" for n, msg in sorted(errors_by_row.items())],
     }
 
+
 # ============================================================
-#  📥 B) Importar Stock IN (Ingreso)
+# 📥📤 Importación de movimientos de stock (IN / OUT)
 # ============================================================
-
-def import_stock_in_from_excel(file):
+# Los códigos (material, almacén, proyecto) se resuelven con JOIN sobre la
+# tabla temporal; las filas con códigos inexistentes se reportan y no se insertan.
+
+_MOVEMENT_STAGE_COLUMNS = {
+    "material_code": "TEXT", "warehouse_code": "TEXT", "project_code": "TEXT",
+    "quantity": "NUMERIC", "reference": "TEXT", "notes": "TEXT",
+}
+
+_MOVEMENT_LOOKUP_SQL = """
+    SELECT s.row_num, m.id IS NULL, w.id IS NULL, {project_missing}
+    FROM _import_movements s
+    LEFT JOIN materials m  ON m.code = s.material_code
+    LEFT JOIN warehouses w ON w.code = s.warehouse_code
+    {project_join}
+    WHERE m.id IS NULL OR w.id IS NULL OR {project_missing}
+"""
+
+_MOVEMENT_INSERT_SQL = """
+    INSERT INTO stock_movements (
+        material_id, movement_type, quantity,
+        from_warehouse, to_warehouse, project_id,
+        reference, notes, created_by
+    )
+    SELECT m.id, '{movement_type}', s.quantity,
+           {from_warehouse}, {to_warehouse}, {project_id},
+           s.reference, s.notes, 'excel'
+    FROM _import_movements s
+    JOIN materials m  ON m.code = s.material_code
+    JOIN warehouses w ON w.code = s.warehouse_code
+    {project_join}
+    WHERE {{row_filter}}
+    ORDER BY s.row_num
+    RETURNING id
+"""
+
+
+def _import_stock_movements_from_excel(file, movement_type: str):
+    started = time.perf_counter()
     df = read_excel(file)
+    with_project = movement_type == "OUT"
 
-    # NOTA: usamos warehouse_code (código humano), no UUID
+    # NOTA: warehouse_id y project_id vienen como CÓDIGOS, no UUID
     required_cols = ["material_code", "warehouse_id", "quantity"]
+    if with_project:
+        required_cols.insert(2, "project_id")
     for col in required_cols:
         if col not in df.columns:
             raise ValueError(f"Falta la columna: {col}")
 
-    inserted = 0
-    failed = 0
-    errors = []
+    # 1️⃣ Validación vectorizada
+    df = ensure_columns(df, ["project_id", "reference", "notes"])
+    data = pd.DataFrame({"row_num": excel_row_numbers(df)})
+    data["material_code"] = clean_text(df["material_code"])
+    data["warehouse_code"] = clean_text(df["warehouse_id"])
+    data["project_code"] = clean_text(df["project_id"]) if with_project else None
+    data["quantity"], bad_quantity = to_number(df["quantity"])
+    data["reference"] = clean_text(df["reference"])
+    data["notes"] = clean_text(df["notes"])
+
+    checks = [
+        (data["material_code"].isna(), "Fila sin material_code"),
+        (data["warehouse_code"].isna(), "Fila sin warehouse_id (código)"),
+    ]
+    if with_project:
+        checks.append((data["project_code"].isna(), "Fila sin project_id (código)"))
+    checks += [
+        (bad_quantity | data["quantity"].isna(), "Cantidad inválida: " + df["quantity"].astype(str)),
+        ((data["quantity"] <= 0).fillna(False), "La cantidad debe ser mayor a 0"),
+    ]
+    row_errors = first_errors(checks)
+    errors_by_row = dict(zip(data.loc[row_errors.notna(), "row_num"], row_errors.dropna()))
+    valid = data[row_errors.isna()]
 
+    project_join = "LEFT JOIN projects p ON p.code = s.project_code" if with_project else ""
+    if movement_type == "IN":
+        from_wh, to_wh = "NULL::uuid", "w.id"
+    else:
+        from_wh, to_wh = "w.id", "NULL::uuid"
+
+    # 2️⃣ COPY + resolución de códigos + INSERT en bloque
     with db_connection() as conn:
         with conn.cursor() as cur:
-            for idx, row in df.iterrows():
-                try:
-                    # 1️⃣ Validar material por código
-                    if not row.get("material_code"):
-                        raise ValueError("Fila sin material_code")
+            stage_rows(cur, "_import_movements", _MOVEMENT_STAGE_COLUMNS, valid)
 
-                    cur.execute(
-                        "SELECT id FROM materials WHERE code=%s;",
-                        (row["material_code"],)
-                    )
-                    mat = cur.fetchone()
-                    if not mat:
-                        raise ValueError(f"Material no existe: {row['material_code']}")
-
-                    material_id = mat[0]
-
-                    # 2️⃣ Validar almacén por CÓDIGO (WH-CENTRAL, etc.)
-                    if not row.get("warehouse_id"):
-                        raise ValueError("Fila sin warehouse_id (código)")
-
-                    cur.execute(
-                        "SELECT id FROM warehouses WHERE code=%s;",
-                        (row["warehouse_id"],)
-                    )
-                    wh = cur.fetchone()
-                    if not wh:
-                        raise ValueError(f"Almacén no existe: {row['warehouse_id']}")
-
-                    warehouse_id = wh[0]
+            cur.execute(_MOVEMENT_LOOKUP_SQL.format(
+                project_missing="p.id IS NULL" if with_project else "FALSE",
+                project_join=project_join,
+            ))
+            codes = valid.set_index("row_num")
+            for row_num, no_material, no_warehouse, no_project in cur.fetchall():
+                if no_material:
+                    errors_by_row[row_num] = f"Material no existe: {codes.at[row_num, 'material_code']}"
+                elif no_warehouse:
+                    errors_by_row[row_num] = f"Almacén no existe: {codes.at[row_num, 'warehouse_code']}"
+                else:
+                    errors_by_row[row_num] = f"Proyecto no existe: {codes.at[row_num, 'project_code']}"
 
-                    # 3️⃣ Insertar movimiento IN usando SOLO UUIDs
-                    cur.execute("""
-                        INSERT INTO stock_movements (
-                            material_id, movement_type, quantity,
-                            from_warehouse, to_warehouse,
-                            reference, notes, created_by
-                        )
-                        VALUES (%s,'IN',%s,NULL,%s,%s,%s,'excel');
-                    """, (
-                        str(material_id),
-                        float(row["quantity"]),
-                        str(warehouse_id),
-                        row.get("reference"),
-                        row.get("notes"),
-                    ))
+            insert_sql = _MOVEMENT_INSERT_SQL.format(
+                movement_type=movement_type, from_warehouse=from_wh, to_warehouse=to_wh,
+                project_id="p.id" if with_project else "NULL::uuid",
+                project_join=project_join.replace("LEFT JOIN", "JOIN"),
+            )
+            returned, db_errors = apply_staged(cur, "_import_movements", [insert_sql])
+        conn.commit()
 
-                    inserted += 1
+    errors_by_row.update(db_errors)
+    inserted = len(returned)
+    log_throughput(f"stock {movement_type}", len(df), started)
 
-                except Exception as e:
-                    failed += 1
-                    errors.append({
-                        "row": int(idx) + 2,  # +2 por encabezado y base 0
-                        "material_code": row.get("material_code"),
-                        "warehouse_id": row.get("warehouse_id"),
-                        "error": str(e)
-                    })
-                    # Continúa con la siguiente fila
-                    continue
-
-        conn.commit()
+    # Detalle de errores con los valores tal como vinieron en el Excel
+    raw = df.set_index(excel_row_numbers(df))
+    errors = []
+    for row_num, msg in sorted(errors_by_row.items()):
+        error = {
+            "row": int(row_num),
+            "material_code": to_python(raw.at[row_num, "material_code"]),
+            "warehouse_id": to_python(raw.at[row_num, "warehouse_id"]),
+        }
+        if with_project:
+            error["project_id"] = to_python(raw.at[row_num, "project_id"])
+        error["error"] = msg
+        errors.append(error)
 
     return {
         "status": "OK",
         "inserted": inserted,
-        "failed": failed,
-        "total": inserted + failed,
+        "failed": len(errors),
+        "total": inserted + len(errors),
         "errors": errors
     }
 
 
 # ============================================================
-#  📤 C) Importar Stock OUT por Proyecto
+#  📥 B) Importar Stock IN (Ingreso)
 # ============================================================
 
-def import_stock_out_from_excel(file):
-    df = read_excel(file)
-
-    # NOTA: warehouse_id y project_id vienen como CÓDIGOS, no UUID
-    required_cols = ["material_code", "warehouse_id", "project_id", "quantity"]
-    for col in required_cols:
-        if col not in df.columns:
-            raise ValueError(f"Falta la columna: {col}")
-
-    inserted = 0
-    failed = 0
-    errors = []
-
-    with db_connection() as conn:
-        with conn.cursor() as cur:
-            for idx, row in df.iterrows():
-                try:
-                    # 1️⃣ Validar material por código
-                    if not row.get("material_code"):
-                        raise ValueError("Fila sin material_code")
-
-                    cur.execute(
-                        "SELECT id FROM materials WHERE code=%s;",
-                        (row["material_code"],)
-                    )
-                    mat = cur.fetchone()
-                    if not mat:
-                        raise ValueError(f"Material no existe: {row['material_code']}")
-
-                    material_id = mat[0]
-
-                    # 2️⃣ Validar almacén por CÓDIGO
-                    if not row.get("warehouse_id"):
-                        raise ValueError("Fila sin warehouse_id (código)")
-
-                    cur.execute(
-                        "SELECT id FROM warehouses WHERE code=%s;",
-                        (row["warehouse_id"],)
-                    )
-                    wh = cur.fetchone()
-                    if not wh:
-                        raise ValueError(f"Almacén no existe: {row['warehouse_id']}")
-
-                    warehouse_id = wh[0]
-
-                    # 3️⃣ Validar proyecto por CÓDIGO
-                    if not row.get("project_id"):
-                        raise ValueError("Fila sin project_id (código)")
-
-                    cur.execute(
-                        "SELECT id FROM projects WHERE code=%s;",
-                        (row["project_id"],)
-                    )
-                    pr = cur.fetchone()
-                    if not pr:
-                        raise ValueError(f"Proyecto no existe: {row['project_id']}")
-
-                    project_id = pr[0]
-
-                    # 4️⃣ Insertar movimiento OUT usando SOLO UUIDs
-                    cur.execute("""
-                        INSERT INTO stock_movements (
-                            material_id, movement_type, quantity,
-                            from_warehouse, to_warehouse, project_id,
-                            reference, notes, created_by
-                        )
-                        VALUES (%s,'OUT',%s,%s,NULL,%s,%s,%s,'excel');
-                    """, (
-                        str(material_id),
-                        float(row["quantity"]),
-                        str(warehouse_id),
-                        str(project_id),
-                        row.get("reference"),
-                        row.get("notes"),
-                    ))
-
-                    inserted += 1
-
-                except Exception as e:
-                    failed += 1
-                    errors.append({
-                        "row": int(idx) + 2,  # +2 por encabezado y base 0
-                        "material_code": row.get("material_code"),
-                        "warehouse_id": row.get("warehouse_id"),
-                        "project_id": row.get("project_id"),
-                        "error": str(e)
-                    })
-                    continue
+def import_stock_in_from_excel(file):
+    # NOTA: usamos warehouse_code (código humano), no UUID
+    return _import_stock_movements_from_excel(file, "IN")
 
-        conn.commit()
 
-    return {
-        "status": "OK",
-        "inserted": inserted,
-        "failed": failed,
-        "total": inserted + failed,
-        "errors": errors
-    }
+# ============================================================
+#  📤 C) Importar Stock OUT por Proyecto
+# ============================================================
 
+def import_stock_out_from_excel(file):
+    return _import_stock_movements_from_excel(file, "OUT")
 
 # ============================================================
 # 🧹 RESET DE DATOS (SOLO PARA TESTING)
@@ -1151,6 +1276,8 @@ def reset_logistics_data_service():
         with conn.cursor() as cur:
             # Movimientos y ubicaciones
             cur.execute("TRUNCATE TABLE stock_movements RESTART IDENTITY CASCADE;")
+            cur.execute("TRUNCATE TABLE stock_balances;")
+            cur.execute("TRUNCATE TABLE stock_valuation;")
             cur.execute("TRUNCATE TABLE stock_locations RESTART IDENTITY CASCADE;")
 
             # Herramientas
@@ -1166,6 +1293,7 @@ def reset_logistics_data_service():
             cur.execute("TRUNCATE TABLE warehouses RESTART IDENTITY CASCADE;")
 
             conn.commit()
+    reorder.invalidate()
 
     return {
         "status": "OK",
@@ -1207,21 +1335,32 @@ def create_warehouse_service(payload):
     }
 
 
+_WAREHOUSES_LIST_SQL = "SELECT id, code, name, location FROM warehouses ORDER BY code;"
+
+
+def _warehouse_list_item(r):
+    return {
+        "id": str(r[0]),
+        "code": r[1],
+        "name": r[2],
+        "location": r[3],
+    }
+
+
 def get_warehouses_service():
     with db_connection() as conn:
         with conn.cursor() as cur:
-            cur.execute("SELECT id, code, name, location FROM warehouses ORDER BY code;")
+            cur.execute(_WAREHOUSES_LIST_SQL)
             rows = cur.fetchall()
 
-    return [
-        {
-            "id": str(r[0]),
-            "code": r[1],
-            "name": r[2],
-            "location": r[3],
-        }
-        for r in rows
-    ]
+    return [_warehouse_list_item(r) for r in rows]
+
+
+async def get_warehouses_async_service():
+    async with async_db_connection() as conn:
+        rows = await conn.fetch(_WAREHOUSES_LIST_SQL)
+
+    return [_warehouse_list_item(r) for r in rows]
 
 
 def get_warehouse_inventory_service(warehouse_id: str):
@@ -1275,6 +1414,7 @@ def get_warehouse_inventory_service(warehouse_id: str):
             """, (warehouse_id, warehouse_id, warehouse_id, warehouse_id))
             rows = cur.fetchall()
 
+    alerts = {a["material_id"]: a["alert"] for a in reorder.stock_alerts(warehouse_id=str(wh[0]))}
     items = []
     for r in rows:
         items.append({
@@ -1302,6 +1442,7 @@ def get_warehouse_inventory_service(warehouse_id: str):
             "return_notes":      r[21],
             "assignment_status": r[22],
             "returned_at":       r[23].isoformat() if r[23] else None,
+            "alert":             alerts.get(str(r[0])),
         })
 
     return {
@@ -1316,59 +1457,71 @@ def get_warehouse_inventory_service(warehouse_id: str):
             "total_skus":   len(items),
             "total_units":  sum(i["stock_available"] for i in items),
             "zero_stock":   sum(1 for i in items if i["stock_available"] <= 0),
-            "low_stock":    sum(1 for i in items if i["stock_available"] > 0 and i["min_stock"] and i["stock_available"] <= i["min_stock"]),
+            "low_stock":    sum(1 for i in items if i["alert"] == "BELOW_MIN"),
             "with_damage":  sum(1 for i in items if i["condition_in"] and i["condition_in"].upper() in ("DAÑADO", "DAÑADA", "REQUIERE MANTENIMIENTO", "MALO", "MALA")),
         },
     }
 
 
+_STOCK_AVAILABILITY_SQL = """
+    SELECT
+        m.id              AS material_id,
+        m.name            AS material_name,
+        m.code            AS material_code,
+        m.min_stock,
+        w.id              AS warehouse_id,
+        w.name            AS warehouse_name,
+        w.code            AS warehouse_code,
+        v.stock_available,
+        sl.rack,
+        sl.level,
+        sl.box,
+        sl.position
+    FROM vw_stock_availability v
+    JOIN materials  m ON m.id = v.material_id
+    JOIN warehouses w ON w.id = v.warehouse_id
+    LEFT JOIN stock_locations sl
+        ON sl.material_id = v.material_id
+       AND sl.warehouse_id = v.warehouse_id
+    ORDER BY m.name, w.code;
+"""
+
+
+def _stock_availability_item(r):
+    return {
+        "material_id":    str(r[0]),
+        "material_name":  r[1],
+        "material_code":  r[2],
+        "min_stock":      float(r[3]) if r[3] is not None else None,
+        "warehouse_id":   str(r[4]),
+        "warehouse_name": r[5],
+        "warehouse_code": r[6],
+        "stock_available": float(r[7]),
+        "rack":           r[8],
+        "level":          r[9],
+        "box":            r[10],
+        "location_ref":   r[11],
+    }
+
+
 def get_stock_availability_service():
     """
     Flat list: material + warehouse + stock_available + location data.
     """
     with db_connection() as conn:
         with conn.cursor() as cur:
-            cur.execute("""
-                SELECT
-                    m.id              AS material_id,
-                    m.name            AS material_name,
-                    m.code            AS material_code,
-                    m.min_stock,
-                    w.id              AS warehouse_id,
-                    w.name            AS warehouse_name,
-                    w.code            AS warehouse_code,
-                    v.stock_available,
-                    sl.rack,
-                    sl.level,
-                    sl.box,
-                    sl.position
-                FROM vw_stock_availability v
-                JOIN materials  m ON m.id = v.material_id
-                JOIN warehouses w ON w.id = v.warehouse_id
-                LEFT JOIN stock_locations sl
-                    ON sl.material_id = v.material_id
-                   AND sl.warehouse_id = v.warehouse_id
-                ORDER BY m.name, w.code;
-            """)
+            cur.execute(_STOCK_AVAILABILITY_SQL)
             rows = cur.fetchall()
 
-    return [
-        {
-            "material_id":    str(r[0]),
-            "material_name":  r[1],
-            "material_code":  r[2],
-            "min_stock":      float(r[3]) if r[3] is not None else None,
-            "warehouse_id":   str(r[4]),
-            "warehouse_name": r[5],
-            "warehouse_code": r[6],
-            "stock_available": float(r[7]),
-            "rack":           r[8],
-            "level":          r[9],
-            "box":            r[10],
-            "location_ref":   r[11],
-        }
-        for r in rows
-    ]
+    return [_stock_availability_item(r) for r in rows]
+
+
+async def get_stock_availability_async_service():
+    """Igual que get_stock_availability_service, sobre el pool asyncpg."""
+    async with async_db_connection() as conn:
+        rows = await conn.fetch(_STOCK_AVAILABILITY_SQL)
+
+    return [_stock_availability_item(r) for r in rows]
 
 
 def update_stock_location_meta_service(
@@ -1821,6 +1974,58 @@ def consume_stock_location_tx(
         WHERE id = %s
     """, (quantity, location_id))
 
+def consume_stock_locations_bulk_tx(cur, items) -> list:
+    """
+    Descuenta de stock_locations varias salidas sin ubicación específica en una
+    sola sentencia. Mismo criterio que los despachos: por (material, almacén) se
+    consumen primero las ubicaciones con más cantidad.
+
+    items: iterable de (material_id, warehouse_id, quantity).
+    Retorna [(material_id, warehouse_id, faltante)] de lo que no alcanzó;
+    decidir si eso aborta la transacción queda del lado del llamador.
+    """
+    items = [(str(m), str(w), q) for m, w, q in items if w is not None and q]
+    if not items:
+        return []
+
+    material_ids, warehouse_ids, quantities = map(list, zip(*items))
+    cur.execute("""
+        WITH demanda AS (
+            SELECT material_id, warehouse_id, SUM(quantity) AS quantity
+            FROM unnest(%s::uuid[], %s::uuid[], %s::numeric[])
+                 AS u(material_id, warehouse_id, quantity)
+            GROUP BY material_id, warehouse_id
+        ), bloqueadas AS (
+            SELECT sl.id, sl.material_id, sl.warehouse_id, sl.quantity
+            FROM stock_locations sl
+            JOIN demanda d ON d.material_id = sl.material_id AND d.warehouse_id = sl.warehouse_id
+            WHERE sl.quantity > 0
+            FOR UPDATE OF sl
+        ), reparto AS (
+            SELECT b.id, b.material_id, b.warehouse_id,
+                   LEAST(b.quantity, d.quantity - COALESCE(SUM(b.quantity) OVER (
+                       PARTITION BY b.material_id, b.warehouse_id
+                       ORDER BY b.quantity DESC, b.id
+                       ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING
+                   ), 0)) AS consumo
+            FROM bloqueadas b
+            JOIN demanda d ON d.material_id = b.material_id AND d.warehouse_id = b.warehouse_id
+        ), consumido AS (
+            UPDATE stock_locations sl
+            SET quantity = sl.quantity - r.consumo,
+                updated_at = NOW()
+            FROM reparto r
+            WHERE sl.id = r.id AND r.consumo > 0
+            RETURNING r.material_id, r.warehouse_id, r.consumo
+        )
+        SELECT d.material_id, d.warehouse_id, d.quantity - COALESCE(SUM(c.consumo), 0)
+        FROM demanda d
+        LEFT JOIN consumido c ON c.material_id = d.material_id AND c.warehouse_id = d.warehouse_id
+        GROUP BY d.material_id, d.warehouse_id, d.quantity
+        HAVING d.quantity - COALESCE(SUM(c.consumo), 0) > 0
+    """, (material_ids, warehouse_ids, quantities))
+    return cur.fetchall()
+
 def add_stock_location_tx(
     cur,
     material_id,
@@ -2885,6 +3090,7 @@ def validate_material_service(material_id: str, payload, user):
                 values
             )
             conn.commit()
+    reorder.invalidate([material_id])
 
     return {"status": "validated", "material_id": material_id}
 
@@ -3496,19 +3702,18 @@ def get_project_requirements_gap(project_id: str):
                     MAX(mr.priority)                              AS priority,
                     MIN(mr.needed_by)                            AS needed_by,
                     m.code, m.name, m.unit, m.category,
-                    COALESCE(stock.total_available, 0)           AS stock_available,
-                    GREATEST(0, SUM(mr.quantity) - COALESCE(stock.total_available, 0)) AS shortage
+                    COALESCE(stock.stock_available, 0)           AS stock_available,
+                    GREATEST(0, SUM(mr.quantity) - COALESCE(stock.stock_available, 0)) AS shortage
                 FROM material_requests mr
                 LEFT JOIN materials m ON m.id = mr.related_material_id
-                LEFT JOIN (
-                    SELECT material_id, SUM(stock_available) AS total_available
-                    FROM vw_stock_availability
-                    GROUP BY material_id
-                ) stock ON stock.material_id = mr.related_material_id
+                LEFT JOIN LATERAL (
+                    SELECT SUM(stock_available) AS stock_available
+                    FROM stock_material_availability WHERE material_id = mr.related_material_id
+                ) stock ON TRUE
                 WHERE mr.project_id = %s
                   AND mr.status NOT IN ('REJECTED', 'CANCELLED')
                   AND mr.related_material_id IS NOT NULL
-                GROUP BY mr.related_material_id, m.code, m.name, m.unit, m.category, stock.total_available
+                GROUP BY mr.related_material_id, m.code, m.name, m.unit, m.category, stock.stock_available
                 ORDER BY shortage DESC, priority DESC
             """, (project_id,))
             rows = cur.fetchall()
@@ -3561,19 +3766,9 @@ def get_project_requirements_gap(project_id: str):
 # ══════════════════════════════════════════════════════════════════════════════
 
 def export_materials_excel_service():
-    from app.core.export_utils import (
-        write_title_row, write_header_row, write_data_row,
-        set_column_widths, fmt_date, fmt_num, excel_response,
-    )
-    import openpyxl
+    from app.core.export_utils import StreamingExcel, fmt_date, fmt_num
 
-    materials = get_materials_service()
     fecha = datetime.now().strftime("%d/%m/%Y %H:%M")
-
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = "Catálogo de Materiales"
-
     headers = [
         "Código", "Nombre", "Categoría", "Stock mínimo",
         "Marca", "Modelo", "N° Serie",
@@ -3584,14 +3779,21 @@ def export_materials_excel_service():
     ]
     widths = [12, 38, 18, 13, 16, 16, 16, 28, 22, 14, 14, 14, 14, 30]
 
-    write_title_row(ws, f"CeShark ERP — Catálogo de Materiales — {fecha}", len(headers))
-    write_header_row(ws, headers, row=2)
-    set_column_widths(ws, widths)
-    ws.row_dimensions[1].height = 26
-    ws.row_dimensions[2].height = 18
+    book = StreamingExcel()
+    sheet = book.sheet(
+        "Catálogo de Materiales", headers, widths,
+        title=f"CeShark ERP — Catálogo de Materiales — {fecha}",
+    )
 
-    for i, m in enumerate(materials, start=1):
-        write_data_row(ws, i + 2, [
+    query, params = _materials_list_query()
+    total = 0
+    categorias = {}
+    for i, row in enumerate(stream_query(query, params, name="export_materials"), start=1):
+        m = _material_list_item(row)
+        total += 1
+        cat = m.get("category") or "Sin categoría"
+        categorias[cat] = categorias.get(cat, 0) + 1
+        sheet.data_row([
             m.get("code", ""),
             m.get("name", ""),
             m.get("category", ""),
@@ -3608,84 +3810,62 @@ def export_materials_excel_service():
             ", ".join(m.get("aliases", [])),
         ], alternate=(i % 2 == 0))
 
-    # Hoja de resumen
-    ws2 = wb.create_sheet("Resumen")
-    from app.core.export_utils import _fill, _font_bold_dark, _font_normal, _align, PRIMARY_HEX
-    ws2.column_dimensions["A"].width = 28
-    ws2.column_dimensions["B"].width = 14
-    ws2["A1"] = "Total de materiales registrados"
-    ws2["B1"] = len(materials)
-    ws2["A1"].font = _font_bold_dark()
-    ws2["B1"].font = _font_bold_dark()
-
-    categorias = {}
-    for m in materials:
-        cat = m.get("category") or "Sin categoría"
-        categorias[cat] = categorias.get(cat, 0) + 1
-    ws2["A2"] = ""
-    ws2["A3"] = "Por categoría:"
-    ws2["A3"].font = _font_bold_dark()
-    for row_i, (cat, count) in enumerate(sorted(categorias.items()), start=4):
-        ws2[f"A{row_i}"] = f"  {cat}"
-        ws2[f"B{row_i}"] = count
-        ws2[f"A{row_i}"].font = _font_normal()
-        ws2[f"B{row_i}"].font = _font_normal()
+    # Hoja de resumen: los conteos se acumulan mientras se escribe el catálogo
+    resumen = book.sheet("Resumen", ["Total de materiales registrados", total], [28, 14])
+    resumen.data_row(["", ""])
+    resumen.data_row(["Por categoría:", ""])
+    for cat, count in sorted(categorias.items()):
+        resumen.data_row([f"  {cat}", count])
 
-    return excel_response(wb, f"materiales_{datetime.now().strftime('%Y%m%d')}.xlsx")
+    return book.response(f"materiales_{datetime.now().strftime('%Y%m%d')}.xlsx")
 
 
 # ══════════════════════════════════════════════════════════════════════════════
 # 📦 EXPORTAR REPORTE DE STOCK A EXCEL
 # ══════════════════════════════════════════════════════════════════════════════
 
-def export_stock_excel_service():
-    from app.core.export_utils import (
-        write_title_row, write_header_row, write_data_row,
-        set_column_widths, fmt_num, excel_response, _fill, _font_bold_dark, ACCENT_HEX,
-    )
-    import openpyxl
-    from openpyxl.styles import Font, PatternFill
+_STOCK_ESTADO_COLORS = {
+    "SIN STOCK":  ("FEE2E2", "991B1B"),
+    "STOCK BAJO": ("FEF3C7", "92400E"),
+    "OK":         ("D1FAE5", "065F46"),
+}
 
-    fecha = datetime.now().strftime("%d/%m/%Y %H:%M")
 
-    with db_connection() as conn:
-        with conn.cursor() as cur:
-            # Stock actual por material + almacén desde stock_locations
-            cur.execute("""
-                SELECT
-                    m.code,
-                    m.name,
-                    m.category,
-                    m.min_stock,
-                    w.code  AS warehouse_code,
-                    w.name  AS warehouse_name,
-                    COALESCE(SUM(sl.quantity), 0) AS stock_actual
-                FROM materials m
-                CROSS JOIN warehouses w
-                LEFT JOIN stock_locations sl
-                    ON sl.material_id = m.id AND sl.warehouse_id = w.id
-                GROUP BY m.id, m.code, m.name, m.category, m.min_stock,
-                         w.id, w.code, w.name
-                HAVING COALESCE(SUM(sl.quantity), 0) > 0
-                   OR m.min_stock > 0
-                ORDER BY m.name, w.name
-            """)
-            rows = cur.fetchall()
-
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = "Stock Disponible"
+def export_stock_excel_service():
+    from app.core.export_utils import StreamingExcel, fmt_num
 
+    fecha = datetime.now().strftime("%d/%m/%Y %H:%M")
     headers = ["Cód. Material", "Nombre Material", "Categoría",
                "Stock Mínimo", "Cód. Almacén", "Almacén",
                "Stock Actual", "Estado"]
     widths = [13, 38, 16, 13, 13, 28, 13, 14]
 
-    write_title_row(ws, f"CeShark ERP — Reporte de Stock — {fecha}", len(headers))
-    write_header_row(ws, headers, row=2)
-    set_column_widths(ws, widths)
-    ws.row_dimensions[1].height = 26
-    ws.row_dimensions[2].height = 18
+    book = StreamingExcel()
+    sheet = book.sheet(
+        "Stock Disponible", headers, widths,
+        title=f"CeShark ERP — Reporte de Stock — {fecha}",
+    )
+
+    # Stock actual por material + almacén desde stock_locations
+    rows = stream_query("""
+        SELECT
+            m.code,
+            m.name,
+            m.category,
+            m.min_stock,
+            w.code  AS warehouse_code,
+            w.name  AS warehouse_name,
+            COALESCE(SUM(sl.quantity), 0) AS stock_actual
+        FROM materials m
+        CROSS JOIN warehouses w
+        LEFT JOIN stock_locations sl
+            ON sl.material_id = m.id AND sl.warehouse_id = w.id
+        GROUP BY m.id, m.code, m.name, m.category, m.min_stock,
+                 w.id, w.code, w.name
+        HAVING COALESCE(SUM(sl.quantity), 0) > 0
+           OR m.min_stock > 0
+        ORDER BY m.name, w.name
+    """, name="export_stock")
 
     for i, r in enumerate(rows, start=1):
         code, name, cat, min_stock, wh_code, wh_name, stock = r
@@ -3698,24 +3878,13 @@ def export_stock_excel_service():
         else:
             estado = "OK"
 
-        write_data_row(ws, i + 2, [
+        # Color semáforo en columna Estado (col 8)
+        sheet.data_row([
             code, name, cat or "",
             fmt_num(min_s, 0),
             wh_code, wh_name,
             fmt_num(stock_f, 2),
             estado,
-        ], alternate=(i % 2 == 0))
-
-        # Color semáforo en columna Estado (col 8)
-        estado_cell = ws.cell(row=i + 2, column=8)
-        if estado == "SIN STOCK":
-            estado_cell.font = Font(size=9, bold=True, color="991B1B")
-            estado_cell.fill = PatternFill("solid", fgColor="FEE2E2")
-        elif estado == "STOCK BAJO":
-            estado_cell.font = Font(size=9, bold=True, color="92400E")
-            estado_cell.fill = PatternFill("solid", fgColor="FEF3C7")
-        else:
-            estado_cell.font = Font(size=9, bold=True, color="065F46")
-            estado_cell.fill = PatternFill("solid", fgColor="D1FAE5")
+        ], alternate=(i % 2 == 0), badges={8: _STOCK_ESTADO_COLORS[estado]})
 
-    return excel_response(wb, f"stock_{datetime.now().strftime('%Y%m%d')}.xlsx")
+    return book.response(f"stock_{datetime.now().strftime('%Y%m%d')}.xlsx")
@@ -153,15 +153,14 @@ def get_plan_detail_service(plan_id: str, user):
                     ppi.wear_percentage,
                     ppi.notes,
                     ppi.created_at,
-                    COALESCE(
-                        (SELECT SUM(va.stock_available)
-                         FROM vw_stock_availability va
-                         WHERE va.material_id = ppi.material_id),
-                        0
-                    ) AS stock_total,
+                    COALESCE(sma.stock_available, 0) AS stock_total,
                     ppi.submission_status
                 FROM project_plan_items ppi
                 JOIN materials m ON m.id = ppi.material_id
+                LEFT JOIN LATERAL (
+                    SELECT SUM(stock_available) AS stock_available
+                    FROM stock_material_availability WHERE material_id = ppi.material_id
+                ) sma ON TRUE
                 WHERE ppi.plan_id = %s
                 ORDER BY m.category, m.name
             """, (plan_id,))
@@ -363,14 +362,13 @@ def create_submission_service(plan_id: str, user, reason: str | None = None):
                     m.unit_cost,
                     ppi.quantity,
                     ppi.wear_percentage,
-                    COALESCE(
-                        (SELECT SUM(va.stock_available)
-                         FROM vw_stock_availability va
-                         WHERE va.material_id = ppi.material_id),
-                        0
-                    ) AS stock_total
+                    COALESCE(sma.stock_available, 0) AS stock_total
                 FROM project_plan_items ppi
                 JOIN materials m ON m.id = ppi.material_id
+                LEFT JOIN LATERAL (
+                    SELECT SUM(stock_available) AS stock_available
+                    FROM stock_material_availability WHERE material_id = ppi.material_id
+                ) sma ON TRUE
                 WHERE ppi.plan_id = %s AND ppi.submission_status = 'PENDING'
             """, (plan_id,))
             items = cur.fetchall()
@@ -951,31 +949,25 @@ def apply_group_to_plan_service(plan_id: str, group_id: str, user):
             if str(plan[0]) != str(user["id"]):
                 raise HTTPException(403, "Solo el ingeniero responsable puede modificar este plan")
 
+            # Todo el grupo en una sentencia (material_id es único dentro del grupo)
             cur.execute("""
-                SELECT mgi.material_id, mgi.quantity, mgi.wear_percentage, mgi.notes
+                INSERT INTO project_plan_items
+                    (plan_id, material_id, quantity, wear_percentage, notes)
+                SELECT %s, mgi.material_id, mgi.quantity, mgi.wear_percentage, mgi.notes
                 FROM material_group_items mgi
                 WHERE mgi.group_id = %s
-            """, (group_id,))
-            items = cur.fetchall()
+                ON CONFLICT (plan_id, material_id)
+                DO UPDATE SET
+                    quantity        = EXCLUDED.quantity,
+                    wear_percentage = EXCLUDED.wear_percentage,
+                    notes           = COALESCE(EXCLUDED.notes, project_plan_items.notes),
+                    updated_at      = NOW()
+            """, (plan_id, group_id))
+            added = cur.rowcount
 
-            if not items:
+            if not added:
                 raise HTTPException(400, "El grupo no tiene materiales")
 
-            added = 0
-            for (material_id, quantity, wear_pct, notes) in items:
-                cur.execute("""
-                    INSERT INTO project_plan_items
-                        (plan_id, material_id, quantity, wear_percentage, notes)
-                    VALUES (%s, %s, %s, %s, %s)
-                    ON CONFLICT (plan_id, material_id)
-                    DO UPDATE SET
-                        quantity        = EXCLUDED.quantity,
-                        wear_percentage = EXCLUDED.wear_percentage,
-                        notes           = COALESCE(EXCLUDED.notes, project_plan_items.notes),
-                        updated_at      = NOW()
-                """, (plan_id, str(material_id), float(quantity), float(wear_pct), notes))
-                added += 1
-
             cur.execute("UPDATE project_plans SET updated_at = NOW() WHERE id = %s", (plan_id,))
             conn.commit()
 
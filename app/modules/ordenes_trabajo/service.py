@@ -1,7 +1,8 @@
-from datetime import datetime, timezone
+from datetime import datetime
 from fastapi import HTTPException
-from app.core.database import db_connection
+from app.core.database import db_connection, stream_query
 from app.core.utils import generate_sequential_code
+from app.modules.logistics.service import consume_stock_locations_bulk_tx
 from app.modules.ordenes_trabajo.schemas import (
     VALID_TIPOS, VALID_PRIORIDAD, VALID_STATUS,
 )
@@ -75,6 +76,8 @@ def _row_to_material(r) -> dict:
         "oc_id":            str(r[12]) if r[12] else None,
         "oc_code":          r[13],
         "stock_disponible": float(r[14]) if r[14] is not None else 0.0,
+        # Disponible neto de reservas (vw_stock_availability); stock_disponible es el físico en ubicaciones
+        "stock_neto_disponible": float(r[15]) if r[15] is not None else 0.0,
     }
 
 
@@ -112,8 +115,8 @@ OT_SELECT = """
 # LISTA Y DETALLE
 # ══════════════════════════════════════════════════════════════════════════════
 
-def list_ot_service(status: str = None, plan_id: str = None,
-                    tipo: str = None, asignado_a: str = None) -> list:
+def _ot_list_query(status: str = None, plan_id: str = None,
+                   tipo: str = None, asignado_a: str = None):
     conditions, vals = [], []
     if status:
         conditions.append("ot.status = %s"); vals.append(status)
@@ -125,72 +128,88 @@ def list_ot_service(status: str = None, plan_id: str = None,
         conditions.append("ot.asignado_a = %s::uuid"); vals.append(asignado_a)
 
     where = ("WHERE " + " AND ".join(conditions)) if conditions else ""
+    return f"{OT_SELECT} {where} ORDER BY ot.created_at DESC", vals
+
+
+def list_ot_service(status: str = None, plan_id: str = None,
+                    tipo: str = None, asignado_a: str = None) -> list:
+    query, vals = _ot_list_query(status, plan_id, tipo, asignado_a)
     with db_connection() as conn:
         with conn.cursor() as cur:
-            cur.execute(f"{OT_SELECT} {where} ORDER BY ot.created_at DESC", vals)
+            cur.execute(query, vals)
             rows = cur.fetchall()
     return [_row_to_ot(r) for r in rows]
 
 
-def get_ot_service(ot_id: str) -> dict:
-    with db_connection() as conn:
-        with conn.cursor() as cur:
-            cur.execute(f"{OT_SELECT} WHERE ot.id = %s::uuid", (ot_id,))
-            row = cur.fetchone()
-            if not row:
-                raise HTTPException(404, "OT no encontrada")
-            ot = _row_to_ot(row)
-
-            # Checklist
-            cur.execute("""
-                SELECT cl.id, cl.ot_id, cl.orden, cl.descripcion,
-                       cl.completado, cl.completado_por, cl.completado_at, cl.notas,
-                       u.username
-                FROM ot_checklist cl
-                LEFT JOIN users u ON u.id = cl.completado_por
-                WHERE cl.ot_id = %s::uuid
-                ORDER BY cl.orden, cl.id
-            """, (ot_id,))
-            ot["checklist"] = [_row_to_checklist(r) for r in cur.fetchall()]
+def _fetch_ot(cur, ot_id: str) -> dict:
+    """OT con checklist, materiales y tiempos, leída con el cursor dado."""
+    cur.execute(f"{OT_SELECT} WHERE ot.id = %s::uuid", (ot_id,))
+    row = cur.fetchone()
+    if not row:
+        raise HTTPException(404, "OT no encontrada")
+    ot = _row_to_ot(row)
+
+    # Checklist
+    cur.execute("""
+        SELECT cl.id, cl.ot_id, cl.orden, cl.descripcion,
+               cl.completado, cl.completado_por, cl.completado_at, cl.notas,
+               u.username
+        FROM ot_checklist cl
+        LEFT JOIN users u ON u.id = cl.completado_por
+        WHERE cl.ot_id = %s::uuid
+        ORDER BY cl.orden, cl.id
+    """, (ot_id,))
+    ot["checklist"] = [_row_to_checklist(r) for r in cur.fetchall()]
+
+    # Materiales
+    cur.execute("""
+        SELECT om.id, om.ot_id, om.material_id, om.almacen_id,
+               om.cantidad_plan, om.cantidad_real, om.stock_movement_id,
+               om.created_at,
+               m.name, m.unit, w.name, u.username,
+               om.oc_id, oc.code AS oc_code,
+               COALESCE((
+                   SELECT SUM(sl.quantity)
+                   FROM stock_locations sl
+                   WHERE sl.material_id = om.material_id
+               ), 0) AS stock_disponible,
+               COALESCE(sma.stock_available, 0) AS stock_neto_disponible
+        FROM ot_materiales om
+        JOIN materials m ON m.id = om.material_id
+        LEFT JOIN LATERAL (
+            SELECT SUM(stock_available) AS stock_available
+            FROM stock_material_availability WHERE material_id = om.material_id
+        ) sma ON TRUE
+        LEFT JOIN warehouses w ON w.id = om.almacen_id
+        LEFT JOIN users u ON u.id = om.registrado_por
+        LEFT JOIN ordenes_compra oc ON oc.id = om.oc_id
+        WHERE om.ot_id = %s::uuid
+        ORDER BY om.created_at
+    """, (ot_id,))
+    ot["materiales"] = [_row_to_material(r) for r in cur.fetchall()]
+
+    # Tiempos
+    cur.execute("""
+        SELECT t.id, t.ot_id, t.tecnico_id,
+               t.inicio, t.fin, t.horas, t.notas,
+               u.username
+        FROM ot_tiempos t
+        LEFT JOIN users u ON u.id = t.tecnico_id
+        WHERE t.ot_id = %s::uuid
+        ORDER BY t.inicio
+    """, (ot_id,))
+    ot["tiempos"] = [_row_to_tiempo(r) for r in cur.fetchall()]
+
+    # Tiempo activo (sin fin)
+    ot["tiene_tiempo_activo"] = any(t["fin"] is None for t in ot["tiempos"])
 
-            # Materiales
-            cur.execute("""
-                SELECT om.id, om.ot_id, om.material_id, om.almacen_id,
-                       om.cantidad_plan, om.cantidad_real, om.stock_movement_id,
-                       om.created_at,
-                       m.name, m.unit, w.name, u.username,
-                       om.oc_id, oc.code AS oc_code,
-                       COALESCE((
-                           SELECT SUM(sl.quantity)
-                           FROM stock_locations sl
-                           WHERE sl.material_id = om.material_id
-                       ), 0) AS stock_disponible
-                FROM ot_materiales om
-                JOIN materials m ON m.id = om.material_id
-                LEFT JOIN warehouses w ON w.id = om.almacen_id
-                LEFT JOIN users u ON u.id = om.registrado_por
-                LEFT JOIN ordenes_compra oc ON oc.id = om.oc_id
-                WHERE om.ot_id = %s::uuid
-                ORDER BY om.created_at
-            """, (ot_id,))
-            ot["materiales"] = [_row_to_material(r) for r in cur.fetchall()]
-
-            # Tiempos
-            cur.execute("""
-                SELECT t.id, t.ot_id, t.tecnico_id,
-                       t.inicio, t.fin, t.horas, t.notas,
-                       u.username
-                FROM ot_tiempos t
-                LEFT JOIN users u ON u.id = t.tecnico_id
-                WHERE t.ot_id = %s::uuid
-                ORDER BY t.inicio
-            """, (ot_id,))
-            ot["tiempos"] = [_row_to_tiempo(r) for r in cur.fetchall()]
+    return ot
 
-            # Tiempo activo (sin fin)
-            ot["tiene_tiempo_activo"] = any(t["fin"] is None for t in ot["tiempos"])
 
-    return ot
+def get_ot_service(ot_id: str) -> dict:
+    with db_connection() as conn:
+        with conn.cursor() as cur:
+            return _fetch_ot(cur, ot_id)
 
 
 # ══════════════════════════════════════════════════════════════════════════════
@@ -446,7 +465,7 @@ def add_material_service(ot_id: str, payload, user: dict) -> dict:
 
             conn.commit()
 
-    return _row_to_material((*row, mat[1], mat[2], wh_name, None, None, None, 0.0))
+    return _row_to_material((*row, mat[1], mat[2], wh_name, None, None, None, 0.0, 0.0))
 
 
 def update_material_service(ot_id: str, mat_id: str, payload, user: dict) -> dict:
@@ -524,30 +543,23 @@ def iniciar_tiempo_service(ot_id: str, user: dict) -> dict:
 def pausar_tiempo_service(ot_id: str, user: dict, notas: str = None) -> dict:
     with db_connection() as conn:
         with conn.cursor() as cur:
-            cur.execute("""
-                SELECT id, inicio FROM ot_tiempos
-                WHERE ot_id = %s::uuid AND tecnico_id = %s::uuid AND fin IS NULL
-                ORDER BY inicio DESC LIMIT 1
-            """, (ot_id, str(user["id"])))
-            row = cur.fetchone()
-            if not row:
-                raise HTTPException(400, "No tienes un cronómetro activo en esta OT")
-
-            tiempo_id, inicio = row
-            fin = datetime.now(timezone.utc)
-            if inicio.tzinfo is None:
-                from datetime import timezone as tz
-                inicio = inicio.replace(tzinfo=timezone.utc)
-            diff = fin - inicio
-            horas = round(diff.total_seconds() / 3600, 4)
-
+            # Mismo reloj que el cierre de la OT: fin y horas salen de LOCALTIMESTAMP
             cur.execute("""
                 UPDATE ot_tiempos
-                SET fin = NOW(), horas = %s, notas = %s
-                WHERE id = %s::uuid
+                SET fin = LOCALTIMESTAMP,
+                    horas = ROUND(EXTRACT(EPOCH FROM LOCALTIMESTAMP - inicio) / 3600, 4),
+                    notas = %s
+                WHERE id = (
+                    SELECT id FROM ot_tiempos
+                    WHERE ot_id = %s::uuid AND tecnico_id = %s::uuid AND fin IS NULL
+                    ORDER BY inicio DESC LIMIT 1
+                    FOR UPDATE
+                )
                 RETURNING id, ot_id, tecnico_id, inicio, fin, horas, notas
-            """, (horas, notas, tiempo_id))
+            """, (notas, ot_id, str(user["id"])))
             updated = cur.fetchone()
+            if not updated:
+                raise HTTPException(400, "No tienes un cronómetro activo en esta OT")
             conn.commit()
 
     return _row_to_tiempo((*updated, None))
@@ -560,77 +572,77 @@ def pausar_tiempo_service(ot_id: str, user: dict, notas: str = None) -> dict:
 def cerrar_ot_service(ot_id: str, user: dict) -> dict:
     with db_connection() as conn:
         with conn.cursor() as cur:
-            cur.execute("SELECT status FROM ordenes_trabajo WHERE id = %s::uuid", (ot_id,))
+            # FOR UPDATE: dos cierres simultáneos no registran el consumo dos veces
+            cur.execute("SELECT status FROM ordenes_trabajo WHERE id = %s::uuid FOR UPDATE", (ot_id,))
             ot_row = cur.fetchone()
             if not ot_row:
                 raise HTTPException(404, "OT no encontrada")
             if ot_row[0] not in ("COMPLETADA", "EN_EJECUCION"):
                 raise HTTPException(400, f"Solo se puede cerrar una OT COMPLETADA o EN_EJECUCION (estado actual: {ot_row[0]})")
 
-            # 1. Pausar cualquier cronómetro abierto
+            # 1. Pausar cualquier cronómetro abierto (inicio/fin son hora local sin zona)
             cur.execute("""
-                SELECT id, inicio FROM ot_tiempos
+                UPDATE ot_tiempos
+                SET fin = LOCALTIMESTAMP,
+                    horas = ROUND(EXTRACT(EPOCH FROM LOCALTIMESTAMP - inicio) / 3600, 4)
                 WHERE ot_id = %s::uuid AND fin IS NULL
             """, (ot_id,))
-            open_timers = cur.fetchall()
-            for tid, inicio in open_timers:
-                fin = datetime.now(timezone.utc)
-                if inicio.tzinfo is None:
-                    inicio = inicio.replace(tzinfo=timezone.utc)
-                horas = round((fin - inicio).total_seconds() / 3600, 4)
-                cur.execute(
-                    "UPDATE ot_tiempos SET fin = NOW(), horas = %s WHERE id = %s",
-                    (horas, tid)
-                )
 
-            # 2. Registrar movimientos de salida para cada material
+            # 2. Un movimiento de salida por material pendiente, enlazado a su fila.
+            #    El id se genera antes del INSERT para unir movimiento y material.
+            #    Orden (material, almacén): los triggers de saldos y disponibilidad
+            #    bloquean en ese orden, igual que la recepción de OC.
             cur.execute("""
-                SELECT id, material_id, almacen_id, cantidad_real
-                FROM ot_materiales
-                WHERE ot_id = %s::uuid AND cantidad_real > 0 AND stock_movement_id IS NULL
-            """, (ot_id,))
-            materiales = cur.fetchall()
-
-            for mat_row in materiales:
-                mat_ot_id, material_id, almacen_id, cantidad = mat_row
-                cur.execute("""
+                WITH pendientes AS (
+                    SELECT id, gen_random_uuid() AS movement_id,
+                           material_id, almacen_id, cantidad_real
+                    FROM ot_materiales
+                    WHERE ot_id = %s::uuid AND cantidad_real > 0 AND stock_movement_id IS NULL
+                    FOR UPDATE
+                ), movimientos AS (
                     INSERT INTO stock_movements
-                        (material_id, movement_type, quantity, from_warehouse, reference, notes, created_by)
-                    VALUES (%s::uuid, 'OUT', %s, %s::uuid, %s, %s, %s::uuid)
-                    RETURNING id
-                """, (
-                    str(material_id),
-                    float(cantidad),
-                    str(almacen_id) if almacen_id else None,
-                    f"OT-CIERRE-{ot_id[:8]}",
-                    f"Consumo registrado al cerrar OT",
-                    str(user["id"]),
-                ))
-                movement_id = cur.fetchone()[0]
+                        (id, material_id, movement_type, quantity, from_warehouse, reference, notes, created_by)
+                    SELECT movement_id, material_id, 'OUT', cantidad_real, almacen_id,
+                           %s, 'Consumo registrado al cerrar OT', %s
+                    FROM pendientes
+                    ORDER BY material_id, almacen_id
+                    RETURNING id, material_id, from_warehouse, quantity
+                )
+                UPDATE ot_materiales om
+                SET stock_movement_id = mv.id
+                FROM pendientes p
+                JOIN movimientos mv ON mv.id = p.movement_id
+                WHERE om.id = p.id
+                RETURNING mv.material_id, mv.from_warehouse, mv.quantity
+            """, (ot_id, f"OT-CIERRE-{ot_id[:8]}", str(user["id"])))
+            salidas = cur.fetchall()
+
+            # 3. Descontar ubicaciones físicas, igual que las demás salidas
+            faltantes = consume_stock_locations_bulk_tx(cur, salidas)
+            if faltantes:
                 cur.execute(
-                    "UPDATE ot_materiales SET stock_movement_id = %s WHERE id = %s",
-                    (str(movement_id), mat_ot_id)
+                    "SELECT name FROM materials WHERE id = ANY(%s::uuid[]) ORDER BY name",
+                    ([str(f[0]) for f in faltantes],)
                 )
+                nombres = ", ".join(r[0] for r in cur.fetchall())
+                raise HTTPException(400, f"Stock insuficiente en ubicaciones físicas: {nombres}")
 
-            # 3. Calcular horas totales
-            cur.execute(
-                "SELECT COALESCE(SUM(horas), 0) FROM ot_tiempos WHERE ot_id = %s::uuid",
-                (ot_id,)
-            )
-            horas_totales = float(cur.fetchone()[0])
-
-            # 4. Cerrar OT
+            # 4. Cerrar OT con las horas totales
             cur.execute("""
                 UPDATE ordenes_trabajo
                 SET status = 'CERRADA',
                     fecha_fin_real = NOW(),
-                    horas_reales = %s,
+                    horas_reales = (
+                        SELECT COALESCE(SUM(horas), 0) FROM ot_tiempos WHERE ot_id = %s::uuid
+                    ),
                     updated_at = NOW()
                 WHERE id = %s::uuid
-            """, (horas_totales, ot_id))
+            """, (ot_id, ot_id))
+
+            ot = _fetch_ot(cur, ot_id)
             conn.commit()
 
-    return get_ot_service(ot_id)
+    return ot
 
 
 # ══════════════════════════════════════════════════════════════════════════════
@@ -727,14 +739,8 @@ def get_comparativa_service(ot_id: str) -> dict:
 # ══════════════════════════════════════════════════════════════════════════════
 
 def export_ot_excel_service(status: str = None, tipo: str = None):
-    from app.core.export_utils import (
-        write_title_row, write_header_row, write_data_row,
-        set_column_widths, fmt_date, fmt_num, excel_response,
-    )
-    import openpyxl
-    from openpyxl.styles import Font, PatternFill
+    from app.core.export_utils import StreamingExcel, fmt_date, fmt_num
 
-    ots = list_ot_service(status=status, tipo=tipo)
     fecha = datetime.now().strftime("%d/%m/%Y %H:%M")
 
     STATUS_COLORS = {
@@ -752,10 +758,6 @@ def export_ot_excel_service(status: str = None, tipo: str = None):
         "BAJA":    ("DCFCE7", "16A34A"),
     }
 
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = "Órdenes de Trabajo"
-
     headers = [
         "Código OT", "Título", "Tipo", "Prioridad", "Estado",
         "Asignado a", "Plan / Proyecto",
@@ -767,14 +769,23 @@ def export_ot_excel_service(status: str = None, tipo: str = None):
     ]
     widths = [12, 38, 12, 10, 14, 18, 16, 10, 11, 28, 14, 14, 14, 14, 32]
 
-    write_title_row(ws, f"CeShark ERP — Órdenes de Trabajo — {fecha}", len(headers))
-    write_header_row(ws, headers, row=2)
-    set_column_widths(ws, widths)
-    ws.row_dimensions[1].height = 26
-    ws.row_dimensions[2].height = 18
+    book = StreamingExcel()
+    sheet = book.sheet(
+        "Órdenes de Trabajo", headers, widths,
+        title=f"CeShark ERP — Órdenes de Trabajo — {fecha}",
+    )
 
-    for i, ot in enumerate(ots, start=1):
-        write_data_row(ws, i + 2, [
+    query, vals = _ot_list_query(status=status, tipo=tipo)
+    for i, row in enumerate(stream_query(query, vals, name="export_ot"), start=1):
+        ot = _row_to_ot(row)
+        # Colores de Prioridad (col 4) y Estado (col 5)
+        badges = {}
+        if ot.get("prioridad", "") in PRIO_COLORS:
+            badges[4] = PRIO_COLORS[ot["prioridad"]]
+        if ot.get("status", "") in STATUS_COLORS:
+            badges[5] = STATUS_COLORS[ot["status"]]
+
+        sheet.data_row([
             ot.get("code", ""),
             ot.get("titulo", ""),
             ot.get("tipo", ""),
@@ -790,26 +801,9 @@ def export_ot_excel_service(status: str = None, tipo: str = None):
             fmt_date(ot.get("fecha_inicio_real")),
             fmt_date(ot.get("fecha_fin_real")),
             ot.get("observaciones") or "",
-        ], alternate=(i % 2 == 0))
-
-        data_row = i + 2
-        # Color de Estado (col 5)
-        status_val = ot.get("status", "")
-        if status_val in STATUS_COLORS:
-            bg, fg = STATUS_COLORS[status_val]
-            c = ws.cell(row=data_row, column=5)
-            c.fill = PatternFill("solid", fgColor=bg)
-            c.font = Font(size=9, bold=True, color=fg)
-
-        # Color de Prioridad (col 4)
-        prio_val = ot.get("prioridad", "")
-        if prio_val in PRIO_COLORS:
-            bg, fg = PRIO_COLORS[prio_val]
-            c = ws.cell(row=data_row, column=4)
-            c.fill = PatternFill("solid", fgColor=bg)
-            c.font = Font(size=9, bold=True, color=fg)
-
-    return excel_response(wb, f"ordenes_trabajo_{datetime.now().strftime('%Y%m%d')}.xlsx")
+        ], alternate=(i % 2 == 0), badges=badges)
+
+    return book.response(f"ordenes_trabajo_{datetime.now().strftime('%Y%m%d')}.xlsx")
 
 
 # ══════════════════════════════════════════════════════════════════════════════
@@ -2,6 +2,7 @@ from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Query
 from typing import Optional
 from datetime import date
 
+from app.core.jobs.runner import submit_job
 from app.core.security.dependencies import get_current_user
 from app.core.security.permissions import require_permission
 from .schemas import PlanificacionCreate, PlanificacionUpdate, SubtareaCreate, SubtareaAssign, ProductividadCreate, BulkSavePayload, ProductividadStart
@@ -28,9 +29,15 @@ def count_my_pending_tasks(user=Depends(get_current_user)):
 @router.post("/import-excel")
 def import_excel(
     file: UploadFile = File(...),
-    _=Depends(_PLAN_ADMIN),
+    background: bool = Query(False),
+    user=Depends(_PLAN_ADMIN),
 ):
     content = file.file.read()
+    if background:
+        return submit_job(
+            "planificacion.import_excel", service.import_planificacion_excel_service, content,
+            user=user, params={"filename": file.filename},
+        )
     return service.import_planificacion_excel_service(content)
 
 
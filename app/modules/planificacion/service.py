@@ -2,7 +2,7 @@ import json
 from datetime import date, datetime
 from typing import Optional
 from psycopg2 import sql
-from app.core.database import db_connection
+from app.core.database import db_connection, stream_query
 
 
 # ─── helpers ────────────────────────────────────────────────────────────────
@@ -280,19 +280,32 @@ def export_planificacion_excel_service(
     cliente: str = None,
     responsable: str = None,
 ):
-    from app.core.export_utils import (
-        write_title_row, write_header_row, write_data_row,
-        set_column_widths, excel_response, fmt_date,
-    )
-    import openpyxl
+    from app.core.export_utils import StreamingExcel, fmt_date
 
-    acts = list_actividades_service()
-    filtered = []
-    for a in acts:
-        if prioridad and a.get("prioridad") != prioridad:
-            continue
-        if estado and a.get("estado") != estado:
-            continue
+    headers = [
+        "Prioridad", "Tarea", "Cliente", "Contacto", "F. Solicitud",
+        "Responsable", "Etapa", "Estado", "F. Límite", "Seguimiento", "Notas", "Progreso %",
+    ]
+    widths = [12, 38, 20, 22, 12, 22, 18, 14, 12, 22, 24, 10]
+    titulo = f"CeShark ERP — Planificación Semanal — {datetime.now().strftime('%d/%m/%Y %H:%M')}"
+    book = StreamingExcel()
+    sheet = book.sheet("Planificación", headers, widths, title=titulo)
+
+    # Los filtros por igualdad van en SQL; el resto replica el del tablero fila a fila
+    conditions, params = [], []
+    if prioridad:
+        conditions.append("ps.prioridad = %s"); params.append(prioridad)
+    if estado:
+        conditions.append("ps.estado = %s"); params.append(estado)
+    where = ("WHERE " + " AND ".join(conditions)) if conditions else ""
+    rows = stream_query(
+        f"{_ACTIVIDAD_SELECT} {where} ORDER BY ps.fecha_limite ASC NULLS LAST, ps.created_at DESC",
+        params,
+        name="export_planificacion",
+    )
+    i = 0
+    for row in rows:
+        a = _row_to_actividad(row)
         if cliente and cliente.lower() not in (a.get("cliente") or "").lower():
             continue
         if responsable:
@@ -310,23 +323,9 @@ def export_planificacion_excel_service(
             continue
         if fecha_fin and (not ftarget or ftarget > fecha_fin):
             continue
-        filtered.append(a)
 
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = "Planificación"
-    headers = [
-        "Prioridad", "Tarea", "Cliente", "Contacto", "F. Solicitud",
-        "Responsable", "Etapa", "Estado", "F. Límite", "Seguimiento", "Notas", "Progreso %",
-    ]
-    widths = [12, 38, 20, 22, 12, 22, 18, 14, 12, 22, 24, 10]
-    titulo = f"CeShark ERP — Planificación Semanal — {datetime.now().strftime('%d/%m/%Y %H:%M')}"
-    write_title_row(ws, titulo, len(headers))
-    write_header_row(ws, headers, row=2)
-    set_column_widths(ws, widths)
-
-    for i, a in enumerate(filtered, start=1):
-        write_data_row(ws, i + 2, [
+        i += 1
+        sheet.data_row([
             a.get("prioridad") or "",
             a.get("tarea") or "",
             a.get("cliente") or "",
@@ -341,7 +340,7 @@ def export_planificacion_excel_service(
             f"{a.get('progreso_pct', 0):.0f}%",
         ], alternate=(i % 2 == 0))
 
-    return excel_response(wb, f"planificacion_{datetime.now().strftime('%Y%m%d')}.xlsx")
+    return book.response(f"planificacion_{datetime.now().strftime('%Y%m%d')}.xlsx")
 
 
 def bulk_save_actividades_service(payload, user):
@@ -572,51 +571,44 @@ def delete_productividad_service(log_id: str, user_id: str):
     return {"ok": True}
 
 
+def _productividad_admin_query(user_id_filter: Optional[str] = None, fecha: Optional[date] = None, mes: Optional[str] = None):
+    conditions = []
+    params = []
+    if user_id_filter:
+        conditions.append("rp.user_id = %s")
+        params.append(user_id_filter)
+    if fecha:
+        conditions.append("rp.fecha = %s")
+        params.append(fecha)
+    elif mes:
+        conditions.append("TO_CHAR(rp.fecha, 'YYYY-MM') = %s")
+        params.append(mes)
+    where = ("WHERE " + " AND ".join(conditions)) if conditions else ""
+    return f"""SELECT rp.id, rp.user_id, u.username, rp.fecha,
+                      rp.actividad, rp.hora_inicio, rp.hora_fin,
+                      rp.duracion_minutos, rp.estado, rp.actividad_semanal_id,
+                      ps.tarea, rp.created_at
+               FROM registro_productividad rp
+               JOIN users u ON u.id = rp.user_id
+               LEFT JOIN planificacion_semanal ps ON ps.id = rp.actividad_semanal_id
+               {where}
+               ORDER BY rp.fecha DESC, u.username, rp.hora_inicio ASC""", params
+
+
 def list_productividad_admin_service(user_id_filter: Optional[str] = None, fecha: Optional[date] = None, mes: Optional[str] = None):
     """Logs agrupados para el panel de administración."""
+    query, params = _productividad_admin_query(user_id_filter, fecha, mes)
     with db_connection() as conn:
         with conn.cursor() as cur:
-            conditions = []
-            params = []
-            if user_id_filter:
-                conditions.append("rp.user_id = %s")
-                params.append(user_id_filter)
-            if fecha:
-                conditions.append("rp.fecha = %s")
-                params.append(fecha)
-            elif mes:
-                conditions.append("TO_CHAR(rp.fecha, 'YYYY-MM') = %s")
-                params.append(mes)
-            where = ("WHERE " + " AND ".join(conditions)) if conditions else ""
-            cur.execute(
-                f"""SELECT rp.id, rp.user_id, u.username, rp.fecha,
-                           rp.actividad, rp.hora_inicio, rp.hora_fin,
-                           rp.duracion_minutos, rp.estado, rp.actividad_semanal_id,
-                           ps.tarea, rp.created_at
-                    FROM registro_productividad rp
-                    JOIN users u ON u.id = rp.user_id
-                    LEFT JOIN planificacion_semanal ps ON ps.id = rp.actividad_semanal_id
-                    {where}
-                    ORDER BY rp.fecha DESC, u.username, rp.hora_inicio ASC""",
-                params
-            )
+            cur.execute(query, params)
             return [_row_to_prod(r) for r in cur.fetchall()]
 
 
 def export_productividad_excel_service(user_id_filter: Optional[str] = None, fecha: Optional[date] = None, mes: Optional[str] = None):
-    from app.core.export_utils import (
-        write_title_row, write_header_row, write_data_row, write_total_row,
-        set_column_widths, fmt_num, excel_response,
-    )
-    from app.core.database import db_connection
-    import openpyxl
+    from app.core.export_utils import StreamingExcel, fmt_num
     import re
-    from datetime import datetime
-
-    # 1. Obtener los logs de productividad
-    logs = list_productividad_admin_service(user_id_filter, fecha, mes)
 
-    # 2. Obtener info del usuario si hay filtro para personalizar el título
+    # 1. Obtener info del usuario si hay filtro para personalizar el título
     username_filter = None
     if user_id_filter:
         with db_connection() as conn:
@@ -626,7 +618,7 @@ def export_productividad_excel_service(user_id_filter: Optional[str] = None, fec
                 if row:
                     username_filter = row[0]
 
-    # 3. Formatear título del reporte
+    # 2. Formatear título del reporte
     report_title = "CeShark ERP — Reporte de Productividad"
     if username_filter:
         formatted_uname = username_filter.replace("_", " ").title()
@@ -649,23 +641,19 @@ def export_productividad_excel_service(user_id_filter: Optional[str] = None, fec
     else:
         report_title += f" — Generado: {datetime.now().strftime('%d/%m/%Y %H:%M')}"
 
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = "Logs de Actividades"
-
     headers = [
         "Usuario", "Fecha", "Actividad", "Hora Inicio", "Hora Fin", "Duración (minutos)", "Duración (horas)", "Tarea Vinculada"
     ]
     widths = [20, 14, 45, 13, 13, 20, 18, 30]
 
-    write_title_row(ws, report_title, len(headers))
-    write_header_row(ws, headers, row=2)
-    set_column_widths(ws, widths)
-    ws.row_dimensions[1].height = 26
-    ws.row_dimensions[2].height = 18
+    book = StreamingExcel()
+    sheet = book.sheet("Logs de Actividades", headers, widths, title=report_title)
 
+    # 3. Volcar los logs de productividad a medida que llegan del cursor
+    query, params = _productividad_admin_query(user_id_filter, fecha, mes)
     total_minutos = 0
-    for i, log in enumerate(logs, start=1):
+    for i, row in enumerate(stream_query(query, params, name="export_productividad"), start=1):
+        log = _row_to_prod(row)
         username = log.get("username", "")
         formatted_username = username.replace("_", " ").title()
         if username.lower() == "admin":
@@ -682,7 +670,7 @@ def export_productividad_excel_service(user_id_filter: Optional[str] = None, fec
         if actividad:
             actividad = re.sub(r"^\[[^\]]+\]\s*[-:]?\s*", "", actividad)
         
-        write_data_row(ws, i + 2, [
+        sheet.data_row([
             formatted_username,
             log.get("fecha") or "",
             actividad,
@@ -694,13 +682,11 @@ def export_productividad_excel_service(user_id_filter: Optional[str] = None, fec
         ], alternate=(i % 2 == 0))
 
     # Fila de totales
-    total_row_idx = len(logs) + 3
     total_val = ["TOTAL ACUMULADO", "", "", "", "", fmt_num(total_minutos, 0), fmt_num(total_minutos/60.0, 2), ""]
-    write_total_row(ws, total_row_idx, total_val, len(headers))
-    ws.row_dimensions[total_row_idx].height = 20
+    sheet.total_row(total_val, height=20)
 
     filename_suffix = username_filter if username_filter else "equipo"
-    return excel_response(wb, f"productividad_{filename_suffix}_{datetime.now().strftime('%Y%m%d')}.xlsx")
+    return book.response(f"productividad_{filename_suffix}_{datetime.now().strftime('%Y%m%d')}.xlsx")
 
 
 def start_productividad_service(data, user):
@@ -1,5 +1,6 @@
 from fastapi import APIRouter, Depends, Query
 from typing import Optional
+from datetime import date
 from app.core.security.dependencies import get_current_user
 
 from app.modules.reporting.service import (
@@ -9,7 +10,7 @@ from app.modules.reporting.service import (
     get_material_requests_lead_time_kpi_service,
     get_material_requests_by_approver_kpi_service,
     get_material_requests_monthly_kpi_service,
-    get_dashboard_kpis_service,
+    get_dashboard_kpis_async_service,
     export_dashboard_kpis_excel_service,
 )
 
@@ -55,8 +56,8 @@ def material_requests_monthly_kpi():
 
 @router.get("/kpis/dashboard-export")
 def export_dashboard_kpis(
-    desde: Optional[str] = Query(None),
-    hasta: Optional[str] = Query(None),
+    desde: Optional[date] = Query(None),
+    hasta: Optional[date] = Query(None),
     logistics: bool = Query(True),
     operations: bool = Query(True),
     compras: bool = Query(True),
@@ -74,8 +75,8 @@ def export_dashboard_kpis(
 
 
 @router.get("/kpis/dashboard-kpis")
-def get_dashboard_kpis(
-    desde: Optional[str] = Query(None),
-    hasta: Optional[str] = Query(None),
+async def get_dashboard_kpis(
+    desde: Optional[date] = Query(None),
+    hasta: Optional[date] = Query(None),
 ):
-    return get_dashboard_kpis_service(desde=desde, hasta=hasta)
+    return await get_dashboard_kpis_async_service(desde=desde, hasta=hasta)
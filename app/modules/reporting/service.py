@@ -1,3 +1,6 @@
+from datetime import date
+
+from app.core.async_database import async_db_connection, pg_sql
 from app.core.database import db_connection
 
 
@@ -6,99 +9,111 @@ def _f(x):
     return float(x) if x is not None else 0.0
 
 
-def get_material_requests_sla_kpi_service():
-    with db_connection() as conn:
-        with conn.cursor() as cur:
-            cur.execute("""
-                SELECT
-                    total_decided_requests,
-                    within_sla,
-                    overdue,
-                    sla_compliance_rate,
-                    avg_decision_time_hours
-                FROM vw_kpi_material_requests_sla
-            """)
+_SLA_KPI_SQL = """
+    SELECT
+        total_decided_requests,
+        within_sla,
+        overdue,
+        sla_compliance_rate,
+        avg_decision_time_hours
+    FROM vw_kpi_material_requests_sla
+"""
 
-            row = cur.fetchone()
 
-            if not row:
-                return {
-                    "total_decided_requests": 0,
-                    "within_sla": 0,
-                    "overdue": 0,
-                    "sla_compliance_rate": 0.0,
-                    "avg_decision_time_hours": 0.0,
-                }
+def _sla_kpi_from_row(row):
+    if not row:
+        return {
+            "total_decided_requests": 0,
+            "within_sla": 0,
+            "overdue": 0,
+            "sla_compliance_rate": 0.0,
+            "avg_decision_time_hours": 0.0,
+        }
 
-            return {
-                "total_decided_requests": row[0],
-                "within_sla": row[1],
-                "overdue": row[2],
-                "sla_compliance_rate": _f(row[3]),
-                "avg_decision_time_hours": _f(row[4]),
-            }
+    return {
+        "total_decided_requests": row[0],
+        "within_sla": row[1],
+        "overdue": row[2],
+        "sla_compliance_rate": _f(row[3]),
+        "avg_decision_time_hours": _f(row[4]),
+    }
 
 
-def get_material_requests_summary_kpi_service():
+def get_material_requests_sla_kpi_service():
     with db_connection() as conn:
         with conn.cursor() as cur:
-            cur.execute("""
-                SELECT
-                    total_requests,
-                    pending_requests,
-                    approved_requests,
-                    rejected_requests,
-                    overdue_requests
-                FROM vw_kpi_material_requests_summary
-            """)
+            cur.execute(_SLA_KPI_SQL)
+            return _sla_kpi_from_row(cur.fetchone())
+
+
+_SUMMARY_KPI_SQL = """
+    SELECT
+        total_requests,
+        pending_requests,
+        approved_requests,
+        rejected_requests,
+        overdue_requests
+    FROM vw_kpi_material_requests_summary
+"""
+
+
+def _summary_kpi_from_row(row):
+    if not row:
+        return {
+            "total_requests": 0,
+            "pending_requests": 0,
+            "approved_requests": 0,
+            "rejected_requests": 0,
+            "overdue_requests": 0,
+        }
 
-            row = cur.fetchone()
+    return {
+        "total_requests": row[0],
+        "pending_requests": row[1],
+        "approved_requests": row[2],
+        "rejected_requests": row[3],
+        "overdue_requests": row[4],
+    }
 
-            if not row:
-                return {
-                    "total_requests": 0,
-                    "pending_requests": 0,
-                    "approved_requests": 0,
-                    "rejected_requests": 0,
-                    "overdue_requests": 0,
-                }
 
-            return {
-                "total_requests": row[0],
-                "pending_requests": row[1],
-                "approved_requests": row[2],
-                "rejected_requests": row[3],
-                "overdue_requests": row[4],
-            }
-
-def get_material_requests_lead_time_kpi_service():
+def get_material_requests_summary_kpi_service():
     with db_connection() as conn:
         with conn.cursor() as cur:
-            cur.execute("""
-                SELECT
-                    avg_lead_time_hours,
-                    min_lead_time_hours,
-                    max_lead_time_hours,
-                    p95_lead_time_hours
-                FROM vw_kpi_material_requests_lead_time
-            """)
+            cur.execute(_SUMMARY_KPI_SQL)
+            return _summary_kpi_from_row(cur.fetchone())
+
+_LEAD_TIME_KPI_SQL = """
+    SELECT
+        avg_lead_time_hours,
+        min_lead_time_hours,
+        max_lead_time_hours,
+        p95_lead_time_hours
+    FROM vw_kpi_material_requests_lead_time
+"""
+
+
+def _lead_time_kpi_from_row(row):
+    if not row:
+        return {
+            "avg_lead_time_hours": 0.0,
+            "min_lead_time_hours": 0.0,
+            "max_lead_time_hours": 0.0,
+            "p95_lead_time_hours": 0.0,
+        }
 
-            row = cur.fetchone()
+    return {
+        "avg_lead_time_hours": _f(row[0]),
+        "min_lead_time_hours": _f(row[1]),
+        "max_lead_time_hours": _f(row[2]),
+        "p95_lead_time_hours": _f(row[3]),
+    }
 
-            if not row:
-                return {
-                    "avg_lead_time_hours": 0.0,
-                    "min_lead_time_hours": 0.0,
-                    "max_lead_time_hours": 0.0,
-                    "p95_lead_time_hours": 0.0,
-                }
 
-            return {
-                "avg_lead_time_hours": _f(row[0]),
-                "min_lead_time_hours": _f(row[1]),
-                "max_lead_time_hours": _f(row[2]),
-                "p95_lead_time_hours": _f(row[3]),
-            }
+def get_material_requests_lead_time_kpi_service():
+    with db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(_LEAD_TIME_KPI_SQL)
+            return _lead_time_kpi_from_row(cur.fetchone())
 
 def get_material_requests_by_approver_kpi_service():
     with db_connection() as conn:
@@ -189,12 +204,11 @@ def get_requests_kpi_summary_service():
             }
 
 
-def get_dashboard_kpis_service(desde: str = None, hasta: str = None):
-    # 1. Logistics KPIs (reuse existing service functions)
-    logistics_summary = get_material_requests_summary_kpi_service()
-    logistics_sla = get_material_requests_sla_kpi_service()
-    logistics_lead = get_material_requests_lead_time_kpi_service()
-
+def _dashboard_queries(desde: date = None, hasta: date = None) -> dict:
+    """
+    Consultas del dashboard como {nombre: (sql, params)}. Las ejecuta tanto la
+    versión síncrona (psycopg2) como la async (asyncpg, vía pg_sql).
+    """
     date_filter_oc = ""
     date_params = []
     if desde:
@@ -204,179 +218,192 @@ def get_dashboard_kpis_service(desde: str = None, hasta: str = None):
         date_filter_oc += " AND created_at <= %s::date + INTERVAL '1 day'"
         date_params.append(hasta)
 
-    with db_connection() as conn:
-        with conn.cursor() as cur:
-            # 2. Operations KPIs
-            cur.execute("""
-                SELECT status, COUNT(*)
-                FROM ordenes_trabajo
-                GROUP BY status
-            """)
-            ot_status_counts = {r[0]: r[1] for r in cur.fetchall()}
-
-            cur.execute("""
-                SELECT id, code, titulo, status, fecha_fin_plan, asignado_a
-                FROM ordenes_trabajo
-                WHERE status NOT IN ('COMPLETADA', 'CERRADA', 'CANCELADA')
-                  AND fecha_fin_plan < NOW()
-                ORDER BY fecha_fin_plan ASC
-            """)
-            delayed_ots = [
-                {
-                    "id": str(r[0]),
-                    "code": r[1],
-                    "titulo": r[2],
-                    "status": r[3],
-                    "fecha_fin_plan": r[4].isoformat() if r[4] else None,
-                    "asignado_a": str(r[5]) if r[5] else None,
-                }
-                for r in cur.fetchall()
-            ]
-
-            # Cotizaciones por estado
-            cur.execute("""
-                SELECT status, COUNT(*)
-                FROM presupuesto_config
-                WHERE numero_cotizacion IS NOT NULL
-                GROUP BY status
-            """)
-            cotizaciones_status = {r[0]: r[1] for r in cur.fetchall()}
-
-            # Compras — OCs por estado y gasto
-            cur.execute(f"""
-                SELECT status, COUNT(*)
-                FROM ordenes_compra
-                WHERE 1=1 {date_filter_oc}
-                GROUP BY status
-            """, date_params)
-            oc_status_counts = {r[0]: r[1] for r in cur.fetchall()}
-
-            cur.execute(f"""
-                SELECT COALESCE(SUM(oci.cantidad_pedida * oci.precio_unitario), 0)
-                FROM ordenes_compra_items oci
-                JOIN ordenes_compra oc ON oc.id = oci.oc_id
-                WHERE oc.status IN ('RECIBIDA', 'CERRADA') {date_filter_oc.replace('created_at', 'oc.created_at')}
-            """, date_params)
-            gasto_compras = float(cur.fetchone()[0] or 0)
-
-            # Logística extra — materiales bajo stock y despachos pendientes
-            cur.execute("""
-                SELECT COUNT(*) FROM (
-                    SELECT m.id
-                    FROM materials m
-                    LEFT JOIN stock_locations sl ON sl.material_id = m.id
-                    GROUP BY m.id, m.min_stock
-                    HAVING COALESCE(SUM(sl.quantity), 0) <= COALESCE(m.min_stock, 0)
-                ) sub
-            """)
-            materiales_bajo_stock = cur.fetchone()[0]
-
-            cur.execute("""
-                SELECT COUNT(*) FROM stock_dispatches
-                WHERE status IN ('PENDING', 'READY')
-            """)
-            despachos_pendientes = cur.fetchone()[0]
-
-            # 3. Administration KPIs
-            cur.execute("""
-                SELECT COUNT(*) FROM servicio_requerimientos
-                WHERE estado NOT IN ('Finalizado', 'Cancelado')
-            """)
-            active_requirements_count = cur.fetchone()[0]
-
-            cur.execute("""
-                SELECT categoria, SUM(total)
-                FROM servicio_requerimiento_costos
-                GROUP BY categoria
-                ORDER BY SUM(total) DESC
-            """)
-            costos_por_categoria = [
-                {"categoria": r[0], "total": float(r[1]) if r[1] is not None else 0.0}
-                for r in cur.fetchall()
-            ]
+    # Productividad por persona (mes actual o rango)
+    prod_filter = ""
+    prod_params = []
+    if desde:
+        prod_filter += " AND rp.fecha >= %s::date"
+        prod_params.append(desde)
+    if hasta:
+        prod_filter += " AND rp.fecha <= %s::date"
+        prod_params.append(hasta)
+    if not desde and not hasta:
+        prod_filter += " AND rp.fecha >= date_trunc('month', CURRENT_DATE)"
 
-            # Planificación — conteos por estado
-            cur.execute("""
-                SELECT estado, COUNT(*)
-                FROM planificacion_semanal
-                GROUP BY estado
-            """)
-            planificacion_counts = {r[0]: r[1] for r in cur.fetchall()}
-
-            # Productividad por persona (mes actual o rango)
-            prod_filter = ""
-            prod_params = []
-            if desde:
-                prod_filter += " AND rp.fecha >= %s::date"
-                prod_params.append(desde)
-            if hasta:
-                prod_filter += " AND rp.fecha <= %s::date"
-                prod_params.append(hasta)
-            if not desde and not hasta:
-                prod_filter += " AND rp.fecha >= date_trunc('month', CURRENT_DATE)"
-
-            cur.execute(f"""
-                SELECT u.username,
-                       COUNT(rp.id) AS registros,
-                       COALESCE(SUM(rp.duracion_minutos), 0) AS minutos_totales
-                FROM registro_productividad rp
-                JOIN users u ON u.id = rp.user_id
-                WHERE 1=1 {prod_filter}
-                GROUP BY u.id, u.username
-                ORDER BY minutos_totales DESC
-                LIMIT 15
-            """, prod_params)
-            productividad_por_persona = [
-                {
-                    "username": r[0],
-                    "registros": r[1],
-                    "horas_totales": round((r[2] or 0) / 60, 1),
-                }
-                for r in cur.fetchall()
-            ]
+    return {
+        # 1. Logistics KPIs (mismas vistas que los endpoints individuales)
+        "logistics_summary": (_SUMMARY_KPI_SQL, []),
+        "logistics_sla": (_SLA_KPI_SQL, []),
+        "logistics_lead": (_LEAD_TIME_KPI_SQL, []),
+
+        # 2. Operations KPIs
+        "ot_status_counts": ("""
+            SELECT status, COUNT(*)
+            FROM ordenes_trabajo
+            GROUP BY status
+        """, []),
+        "delayed_ots": ("""
+            SELECT id, code, titulo, status, fecha_fin_plan, asignado_a
+            FROM ordenes_trabajo
+            WHERE status NOT IN ('COMPLETADA', 'CERRADA', 'CANCELADA')
+              AND fecha_fin_plan < NOW()
+            ORDER BY fecha_fin_plan ASC
+        """, []),
+        # Cotizaciones por estado
+        "cotizaciones_status": ("""
+            SELECT status, COUNT(*)
+            FROM presupuesto_config
+            WHERE numero_cotizacion IS NOT NULL
+            GROUP BY status
+        """, []),
+
+        # Compras — OCs por estado y gasto
+        "oc_status_counts": (f"""
+            SELECT status, COUNT(*)
+            FROM ordenes_compra
+            WHERE 1=1 {date_filter_oc}
+            GROUP BY status
+        """, date_params),
+        "gasto_compras": (f"""
+            SELECT COALESCE(SUM(oci.cantidad_pedida * oci.precio_unitario), 0)
+            FROM ordenes_compra_items oci
+            JOIN ordenes_compra oc ON oc.id = oci.oc_id
+            WHERE oc.status IN ('RECIBIDA', 'CERRADA') {date_filter_oc.replace('created_at', 'oc.created_at')}
+        """, date_params),
+
+        # Logística extra — materiales bajo stock y despachos pendientes
+        "materiales_bajo_stock": ("""
+            SELECT COUNT(*) FROM (
+                SELECT m.id
+                FROM materials m
+                LEFT JOIN stock_locations sl ON sl.material_id = m.id
+                GROUP BY m.id, m.min_stock
+                HAVING COALESCE(SUM(sl.quantity), 0) <= COALESCE(m.min_stock, 0)
+            ) sub
+        """, []),
+        "despachos_pendientes": ("""
+            SELECT COUNT(*) FROM stock_dispatches
+            WHERE status IN ('PENDING', 'READY')
+        """, []),
+
+        # 3. Administration KPIs
+        "active_requirements_count": ("""
+            SELECT COUNT(*) FROM servicio_requerimientos
+            WHERE estado NOT IN ('Finalizado', 'Cancelado')
+        """, []),
+        "costos_por_categoria": ("""
+            SELECT categoria, SUM(total)
+            FROM servicio_requerimiento_costos
+            GROUP BY categoria
+            ORDER BY SUM(total) DESC
+        """, []),
+        # Planificación — conteos por estado
+        "planificacion_counts": ("""
+            SELECT estado, COUNT(*)
+            FROM planificacion_semanal
+            GROUP BY estado
+        """, []),
+        "productividad_por_persona": (f"""
+            SELECT u.username,
+                   COUNT(rp.id) AS registros,
+                   COALESCE(SUM(rp.duracion_minutos), 0) AS minutos_totales
+            FROM registro_productividad rp
+            JOIN users u ON u.id = rp.user_id
+            WHERE 1=1 {prod_filter}
+            GROUP BY u.id, u.username
+            ORDER BY minutos_totales DESC
+            LIMIT 15
+        """, prod_params),
+
+        # 4. Overloaded users
+        "overloaded_users": ("""
+            SELECT u.id, u.username,
+                   (SELECT COUNT(*) FROM planificacion_semanal
+                    WHERE (responsable_id = u.id OR responsables_ids LIKE '%%' || u.id::text || '%%')
+                      AND estado NOT IN ('Completado', 'Cancelado')) AS active_plan,
+                   (SELECT COUNT(*) FROM ordenes_trabajo
+                    WHERE asignado_a = u.id AND status IN ('PENDIENTE', 'EN_EJECUCION', 'PAUSADA')) AS active_ots
+            FROM users u
+            WHERE u.is_active = TRUE
+        """, []),
+        "delayed_planning": ("""
+            SELECT id, tarea, cliente, prioridad, estado, fecha_limite, responsable_id
+            FROM planificacion_semanal
+            WHERE estado NOT IN ('Completado', 'Cancelado')
+              AND (estado = 'Retraso' OR (fecha_limite IS NOT NULL AND fecha_limite < CURRENT_DATE))
+            ORDER BY fecha_limite ASC NULLS LAST
+        """, []),
+    }
 
-            # 4. Overloaded users
-            cur.execute("""
-                SELECT u.id, u.username,
-                       (SELECT COUNT(*) FROM planificacion_semanal
-                        WHERE (responsable_id = u.id OR responsables_ids LIKE '%%' || u.id::text || '%%')
-                          AND estado NOT IN ('Completado', 'Cancelado')) AS active_plan,
-                       (SELECT COUNT(*) FROM ordenes_trabajo
-                        WHERE asignado_a = u.id AND status IN ('PENDIENTE', 'EN_EJECUCION', 'PAUSADA')) AS active_ots
-                FROM users u
-                WHERE u.is_active = TRUE
-            """)
-            overloaded_users = []
-            for uid, username, active_plan, active_ots in cur.fetchall():
-                total_active = (active_plan or 0) + (active_ots or 0)
-                if total_active >= 5:
-                    overloaded_users.append({
-                        "id": str(uid),
-                        "username": username,
-                        "active_plan": active_plan,
-                        "active_ots": active_ots,
-                        "total_active": total_active,
-                    })
 
-            cur.execute("""
-                SELECT id, tarea, cliente, prioridad, estado, fecha_limite, responsable_id
-                FROM planificacion_semanal
-                WHERE estado NOT IN ('Completado', 'Cancelado')
-                  AND (estado = 'Retraso' OR (fecha_limite IS NOT NULL AND fecha_limite < CURRENT_DATE))
-                ORDER BY fecha_limite ASC NULLS LAST
-            """)
-            delayed_planning = [
-                {
-                    "id": str(r[0]),
-                    "tarea": r[1],
-                    "cliente": r[2],
-                    "prioridad": r[3],
-                    "estado": r[4],
-                    "fecha_limite": r[5].isoformat() if r[5] else None,
-                    "responsable_id": str(r[6]) if r[6] else None,
-                }
-                for r in cur.fetchall()
-            ]
+def _build_dashboard(rows: dict) -> dict:
+    """Arma la respuesta del dashboard a partir de {nombre: filas} (tuplas o Records)."""
+    def first(name):
+        return rows[name][0] if rows[name] else None
+
+    logistics_summary = _summary_kpi_from_row(first("logistics_summary"))
+    logistics_sla = _sla_kpi_from_row(first("logistics_sla"))
+    logistics_lead = _lead_time_kpi_from_row(first("logistics_lead"))
+
+    ot_status_counts = {r[0]: r[1] for r in rows["ot_status_counts"]}
+    delayed_ots = [
+        {
+            "id": str(r[0]),
+            "code": r[1],
+            "titulo": r[2],
+            "status": r[3],
+            "fecha_fin_plan": r[4].isoformat() if r[4] else None,
+            "asignado_a": str(r[5]) if r[5] else None,
+        }
+        for r in rows["delayed_ots"]
+    ]
+    cotizaciones_status = {r[0]: r[1] for r in rows["cotizaciones_status"]}
+
+    oc_status_counts = {r[0]: r[1] for r in rows["oc_status_counts"]}
+    gasto_compras = float(first("gasto_compras")[0] or 0)
+
+    materiales_bajo_stock = first("materiales_bajo_stock")[0]
+    despachos_pendientes = first("despachos_pendientes")[0]
+
+    active_requirements_count = first("active_requirements_count")[0]
+    costos_por_categoria = [
+        {"categoria": r[0], "total": float(r[1]) if r[1] is not None else 0.0}
+        for r in rows["costos_por_categoria"]
+    ]
+    planificacion_counts = {r[0]: r[1] for r in rows["planificacion_counts"]}
+    productividad_por_persona = [
+        {
+            "username": r[0],
+            "registros": r[1],
+            "horas_totales": round((r[2] or 0) / 60, 1),
+        }
+        for r in rows["productividad_por_persona"]
+    ]
+
+    overloaded_users = []
+    for uid, username, active_plan, active_ots in rows["overloaded_users"]:
+        total_active = (active_plan or 0) + (active_ots or 0)
+        if total_active >= 5:
+            overloaded_users.append({
+                "id": str(uid),
+                "username": username,
+                "active_plan": active_plan,
+                "active_ots": active_ots,
+                "total_active": total_active,
+            })
+
+    delayed_planning = [
+        {
+            "id": str(r[0]),
+            "tarea": r[1],
+            "cliente": r[2],
+            "prioridad": r[3],
+            "estado": r[4],
+            "fecha_limite": r[5].isoformat() if r[5] else None,
+            "responsable_id": str(r[6]) if r[6] else None,
+        }
+        for r in rows["delayed_planning"]
+    ]
 
     return {
         "logistics": {
@@ -415,9 +442,30 @@ def get_dashboard_kpis_service(desde: str = None, hasta: str = None):
     }
 
 
+
+def get_dashboard_kpis_service(desde: date = None, hasta: date = None):
+    queries = _dashboard_queries(desde, hasta)
+    rows = {}
+    with db_connection() as conn:
+        with conn.cursor() as cur:
+            for name, (query, params) in queries.items():
+                cur.execute(query, params or None)
+                rows[name] = cur.fetchall()
+    return _build_dashboard(rows)
+
+
+async def get_dashboard_kpis_async_service(desde: date = None, hasta: date = None):
+    queries = _dashboard_queries(desde, hasta)
+    rows = {}
+    async with async_db_connection() as conn:
+        for name, (query, params) in queries.items():
+            rows[name] = await conn.fetch(pg_sql(query), *params)
+    return _build_dashboard(rows)
+
+
 def export_dashboard_kpis_excel_service(
-    desde: str = None,
-    hasta: str = None,
+    desde: date = None,
+    hasta: date = None,
     include_logistics: bool = True,
     include_operations: bool = True,
     include_compras: bool = True,
@@ -1,4 +1,5 @@
 from app.core.database import db_connection
+from typing import Optional
 from uuid import uuid4
 from datetime import datetime, timedelta
 from fastapi import HTTPException
@@ -761,22 +762,47 @@ def list_my_dispatches_service(user):
     ]
 
 
-def expire_reservations_service():
+def expire_reservations_service(batch_size: int = 500, max_batches: Optional[int] = None):
+    """
+    Expira reservas BLOCKED vencidas en lotes acotados. Cada lote es su propia
+    transacción y toma las filas con SKIP LOCKED: no espera a una reserva que
+    otra transacción está confirmando/liberando, y dos ejecuciones simultáneas
+    (endpoint + scheduler, o varios workers) no se pisan.
+    """
+    expired_ids = []
+    batches = 0
     with db_connection() as conn:
-        with conn.cursor() as cur:
-            cur.execute("""
-                UPDATE stock_reservations
-                SET status = 'EXPIRED'
-                WHERE status = 'BLOCKED'
-                  AND expires_at <= NOW()
-                RETURNING id
-            """)
-            expired = cur.fetchall()
+        while max_batches is None or batches < max_batches:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    WITH due AS (
+                        SELECT id
+                        FROM stock_reservations
+                        WHERE status = 'BLOCKED'
+                          AND expires_at <= NOW()
+                        ORDER BY expires_at
+                        LIMIT %s
+                        FOR UPDATE SKIP LOCKED
+                    )
+                    UPDATE stock_reservations sr
+                    SET status = 'EXPIRED'
+                    FROM due
+                    WHERE sr.id = due.id
+                    RETURNING sr.id
+                """, (batch_size,))
+                rows = cur.fetchall()
             conn.commit()
+            batches += 1
+
+            if rows:
+                expired_ids.extend(str(r[0]) for r in rows)
+            if len(rows) < batch_size:
+                break
 
     return {
-        "expired_count": len(expired),
-        "expired_ids": [str(r[0]) for r in expired]
+        "expired_count": len(expired_ids),
+        "expired_ids": expired_ids,
+        "batches": batches,
     }
 
 def confirm_reservation_service(reservation_id, _user):
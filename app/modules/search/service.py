@@ -1,4 +1,39 @@
-from app.core.database import db_connection
+import json
+
+from app.core.async_database import async_db_connection
+
+# Categorías en el orden en que se muestran; cada una aporta hasta 5 resultados.
+_CATEGORY_ORDER = ["material", "plan", "ot", "oc", "cliente", "proveedor", "usuario"]
+_PER_CATEGORY = 5
+
+# Una sola consulta sobre search_documents (migración 046): texto normalizado
+# (sin tildes, minúsculas) con índice de trigramas. Ranking: código exacto >
+# prefijo de código/título > similitud por palabra. El filtro LIKE usa la
+# función sobre el parámetro (no la columna del CTE) para poder usar el índice.
+_SEARCH_SQL = """
+    WITH q AS (SELECT search_normalize($1) AS term, search_like_pattern($1) AS pat)
+    SELECT entity_type, entity_id, data
+    FROM (
+        SELECT d.entity_type, d.entity_id, d.data,
+               row_number() OVER (
+                   PARTITION BY d.entity_type
+                   ORDER BY
+                       CASE
+                           WHEN d.code_text = q.term THEN 3
+                           WHEN d.code_text LIKE q.pat || '%' OR d.title_text LIKE q.pat || '%' THEN 2
+                           ELSE 0
+                       END + word_similarity(q.term, d.search_text) DESC,
+                       d.title_text
+               ) AS rn
+        FROM search_documents d, q
+        WHERE d.search_text LIKE '%' || search_like_pattern($1) || '%'
+          AND d.entity_type = ANY($2::text[])
+          AND (d.entity_type NOT IN ('plan', 'ot') OR $3 OR $4::uuid = ANY(d.owner_ids))
+    ) ranked
+    WHERE rn <= $5
+    ORDER BY array_position($6::text[], entity_type::text), rn
+"""
+
 
 def has_permission(user: dict, permission: str) -> bool:
     perms = user.get("permissions", [])
@@ -6,157 +41,114 @@ def has_permission(user: dict, permission: str) -> bool:
         return True
     return permission in perms
 
-def global_search_service(query: str, user: dict) -> list:
+
+def _allowed_categories(user: dict) -> list:
+    is_superadmin = user.get("role") == "superadmin"
+    allowed = []
+    # 1. MATERIALES (Requiere logistics:materials:view)
+    if has_permission(user, "logistics:materials:view") or is_superadmin:
+        allowed.append("material")
+    # 2-3. PLANES y OTs: todos los ven; el no-staff solo los suyos (owner_ids)
+    allowed += ["plan", "ot"]
+    # 4. ÓRDENES DE COMPRA: logistics:stock:view o logistics:stock:receive
+    if has_permission(user, "logistics:stock:view") or has_permission(user, "logistics:stock:receive") or is_superadmin:
+        allowed.append("oc")
+    # 5. CLIENTES: logistics:materials:view o reporting:view
+    if has_permission(user, "logistics:materials:view") or has_permission(user, "reporting:view") or is_superadmin:
+        allowed.append("cliente")
+    # 6. PROVEEDORES: logistics:stock:view
+    if has_permission(user, "logistics:stock:view") or is_superadmin:
+        allowed.append("proveedor")
+    # 7. USUARIOS: admin:users
+    if has_permission(user, "admin:users") or is_superadmin:
+        allowed.append("usuario")
+    return allowed
+
+
+def _format_result(entity_type: str, entity_id, d: dict, is_staff: bool) -> dict:
+    if entity_type == "material":
+        return {
+            "category": "Materiales",
+            "title": d["name"],
+            "subtitle": f"Código: {d['code']} | Categoría: {d['category']}",
+            "link": f"/materials?search={d['code']}",
+        }
+    if entity_type == "plan":
+        return {
+            "category": "Proyectos / Planes",
+            "title": d["title"],
+            "subtitle": f"Código: {d['project_code'] or '—'} | Creador: {d['engineer'] or '—'}",
+            "link": f"/operations/plans?id={entity_id}",
+        }
+    if entity_type == "ot":
+        return {
+            "category": "Órdenes de Trabajo (OT)",
+            "title": f"OT {d['code']}: {d['titulo']}",
+            "subtitle": f"Estado: {d['status']}",
+            "link": f"/operaciones/ot?code={d['code']}",
+        }
+    if entity_type == "oc":
+        return {
+            "category": "Órdenes de Compra (OC)",
+            "title": f"OC {d['code']}",
+            "subtitle": f"Proveedor: {d['proveedor']} | Estado: {d['status']}",
+            "link": f"/compras/oc?code={d['code']}",
+        }
+    if entity_type == "cliente":
+        return {
+            "category": "Clientes",
+            "title": d["razon_social"],
+            "subtitle": f"Código: {d['codigo']} | RUC: {d['ruc'] or '—'} | Contacto: {d['contacto'] or '—'}",
+            "link": f"/admin/clientes-dashboard?id={entity_id}" if is_staff else f"/clientes?id={entity_id}",
+        }
+    if entity_type == "proveedor":
+        return {
+            "category": "Proveedores",
+            "title": d["nombre"],
+            "subtitle": f"Código: {d['codigo']} | RUC: {d['ruc'] or '—'} | Contacto: {d['contacto'] or '—'}",
+            "link": f"/compras/proveedores?code={d['codigo']}",
+        }
+    return {
+        "category": "Usuarios",
+        "title": d["username"],
+        "subtitle": f"Email: {d['email']}",
+        "link": "/admin/users",
+    }
+
+
+async def global_search_service(query: str, user: dict) -> list:
     if not query or len(query.strip()) < 2:
         return []
 
-    q = f"%{query.strip()}%"
-    results = []
+    term = query.strip()
     user_id = str(user["id"])
-    
+
     # Comprobar si es staff (admin, logística, supervisor)
     is_staff = (
-        has_permission(user, "admin:users") or 
-        has_permission(user, "logistics:stock:view") or 
+        has_permission(user, "admin:users") or
+        has_permission(user, "logistics:stock:view") or
         has_permission(user, "logistics:projects:manage") or
         user.get("role") == "superadmin"
     )
+    # Staff ve todos los planes/OTs; si no, solo donde figura en owner_ids
+    owner_id = None if is_staff else user_id
+
+    async with async_db_connection() as conn:
+        rows = await conn.fetch(
+            _SEARCH_SQL,
+            term,
+            _allowed_categories(user),
+            is_staff,
+            owner_id,
+            _PER_CATEGORY,
+            _CATEGORY_ORDER,
+        )
+
+    return [_format_result(r["entity_type"], r["entity_id"], _json(r["data"]), is_staff) for r in rows]
+
 
-    with db_connection() as conn:
-        with conn.cursor() as cur:
-            # 1. MATERIALES (Requiere logistics:materials:view)
-            if has_permission(user, "logistics:materials:view") or user.get("role") == "superadmin":
-                cur.execute("""
-                    SELECT id, code, name, category
-                    FROM materials
-                    WHERE (name ILIKE %s OR code ILIKE %s OR category ILIKE %s) AND estado = 'ACTIVO'
-                    LIMIT 5
-                """, (q, q, q))
-                for row in cur.fetchall():
-                    results.append({
-                        "category": "Materiales",
-                        "title": row[2],
-                        "subtitle": f"Código: {row[1]} | Categoría: {row[3]}",
-                        "link": f"/materials?search={row[1]}"
-                    })
-
-            # 2. PROYECTOS / PLANES
-            # Si es staff, puede ver todos los planes. Si no, solo los suyos.
-            if is_staff:
-                cur.execute("""
-                    SELECT pp.id, pp.title, pp.project_code, u.username
-                    FROM project_plans pp
-                    LEFT JOIN users u ON u.id = pp.engineer_id
-                    WHERE pp.title ILIKE %s OR pp.project_code ILIKE %s OR pp.custom_project_name ILIKE %s
-                    LIMIT 5
-                """, (q, q, q))
-            else:
-                cur.execute("""
-                    SELECT pp.id, pp.title, pp.project_code, u.username
-                    FROM project_plans pp
-                    LEFT JOIN users u ON u.id = pp.engineer_id
-                    WHERE pp.engineer_id = %s AND (pp.title ILIKE %s OR pp.project_code ILIKE %s OR pp.custom_project_name ILIKE %s)
-                    LIMIT 5
-                """, (user_id, q, q, q))
-            for row in cur.fetchall():
-                results.append({
-                    "category": "Proyectos / Planes",
-                    "title": row[1],
-                    "subtitle": f"Código: {row[2] or '—'} | Creador: {row[3] or '—'}",
-                    "link": f"/operations/plans?id={row[0]}"
-                })
-
-            # 3. ÓRDENES DE TRABAJO (OTs)
-            # Si es staff, puede ver todas las OTs. Si no, solo las que creó o tiene asignadas.
-            if is_staff:
-                cur.execute("""
-                    SELECT ot.id, ot.code, ot.titulo, ot.status
-                    FROM ordenes_trabajo ot
-                    WHERE ot.titulo ILIKE %s OR ot.code ILIKE %s OR ot.descripcion ILIKE %s
-                    LIMIT 5
-                """, (q, q, q))
-            else:
-                cur.execute("""
-                    SELECT ot.id, ot.code, ot.titulo, ot.status
-                    FROM ordenes_trabajo ot
-                    WHERE (ot.creado_por = %s OR ot.asignado_a = %s) AND (ot.titulo ILIKE %s OR ot.code ILIKE %s OR ot.descripcion ILIKE %s)
-                    LIMIT 5
-                """, (user_id, user_id, q, q, q))
-            for row in cur.fetchall():
-                results.append({
-                    "category": "Órdenes de Trabajo (OT)",
-                    "title": f"OT {row[1]}: {row[2]}",
-                    "subtitle": f"Estado: {row[3]}",
-                    "link": f"/operaciones/ot?code={row[1]}"
-                })
-
-            # 4. ÓRDENES DE COMPRA (OCs)
-            # Requiere logistics:stock:view o logistics:stock:receive o ser superadmin
-            if has_permission(user, "logistics:stock:view") or has_permission(user, "logistics:stock:receive") or user.get("role") == "superadmin":
-                cur.execute("""
-                    SELECT oc.id, oc.code, p.nombre, oc.status
-                    FROM ordenes_compra oc
-                    JOIN proveedores p ON p.id = oc.proveedor_id
-                    WHERE oc.code ILIKE %s OR oc.notas ILIKE %s OR p.nombre ILIKE %s
-                    LIMIT 5
-                """, (q, q, q))
-                for row in cur.fetchall():
-                    results.append({
-                        "category": "Órdenes de Compra (OC)",
-                        "title": f"OC {row[1]}",
-                        "subtitle": f"Proveedor: {row[2]} | Estado: {row[3]}",
-                        "link": f"/compras/oc?code={row[1]}"
-                    })
-
-            # 5. CLIENTES
-            # Requiere logistics:materials:view o reporting:view o ser superadmin
-            if has_permission(user, "logistics:materials:view") or has_permission(user, "reporting:view") or user.get("role") == "superadmin":
-                cur.execute("""
-                    SELECT id, codigo, razon_social, ruc, contacto
-                    FROM clientes
-                    WHERE razon_social ILIKE %s OR codigo ILIKE %s OR ruc ILIKE %s OR contacto ILIKE %s
-                    LIMIT 5
-                """, (q, q, q, q))
-                for row in cur.fetchall():
-                    results.append({
-                        "category": "Clientes",
-                        "title": row[2],
-                        "subtitle": f"Código: {row[1]} | RUC: {row[3] or '—'} | Contacto: {row[4] or '—'}",
-                        "link": f"/admin/clientes-dashboard?id={row[0]}" if is_staff else f"/clientes?id={row[0]}"
-                    })
-
-            # 6. PROVEEDORES
-            # Requiere logistics:stock:view o ser superadmin
-            if has_permission(user, "logistics:stock:view") or user.get("role") == "superadmin":
-                cur.execute("""
-                    SELECT id, codigo, nombre, ruc, contacto
-                    FROM proveedores
-                    WHERE nombre ILIKE %s OR codigo ILIKE %s OR ruc ILIKE %s OR contacto ILIKE %s
-                    LIMIT 5
-                """, (q, q, q, q))
-                for row in cur.fetchall():
-                    results.append({
-                        "category": "Proveedores",
-                        "title": row[2],
-                        "subtitle": f"Código: {row[1]} | RUC: {row[3] or '—'} | Contacto: {row[4] or '—'}",
-                        "link": f"/compras/proveedores?code={row[1]}"
-                    })
-
-            # 7. USUARIOS
-            # Requiere admin:users o ser superadmin
-            if has_permission(user, "admin:users") or user.get("role") == "superadmin":
-                cur.execute("""
-                    SELECT id, username, email
-                    FROM users
-                    WHERE username ILIKE %s OR email ILIKE %s
-                    LIMIT 5
-                """, (q, q))
-                for row in cur.fetchall():
-                    results.append({
-                        "category": "Usuarios",
-                        "title": row[1],
-                        "subtitle": f"Email: {row[2]}",
-                        "link": "/admin/users"
-                    })
-
-    return results
+def _json(value) -> dict:
+    # asyncpg entrega jsonb como str salvo que la conexión registre un codec
+    if isinstance(value, str):
+        return json.loads(value)
+    return value
@@ -23,6 +23,7 @@ from app.modules.superadmin.service import (
     get_users_with_blocks_service,
     get_user_blocks_by_id_service,
     set_user_blocks_service,
+    get_runtime_metrics_service,
 )
 
 router = APIRouter(prefix="/superadmin", tags=["Superadmin"])
@@ -67,6 +68,11 @@ def patch_tenant_status(
 
 # ── Block management endpoints ─────────────────────────────────────────────────
 
+@router.get("/metrics")
+def runtime_metrics(_=Depends(require_superadmin)):
+    return get_runtime_metrics_service()
+
+
 @router.get("/users", response_model=List[UserWithBlocksOut])
 def list_users_with_blocks(_=Depends(require_superadmin_or_admin)):
     return get_users_with_blocks_service()
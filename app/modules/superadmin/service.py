@@ -254,6 +254,10 @@ def provision_tenant(payload: TenantCreate) -> dict:
             created_at = cur.fetchone()[0]
         conn.commit()
 
+    # El slug pudo quedar cacheado como inexistente (TENANT_CACHE_MISS_TTL)
+    from app.core.tenant_middleware import invalidate_tenant_cache
+    invalidate_tenant_cache(slug)
+
     # SECURITY: contraseña temporal retornada una sola vez en este response.
     # Requiere HTTPS en producción. El superadmin debe comunicarla al cliente
     # por canal seguro y el admin debe cambiarla en el primer login.
@@ -329,3 +333,29 @@ def update_tenant_status(tenant_id: UUID, is_active: bool) -> dict:
         "id": row[0], "name": row[1], "slug": row[2],
         "is_active": row[3], "provision_status": row[4], "created_at": row[5],
     }
+
+
+# ── Métricas de runtime ───────────────────────────────────────────────────────
+
+def get_runtime_metrics_service() -> dict:
+    """Pools, caches, scheduler y colas de este worker. /health queda como liveness."""
+    from app.core import labels, tenant_scheduler
+    from app.core.async_database import get_async_pool_stats
+    from app.core.audit.writer import audit_writer
+    from app.core.database import get_pool_stats
+    from app.core.jobs.runner import job_runner
+    from app.core.notifications import hub as notifications_hub
+    from app.core.security import principal_cache
+    from app.modules.logistics import reorder
+
+    return {
+        "audit_writer": audit_writer.stats(),
+        "jobs": job_runner.stats(),
+        "db_pools": get_pool_stats(),
+        "db_async_pools": get_async_pool_stats(),
+        "principal_cache": principal_cache.stats(),
+        "scheduler": tenant_scheduler.stats(),
+        "qr_cache": labels.stats(),
+        "reorder_alerts": reorder.stats(),
+        "notifications": notifications_hub.stats(),
+    }
@@ -0,0 +1,116 @@
+-- ============================================================
+-- CeShark ERP — Migration 043
+-- Saldo materializado de stock por (material, almacén, proyecto)
+--   · stock_balances: una fila por combinación con movimientos
+--   · vw_stock_movement_deltas: los deltas (+/-) de cada movimiento,
+--     misma semántica que vw_stock_availability
+--   · trigger en stock_movements que mantiene stock_balances en la
+--     MISMA transacción que inserta/edita/borra el movimiento
+-- Lecturas de saldo pasan a ser O(1) en vez de recorrer el kardex.
+-- Rebuild / verificación: python scripts/rebuild_stock_balances.py
+-- ============================================================
+
+
+-- ── 1. TABLA DE SALDOS ────────────────────────────────────────
+CREATE TABLE IF NOT EXISTS stock_balances (
+    material_id  UUID          NOT NULL REFERENCES materials(id)  ON DELETE CASCADE,
+    warehouse_id UUID          NOT NULL REFERENCES warehouses(id) ON DELETE CASCADE,
+    project_id   UUID,                       -- NULL = movimiento sin proyecto
+    quantity     NUMERIC(14,2) NOT NULL DEFAULT 0,
+    updated_at   TIMESTAMP     NOT NULL DEFAULT now()
+);
+
+-- project_id puede ser NULL: la unicidad se define sobre COALESCE
+CREATE UNIQUE INDEX IF NOT EXISTS uq_stock_balances_key
+    ON stock_balances (material_id, warehouse_id, COALESCE(project_id, '00000000-0000-0000-0000-000000000000'::uuid));
+
+CREATE INDEX IF NOT EXISTS idx_stock_balances_warehouse ON stock_balances(warehouse_id);
+
+
+-- ── 2. DELTAS POR MOVIMIENTO ──────────────────────────────────
+-- IN / RETURN      → +to_warehouse
+-- OUT              → −from_warehouse
+-- TRANSFER         → −from_warehouse, +to_warehouse
+-- ADJUST           → +to_warehouse si existe; si no, −from_warehouse
+CREATE OR REPLACE VIEW vw_stock_movement_deltas AS
+    SELECT sm.id AS movement_id, sm.material_id, sm.to_warehouse AS warehouse_id,
+           sm.project_id, sm.quantity AS delta, sm.created_at
+    FROM stock_movements sm
+    WHERE sm.to_warehouse IS NOT NULL
+      AND sm.movement_type IN ('IN', 'RETURN', 'TRANSFER', 'ADJUST')
+    UNION ALL
+    SELECT sm.id, sm.material_id, sm.from_warehouse,
+           sm.project_id, -sm.quantity, sm.created_at
+    FROM stock_movements sm
+    WHERE sm.from_warehouse IS NOT NULL
+      AND (sm.movement_type IN ('OUT', 'TRANSFER')
+           OR (sm.movement_type = 'ADJUST' AND sm.to_warehouse IS NULL));
+
+
+-- ── 3. MANTENIMIENTO EN LÍNEA (TRIGGER) ───────────────────────
+CREATE OR REPLACE FUNCTION public.bump_stock_balance(
+    p_material_id UUID, p_warehouse_id UUID, p_project_id UUID, p_delta NUMERIC
+) RETURNS void
+    LANGUAGE plpgsql
+    AS $$
+BEGIN
+    IF p_warehouse_id IS NULL OR p_delta = 0 THEN
+        RETURN;
+    END IF;
+    INSERT INTO stock_balances (material_id, warehouse_id, project_id, quantity, updated_at)
+    VALUES (p_material_id, p_warehouse_id, p_project_id, p_delta, now())
+    ON CONFLICT (material_id, warehouse_id, COALESCE(project_id, '00000000-0000-0000-0000-000000000000'::uuid))
+    DO UPDATE SET quantity   = stock_balances.quantity + EXCLUDED.quantity,
+                  updated_at = now();
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION public.apply_stock_movement_balance(
+    p_row stock_movements, p_sign INTEGER
+) RETURNS void
+    LANGUAGE plpgsql
+    AS $$
+BEGIN
+    IF p_row.to_warehouse IS NOT NULL
+       AND p_row.movement_type IN ('IN', 'RETURN', 'TRANSFER', 'ADJUST') THEN
+        PERFORM public.bump_stock_balance(p_row.material_id, p_row.to_warehouse,
+                                          p_row.project_id, p_sign * p_row.quantity);
+    END IF;
+    IF p_row.from_warehouse IS NOT NULL
+       AND (p_row.movement_type IN ('OUT', 'TRANSFER')
+            OR (p_row.movement_type = 'ADJUST' AND p_row.to_warehouse IS NULL)) THEN
+        PERFORM public.bump_stock_balance(p_row.material_id, p_row.from_warehouse,
+                                          p_row.project_id, -p_sign * p_row.quantity);
+    END IF;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION public.trg_stock_movements_balance() RETURNS trigger
+    LANGUAGE plpgsql
+    AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM public.apply_stock_movement_balance(OLD, -1);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM public.apply_stock_movement_balance(NEW, 1);
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_stock_movements_balance ON stock_movements;
+CREATE TRIGGER trg_stock_movements_balance
+    AFTER INSERT OR UPDATE OR DELETE ON stock_movements
+    FOR EACH ROW EXECUTE FUNCTION public.trg_stock_movements_balance();
+
+
+-- ── 4. CARGA INICIAL (solo si la tabla está vacía) ───────────
+INSERT INTO stock_balances (material_id, warehouse_id, project_id, quantity)
+SELECT d.material_id, d.warehouse_id, d.project_id, d.quantity
+FROM (
+    SELECT material_id, warehouse_id, project_id, SUM(delta) AS quantity
+    FROM vw_stock_movement_deltas
+    GROUP BY material_id, warehouse_id, project_id
+) d
+WHERE NOT EXISTS (SELECT 1 FROM stock_balances);
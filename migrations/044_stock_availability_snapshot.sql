@@ -0,0 +1,36 @@
+-- ============================================================
+-- CeShark ERP — Migration 044
+-- vw_stock_availability deja de recalcular el UNION ALL sobre todo
+-- stock_movements: ahora lee el snapshot incremental stock_balances
+-- (043, mantenido por trigger en cada movimiento) y le resta las
+-- reservas activas. El costo de la vista escala con el número de
+-- combinaciones material/almacén, no con la historia del kardex.
+-- La conciliación periódica la hace el job reconcile_stock_balances
+-- (app/core/scheduler.py).
+-- ============================================================
+
+CREATE OR REPLACE VIEW public.vw_stock_availability AS
+ WITH physical AS (
+         SELECT stock_balances.material_id,
+            stock_balances.warehouse_id,
+            sum(stock_balances.quantity) AS physical_qty
+           FROM public.stock_balances
+          GROUP BY stock_balances.material_id, stock_balances.warehouse_id
+        ), reserved AS (
+         SELECT stock_reservations.material_id,
+            stock_reservations.warehouse_id,
+            sum(stock_reservations.quantity) AS reserved_qty
+           FROM public.stock_reservations
+          WHERE (stock_reservations.status = ANY (ARRAY['BLOCKED'::public.stock_reservation_status_enum, 'CONFIRMED'::public.stock_reservation_status_enum]))
+          GROUP BY stock_reservations.material_id, stock_reservations.warehouse_id
+        )
+ SELECT p.material_id,
+    p.warehouse_id,
+    GREATEST((0)::numeric, (p.physical_qty - COALESCE(r.reserved_qty, (0)::numeric))) AS stock_available
+   FROM (physical p
+     LEFT JOIN reserved r ON (((r.material_id = p.material_id) AND (r.warehouse_id = p.warehouse_id))));
+
+-- Reservas activas: el filtro por estado es el camino caliente de la vista
+CREATE INDEX IF NOT EXISTS idx_stock_reservations_active
+    ON stock_reservations (material_id, warehouse_id)
+    WHERE status IN ('BLOCKED', 'CONFIRMED');
@@ -0,0 +1,38 @@
+-- ============================================================
+-- CeShark ERP — Migration 045
+-- background_jobs: importaciones / exportaciones largas que se
+-- ejecutan fuera del request (app/core/jobs). El cliente recibe
+-- un job_id, consulta el progreso y descarga el resultado luego.
+--   · status    : PENDING → RUNNING → SUCCEEDED | FAILED
+--   · result    : JSON devuelto por el servicio (p.ej. resumen de importación)
+--   · artifact_*: archivo generado (Excel/PDF) en app/storage/jobs/<id>/
+--   · runner_id / heartbeat_at: proceso que lo ejecuta y su último latido;
+--     un job sin latido reciente se reporta como interrumpido.
+-- ============================================================
+
+CREATE TABLE IF NOT EXISTS background_jobs (
+    id                  UUID         PRIMARY KEY DEFAULT gen_random_uuid(),
+    kind                VARCHAR(80)  NOT NULL,
+    status              VARCHAR(20)  NOT NULL DEFAULT 'PENDING'
+                        CHECK (status IN ('PENDING', 'RUNNING', 'SUCCEEDED', 'FAILED')),
+    progress            SMALLINT     NOT NULL DEFAULT 0 CHECK (progress BETWEEN 0 AND 100),
+    message             TEXT,
+    params              JSONB        NOT NULL DEFAULT '{}'::jsonb,
+    result              JSONB,
+    error               TEXT,
+    artifact_path       TEXT,
+    artifact_name       TEXT,
+    artifact_media_type TEXT,
+    created_by          TEXT,
+    runner_id           TEXT,
+    created_at          TIMESTAMP    NOT NULL DEFAULT now(),
+    started_at          TIMESTAMP,
+    finished_at         TIMESTAMP,
+    heartbeat_at        TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_background_jobs_user
+    ON background_jobs (created_by, created_at DESC);
+
+CREATE INDEX IF NOT EXISTS idx_background_jobs_active
+    ON background_jobs (status) WHERE status IN ('PENDING', 'RUNNING');
@@ -0,0 +1,217 @@
+-- ============================================================
+-- CeShark ERP — Migration 046
+-- Índice unificado para la búsqueda global (/search)
+--   · search_documents: un documento por entidad buscable (material,
+--     plan, OT, OC, cliente, proveedor, usuario) con el texto ya
+--     normalizado (minúsculas, sin tildes) e índice GIN de trigramas
+--   · vw_search_documents: definición de cada documento a partir de
+--     las tablas de origen (fuente única para triggers y recarga)
+--   · triggers en las tablas de origen que refrescan el documento en
+--     la MISMA transacción del cambio
+-- Una sola consulta reemplaza los siete ILIKE '%q%' secuenciales.
+-- Recarga completa: SELECT search_rebuild_documents();
+-- ============================================================
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm WITH SCHEMA public;
+CREATE EXTENSION IF NOT EXISTS unaccent WITH SCHEMA public;
+
+
+-- ── 1. NORMALIZACIÓN ──────────────────────────────────────────
+-- unaccent() es STABLE; con el diccionario explícito es seguro
+-- declararla IMMUTABLE y usarla en índices y columnas derivadas.
+CREATE OR REPLACE FUNCTION public.search_normalize(p_text TEXT) RETURNS TEXT
+    LANGUAGE sql IMMUTABLE PARALLEL SAFE
+    AS $$
+    SELECT lower(public.unaccent('public.unaccent'::regdictionary, COALESCE(p_text, '')))
+$$;
+
+-- Texto del usuario normalizado y con los comodines de LIKE escapados.
+-- Al ser IMMUTABLE sobre un parámetro, `search_text LIKE '%' || search_like_pattern($1) || '%'`
+-- sigue siendo indexable por el GIN de trigramas.
+CREATE OR REPLACE FUNCTION public.search_like_pattern(p_text TEXT) RETURNS TEXT
+    LANGUAGE sql IMMUTABLE PARALLEL SAFE
+    AS $$
+    SELECT replace(replace(replace(public.search_normalize(p_text), '\', '\\'), '%', '\%'), '_', '\_')
+$$;
+
+
+-- ── 2. TABLA DE DOCUMENTOS ────────────────────────────────────
+CREATE TABLE IF NOT EXISTS search_documents (
+    entity_type VARCHAR(20) NOT NULL,
+    entity_id   UUID        NOT NULL,
+    code_text   TEXT        NOT NULL DEFAULT '',   -- código normalizado (boost por prefijo)
+    title_text  TEXT        NOT NULL DEFAULT '',   -- título normalizado (boost por prefijo)
+    search_text TEXT        NOT NULL,              -- todos los campos buscables, normalizados
+    owner_ids   UUID[]      NOT NULL DEFAULT '{}', -- planes/OTs: quién los ve sin ser staff
+    data        JSONB       NOT NULL,              -- campos para armar el resultado
+    PRIMARY KEY (entity_type, entity_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_search_documents_trgm
+    ON search_documents USING gin (search_text gin_trgm_ops);
+
+
+-- ── 3. DEFINICIÓN DE DOCUMENTOS ───────────────────────────────
+CREATE OR REPLACE VIEW vw_search_documents AS
+    SELECT 'material'::varchar(20) AS entity_type, m.id AS entity_id,
+           search_normalize(m.code) AS code_text,
+           search_normalize(m.name) AS title_text,
+           search_normalize(concat_ws(' ', m.code, m.name, m.category)) AS search_text,
+           '{}'::uuid[] AS owner_ids,
+           jsonb_build_object('code', m.code, 'name', m.name, 'category', m.category) AS data
+    FROM materials m
+    WHERE m.estado = 'ACTIVO'
+    UNION ALL
+    SELECT 'plan', pp.id,
+           search_normalize(pp.project_code),
+           search_normalize(pp.title),
+           search_normalize(concat_ws(' ', pp.project_code, pp.title, pp.custom_project_name)),
+           ARRAY[pp.engineer_id],
+           jsonb_build_object('title', pp.title, 'project_code', pp.project_code, 'engineer', u.username)
+    FROM project_plans pp
+    LEFT JOIN users u ON u.id = pp.engineer_id
+    UNION ALL
+    SELECT 'ot', ot.id,
+           search_normalize(ot.code),
+           search_normalize(ot.titulo),
+           search_normalize(concat_ws(' ', ot.code, ot.titulo, ot.descripcion)),
+           array_remove(ARRAY[ot.creado_por, ot.asignado_a], NULL),
+           jsonb_build_object('code', ot.code, 'titulo', ot.titulo, 'status', ot.status)
+    FROM ordenes_trabajo ot
+    UNION ALL
+    SELECT 'oc', oc.id,
+           search_normalize(oc.code),
+           search_normalize(oc.code),
+           search_normalize(concat_ws(' ', oc.code, oc.notas, p.nombre)),
+           '{}'::uuid[],
+           jsonb_build_object('code', oc.code, 'proveedor', p.nombre, 'status', oc.status)
+    FROM ordenes_compra oc
+    JOIN proveedores p ON p.id = oc.proveedor_id
+    UNION ALL
+    SELECT 'cliente', c.id,
+           search_normalize(c.codigo),
+           search_normalize(c.razon_social),
+           search_normalize(concat_ws(' ', c.codigo, c.razon_social, c.ruc, c.contacto)),
+           '{}'::uuid[],
+           jsonb_build_object('codigo', c.codigo, 'razon_social', c.razon_social,
+                              'ruc', c.ruc, 'contacto', c.contacto)
+    FROM clientes c
+    UNION ALL
+    SELECT 'proveedor', p.id,
+           search_normalize(p.codigo),
+           search_normalize(p.nombre),
+           search_normalize(concat_ws(' ', p.codigo, p.nombre, p.ruc, p.contacto)),
+           '{}'::uuid[],
+           jsonb_build_object('codigo', p.codigo, 'nombre', p.nombre,
+                              'ruc', p.ruc, 'contacto', p.contacto)
+    FROM proveedores p
+    UNION ALL
+    SELECT 'usuario', u.id,
+           search_normalize(u.username),
+           search_normalize(u.username),
+           search_normalize(concat_ws(' ', u.username, u.email)),
+           '{}'::uuid[],
+           jsonb_build_object('username', u.username, 'email', u.email)
+    FROM users u;
+
+
+-- ── 4. MANTENIMIENTO EN LÍNEA (TRIGGERS) ──────────────────────
+CREATE OR REPLACE FUNCTION public.search_refresh_document(p_type TEXT, p_id UUID) RETURNS void
+    LANGUAGE plpgsql
+    AS $$
+BEGIN
+    DELETE FROM search_documents WHERE entity_type = p_type AND entity_id = p_id;
+    INSERT INTO search_documents (entity_type, entity_id, code_text, title_text, search_text, owner_ids, data)
+    SELECT entity_type, entity_id, code_text, title_text, search_text, owner_ids, data
+    FROM vw_search_documents
+    WHERE entity_type = p_type AND entity_id = p_id;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION public.search_rebuild_documents() RETURNS integer
+    LANGUAGE plpgsql
+    AS $$
+DECLARE
+    v_count integer;
+BEGIN
+    DELETE FROM search_documents;
+    INSERT INTO search_documents (entity_type, entity_id, code_text, title_text, search_text, owner_ids, data)
+    SELECT entity_type, entity_id, code_text, title_text, search_text, owner_ids, data
+    FROM vw_search_documents;
+    GET DIAGNOSTICS v_count = ROW_COUNT;
+    RETURN v_count;
+END;
+$$;
+
+-- TG_ARGV[0] = entity_type del documento que representa la fila
+CREATE OR REPLACE FUNCTION public.trg_search_documents_sync() RETURNS trigger
+    LANGUAGE plpgsql
+    AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        DELETE FROM search_documents WHERE entity_type = TG_ARGV[0] AND entity_id = OLD.id;
+        RETURN NULL;
+    END IF;
+
+    PERFORM public.search_refresh_document(TG_ARGV[0], NEW.id);
+
+    -- Documentos que muestran datos de esta fila. IF anidados: OLD.nombre /
+    -- OLD.username solo existen en su tabla y no deben evaluarse en las demás.
+    IF TG_OP = 'UPDATE' AND TG_ARGV[0] = 'proveedor' THEN
+        IF OLD.nombre IS DISTINCT FROM NEW.nombre THEN
+            PERFORM public.search_refresh_document('oc', oc.id)
+            FROM ordenes_compra oc WHERE oc.proveedor_id = NEW.id;
+        END IF;
+    ELSIF TG_OP = 'UPDATE' AND TG_ARGV[0] = 'usuario' THEN
+        IF OLD.username IS DISTINCT FROM NEW.username THEN
+            PERFORM public.search_refresh_document('plan', pp.id)
+            FROM project_plans pp WHERE pp.engineer_id = NEW.id;
+        END IF;
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+-- UPDATE OF: solo los campos que aparecen en el documento (p.ej. un login
+-- que toca users no reescribe el documento del usuario).
+DROP TRIGGER IF EXISTS trg_search_materials ON materials;
+CREATE TRIGGER trg_search_materials
+    AFTER INSERT OR DELETE OR UPDATE OF code, name, category, estado ON materials
+    FOR EACH ROW EXECUTE FUNCTION public.trg_search_documents_sync('material');
+
+DROP TRIGGER IF EXISTS trg_search_project_plans ON project_plans;
+CREATE TRIGGER trg_search_project_plans
+    AFTER INSERT OR DELETE OR UPDATE OF title, project_code, custom_project_name, engineer_id ON project_plans
+    FOR EACH ROW EXECUTE FUNCTION public.trg_search_documents_sync('plan');
+
+DROP TRIGGER IF EXISTS trg_search_ordenes_trabajo ON ordenes_trabajo;
+CREATE TRIGGER trg_search_ordenes_trabajo
+    AFTER INSERT OR DELETE OR UPDATE OF code, titulo, descripcion, status, creado_por, asignado_a ON ordenes_trabajo
+    FOR EACH ROW EXECUTE FUNCTION public.trg_search_documents_sync('ot');
+
+DROP TRIGGER IF EXISTS trg_search_ordenes_compra ON ordenes_compra;
+CREATE TRIGGER trg_search_ordenes_compra
+    AFTER INSERT OR DELETE OR UPDATE OF code, notas, status, proveedor_id ON ordenes_compra
+    FOR EACH ROW EXECUTE FUNCTION public.trg_search_documents_sync('oc');
+
+DROP TRIGGER IF EXISTS trg_search_clientes ON clientes;
+CREATE TRIGGER trg_search_clientes
+    AFTER INSERT OR DELETE OR UPDATE OF codigo, razon_social, ruc, contacto ON clientes
+    FOR EACH ROW EXECUTE FUNCTION public.trg_search_documents_sync('cliente');
+
+DROP TRIGGER IF EXISTS trg_search_proveedores ON proveedores;
+CREATE TRIGGER trg_search_proveedores
+    AFTER INSERT OR DELETE OR UPDATE OF codigo, nombre, ruc, contacto ON proveedores
+    FOR EACH ROW EXECUTE FUNCTION public.trg_search_documents_sync('proveedor');
+
+DROP TRIGGER IF EXISTS trg_search_users ON users;
+CREATE TRIGGER trg_search_users
+    AFTER INSERT OR DELETE OR UPDATE OF username, email ON users
+    FOR EACH ROW EXECUTE FUNCTION public.trg_search_documents_sync('usuario');
+
+
+-- ── 5. CARGA INICIAL (solo si la tabla está vacía) ───────────
+INSERT INTO search_documents (entity_type, entity_id, code_text, title_text, search_text, owner_ids, data)
+SELECT entity_type, entity_id, code_text, title_text, search_text, owner_ids, data
+FROM vw_search_documents
+WHERE NOT EXISTS (SELECT 1 FROM search_documents);
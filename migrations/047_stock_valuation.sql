@@ -0,0 +1,168 @@
+-- ============================================================
+-- CeShark ERP — Migration 047
+-- Costo promedio ponderado perpetuo (valorización incremental)
+--   · materials.weighted_avg_cost: CPP vigente del material, se
+--     actualiza con cada entrada con costo (IN / RETURN / ADJUST)
+--   · stock_valuation: cantidad y valor en existencia por
+--     (material, almacén) = cantidad × CPP del material
+--   · trigger en stock_movements que mantiene ambos en la MISMA
+--     transacción que registra el movimiento
+-- /logistics/advanced/valuation pasa a ser una lectura indexada.
+-- Rebuild / verificación: python scripts/rebuild_stock_valuation.py
+-- ============================================================
+
+
+-- ── 1. TABLA DE VALORIZACIÓN ──────────────────────────────────
+CREATE TABLE IF NOT EXISTS stock_valuation (
+    material_id  UUID          NOT NULL REFERENCES materials(id)  ON DELETE CASCADE,
+    warehouse_id UUID          NOT NULL REFERENCES warehouses(id) ON DELETE CASCADE,
+    quantity     NUMERIC(14,2) NOT NULL DEFAULT 0,
+    value        NUMERIC(18,4) NOT NULL DEFAULT 0,
+    updated_at   TIMESTAMP     NOT NULL DEFAULT now(),
+    PRIMARY KEY (material_id, warehouse_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_stock_valuation_warehouse ON stock_valuation(warehouse_id);
+
+
+-- ── 2. APLICAR UN MOVIMIENTO ──────────────────────────────────
+-- Entrada con costo (IN / RETURN / ADJUST hacia un almacén, unit_cost > 0):
+--     CPP' = (Q × CPP + q × c) / (Q + q)      Q = existencia total previa
+--     si Q <= 0 el CPP se reinicia al costo de la entrada.
+-- Cualquier otro movimiento solo mueve cantidad; el valor de cada almacén
+-- se recalcula como cantidad × CPP. Sin CPP previo se usa materials.unit_cost.
+-- La fila del material se bloquea (FOR UPDATE): dos entradas concurrentes
+-- del mismo material se promedian en serie.
+CREATE OR REPLACE FUNCTION public.bump_stock_valuation(
+    p_material_id UUID, p_warehouse_id UUID, p_delta NUMERIC
+) RETURNS void
+    LANGUAGE plpgsql
+    AS $$
+BEGIN
+    IF p_warehouse_id IS NULL OR p_delta = 0 THEN
+        RETURN;
+    END IF;
+    INSERT INTO stock_valuation (material_id, warehouse_id, quantity, updated_at)
+    VALUES (p_material_id, p_warehouse_id, p_delta, now())
+    ON CONFLICT (material_id, warehouse_id)
+    DO UPDATE SET quantity   = stock_valuation.quantity + EXCLUDED.quantity,
+                  updated_at = now();
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION public.apply_stock_movement_valuation(p_row stock_movements) RETURNS void
+    LANGUAGE plpgsql
+    AS $$
+DECLARE
+    v_avg NUMERIC;
+    v_qty NUMERIC;
+BEGIN
+    SELECT COALESCE(NULLIF(weighted_avg_cost, 0), unit_cost, 0) INTO v_avg
+    FROM materials WHERE id = p_row.material_id
+    FOR UPDATE;
+
+    IF p_row.to_warehouse IS NOT NULL
+       AND p_row.movement_type IN ('IN', 'RETURN', 'ADJUST')
+       AND COALESCE(p_row.unit_cost, 0) > 0 THEN
+        SELECT COALESCE(SUM(quantity), 0) INTO v_qty
+        FROM stock_valuation WHERE material_id = p_row.material_id;
+
+        IF v_qty <= 0 THEN
+            v_avg := p_row.unit_cost;
+        ELSE
+            v_avg := (v_qty * v_avg + p_row.quantity * p_row.unit_cost) / (v_qty + p_row.quantity);
+        END IF;
+
+        UPDATE materials SET weighted_avg_cost = round(v_avg, 4)
+        WHERE id = p_row.material_id AND weighted_avg_cost IS DISTINCT FROM round(v_avg, 4);
+        v_avg := round(v_avg, 4);
+    END IF;
+
+    -- Mismos deltas de cantidad que stock_balances (migración 043)
+    IF p_row.to_warehouse IS NOT NULL
+       AND p_row.movement_type IN ('IN', 'RETURN', 'TRANSFER', 'ADJUST') THEN
+        PERFORM public.bump_stock_valuation(p_row.material_id, p_row.to_warehouse, p_row.quantity);
+    END IF;
+    IF p_row.from_warehouse IS NOT NULL
+       AND (p_row.movement_type IN ('OUT', 'TRANSFER')
+            OR (p_row.movement_type = 'ADJUST' AND p_row.to_warehouse IS NULL)) THEN
+        PERFORM public.bump_stock_valuation(p_row.material_id, p_row.from_warehouse, -p_row.quantity);
+    END IF;
+
+    UPDATE stock_valuation
+    SET value = quantity * v_avg, updated_at = now()
+    WHERE material_id = p_row.material_id
+      AND value IS DISTINCT FROM quantity * v_avg;
+END;
+$$;
+
+
+-- ── 3. RECÁLCULO DESDE EL KARDEX ──────────────────────────────
+-- El CPP depende del orden: editar o borrar un movimiento pasado no se
+-- puede revertir incrementalmente, así que se reproduce el historial
+-- del material (created_at, id).
+CREATE OR REPLACE FUNCTION public.recompute_material_valuation(p_material_id UUID) RETURNS void
+    LANGUAGE plpgsql
+    AS $$
+DECLARE
+    v_row stock_movements;
+BEGIN
+    PERFORM 1 FROM materials WHERE id = p_material_id FOR UPDATE;
+    DELETE FROM stock_valuation WHERE material_id = p_material_id;
+    UPDATE materials SET weighted_avg_cost = 0 WHERE id = p_material_id;
+    FOR v_row IN
+        SELECT * FROM stock_movements
+        WHERE material_id = p_material_id
+        ORDER BY created_at, id
+    LOOP
+        PERFORM public.apply_stock_movement_valuation(v_row);
+    END LOOP;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION public.rebuild_stock_valuation() RETURNS integer
+    LANGUAGE plpgsql
+    AS $$
+DECLARE
+    v_material UUID;
+    v_count    integer := 0;
+BEGIN
+    DELETE FROM stock_valuation;
+    UPDATE materials SET weighted_avg_cost = 0 WHERE weighted_avg_cost <> 0;
+    FOR v_material IN SELECT DISTINCT material_id FROM stock_movements LOOP
+        PERFORM public.recompute_material_valuation(v_material);
+        v_count := v_count + 1;
+    END LOOP;
+    RETURN v_count;
+END;
+$$;
+
+
+-- ── 4. MANTENIMIENTO EN LÍNEA (TRIGGER) ───────────────────────
+-- INSERT: incremental. UPDATE / DELETE: se reproduce el material afectado.
+CREATE OR REPLACE FUNCTION public.trg_stock_movements_valuation() RETURNS trigger
+    LANGUAGE plpgsql
+    AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM public.apply_stock_movement_valuation(NEW);
+        RETURN NULL;
+    END IF;
+    PERFORM public.recompute_material_valuation(OLD.material_id);
+    IF TG_OP = 'UPDATE' AND NEW.material_id <> OLD.material_id THEN
+        PERFORM public.recompute_material_valuation(NEW.material_id);
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_stock_movements_valuation ON stock_movements;
+CREATE TRIGGER trg_stock_movements_valuation
+    AFTER INSERT OR DELETE OR UPDATE OF material_id, movement_type, quantity, from_warehouse,
+                                        to_warehouse, unit_cost, created_at ON stock_movements
+    FOR EACH ROW EXECUTE FUNCTION public.trg_stock_movements_valuation();
+
+
+-- ── 5. CARGA INICIAL (solo si la tabla está vacía) ───────────
+SELECT public.rebuild_stock_valuation()
+WHERE NOT EXISTS (SELECT 1 FROM stock_valuation);
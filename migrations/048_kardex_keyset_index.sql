@@ -0,0 +1,11 @@
+-- ============================================================
+-- CeShark ERP — Migration 048
+-- Índice para el kardex paginado por keyset (created_at, id)
+--   · /logistics/advanced/kardex/{material_id}?cursor=... lee una
+--     página con un range scan y calcula el saldo inicial sumando
+--     el rango anterior al cursor sin ir al heap (INCLUDE)
+-- ============================================================
+
+CREATE INDEX IF NOT EXISTS idx_stock_movements_kardex
+    ON stock_movements (material_id, created_at, id)
+    INCLUDE (movement_type, quantity, unit_cost, from_warehouse, to_warehouse);
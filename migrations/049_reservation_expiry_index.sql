@@ -0,0 +1,10 @@
+-- ============================================================
+-- CeShark ERP — Migration 049
+-- Expiración programada de reservas (job expire_stock_reservations)
+--   · índice parcial sobre las reservas BLOCKED por vencimiento:
+--     cada lote del job es un range scan de las ya vencidas
+-- ============================================================
+
+CREATE INDEX IF NOT EXISTS idx_stock_reservations_blocked_expiry
+    ON stock_reservations (expires_at)
+    WHERE status = 'BLOCKED';
@@ -0,0 +1,26 @@
+-- Migración 050: Registro de ejecuciones del scheduler por tenant (Master DB)
+-- EJECUTAR MANUALMENTE una sola vez contra erp_master:
+--   psql -U postgres erp_master -f migrations/050_scheduler_job_runs.sql
+-- Sin MASTER_DATABASE_URL (dev / single-tenant) aplicar en la DB por defecto.
+--
+-- Cada fila es una ejecución de un job periódico en un tenant. La clave única
+-- (job_name, tenant_slug, fire_key) es el "turno" del job: el primer worker
+-- uvicorn que lo inserta lo ejecuta, los demás lo saltan.
+
+CREATE TABLE IF NOT EXISTS scheduler_job_runs (
+    id            BIGSERIAL    PRIMARY KEY,
+    job_name      VARCHAR(100) NOT NULL,
+    tenant_slug   VARCHAR(100) NOT NULL,
+    fire_key      BIGINT       NOT NULL,     -- epoch // período del job
+    runner        VARCHAR(255) NOT NULL,     -- host:pid que lo ejecutó
+    status        VARCHAR(20)  NOT NULL DEFAULT 'RUNNING',  -- RUNNING | OK | ERROR | SKIPPED | ABANDONED
+    rows_affected BIGINT,
+    duration_ms   NUMERIC(12,1),
+    error         TEXT,
+    started_at    TIMESTAMP    NOT NULL DEFAULT NOW(),
+    finished_at   TIMESTAMP,
+    CONSTRAINT uq_scheduler_job_runs_turn UNIQUE (job_name, tenant_slug, fire_key)
+);
+
+CREATE INDEX IF NOT EXISTS idx_scheduler_job_runs_started
+    ON scheduler_job_runs (started_at);
@@ -0,0 +1,139 @@
+-- ============================================================
+-- CeShark ERP — Migration 051
+-- audit_logs particionada por mes (RANGE sobre created_at)
+--   · una partición por mes: audit_logs_pYYYYMM
+--   · audit_logs_default recoge lo que no cae en ningún mes creado
+--     (no debería pasar: el scheduler crea los meses por adelantado)
+--   · retención = DETACH + (archivo .csv.gz opcional) + DROP de la
+--     partición vencida, en vez de un DELETE masivo con bloat
+--     (app/core/audit/retention.py, job maintain_audit_partitions)
+--   · consultas con filtro de fecha podan particiones; sin filtro,
+--     ORDER BY created_at DESC LIMIT mezcla los índices de cada mes
+--     (Merge Append) y se detiene al llenar el LIMIT
+-- La conversión copia la tabla existente (una vez). Idempotente: si
+-- audit_logs ya es particionada no hace nada.
+-- ============================================================
+
+
+-- ── 1. CREAR PARTICIONES ──────────────────────────────────────
+CREATE OR REPLACE FUNCTION public.audit_logs_partition_name(p_month DATE) RETURNS TEXT
+    LANGUAGE sql IMMUTABLE
+    AS $$
+    SELECT 'audit_logs_p' || to_char(date_trunc('month', p_month), 'YYYYMM')
+$$;
+
+-- Crea (si falta) la partición de cada mes entre p_from y p_to. Retorna cuántas creó.
+-- Si audit_logs_default ya tiene filas de ese mes (el job no corrió a
+-- tiempo, reloj desfasado) el CREATE fallaría: se sacan antes, se crea
+-- la partición y se reinsertan, todo en la misma transacción.
+CREATE OR REPLACE FUNCTION public.audit_logs_ensure_partitions(p_from DATE, p_to DATE) RETURNS integer
+    LANGUAGE plpgsql
+    AS $$
+DECLARE
+    v_month   DATE := date_trunc('month', p_from)::date;
+    v_next    DATE;
+    v_name    TEXT;
+    v_moved   boolean;
+    v_created integer := 0;
+BEGIN
+    WHILE v_month <= p_to LOOP
+        v_name := public.audit_logs_partition_name(v_month);
+        v_next := (v_month + INTERVAL '1 month')::date;
+        IF to_regclass('public.' || v_name) IS NULL THEN
+            v_moved := to_regclass('public.audit_logs_default') IS NOT NULL AND EXISTS (
+                SELECT 1 FROM public.audit_logs_default
+                WHERE created_at >= v_month AND created_at < v_next
+            );
+            IF v_moved THEN
+                -- Sin INSERT concurrentes en default hasta que exista el mes
+                LOCK TABLE public.audit_logs_default IN EXCLUSIVE MODE;
+                CREATE TEMP TABLE audit_logs_moved (LIKE public.audit_logs) ON COMMIT DROP;
+                WITH moved AS (
+                    DELETE FROM public.audit_logs_default
+                    WHERE created_at >= v_month AND created_at < v_next
+                    RETURNING *
+                )
+                INSERT INTO audit_logs_moved SELECT * FROM moved;
+            END IF;
+
+            EXECUTE format(
+                'CREATE TABLE public.%I PARTITION OF public.audit_logs FOR VALUES FROM (%L) TO (%L)',
+                v_name, v_month, v_next
+            );
+
+            IF v_moved THEN
+                INSERT INTO public.audit_logs SELECT * FROM audit_logs_moved;
+                DROP TABLE audit_logs_moved;
+            END IF;
+            v_created := v_created + 1;
+        END IF;
+        v_month := v_next;
+    END LOOP;
+    RETURN v_created;
+END;
+$$;
+
+
+-- ── 2. CONVERSIÓN (solo si audit_logs no es particionada) ─────
+DO $$
+DECLARE
+    v_first DATE;
+BEGIN
+    IF (SELECT relkind FROM pg_class WHERE oid = 'public.audit_logs'::regclass) = 'p' THEN
+        RETURN;
+    END IF;
+
+    ALTER TABLE public.audit_logs RENAME TO audit_logs_legacy;
+    ALTER TABLE public.audit_logs_legacy DROP CONSTRAINT IF EXISTS audit_logs_pkey;
+    ALTER INDEX IF EXISTS public.idx_audit_logs_created_at RENAME TO idx_audit_logs_legacy_created_at;
+    ALTER INDEX IF EXISTS public.idx_audit_logs_entity     RENAME TO idx_audit_logs_legacy_entity;
+    ALTER INDEX IF EXISTS public.idx_audit_logs_module     RENAME TO idx_audit_logs_legacy_module;
+    ALTER INDEX IF EXISTS public.idx_audit_logs_user       RENAME TO idx_audit_logs_legacy_user;
+
+    CREATE TABLE public.audit_logs (
+        id            UUID      NOT NULL DEFAULT gen_random_uuid(),
+        user_id       UUID,
+        username      TEXT,
+        action        TEXT      NOT NULL,
+        endpoint      TEXT      NOT NULL,
+        module        TEXT      NOT NULL,
+        payload       JSONB,
+        ip_address    TEXT,
+        created_at    TIMESTAMP NOT NULL DEFAULT now(),
+        roles         TEXT[],
+        entity        TEXT,
+        entity_id     UUID,
+        old_data      JSONB,
+        new_data      JSONB,
+        status        TEXT      DEFAULT 'SUCCESS',
+        error_message TEXT,
+        user_agent    TEXT,
+        method        TEXT      DEFAULT 'UNKNOWN',
+        -- La clave de partición debe formar parte de la PK
+        CONSTRAINT audit_logs_pkey PRIMARY KEY (id, created_at)
+    ) PARTITION BY RANGE (created_at);
+
+    CREATE TABLE public.audit_logs_default PARTITION OF public.audit_logs DEFAULT;
+
+    CREATE INDEX idx_audit_logs_created_at ON public.audit_logs (created_at);
+    CREATE INDEX idx_audit_logs_entity     ON public.audit_logs (entity, entity_id);
+    CREATE INDEX idx_audit_logs_module     ON public.audit_logs (module);
+    CREATE INDEX idx_audit_logs_user       ON public.audit_logs (user_id);
+
+    SELECT COALESCE(min(created_at), now())::date INTO v_first FROM public.audit_logs_legacy;
+    PERFORM public.audit_logs_ensure_partitions(v_first, (now() + INTERVAL '2 months')::date);
+
+    INSERT INTO public.audit_logs (
+        id, user_id, username, action, endpoint, module, payload, ip_address,
+        created_at, roles, entity, entity_id, old_data, new_data, status,
+        error_message, user_agent, method
+    )
+    SELECT
+        id, user_id, username, action, endpoint, module, payload, ip_address,
+        COALESCE(created_at, now()), roles, entity, entity_id, old_data, new_data, status,
+        error_message, user_agent, method
+    FROM public.audit_logs_legacy;
+
+    DROP TABLE public.audit_logs_legacy;
+END;
+$$;
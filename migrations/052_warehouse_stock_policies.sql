@@ -0,0 +1,26 @@
+-- ============================================================
+-- CeShark ERP — Migration 052
+-- Umbrales de stock por almacén (motor de alertas de reposición)
+--   · warehouse_stock_policies: mínimo / punto de reposición /
+--     máximo de un material en un almacén. NULL = usa el valor
+--     global de materials (min_stock, reorder_point, max_stock)
+--   · updated_at: el motor (app/modules/logistics/reorder.py)
+--     recalcula solo los materiales con saldo o política cambiada
+--     desde su última pasada
+-- Sin índice sobre stock_balances.updated_at a propósito: indexar
+-- la columna que toca cada movimiento anula los HOT updates, y la
+-- tabla (material × almacén × proyecto) se recorre en milisegundos.
+-- ============================================================
+
+CREATE TABLE IF NOT EXISTS warehouse_stock_policies (
+    material_id   UUID          NOT NULL REFERENCES materials(id)  ON DELETE CASCADE,
+    warehouse_id  UUID          NOT NULL REFERENCES warehouses(id) ON DELETE CASCADE,
+    min_stock     NUMERIC(12,2),
+    reorder_point NUMERIC(12,2),
+    max_stock     NUMERIC(12,2),
+    updated_at    TIMESTAMP     NOT NULL DEFAULT now(),
+    PRIMARY KEY (material_id, warehouse_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_warehouse_stock_policies_warehouse
+    ON warehouse_stock_policies(warehouse_id);
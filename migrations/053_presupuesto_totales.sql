@@ -0,0 +1,220 @@
+-- ============================================================
+-- CeShark ERP — Migration 053
+-- Totales precalculados del presupuesto (cotizaciones / APU)
+--   · presupuesto_partidas.precio_unitario_apu: Σ cantidad × precio
+--     de los ítems APU de la partida
+--   · presupuesto_categoria_totales: costo por (plan, tipo_recurso)
+--     = Σ partida.cantidad × ítem.cantidad × ítem.precio_unitario
+--     sobre partidas que no son capítulo; `lineas` = ítems que
+--     aportan (0 = la categoría ya no tiene ítems)
+--   · triggers en presupuesto_apu_items (por sentencia, con tablas
+--     de transición: un INSERT masivo es una sola actualización) y
+--     en presupuesto_partidas (cantidad / es_capitulo / borrado)
+-- Listado de partidas, resumen, PDF y Excel leen estos valores en
+-- vez de re-agregar los ítems APU en cada request.
+-- Rebuild: SELECT public.rebuild_presupuesto_totales([plan_id]);
+-- ============================================================
+
+
+-- ── 1. COLUMNA Y TABLA ────────────────────────────────────────
+-- NUMERIC sin escala: los deltas se suman exactos, sin deriva de redondeo
+ALTER TABLE presupuesto_partidas
+    ADD COLUMN IF NOT EXISTS precio_unitario_apu NUMERIC NOT NULL DEFAULT 0;
+
+CREATE TABLE IF NOT EXISTS presupuesto_categoria_totales (
+    plan_id      UUID        NOT NULL REFERENCES project_plans(id) ON DELETE CASCADE,
+    tipo_recurso VARCHAR(20) NOT NULL,
+    costo        NUMERIC     NOT NULL DEFAULT 0,
+    lineas       INTEGER     NOT NULL DEFAULT 0,
+    PRIMARY KEY (plan_id, tipo_recurso)
+);
+
+
+-- ── 2. APLICAR DELTAS DE ÍTEMS APU ────────────────────────────
+-- Arreglos paralelos (partida, tipo, monto, líneas); monto y líneas
+-- negativos para ítems que salen. La fila de la partida se lee con su
+-- cantidad vigente: los cambios de cantidad los cubre el trigger de
+-- presupuesto_partidas.
+CREATE OR REPLACE FUNCTION public.apply_presupuesto_apu_deltas(
+    p_partidas UUID[], p_tipos TEXT[], p_montos NUMERIC[], p_lineas INTEGER[]
+) RETURNS void
+    LANGUAGE plpgsql
+    AS $$
+BEGIN
+    WITH d AS (
+        SELECT partida_id, tipo_recurso, SUM(monto) AS monto, SUM(lineas) AS lineas
+        FROM unnest(p_partidas, p_tipos, p_montos, p_lineas)
+             AS u(partida_id, tipo_recurso, monto, lineas)
+        GROUP BY partida_id, tipo_recurso
+    ), pu AS (
+        UPDATE presupuesto_partidas pp
+        SET precio_unitario_apu = pp.precio_unitario_apu + x.monto
+        FROM (SELECT partida_id, SUM(monto) AS monto FROM d GROUP BY partida_id) x
+        WHERE pp.id = x.partida_id AND x.monto <> 0
+    )
+    INSERT INTO presupuesto_categoria_totales AS t (plan_id, tipo_recurso, costo, lineas)
+    SELECT pp.plan_id, d.tipo_recurso, SUM(pp.cantidad * d.monto), SUM(d.lineas)
+    FROM d
+    JOIN presupuesto_partidas pp ON pp.id = d.partida_id
+    WHERE NOT pp.es_capitulo
+    GROUP BY pp.plan_id, d.tipo_recurso
+    HAVING SUM(pp.cantidad * d.monto) <> 0 OR SUM(d.lineas) <> 0
+    ON CONFLICT (plan_id, tipo_recurso)
+    DO UPDATE SET costo  = t.costo  + EXCLUDED.costo,
+                  lineas = t.lineas + EXCLUDED.lineas;
+END;
+$$;
+
+-- Un trigger por evento (las tablas de transición no admiten varios).
+-- Al borrar una partida, sus ítems caen por CASCADE cuando la partida ya
+-- no existe: el JOIN no encuentra nada y el trigger de partidas ya restó.
+CREATE OR REPLACE FUNCTION public.trg_presupuesto_apu_totales() RETURNS trigger
+    LANGUAGE plpgsql
+    AS $$
+DECLARE
+    v_partidas UUID[];
+    v_tipos    TEXT[];
+    v_montos   NUMERIC[];
+    v_lineas   INTEGER[];
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        SELECT array_agg(partida_id), array_agg(tipo_recurso),
+               array_agg(cantidad * precio_unitario), array_agg(1)
+        INTO v_partidas, v_tipos, v_montos, v_lineas
+        FROM new_rows;
+    ELSIF TG_OP = 'DELETE' THEN
+        SELECT array_agg(partida_id), array_agg(tipo_recurso),
+               array_agg(-(cantidad * precio_unitario)), array_agg(-1)
+        INTO v_partidas, v_tipos, v_montos, v_lineas
+        FROM old_rows;
+    ELSE
+        SELECT array_agg(partida_id), array_agg(tipo_recurso),
+               array_agg(monto), array_agg(lineas)
+        INTO v_partidas, v_tipos, v_montos, v_lineas
+        FROM (
+            SELECT partida_id, tipo_recurso, cantidad * precio_unitario AS monto, 1 AS lineas
+            FROM new_rows
+            UNION ALL
+            SELECT partida_id, tipo_recurso, -(cantidad * precio_unitario), -1
+            FROM old_rows
+        ) d;
+    END IF;
+
+    IF v_partidas IS NOT NULL THEN
+        PERFORM public.apply_presupuesto_apu_deltas(v_partidas, v_tipos, v_montos, v_lineas);
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_presupuesto_apu_totales_ins ON presupuesto_apu_items;
+CREATE TRIGGER trg_presupuesto_apu_totales_ins
+    AFTER INSERT ON presupuesto_apu_items
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION public.trg_presupuesto_apu_totales();
+
+DROP TRIGGER IF EXISTS trg_presupuesto_apu_totales_upd ON presupuesto_apu_items;
+CREATE TRIGGER trg_presupuesto_apu_totales_upd
+    AFTER UPDATE ON presupuesto_apu_items
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION public.trg_presupuesto_apu_totales();
+
+DROP TRIGGER IF EXISTS trg_presupuesto_apu_totales_del ON presupuesto_apu_items;
+CREATE TRIGGER trg_presupuesto_apu_totales_del
+    AFTER DELETE ON presupuesto_apu_items
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION public.trg_presupuesto_apu_totales();
+
+
+-- ── 3. CAMBIOS EN LA PARTIDA ──────────────────────────────────
+-- Resta el aporte con los valores anteriores y (UPDATE) suma el nuevo.
+-- DELETE es BEFORE: los ítems aún existen para calcular lo que se resta.
+CREATE OR REPLACE FUNCTION public.trg_presupuesto_partidas_totales() RETURNS trigger
+    LANGUAGE plpgsql
+    AS $$
+BEGIN
+    IF NOT OLD.es_capitulo THEN
+        UPDATE presupuesto_categoria_totales t
+        SET costo  = t.costo  - OLD.cantidad * s.monto,
+            lineas = t.lineas - s.lineas
+        FROM (
+            SELECT tipo_recurso, SUM(cantidad * precio_unitario) AS monto, COUNT(*) AS lineas
+            FROM presupuesto_apu_items
+            WHERE partida_id = OLD.id
+            GROUP BY tipo_recurso
+        ) s
+        WHERE t.plan_id = OLD.plan_id AND t.tipo_recurso = s.tipo_recurso;
+    END IF;
+
+    IF TG_OP = 'DELETE' THEN
+        RETURN OLD;
+    END IF;
+
+    IF NOT NEW.es_capitulo THEN
+        INSERT INTO presupuesto_categoria_totales AS t (plan_id, tipo_recurso, costo, lineas)
+        SELECT NEW.plan_id, tipo_recurso, NEW.cantidad * SUM(cantidad * precio_unitario), COUNT(*)
+        FROM presupuesto_apu_items
+        WHERE partida_id = NEW.id
+        GROUP BY tipo_recurso
+        ON CONFLICT (plan_id, tipo_recurso)
+        DO UPDATE SET costo  = t.costo  + EXCLUDED.costo,
+                      lineas = t.lineas + EXCLUDED.lineas;
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_presupuesto_partidas_totales_upd ON presupuesto_partidas;
+CREATE TRIGGER trg_presupuesto_partidas_totales_upd
+    AFTER UPDATE OF cantidad, es_capitulo, plan_id ON presupuesto_partidas
+    FOR EACH ROW
+    WHEN (OLD.cantidad    IS DISTINCT FROM NEW.cantidad
+       OR OLD.es_capitulo IS DISTINCT FROM NEW.es_capitulo
+       OR OLD.plan_id     IS DISTINCT FROM NEW.plan_id)
+    EXECUTE FUNCTION public.trg_presupuesto_partidas_totales();
+
+DROP TRIGGER IF EXISTS trg_presupuesto_partidas_totales_del ON presupuesto_partidas;
+CREATE TRIGGER trg_presupuesto_partidas_totales_del
+    BEFORE DELETE ON presupuesto_partidas
+    FOR EACH ROW EXECUTE FUNCTION public.trg_presupuesto_partidas_totales();
+
+
+-- ── 4. RECÁLCULO COMPLETO ─────────────────────────────────────
+-- p_plan_id NULL = todos los planes. Retorna las partidas recalculadas.
+CREATE OR REPLACE FUNCTION public.rebuild_presupuesto_totales(p_plan_id UUID DEFAULT NULL) RETURNS integer
+    LANGUAGE plpgsql
+    AS $$
+DECLARE
+    v_count integer;
+BEGIN
+    UPDATE presupuesto_partidas pp
+    SET precio_unitario_apu = s.monto
+    FROM (
+        SELECT p.id, COALESCE(SUM(ai.cantidad * ai.precio_unitario), 0) AS monto
+        FROM presupuesto_partidas p
+        LEFT JOIN presupuesto_apu_items ai ON ai.partida_id = p.id
+        WHERE p_plan_id IS NULL OR p.plan_id = p_plan_id
+        GROUP BY p.id
+    ) s
+    WHERE pp.id = s.id AND pp.precio_unitario_apu IS DISTINCT FROM s.monto;
+
+    SELECT COUNT(*) INTO v_count
+    FROM presupuesto_partidas WHERE p_plan_id IS NULL OR plan_id = p_plan_id;
+
+    DELETE FROM presupuesto_categoria_totales WHERE p_plan_id IS NULL OR plan_id = p_plan_id;
+    INSERT INTO presupuesto_categoria_totales (plan_id, tipo_recurso, costo, lineas)
+    SELECT pp.plan_id, ai.tipo_recurso,
+           SUM(pp.cantidad * ai.cantidad * ai.precio_unitario), COUNT(*)
+    FROM presupuesto_partidas pp
+    JOIN presupuesto_apu_items ai ON ai.partida_id = pp.id
+    WHERE NOT pp.es_capitulo AND (p_plan_id IS NULL OR pp.plan_id = p_plan_id)
+    GROUP BY pp.plan_id, ai.tipo_recurso;
+
+    RETURN v_count;
+END;
+$$;
+
+
+-- ── 5. CARGA INICIAL (solo si la tabla está vacía) ───────────
+SELECT public.rebuild_presupuesto_totales()
+WHERE NOT EXISTS (SELECT 1 FROM presupuesto_categoria_totales);
@@ -0,0 +1,182 @@
+-- ============================================================
+-- CeShark ERP — Migration 054
+-- Deltas de contadores (badges) por LISTEN/NOTIFY
+--   · canal 'badges': un NOTIFY por (clave, delta) al confirmar la
+--     transacción; payload JSON {"k": clave, "d": delta, "n": id}
+--     ("n" es único: PostgreSQL descarta NOTIFY idénticos dentro de
+--     una transacción y dos +1 de la misma clave se perderían)
+--   · claves (mismas que app/core/notifications/badges.py):
+--       planificacion:<user_id>  tareas no completadas del usuario
+--       canal:<to_module>        solicitudes PENDIENTE del módulo
+--       canal:*                  todas las solicitudes PENDIENTE
+--       gerencia                 aprobaciones PENDIENTE
+--       requests                 solicitudes de material PENDING
+--   · triggers por sentencia con tablas de transición: una
+--     importación o un lote emite un NOTIFY por clave, no por fila;
+--     un UPDATE que no cambia lo contado no emite nada
+-- El hub de /notifications/stream (app/core/notifications/hub.py)
+-- escucha el canal y empuja los valores a los clientes conectados.
+-- ============================================================
+
+
+-- ── 1. EMISIÓN ────────────────────────────────────────────────
+-- Arreglos paralelos (clave, delta); se agregan por clave y se omiten los netos en 0.
+CREATE OR REPLACE FUNCTION public.badge_notify(p_keys TEXT[], p_deltas INTEGER[]) RETURNS void
+    LANGUAGE plpgsql
+    AS $$
+BEGIN
+    PERFORM pg_notify('badges', json_build_object('k', k, 'd', d, 'n', gen_random_uuid())::text)
+    FROM (
+        SELECT k, SUM(d)::integer AS d
+        FROM unnest(p_keys, p_deltas) AS u(k, d)
+        GROUP BY k
+        HAVING SUM(d) <> 0
+    ) x;
+END;
+$$;
+
+
+-- ── 2. CANAL ──────────────────────────────────────────────────
+CREATE OR REPLACE FUNCTION public.trg_badges_canal() RETURNS trigger
+    LANGUAGE plpgsql
+    AS $$
+DECLARE
+    v_keys   TEXT[]    := '{}';
+    v_deltas INTEGER[] := '{}';
+BEGIN
+    IF TG_OP <> 'DELETE' THEN
+        SELECT v_keys || array_agg(k), v_deltas || array_agg(1)
+        INTO v_keys, v_deltas
+        FROM new_rows r, unnest(ARRAY['canal:' || r.to_module, 'canal:*']) AS k
+        WHERE r.status = 'PENDIENTE';
+    END IF;
+    IF TG_OP <> 'INSERT' THEN
+        SELECT v_keys || array_agg(k), v_deltas || array_agg(-1)
+        INTO v_keys, v_deltas
+        FROM old_rows r, unnest(ARRAY['canal:' || r.to_module, 'canal:*']) AS k
+        WHERE r.status = 'PENDIENTE';
+    END IF;
+    PERFORM public.badge_notify(v_keys, v_deltas);
+    RETURN NULL;
+END;
+$$;
+
+
+-- ── 3. PLANIFICACIÓN ──────────────────────────────────────────
+-- Una tarea cuenta para su responsable_id y para cada id de
+-- responsables_ids (texto separado por comas), una vez por usuario.
+CREATE OR REPLACE FUNCTION public.planificacion_badge_users(p_responsable UUID, p_ids TEXT) RETURNS SETOF TEXT
+    LANGUAGE sql IMMUTABLE
+    AS $$
+    SELECT DISTINCT u
+    FROM (
+        SELECT p_responsable::text AS u
+        UNION ALL
+        SELECT trim(x) FROM unnest(string_to_array(COALESCE(p_ids, ''), ',')) AS x
+    ) s
+    WHERE u IS NOT NULL AND u <> ''
+$$;
+
+CREATE OR REPLACE FUNCTION public.trg_badges_planificacion() RETURNS trigger
+    LANGUAGE plpgsql
+    AS $$
+DECLARE
+    v_keys   TEXT[]    := '{}';
+    v_deltas INTEGER[] := '{}';
+BEGIN
+    IF TG_OP <> 'DELETE' THEN
+        SELECT v_keys || array_agg('planificacion:' || u), v_deltas || array_agg(1)
+        INTO v_keys, v_deltas
+        FROM new_rows r, public.planificacion_badge_users(r.responsable_id, r.responsables_ids) AS u
+        WHERE r.estado <> 'Completado';
+    END IF;
+    IF TG_OP <> 'INSERT' THEN
+        SELECT v_keys || array_agg('planificacion:' || u), v_deltas || array_agg(-1)
+        INTO v_keys, v_deltas
+        FROM old_rows r, public.planificacion_badge_users(r.responsable_id, r.responsables_ids) AS u
+        WHERE r.estado <> 'Completado';
+    END IF;
+    PERFORM public.badge_notify(v_keys, v_deltas);
+    RETURN NULL;
+END;
+$$;
+
+
+-- ── 4. GERENCIA ───────────────────────────────────────────────
+CREATE OR REPLACE FUNCTION public.trg_badges_gerencia() RETURNS trigger
+    LANGUAGE plpgsql
+    AS $$
+DECLARE
+    v_keys   TEXT[]    := '{}';
+    v_deltas INTEGER[] := '{}';
+BEGIN
+    IF TG_OP <> 'DELETE' THEN
+        SELECT v_keys || array_agg('gerencia'::text), v_deltas || array_agg(1)
+        INTO v_keys, v_deltas
+        FROM new_rows WHERE estado = 'PENDIENTE';
+    END IF;
+    IF TG_OP <> 'INSERT' THEN
+        SELECT v_keys || array_agg('gerencia'::text), v_deltas || array_agg(-1)
+        INTO v_keys, v_deltas
+        FROM old_rows WHERE estado = 'PENDIENTE';
+    END IF;
+    PERFORM public.badge_notify(v_keys, v_deltas);
+    RETURN NULL;
+END;
+$$;
+
+
+-- ── 5. SOLICITUDES DE MATERIAL ────────────────────────────────
+CREATE OR REPLACE FUNCTION public.trg_badges_material_requests() RETURNS trigger
+    LANGUAGE plpgsql
+    AS $$
+DECLARE
+    v_keys   TEXT[]    := '{}';
+    v_deltas INTEGER[] := '{}';
+BEGIN
+    IF TG_OP <> 'DELETE' THEN
+        SELECT v_keys || array_agg('requests'::text), v_deltas || array_agg(1)
+        INTO v_keys, v_deltas
+        FROM new_rows WHERE status = 'PENDING';
+    END IF;
+    IF TG_OP <> 'INSERT' THEN
+        SELECT v_keys || array_agg('requests'::text), v_deltas || array_agg(-1)
+        INTO v_keys, v_deltas
+        FROM old_rows WHERE status = 'PENDING';
+    END IF;
+    PERFORM public.badge_notify(v_keys, v_deltas);
+    RETURN NULL;
+END;
+$$;
+
+
+-- ── 6. TRIGGERS ───────────────────────────────────────────────
+-- Las tablas de transición admiten un solo evento por trigger: tres por tabla.
+DO $$
+DECLARE
+    v_table TEXT;
+    v_fn    TEXT;
+BEGIN
+    FOR v_table, v_fn IN
+        SELECT * FROM (VALUES
+            ('canal_solicitudes',     'trg_badges_canal'),
+            ('planificacion_semanal', 'trg_badges_planificacion'),
+            ('aprobaciones_gerencia', 'trg_badges_gerencia'),
+            ('material_requests',     'trg_badges_material_requests')
+        ) AS t(tbl, fn)
+    LOOP
+        EXECUTE format('DROP TRIGGER IF EXISTS %I ON public.%I', v_fn || '_ins', v_table);
+        EXECUTE format('DROP TRIGGER IF EXISTS %I ON public.%I', v_fn || '_upd', v_table);
+        EXECUTE format('DROP TRIGGER IF EXISTS %I ON public.%I', v_fn || '_del', v_table);
+        EXECUTE format(
+            'CREATE TRIGGER %I AFTER INSERT ON public.%I REFERENCING NEW TABLE AS new_rows '
+            'FOR EACH STATEMENT EXECUTE FUNCTION public.%I()', v_fn || '_ins', v_table, v_fn);
+        EXECUTE format(
+            'CREATE TRIGGER %I AFTER UPDATE ON public.%I REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows '
+            'FOR EACH STATEMENT EXECUTE FUNCTION public.%I()', v_fn || '_upd', v_table, v_fn);
+        EXECUTE format(
+            'CREATE TRIGGER %I AFTER DELETE ON public.%I REFERENCING OLD TABLE AS old_rows '
+            'FOR EACH STATEMENT EXECUTE FUNCTION public.%I()', v_fn || '_del', v_table, v_fn);
+    END LOOP;
+END;
+$$;
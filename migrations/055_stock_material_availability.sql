@@ -0,0 +1,203 @@
+-- ============================================================
+-- CeShark ERP — Migration 055
+-- Disponibilidad precalculada por (material, almacén)
+--   · stock_material_availability: saldo físico y reservado por
+--     almacén; stock_available = GREATEST(0, físico − reservado),
+--     la misma fórmula de vw_stock_availability
+--   · triggers por sentencia en stock_balances (043, tocado por
+--     cada movimiento) y stock_reservations: suman deltas a las
+--     filas afectadas, en la misma transacción
+-- Detalle de plan, envío de requerimientos, brecha de proyecto y
+-- el disponible neto de materiales de OT leen Σ stock_available
+-- del material (filas por PK) en vez de re-evaluar la vista por
+-- cada ítem.
+-- Rebuild: SELECT public.rebuild_stock_material_availability();
+-- ============================================================
+
+
+-- ── 1. TABLA ──────────────────────────────────────────────────
+CREATE TABLE IF NOT EXISTS stock_material_availability (
+    material_id     UUID      NOT NULL REFERENCES materials(id)  ON DELETE CASCADE,
+    warehouse_id    UUID      NOT NULL REFERENCES warehouses(id) ON DELETE CASCADE,
+    physical_qty    NUMERIC   NOT NULL DEFAULT 0,
+    reserved_qty    NUMERIC   NOT NULL DEFAULT 0,
+    stock_available NUMERIC   GENERATED ALWAYS AS (GREATEST(0, physical_qty - reserved_qty)) STORED,
+    updated_at      TIMESTAMP NOT NULL DEFAULT now(),
+    PRIMARY KEY (material_id, warehouse_id)
+);
+
+
+-- ── 2. APLICAR DELTAS ─────────────────────────────────────────
+-- Arreglos paralelos (material, almacén, físico, reservado). Solo
+-- suma: no relee saldos ni reservas, así que no depende de lo que
+-- otra transacción aún no confirmó. Cada fila (material, almacén)
+-- queda bloqueada hasta el commit, igual que la de stock_balances
+-- que la originó; las claves se escriben en orden dentro de la
+-- sentencia. Dos transacciones que tocan los mismos pares en
+-- sentencias separadas y en orden inverso pueden chocar, como ya
+-- ocurre con stock_balances: los servicios que mueven varios
+-- materiales los escriben ordenados por (material, almacén).
+-- Materiales o almacenes recién borrados (CASCADE) se ignoran.
+CREATE OR REPLACE FUNCTION public.apply_stock_availability_deltas(
+    p_materials UUID[], p_warehouses UUID[], p_physical NUMERIC[], p_reserved NUMERIC[]
+) RETURNS void
+    LANGUAGE plpgsql
+    AS $$
+BEGIN
+    INSERT INTO stock_material_availability AS a (material_id, warehouse_id, physical_qty, reserved_qty)
+    SELECT d.material_id, d.warehouse_id, SUM(d.physical), SUM(d.reserved)
+    FROM unnest(p_materials, p_warehouses, p_physical, p_reserved)
+         AS d(material_id, warehouse_id, physical, reserved)
+    JOIN materials  m ON m.id = d.material_id
+    JOIN warehouses w ON w.id = d.warehouse_id
+    GROUP BY d.material_id, d.warehouse_id
+    HAVING SUM(d.physical) <> 0 OR SUM(d.reserved) <> 0
+    ORDER BY d.material_id, d.warehouse_id
+    ON CONFLICT (material_id, warehouse_id)
+    DO UPDATE SET physical_qty = a.physical_qty + EXCLUDED.physical_qty,
+                  reserved_qty = a.reserved_qty + EXCLUDED.reserved_qty,
+                  updated_at   = now();
+END;
+$$;
+
+
+-- ── 3. TRIGGERS ───────────────────────────────────────────────
+-- Un INSERT ... ON CONFLICT de bump_stock_balance dispara los
+-- triggers de INSERT y de UPDATE; cada uno ve solo sus filas.
+CREATE OR REPLACE FUNCTION public.trg_stock_material_availability_balances() RETURNS trigger
+    LANGUAGE plpgsql
+    AS $$
+DECLARE
+    v_materials  UUID[];
+    v_warehouses UUID[];
+    v_physical   NUMERIC[];
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        SELECT array_agg(material_id), array_agg(warehouse_id), array_agg(quantity)
+        INTO v_materials, v_warehouses, v_physical
+        FROM new_rows;
+    ELSIF TG_OP = 'DELETE' THEN
+        SELECT array_agg(material_id), array_agg(warehouse_id), array_agg(-quantity)
+        INTO v_materials, v_warehouses, v_physical
+        FROM old_rows;
+    ELSE
+        SELECT array_agg(material_id), array_agg(warehouse_id), array_agg(quantity)
+        INTO v_materials, v_warehouses, v_physical
+        FROM (
+            SELECT material_id, warehouse_id, quantity FROM new_rows
+            UNION ALL
+            SELECT material_id, warehouse_id, -quantity FROM old_rows
+        ) d;
+    END IF;
+
+    IF v_materials IS NOT NULL THEN
+        PERFORM public.apply_stock_availability_deltas(
+            v_materials, v_warehouses, v_physical,
+            array_fill(0::numeric, ARRAY[cardinality(v_materials)]));
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+-- Solo cuentan las reservas BLOCKED / CONFIRMED con material y
+-- almacén; un UPDATE que no cambia lo reservado (extensión de
+-- vencimiento, request_id) suma cero y no escribe.
+CREATE OR REPLACE FUNCTION public.trg_stock_material_availability_reservations() RETURNS trigger
+    LANGUAGE plpgsql
+    AS $$
+DECLARE
+    v_materials  UUID[];
+    v_warehouses UUID[];
+    v_reserved   NUMERIC[];
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        SELECT array_agg(material_id), array_agg(warehouse_id), array_agg(quantity)
+        INTO v_materials, v_warehouses, v_reserved
+        FROM new_rows
+        WHERE status IN ('BLOCKED', 'CONFIRMED') AND material_id IS NOT NULL AND warehouse_id IS NOT NULL;
+    ELSIF TG_OP = 'DELETE' THEN
+        SELECT array_agg(material_id), array_agg(warehouse_id), array_agg(-quantity)
+        INTO v_materials, v_warehouses, v_reserved
+        FROM old_rows
+        WHERE status IN ('BLOCKED', 'CONFIRMED') AND material_id IS NOT NULL AND warehouse_id IS NOT NULL;
+    ELSE
+        SELECT array_agg(material_id), array_agg(warehouse_id), array_agg(quantity)
+        INTO v_materials, v_warehouses, v_reserved
+        FROM (
+            SELECT material_id, warehouse_id, quantity, status FROM new_rows
+            UNION ALL
+            SELECT material_id, warehouse_id, -quantity, status FROM old_rows
+        ) d
+        WHERE status IN ('BLOCKED', 'CONFIRMED') AND material_id IS NOT NULL AND warehouse_id IS NOT NULL;
+    END IF;
+
+    IF v_materials IS NOT NULL THEN
+        PERFORM public.apply_stock_availability_deltas(
+            v_materials, v_warehouses,
+            array_fill(0::numeric, ARRAY[cardinality(v_materials)]), v_reserved);
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+-- Las tablas de transición admiten un solo evento por trigger: tres por tabla.
+DO $$
+DECLARE
+    v_table TEXT;
+    v_fn    TEXT;
+BEGIN
+    FOR v_table, v_fn IN
+        SELECT * FROM (VALUES
+            ('stock_balances',     'trg_stock_material_availability_balances'),
+            ('stock_reservations', 'trg_stock_material_availability_reservations')
+        ) AS t(tbl, fn)
+    LOOP
+        EXECUTE format('DROP TRIGGER IF EXISTS %I ON public.%I', v_fn || '_ins', v_table);
+        EXECUTE format('DROP TRIGGER IF EXISTS %I ON public.%I', v_fn || '_upd', v_table);
+        EXECUTE format('DROP TRIGGER IF EXISTS %I ON public.%I', v_fn || '_del', v_table);
+        EXECUTE format(
+            'CREATE TRIGGER %I AFTER INSERT ON public.%I REFERENCING NEW TABLE AS new_rows '
+            'FOR EACH STATEMENT EXECUTE FUNCTION public.%I()', v_fn || '_ins', v_table, v_fn);
+        EXECUTE format(
+            'CREATE TRIGGER %I AFTER UPDATE ON public.%I REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows '
+            'FOR EACH STATEMENT EXECUTE FUNCTION public.%I()', v_fn || '_upd', v_table, v_fn);
+        EXECUTE format(
+            'CREATE TRIGGER %I AFTER DELETE ON public.%I REFERENCING OLD TABLE AS old_rows '
+            'FOR EACH STATEMENT EXECUTE FUNCTION public.%I()', v_fn || '_del', v_table, v_fn);
+    END LOOP;
+END;
+$$;
+
+
+-- ── 4. RECÁLCULO COMPLETO ─────────────────────────────────────
+-- Para cargas que no pasan por los triggers (TRUNCATE, restauración
+-- de respaldos). Retorna los pares (material, almacén) con fila.
+CREATE OR REPLACE FUNCTION public.rebuild_stock_material_availability() RETURNS integer
+    LANGUAGE plpgsql
+    AS $$
+DECLARE
+    v_count integer;
+BEGIN
+    DELETE FROM stock_material_availability;
+    INSERT INTO stock_material_availability (material_id, warehouse_id, physical_qty, reserved_qty)
+    SELECT d.material_id, d.warehouse_id, SUM(d.physical), SUM(d.reserved)
+    FROM (
+        SELECT material_id, warehouse_id, quantity AS physical, 0 AS reserved
+        FROM stock_balances
+        UNION ALL
+        SELECT material_id, warehouse_id, 0, quantity
+        FROM stock_reservations
+        WHERE status IN ('BLOCKED', 'CONFIRMED') AND material_id IS NOT NULL AND warehouse_id IS NOT NULL
+    ) d
+    JOIN materials  m ON m.id = d.material_id
+    JOIN warehouses w ON w.id = d.warehouse_id
+    GROUP BY d.material_id, d.warehouse_id;
+    GET DIAGNOSTICS v_count = ROW_COUNT;
+    RETURN v_count;
+END;
+$$;
+
+
+-- ── 5. CARGA INICIAL (solo si la tabla está vacía) ───────────
+SELECT public.rebuild_stock_material_availability()
+WHERE NOT EXISTS (SELECT 1 FROM stock_material_availability);
@@ -0,0 +1,116 @@
+"""
+Benchmark: lecturas calientes por el threadpool (psycopg2) vs la capa asyncpg.
+
+Ejecuta el mismo servicio de dos formas, con la misma concurrencia:
+  - threadpool : run_in_threadpool(servicio_sync) — lo que hace Starlette con una ruta `def`
+  - async      : await servicio_async               — ruta `async def` sobre el pool asyncpg
+
+Uso:
+    python scripts/bench_async_db.py                                # stock availability, 500 req, 100 concurrentes
+    python scripts/bench_async_db.py --target dashboard -n 200 -c 50
+    python scripts/bench_async_db.py --target all --db-url postgresql://...   # otra DB de tenant
+
+Reporta req/s y latencias p50/p95 por modo. Ojo: el modo threadpool además queda
+limitado por DB_POOL_MAX y por los 40 hilos por defecto de Starlette.
+"""
+import argparse
+import asyncio
+import sys
+import time
+
+sys.path.insert(0, ".")
+from starlette.concurrency import run_in_threadpool  # noqa: E402
+
+from app.core.async_database import close_async_pools  # noqa: E402
+from app.core.config import settings  # noqa: E402
+from app.core.database import close_all_pools  # noqa: E402
+from app.core.tenant_context import set_tenant_db  # noqa: E402
+from app.modules.logistics.service import (  # noqa: E402
+    get_materials_async_service,
+    get_materials_service,
+    get_stock_availability_async_service,
+    get_stock_availability_service,
+    get_warehouses_async_service,
+    get_warehouses_service,
+)
+from app.modules.reporting.service import (  # noqa: E402
+    get_dashboard_kpis_async_service,
+    get_dashboard_kpis_service,
+)
+
+TARGETS = {
+    "availability": (get_stock_availability_service, get_stock_availability_async_service),
+    "materials": (get_materials_service, get_materials_async_service),
+    "warehouses": (get_warehouses_service, get_warehouses_async_service),
+    "dashboard": (get_dashboard_kpis_service, get_dashboard_kpis_async_service),
+}
+
+
+def _percentile(values: list, pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+async def _run(call, requests: int, concurrency: int) -> dict:
+    sem = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    async def one():
+        nonlocal errors
+        async with sem:
+            started = time.perf_counter()
+            try:
+                await call()
+            except Exception:
+                errors += 1
+            latencies.append(time.perf_counter() - started)
+
+    await call()  # calentar pool / planes
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    elapsed = time.perf_counter() - started
+    return {
+        "rps": requests / elapsed,
+        "p50_ms": _percentile(latencies, 0.50) * 1000,
+        "p95_ms": _percentile(latencies, 0.95) * 1000,
+        "errors": errors,
+    }
+
+
+async def main_async(args) -> None:
+    if args.db_url:
+        set_tenant_db(args.db_url)
+
+    names = list(TARGETS) if args.target == "all" else [args.target]
+    print(f"  {args.requests} requests, concurrencia {args.concurrency}, "
+          f"DB_POOL_MAX={settings.DB_POOL_MAX}, DB_ASYNC_POOL_MAX={settings.DB_ASYNC_POOL_MAX}")
+    print(f"  {'endpoint':<14}{'modo':<12}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'errores':>9}")
+    try:
+        for name in names:
+            sync_fn, async_fn = TARGETS[name]
+            modes = (
+                ("threadpool", lambda: run_in_threadpool(sync_fn)),
+                ("async", async_fn),
+            )
+            results = {}
+            for mode, call in modes:
+                r = results[mode] = await _run(call, args.requests, args.concurrency)
+                print(f"  {name:<14}{mode:<12}{r['rps']:>10.1f}{r['p50_ms']:>10.1f}{r['p95_ms']:>10.1f}{r['errors']:>9}")
+            print(f"  {'':<14}{'async/thr':<12}{results['async']['rps'] / results['threadpool']['rps']:>9.2f}x")
+    finally:
+        await close_async_pools()
+        close_all_pools()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", choices=[*TARGETS, "all"], default="availability")
+    parser.add_argument("-n", "--requests", type=int, default=500)
+    parser.add_argument("-c", "--concurrency", type=int, default=100)
+    parser.add_argument("--db-url", help="URL de la DB del tenant (por defecto DATABASE_URL)")
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
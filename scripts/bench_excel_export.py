@@ -0,0 +1,91 @@
+"""
+Compara memoria y tiempo del Excel en memoria (write_*_row + excel_response)
+contra el motor en streaming (StreamingExcel) con N filas sintéticas.
+
+No toca la base de datos: mide solo la construcción y serialización del .xlsx,
+que es lo que domina en exportaciones grandes (stock, auditoría).
+
+Uso:
+    python scripts/bench_excel_export.py              # 100.000 filas
+    python scripts/bench_excel_export.py -n 20000
+"""
+import argparse
+import asyncio
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, ".")
+from app.core.export_utils import (  # noqa: E402
+    StreamingExcel,
+    excel_response,
+    set_column_widths,
+    write_data_row,
+    write_header_row,
+    write_title_row,
+)
+
+HEADERS = ["Cód. Material", "Nombre Material", "Categoría", "Stock Mínimo",
+           "Cód. Almacén", "Almacén", "Stock Actual", "Estado"]
+WIDTHS = [13, 38, 16, 13, 13, 28, 13, 14]
+
+
+def _rows(n: int):
+    for i in range(n):
+        yield [f"MAT-{i:06d}", f"Material de prueba {i}", "Bench", "10",
+               "WH-01", "Almacén central", f"{i % 500:,.2f}", "OK" if i % 7 else "STOCK BAJO"]
+
+
+async def _drain(response) -> int:
+    size = 0
+    async for chunk in response.body_iterator:
+        size += len(chunk)
+    return size
+
+
+def in_memory(n: int):
+    import openpyxl
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    write_title_row(ws, "Bench", len(HEADERS))
+    write_header_row(ws, HEADERS, row=2)
+    set_column_widths(ws, WIDTHS)
+    for i, row in enumerate(_rows(n), start=1):
+        write_data_row(ws, i + 2, row, alternate=(i % 2 == 0))
+    return excel_response(wb, "bench.xlsx")
+
+
+def streaming(n: int):
+    book = StreamingExcel()
+    sheet = book.sheet("Bench", HEADERS, WIDTHS, title="Bench")
+    for i, row in enumerate(_rows(n), start=1):
+        sheet.data_row(row, alternate=(i % 2 == 0),
+                       badges={8: ("FEF3C7", "92400E")} if row[7] != "OK" else None)
+    return book.response("bench.xlsx")
+
+
+def _measure(label: str, fn, n: int) -> None:
+    # Tiempo sin trazar (tracemalloc multiplica el costo); memoria en una segunda pasada
+    started = time.perf_counter()
+    size = asyncio.run(_drain(fn(n)))
+    elapsed = time.perf_counter() - started
+
+    tracemalloc.start()
+    asyncio.run(_drain(fn(n)))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"  {label:<12} {n:>8} filas  {elapsed:6.2f}s  pico {peak / 2**20:7.1f} MB  archivo {size / 2**20:5.1f} MB")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", "--rows", type=int, default=100_000, help="filas a exportar")
+    args = parser.parse_args()
+
+    _measure("en memoria", in_memory, args.rows)
+    _measure("streaming", streaming, args.rows)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,108 @@
+"""
+Mide el throughput de la importación Excel de materiales y de stock IN.
+
+Genera un archivo sintético de N filas (códigos BENCH-xxxxxx), lo importa dos
+veces (la primera inserta, la segunda actualiza) y reporta filas/s. Con
+--stock-in también importa N ingresos al almacén indicado.
+
+Uso:
+    python scripts/bench_excel_import.py                          # 20.000 materiales
+    python scripts/bench_excel_import.py -n 50000 --stock-in WH-CENTRAL
+    python scripts/bench_excel_import.py --cleanup                # borra los BENCH-* creados
+    python scripts/bench_excel_import.py --db-url postgresql://...   # otra DB de tenant
+
+ATENCIÓN: escribe en la base de datos. Usar contra una DB de pruebas.
+"""
+import argparse
+import io
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, ".")
+from app.core.database import db_connection  # noqa: E402
+from app.core.tenant_context import set_tenant_db  # noqa: E402
+from app.modules.logistics.service import (  # noqa: E402
+    import_materials_from_excel,
+    import_stock_in_from_excel,
+)
+
+PREFIX = "BENCH-"
+
+
+def _to_excel(df: pd.DataFrame) -> io.BytesIO:
+    buf = io.BytesIO()
+    df.to_excel(buf, index=False)
+    buf.seek(0)
+    return buf
+
+
+def _materials_file(n: int) -> io.BytesIO:
+    return _to_excel(pd.DataFrame({
+        "Código": [f"{PREFIX}{i:06d}" for i in range(n)],
+        "Nombre": [f"Material de prueba {i}" for i in range(n)],
+        "Categoría": ["BENCH"] * n,
+        "Stock mínimo": [i % 10 for i in range(n)],
+        "Marca": ["ACME"] * n,
+        "Costo unitario": [round(1 + i % 500 * 0.37, 2) for i in range(n)],
+        "Aliases (sep. por coma)": [f"alias-{i}, bench-{i % 100}" for i in range(n)],
+    }))
+
+
+def _stock_in_file(n: int, warehouse_code: str) -> io.BytesIO:
+    return _to_excel(pd.DataFrame({
+        "material_code": [f"{PREFIX}{i:06d}" for i in range(n)],
+        "warehouse_id": [warehouse_code] * n,
+        "quantity": [1 + i % 25 for i in range(n)],
+        "reference": ["bench-import"] * n,
+    }))
+
+
+def _timed(label: str, fn, buf: io.BytesIO, rows: int) -> dict:
+    started = time.perf_counter()
+    result = fn(buf)
+    elapsed = time.perf_counter() - started
+    errors = len(result.get("errors", []))
+    print(f"  {label:<28}{rows:>8} filas {elapsed:>8.2f}s {rows / elapsed:>10.0f} filas/s  errores={errors}")
+    return result
+
+
+def cleanup() -> None:
+    with db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                "DELETE FROM stock_movements WHERE material_id IN (SELECT id FROM materials WHERE code LIKE %s)",
+                (PREFIX + "%",),
+            )
+            movements = cur.rowcount
+            cur.execute("DELETE FROM materials WHERE code LIKE %s", (PREFIX + "%",))
+            materials = cur.rowcount
+        conn.commit()
+    print(f"  OK    borrados {materials} materiales y {movements} movimientos {PREFIX}*")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", "--rows", type=int, default=20000)
+    parser.add_argument("--stock-in", metavar="WAREHOUSE_CODE", help="importar también N ingresos a este almacén")
+    parser.add_argument("--cleanup", action="store_true", help="borrar los materiales/movimientos BENCH-* y salir")
+    parser.add_argument("--db-url", help="URL de la DB del tenant (por defecto DATABASE_URL)")
+    args = parser.parse_args()
+
+    if args.db_url:
+        set_tenant_db(args.db_url)
+    if args.cleanup:
+        cleanup()
+        return 0
+
+    print(f"  Generando archivos de {args.rows} filas...")
+    _timed("materiales (inserción)", import_materials_from_excel, _materials_file(args.rows), args.rows)
+    _timed("materiales (actualización)", import_materials_from_excel, _materials_file(args.rows), args.rows)
+    if args.stock_in:
+        _timed("stock IN", import_stock_in_from_excel, _stock_in_file(args.rows, args.stock_in), args.rows)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
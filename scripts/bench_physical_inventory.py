@@ -0,0 +1,160 @@
+"""
+Mide el inventario físico en lote sobre un inventario sintético grande.
+
+Crea N materiales PINV-xxxxxx con stock en el almacén BENCH-PINV, abre un
+inventario, registra todos los conteos en un solo lote (un tercio sobra, un
+tercio falta, un tercio cuadra), reenvía el lote, cierra y aprueba, midiendo
+cada paso. La corrección (idempotencia, ajustes, stock final) la verifica
+test_inventario_fisico_en_lote en tests/smoke.
+
+Uso:
+    python scripts/bench_physical_inventory.py                    # 20.000 ítems
+    python scripts/bench_physical_inventory.py -n 100000 --user admin
+    python scripts/bench_physical_inventory.py --cleanup          # borra los PINV-* creados
+    python scripts/bench_physical_inventory.py --db-url postgresql://...   # otra DB de tenant
+
+ATENCIÓN: escribe en la base de datos. Usar contra una DB de pruebas.
+"""
+import argparse
+import sys
+import time
+
+from psycopg2.extras import execute_values
+
+sys.path.insert(0, ".")
+from app.core.database import db_connection  # noqa: E402
+from app.core.tenant_context import set_tenant_db  # noqa: E402
+from app.modules.logistics.router_physical_inv import (  # noqa: E402
+    InventoryCreate,
+    ItemCount,
+    approve_inventory,
+    close_inventory,
+    open_inventory,
+    register_counts_bulk,
+)
+
+PREFIX = "PINV-"
+WAREHOUSE_CODE = "BENCH-PINV"
+
+
+def _timed(label: str, fn, *args, rows: int):
+    started = time.perf_counter()
+    result = fn(*args)
+    elapsed = time.perf_counter() - started
+    print(f"  {label:<28}{rows:>8} ítems {elapsed:>8.2f}s {rows / elapsed:>10.0f} ítems/s")
+    return result
+
+
+def _setup(n: int, username: str) -> tuple[str, dict]:
+    with db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT id FROM users WHERE username = %s", (username,))
+            row = cur.fetchone()
+            if not row:
+                raise SystemExit(f"  ERROR usuario '{username}' no existe")
+            user = {"id": str(row[0])}
+
+            cur.execute("SELECT id FROM warehouses WHERE code = %s", (WAREHOUSE_CODE,))
+            row = cur.fetchone()
+            if not row:
+                cur.execute(
+                    "INSERT INTO warehouses (name, code) VALUES (%s, %s) RETURNING id",
+                    ("Almacén benchmark inventario", WAREHOUSE_CODE),
+                )
+                row = cur.fetchone()
+            warehouse_id = str(row[0])
+
+            execute_values(cur, """
+                INSERT INTO materials (code, name, unit_cost)
+                VALUES %s
+                ON CONFLICT DO NOTHING
+            """, [(f"{PREFIX}{i:06d}", f"Material inventario {i}", 1 + i % 50) for i in range(n)],
+                page_size=5000)
+            cur.execute("""
+                INSERT INTO stock_movements
+                    (material_id, movement_type, quantity, to_warehouse, unit_cost, reference, created_by)
+                SELECT m.id, 'IN', 10 + substr(m.code, 6)::int %% 40, %s::uuid, m.unit_cost,
+                       'bench-pinv', %s::uuid
+                FROM materials m
+                WHERE m.code LIKE %s
+                  AND NOT EXISTS (
+                      SELECT 1 FROM stock_movements sm
+                      WHERE sm.material_id = m.id AND sm.reference = 'bench-pinv'
+                  )
+            """, (warehouse_id, user["id"], PREFIX + "%"))
+        conn.commit()
+    return warehouse_id, user
+
+
+def _expected(cur, inv_id: str) -> dict:
+    cur.execute("""
+        SELECT pii.id, m.code, pii.system_quantity
+        FROM physical_inventory_items pii
+        JOIN materials m ON m.id = pii.material_id
+        WHERE pii.inventory_id = %s::uuid AND m.code LIKE %s
+    """, (inv_id, PREFIX + "%"))
+    return {str(item_id): (code, float(qty)) for item_id, code, qty in cur.fetchall()}
+
+
+def _counted(system_qty: float, i: int) -> float:
+    return system_qty + (0, 3, -2)[i % 3]
+
+
+def cleanup() -> None:
+    with db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                DELETE FROM physical_inventories
+                WHERE warehouse_id IN (SELECT id FROM warehouses WHERE code = %s)
+            """, (WAREHOUSE_CODE,))
+            inventories = cur.rowcount
+            cur.execute(
+                "DELETE FROM stock_movements WHERE material_id IN (SELECT id FROM materials WHERE code LIKE %s)",
+                (PREFIX + "%",),
+            )
+            movements = cur.rowcount
+            cur.execute("DELETE FROM materials WHERE code LIKE %s", (PREFIX + "%",))
+            materials = cur.rowcount
+        conn.commit()
+    print(f"  OK    borrados {inventories} inventarios, {materials} materiales y {movements} movimientos {PREFIX}*")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", "--items", type=int, default=20000)
+    parser.add_argument("--user", default="juliet_alvis", help="usuario que cuenta y aprueba")
+    parser.add_argument("--cleanup", action="store_true", help="borrar los datos PINV-* y salir")
+    parser.add_argument("--db-url", help="URL de la DB del tenant (por defecto DATABASE_URL)")
+    args = parser.parse_args()
+
+    if args.db_url:
+        set_tenant_db(args.db_url)
+    if args.cleanup:
+        cleanup()
+        return 0
+
+    print(f"  Generando {args.items} materiales con stock en {WAREHOUSE_CODE}...")
+    warehouse_id, user = _setup(args.items, args.user)
+
+    inv = _timed("abrir inventario", open_inventory,
+                 InventoryCreate(warehouse_id=warehouse_id, title="Benchmark inventario físico"), user,
+                 rows=args.items)
+    inv_id = inv["id"]
+    with db_connection() as conn:
+        with conn.cursor() as cur:
+            items = _expected(cur, inv_id)
+
+    counts = [
+        ItemCount(item_id=item_id, counted_quantity=_counted(qty, i))
+        for i, (item_id, (_code, qty)) in enumerate(items.items())
+    ]
+    first = _timed("conteo en lote", register_counts_bulk, inv_id, counts, user, rows=len(counts))
+    again = _timed("conteo en lote (reenvío)", register_counts_bulk, inv_id, counts, user, rows=len(counts))
+    close_inventory(inv_id)
+    result = _timed("aprobación", approve_inventory, inv_id, user, rows=len(counts))
+    print(f"  {first['updated']} ítems contados, {again['updated']} cambiados en el reenvío, "
+          f"{result['adjustments_applied']} ajustes aplicados")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,50 @@
+"""
+Verifica o reconstruye la tabla stock_balances (saldo materializado) contra stock_movements.
+
+Uso:
+    python scripts/rebuild_stock_balances.py                 # solo verificar
+    python scripts/rebuild_stock_balances.py --rebuild       # reconstruir y volver a verificar
+    python scripts/rebuild_stock_balances.py --db-url postgresql://...   # otra DB de tenant
+
+Código de salida 1 si quedan diferencias tras la ejecución.
+"""
+import argparse
+import sys
+
+sys.path.insert(0, ".")
+from app.core.tenant_context import set_tenant_db  # noqa: E402
+from app.modules.logistics.service import (  # noqa: E402
+    rebuild_stock_balances_service,
+    verify_stock_balances_service,
+)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rebuild", action="store_true", help="reconstruir stock_balances desde stock_movements")
+    parser.add_argument("--db-url", help="URL de la DB del tenant (por defecto DATABASE_URL)")
+    args = parser.parse_args()
+
+    if args.db_url:
+        set_tenant_db(args.db_url)
+
+    if args.rebuild:
+        result = rebuild_stock_balances_service()
+        print(f"  OK    stock_balances reconstruida: {result['balances']} saldos")
+
+    report = verify_stock_balances_service()
+    if report["ok"]:
+        print(f"  OK    {report['balances']} saldos coinciden con stock_movements")
+        return 0
+
+    print(f"  WARN  {len(report['mismatches'])} saldos no coinciden:")
+    for m in report["mismatches"][:50]:
+        print(
+            f"        material={m['material_id']} almacén={m['warehouse_id']} "
+            f"proyecto={m['project_id']} esperado={m['expected']} guardado={m['stored']}"
+        )
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,54 @@
+"""
+Verifica o reconstruye la valorización perpetua (materials.weighted_avg_cost y
+stock_valuation) reproduciendo stock_movements en orden cronológico.
+
+Uso:
+    python scripts/rebuild_stock_valuation.py                     # solo verificar
+    python scripts/rebuild_stock_valuation.py --rebuild           # recalcular todo y volver a verificar
+    python scripts/rebuild_stock_valuation.py --rebuild --material <uuid>
+    python scripts/rebuild_stock_valuation.py --db-url postgresql://...   # otra DB de tenant
+
+Código de salida 1 si quedan diferencias tras la ejecución.
+"""
+import argparse
+import sys
+
+sys.path.insert(0, ".")
+from app.core.tenant_context import set_tenant_db  # noqa: E402
+from app.modules.logistics.service import (  # noqa: E402
+    rebuild_stock_valuation_service,
+    verify_stock_valuation_service,
+)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rebuild", action="store_true", help="recalcular el CPP desde stock_movements")
+    parser.add_argument("--material", help="recalcular solo este material (uuid)")
+    parser.add_argument("--db-url", help="URL de la DB del tenant (por defecto DATABASE_URL)")
+    args = parser.parse_args()
+
+    if args.db_url:
+        set_tenant_db(args.db_url)
+
+    if args.rebuild:
+        result = rebuild_stock_valuation_service(args.material)
+        print(f"  OK    valorización recalculada: {result['materials']} materiales")
+
+    report = verify_stock_valuation_service()
+    if report["ok"]:
+        print(f"  OK    {report['valuations']} valorizaciones coinciden con stock_movements")
+        return 0
+
+    print(f"  WARN  {len(report['mismatches'])} valorizaciones no coinciden:")
+    for m in report["mismatches"][:50]:
+        print(
+            f"        material={m['material_id']} almacén={m['warehouse_id']} "
+            f"cantidad esperada={m['expected_quantity']} guardada={m['stored_quantity']} "
+            f"valor esperado={m['expected_value']} guardado={m['stored_value']}"
+        )
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -444,3 +444,216 @@ def test_avatar_put_base64_success(client, auth):
     assert r.status_code == 200, r.text[:300]
     assert r.json()["status"] == "ok"
     assert r.json()["avatar_url"].startswith("data:image/")
+
+
+# ── Bandeja de aprobaciones de gerencia: costo constante por página ──────────
+
+class _CountingCursor:
+    """Cursor que cuenta cada execute() contra la DB."""
+
+    def __init__(self, cur, executed):
+        self._cur = cur
+        self._executed = executed
+
+    def execute(self, *args, **kwargs):
+        self._executed.append(args[0])
+        return self._cur.execute(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._cur, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return self._cur.__exit__(*exc)
+
+
+class _CountingConnection:
+    def __init__(self, conn, executed):
+        self._conn = conn
+        self._executed = executed
+
+    def cursor(self, *args, **kwargs):
+        return _CountingCursor(self._conn.cursor(*args, **kwargs), self._executed)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+@pytest.fixture
+def _aprobaciones_de_todos_los_tipos():
+    """Una aprobación PENDIENTE por tipo con detalles, para que la página los mezcle."""
+    from uuid import uuid4
+    from app.core.database import db_connection
+    from app.modules.gerencia import service as gerencia_service
+
+    tipos = sorted(gerencia_service._DETALLES_POR_TIPO)
+    with db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT id FROM users WHERE username = %s", (USER,))
+            row = cur.fetchone()
+            if not row:
+                pytest.skip(f"usuario demo {USER} no encontrado")
+            ids = []
+            for tipo in tipos:
+                cur.execute("""
+                    INSERT INTO aprobaciones_gerencia
+                        (tipo, referencia_id, titulo, descripcion, estado, solicitado_por)
+                    VALUES (%s, %s, %s, 'smoke test', 'PENDIENTE', %s)
+                    RETURNING id
+                """, (tipo, str(uuid4()), f"smoke {tipo}", row[0]))
+                ids.append(cur.fetchone()[0])
+        conn.commit()
+    try:
+        yield tipos
+    finally:
+        with db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("DELETE FROM aprobaciones_gerencia WHERE id = ANY(%s::uuid[])",
+                            ([str(i) for i in ids],))
+            conn.commit()
+
+
+def test_aprobaciones_query_count_constante(client, auth, monkeypatch, _aprobaciones_de_todos_los_tipos):
+    """Regresión N+1: listar una página cuesta lo mismo con 1 o con 200 aprobaciones.
+
+    Cota: 1 consulta de la página + 1 por tipo con detalles + 1 de ítems de OC.
+    """
+    from contextlib import contextmanager
+    from app.modules.gerencia import service as gerencia_service
+
+    real_connection = gerencia_service.db_connection
+    executed: list = []
+
+    @contextmanager
+    def counting_connection():
+        with real_connection() as conn:
+            yield _CountingConnection(conn, executed)
+
+    monkeypatch.setattr(gerencia_service, "db_connection", counting_connection)
+    max_queries = 1 + len(gerencia_service._DETALLES_POR_TIPO) + 1
+
+    for limit in (1, 200):
+        executed.clear()
+        rows, total = gerencia_service.list_aprobaciones_service(estado="PENDIENTE", limit=limit)
+        assert len(rows) == min(limit, total)
+        assert len(executed) <= max_queries, (
+            f"{len(executed)} consultas para {len(rows)} aprobaciones (máximo {max_queries})"
+        )
+    # Con limit=200 la página trae las recién creadas: la cota se midió con todos los tipos
+    assert set(_aprobaciones_de_todos_los_tipos) <= {r["tipo"] for r in rows}
+
+    # La forma pública no cambia; total y siguiente página van en cabeceras
+    r = client.get("/gerencia/aprobaciones?estado=PENDIENTE&limit=1&offset=0", headers=auth)
+    assert r.status_code == 200, r.text[:300]
+    assert isinstance(r.json(), list) and len(r.json()) == 1
+    assert int(r.headers["X-Total-Count"]) >= len(_aprobaciones_de_todos_los_tipos)
+    assert r.headers["X-Next-Offset"] == "1"
+
+
+# ── Inventario físico en lote sobre un inventario sintético ──────────────────
+
+_PINV_ITEMS = 3000
+
+
+@pytest.fixture
+def _inventario_sintetico():
+    """Almacén propio con _PINV_ITEMS materiales con stock (10..49); se borra todo al final."""
+    from uuid import uuid4
+    from psycopg2.extras import execute_values
+    from app.core.database import db_connection
+
+    tag = uuid4().hex[:8].upper()
+    prefix = f"SMK-PINV-{tag}-"
+    with db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT id FROM users WHERE username = %s", (USER,))
+            row = cur.fetchone()
+            if not row:
+                pytest.skip(f"usuario demo {USER} no encontrado")
+            user_id = row[0]
+            cur.execute(
+                "INSERT INTO warehouses (name, code) VALUES (%s, %s) RETURNING id",
+                (f"Smoke inventario {tag}", f"SMK-PINV-{tag}"),
+            )
+            warehouse_id = str(cur.fetchone()[0])
+            materials = execute_values(cur, """
+                INSERT INTO materials (code, name, unit_cost) VALUES %s RETURNING id, code
+            """, [(f"{prefix}{i:05d}", f"Smoke inventario {i}", 1 + i % 50) for i in range(_PINV_ITEMS)],
+                page_size=1000, fetch=True)
+            execute_values(cur, """
+                INSERT INTO stock_movements
+                    (material_id, movement_type, quantity, to_warehouse, unit_cost, reference, created_by)
+                VALUES %s
+            """, [(mid, "IN", 10 + int(code[-5:]) % 40, warehouse_id, 1, "smoke-pinv", user_id)
+                  for mid, code in materials], page_size=1000)
+        conn.commit()
+    try:
+        yield warehouse_id
+    finally:
+        with db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("DELETE FROM physical_inventories WHERE warehouse_id = %s::uuid", (warehouse_id,))
+                cur.execute(
+                    "DELETE FROM stock_movements WHERE material_id IN (SELECT id FROM materials WHERE code LIKE %s)",
+                    (prefix + "%",),
+                )
+                cur.execute("DELETE FROM materials WHERE code LIKE %s", (prefix + "%",))
+                cur.execute("DELETE FROM warehouses WHERE id = %s::uuid", (warehouse_id,))
+            conn.commit()
+
+
+def test_inventario_fisico_en_lote(client, auth, _inventario_sintetico):
+    """Conteo en lote idempotente; la aprobación deja el stock del almacén igual a lo contado.
+
+    Un tercio de los ítems cuadra, un tercio sobra (+3) y un tercio falta (−2).
+    """
+    from app.core.database import db_connection
+
+    warehouse_id = _inventario_sintetico
+    r = client.post("/logistics/physical-inventory", headers=auth,
+                    json={"warehouse_id": warehouse_id, "title": "Smoke inventario físico"})
+    assert r.status_code == 201, r.text[:300]
+    inv_id = r.json()["id"]
+
+    with db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT id, system_quantity FROM physical_inventory_items
+                WHERE inventory_id = %s::uuid ORDER BY id
+            """, (inv_id,))
+            items = [(str(item_id), float(qty)) for item_id, qty in cur.fetchall()]
+    assert len(items) == _PINV_ITEMS
+
+    counts = {item_id: qty + (0, 3, -2)[i % 3] for i, (item_id, qty) in enumerate(items)}
+    body = [{"item_id": item_id, "counted_quantity": qty} for item_id, qty in counts.items()]
+    discrepant = sum(1 for item_id, qty in items if counts[item_id] != qty)
+
+    r = client.patch(f"/logistics/physical-inventory/{inv_id}/items/count/bulk", headers=auth, json=body)
+    assert r.status_code == 200, r.text[:300]
+    assert r.json()["updated"] == _PINV_ITEMS and not r.json()["unknown"]
+
+    r = client.patch(f"/logistics/physical-inventory/{inv_id}/items/count/bulk", headers=auth, json=body)
+    assert r.status_code == 200, r.text[:300]
+    assert r.json()["updated"] == 0, "el reenvío del mismo lote no debe modificar ítems"
+
+    r = client.post(f"/logistics/physical-inventory/{inv_id}/close", headers=auth)
+    assert r.status_code == 200, r.text[:300]
+    r = client.post(f"/logistics/physical-inventory/{inv_id}/approve", headers=auth)
+    assert r.status_code == 200, r.text[:300]
+    assert r.json()["adjustments_applied"] == discrepant
+
+    with db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT pii.id, COALESCE(SUM(sb.quantity), 0)
+                FROM physical_inventory_items pii
+                LEFT JOIN stock_balances sb
+                       ON sb.material_id = pii.material_id AND sb.warehouse_id = %s::uuid
+                WHERE pii.inventory_id = %s::uuid
+                GROUP BY pii.id
+            """, (warehouse_id, inv_id))
+            stock = {str(item_id): float(qty) for item_id, qty in cur.fetchall()}
+    wrong = [item_id for item_id, qty in counts.items() if abs(stock.get(item_id, 0) - qty) > 0.005]
+    assert not wrong, f"{len(wrong)} ítems con stock distinto al conteo"